@@ -3,10 +3,13 @@ from flask_cors import CORS
 import json
 import random
 import time
+import os
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 import logging
 
+from portfolio_core.engines import available_engines, get_engine
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,6 +25,7 @@ class Config:
     DEFAULT_STOCKS = 10
     DEFAULT_BETA = 1.0
     CACHE_DURATION = 300  # 5 minutes
+    ENGINE = os.environ.get('OPTIMIZER_ENGINE', 'bracket-refine')
 
 app.config.from_object(Config)
 
@@ -185,188 +189,15 @@ class PortfolioOptimizer:
             'target_achieved': target_return is not None and abs(expected_return - target_return) < 0.02
         }
     
-    def optimize_portfolio_weights(self, stocks: List[Dict], target_beta: float, individual_returns: Dict[str, float] = None, target_return: float = None, strategy: str = 'diversified') -> Dict[str, float]:
-        """Optimize portfolio weights - uses mathematical approach to match target return exactly"""
-        n = len(stocks)
-        
-        # If target return is specified, solve mathematically to match it exactly
-        if target_return is not None and individual_returns is not None:
-            # Get stock returns and betas as lists
-            stock_returns = [individual_returns.get(stock['symbol'], 0.08) for stock in stocks]
-            stock_betas = [stock['beta'] for stock in stocks]
-            
-            # Check if target is achievable
-            min_return = min(stock_returns)
-            max_return = max(stock_returns)
-            
-            # Initialize weights - start with solution that targets return
-            # Use two-stock combination approach: find two stocks that bracket target return
-            weights_list = [0.0] * n
-            
-            # Find stocks closest to target return
-            sorted_indices = sorted(range(n), key=lambda i: abs(stock_returns[i] - target_return))
-            
-            # Use top 2-3 stocks closest to target to build solution
-            if n >= 2:
-                # Use two stocks to create a combination that hits target return
-                idx1 = sorted_indices[0]
-                idx2 = sorted_indices[1] if n > 1 else sorted_indices[0]
-                
-                r1, r2 = stock_returns[idx1], stock_returns[idx2]
-                
-                # Solve: w1*r1 + w2*r2 = target_return, w1 + w2 = 1
-                # w1 = (target_return - r2) / (r1 - r2)
-                if abs(r1 - r2) > 0.001:
-                    w1 = (target_return - r2) / (r1 - r2)
-                    w1 = max(0.0, min(1.0, w1))  # Clamp to [0, 1]
-                    w2 = 1.0 - w1
-                    
-                    weights_list[idx1] = w1
-                    weights_list[idx2] = w2
-                else:
-                    # Stocks have similar returns - use equal weights
-                    weights_list[idx1] = 0.5
-                    weights_list[idx2] = 0.5
-            else:
-                weights_list[0] = 1.0
-            
-            # Now refine to also optimize beta while maintaining return
-            best_weights_dict = {stock['symbol']: weights_list[i] for i, stock in enumerate(stocks)}
-            best_return_diff = abs(sum(w * r for w, r in zip(weights_list, stock_returns)) - target_return)
-            best_beta_diff = abs(sum(w * b for w, b in zip(weights_list, stock_betas)) - target_beta)
-            
-            # Refine solution: use random search around the initial solution to optimize beta
-            for refinement in range(5000):
-                # Start from current best or initial solution
-                if refinement == 0:
-                    test_weights = weights_list.copy()
-                else:
-                    # Perturb current solution slightly
-                    test_weights = [w * (0.9 + 0.2 * random.random()) for w in weights_list]
-                    # Renormalize
-                    total = sum(test_weights)
-                    if total > 0:
-                        test_weights = [w / total for w in test_weights]
-                    else:
-                        test_weights = weights_list.copy()
-                
-                # Calculate metrics
-                test_return = sum(w * r for w, r in zip(test_weights, stock_returns))
-                test_beta = sum(w * b for w, b in zip(test_weights, stock_betas))
-                return_diff = abs(test_return - target_return)
-                beta_diff = abs(test_beta - target_beta)
-                
-                # Accept if return is close and beta is better
-                if return_diff < 0.01 and (return_diff < best_return_diff or (abs(return_diff - best_return_diff) < 0.001 and beta_diff < best_beta_diff)):
-                    best_return_diff = return_diff
-                    best_beta_diff = beta_diff
-                    weights_list = test_weights
-                    best_weights_dict = {stock['symbol']: weights_list[i] for i, stock in enumerate(stocks)}
-                
-                # Early exit if both targets achieved
-                if return_diff < 0.001 and beta_diff < 0.05:
-                    break
-            
-            # Return solution
-            return best_weights_dict
-        
-        # Fallback: optimize for beta (or if no target return specified)
-        max_attempts = 5000
-        best_weights = None
-        best_score = float('inf')
-        
-        for _ in range(max_attempts):
-            # Generate random weights
-            raw_weights = [random.random() for _ in range(n)]
-            total = sum(raw_weights)
-            weights = {stock['symbol']: w/total for stock, w in zip(stocks, raw_weights)}
-            
-            # Calculate portfolio beta
-            portfolio_beta = sum(weights[stock['symbol']] * stock['beta'] for stock in stocks)
-            beta_diff = abs(portfolio_beta - target_beta)
-            
-            # Calculate score
-            if target_return is not None and individual_returns is not None:
-                portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
-                return_diff = abs(portfolio_return - target_return)
-                # Balance both, but return is still important
-                score = return_diff * 10 + beta_diff
-            else:
-                score = beta_diff
-            
-            if score < best_score:
-                best_score = score
-                best_weights = weights
-            
-            # Early exit
-            if target_return is not None and individual_returns is not None:
-                portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
-                if abs(portfolio_return - target_return) < 0.01 and beta_diff < 0.1:
-                    break
-            elif beta_diff < 0.05:
-                break
-        
-        return best_weights or {stock['symbol']: 1.0/n for stock in stocks}
+    def optimize_portfolio_weights(self, stocks: List[Dict], target_beta: float, individual_returns: Dict[str, float] = None, target_return: float = None, strategy: str = 'diversified', engine: str = None) -> Dict[str, float]:
+        """Optimize portfolio weights with the selected weight engine"""
+        return get_engine(engine or Config.ENGINE).optimize(stocks, target_beta, individual_returns, target_return, strategy)
     
-    def optimize_portfolio_weights_strict(self, stocks: List[Dict], target_beta: float, individual_returns: Dict[str, float] = None, target_return: float = None, strategy: str = 'diversified') -> Dict[str, float]:
+    def optimize_portfolio_weights_strict(self, stocks: List[Dict], target_beta: float, individual_returns: Dict[str, float] = None, target_return: float = None, strategy: str = 'diversified', engine: str = None) -> Dict[str, float]:
         """Optimize portfolio weights with strict constraint: ALL stocks must have non-zero weight"""
-        n = len(stocks)
-        min_weight = 0.01  # Minimum 1% per stock
-        
-        # Ensure we can allocate minimum to all stocks
-        if n * min_weight > 1.0:
-            min_weight = 1.0 / n
-        
-        max_attempts = 10000
-        best_weights = None
-        best_score = float('inf')
-        
-        for _ in range(max_attempts):
-            # Generate weights ensuring all stocks get at least min_weight
-            # Start with minimum weights for all
-            weights_list = [min_weight] * n
-            remaining = 1.0 - (n * min_weight)
-            
-            # Distribute remaining weight randomly but ensure all stay above minimum
-            if remaining > 0:
-                raw_additional = [random.random() for _ in range(n)]
-                total_additional = sum(raw_additional)
-                if total_additional > 0:
-                    for i in range(n):
-                        weights_list[i] += (raw_additional[i] / total_additional) * remaining
-            
-            weights = {stock['symbol']: weights_list[i] for i, stock in enumerate(stocks)}
-            
-            # Calculate metrics
-            portfolio_beta = sum(weights[stock['symbol']] * stock['beta'] for stock in stocks)
-            beta_diff = abs(portfolio_beta - target_beta)
-            
-            # For target_return strategy, prioritize return matching
-            if strategy == 'target_return' and target_return is not None and individual_returns is not None:
-                portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
-                return_diff = abs(portfolio_return - target_return)
-                # Prioritize return matching - use return_diff as primary score
-                score = return_diff * 1000 + beta_diff
-            else:
-                score = beta_diff
-                if target_return is not None and individual_returns is not None:
-                    portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
-                    return_diff = abs(portfolio_return - target_return)
-                    score = return_diff * 10 + beta_diff
-            
-            if score < best_score:
-                best_score = score
-                best_weights = weights
-                
-                # Early exit for target_return strategy if return is very close
-                if strategy == 'target_return' and target_return is not None and individual_returns is not None:
-                    portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
-                    if abs(portfolio_return - target_return) < 0.0001:
-                        break
-        
-        return best_weights or {stock['symbol']: 1.0/n for stock in stocks}
+        return get_engine(engine or Config.ENGINE).optimize(stocks, target_beta, individual_returns, target_return, strategy, strict=True)
     
-    def optimize(self, num_stocks: int, target_beta: float, target_return: float = None, strategy: str = 'diversified') -> Dict:
+    def optimize(self, num_stocks: int, target_beta: float, target_return: float = None, strategy: str = 'diversified', engine: str = None) -> Dict:
         """Main optimization function"""
         start_time = time.time()
         
@@ -380,10 +211,14 @@ class PortfolioOptimizer:
             if not is_valid:
                 return {'error': error_msg}
         
+        engine = engine or Config.ENGINE
+        if engine not in available_engines():
+            return {'error': f"Unknown engine '{engine}'"}
+        
         # Check cache
         # For target_return strategy, num_stocks is not relevant for caching
         cache_num_stocks = 0 if strategy == 'target_return' else num_stocks
-        cache_key = f"{cache_num_stocks}_{target_beta}_{target_return}_{strategy}"
+        cache_key = f"{cache_num_stocks}_{target_beta}_{target_return}_{strategy}_{engine}"
         if cache_key in optimization_cache:
             cached_result = optimization_cache[cache_key]
             if time.time() - cached_result['timestamp'] < Config.CACHE_DURATION:
@@ -408,7 +243,7 @@ class PortfolioOptimizer:
         
         # Optimize weights (now considers both beta and return)
         # Pass strategy to optimization for target_return strategy handling
-        weights = self.optimize_portfolio_weights(selected_stocks, target_beta, individual_returns, target_return, strategy)
+        weights = self.optimize_portfolio_weights(selected_stocks, target_beta, individual_returns, target_return, strategy, engine)
         
         # STRICT REQUIREMENT: Ensure ALL selected stocks have meaningful weights
         # Check if any stocks have zero or near-zero weights
@@ -417,7 +252,7 @@ class PortfolioOptimizer:
         if stocks_with_zero_weight:
             # Re-optimize with strict constraint: ALL stocks must have at least minimum weight
             # For target_return strategy, still prioritize matching return
-            weights = self.optimize_portfolio_weights_strict(selected_stocks, target_beta, individual_returns, target_return, strategy)
+            weights = self.optimize_portfolio_weights_strict(selected_stocks, target_beta, individual_returns, target_return, strategy, engine)
         
         # Final verification: ensure all selected stocks have weights
         # For target_return strategy, use actual number of selected stocks
@@ -666,6 +501,7 @@ def optimize_portfolio():
         target_beta = data.get('target_beta', Config.DEFAULT_BETA)
         target_return = data.get('target_return')  # Can be None
         strategy = data.get('strategy', 'diversified')
+        engine = data.get('engine')  # None selects the configured engine
         
         # Convert target_return from percentage to decimal if provided
         if target_return is not None:
@@ -675,7 +511,7 @@ def optimize_portfolio():
                 target_return = target_return / 100
         
         # Optimize portfolio
-        result = optimizer.optimize(num_stocks, target_beta, target_return, strategy)
+        result = optimizer.optimize(num_stocks, target_beta, target_return, strategy, engine)
         
         if 'error' in result:
             return jsonify(result), 400
@@ -0,0 +1,68 @@
+"""
+Core portfolio optimisation logic shared by the Flask backends and the
+offline tools in ``benchmarks/``.
+
+The package has no web dependencies.  Names are loaded lazily on first
+access, so ``import portfolio_core`` is cheap and NumPy is only imported
+once an engine or the optimiser is used.
+"""
+
+import importlib
+
+# Public name -> submodule defining it
+_EXPORTS = {
+    'ALLOCATORS': 'allocation',
+    'Allocator': 'allocation',
+    'available_allocators': 'allocation',
+    'get_allocator': 'allocation',
+    'register_allocator': 'allocation',
+    'run_backtest': 'backtest',
+    'ProductionConfig': 'config',
+    'DEFAULT_ENGINE': 'engines',
+    'ENGINES': 'engines',
+    'SectorLimits': 'engines',
+    'Uncertainty': 'engines',
+    'WeightEngine': 'engines',
+    'available_engines': 'engines',
+    'get_engine': 'engines',
+    'register_engine': 'engines',
+    'sector_matrix': 'engines',
+    'MetricsRegistry': 'metrics',
+    'metrics': 'metrics',
+    'stage_timer': 'metrics',
+    'PortfolioOptimizer': 'optimizer',
+    'normalize_target_return': 'optimizer',
+    'optimization_cache': 'optimizer',
+    'PriceStore': 'prices',
+    'cost_model': 'rebalance',
+    'ingest': 'prices',
+    'RollingStatistics': 'rolling',
+    'update_store': 'rolling',
+    'portfolio_risk': 'risk',
+    'risk_summary': 'risk',
+    'standard_errors': 'risk',
+    'value_at_risk': 'risk',
+    'RequestTrace': 'tracing',
+    'annotate_trace': 'tracing',
+    'current_trace': 'tracing',
+    'set_trace': 'tracing',
+    'simulate': 'simulation',
+    'ENHANCED_STOCKS': 'universe',
+    'load_universe': 'universe',
+    'read_universe': 'universe',
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
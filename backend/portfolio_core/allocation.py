@@ -0,0 +1,623 @@
+"""
+Risk-model allocation strategies.
+
+The strategies in :meth:`PortfolioOptimizer.select_stocks` only choose
+names; the weight engines then fit weights to a target beta and return.
+The strategies registered here instead solve for the weights from the
+expected returns and the single-factor risk model of :mod:`risk`:
+
+    cov = MARKET_VOLATILITY ** 2 * beta beta^T + diag(idio ** 2)
+
+Every allocator is long-only with a per-stock floor.  It picks its
+names by solving on the whole universe (floor 0) and keeping the
+``num_stocks`` names it values most, then re-solves on those with the
+floor.  ``target_beta`` and ``target_return`` are not imposed; the result
+reports how close the allocation comes.
+
+Registered strategies:
+    * min_variance: the lowest-variance portfolio
+    * max_sharpe:   the highest Sharpe ratio on the efficient frontier
+    * risk_parity:  every stock contributes the same share of variance
+    * hrp:          hierarchical risk parity over correlation clusters
+    * tracking:     the lowest tracking error against the cap-weighted
+                    universe
+
+The first two rest on :func:`mean_variance`.  Its KKT conditions give every
+weight in closed form from two scalars, the budget multiplier ``a`` and
+the market exposure ``c`` (market variance times portfolio beta):
+
+    w = max(floor, (a + t * mu - c * beta) / idio ** 2)
+
+A damped semismooth Newton iteration on (a, c) converges in a few O(n)
+steps, and the first step is the exact answer whenever no floor binds.
+The covariance matrix is never formed.  :func:`risk_parity` works the
+same way: given the portfolio beta and the common risk contribution,
+each weight solves a quadratic.  :func:`hierarchical_risk_parity` needs
+no solve at all.
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple, Type
+
+import numpy as np
+
+from .config import ProductionConfig
+from .risk import MARKET_VOLATILITY, factor_exposures
+
+logger = logging.getLogger(__name__)
+
+NEWTON_MAX_ITER = 50
+NEWTON_TOLERANCE = 1e-12
+# Golden-section steps along the efficient frontier for max_sharpe
+FRONTIER_STEPS = 40
+GOLDEN_RATIO = (math.sqrt(5.0) - 1.0) / 2.0
+
+
+def mean_variance(
+    mu: np.ndarray,
+    beta: np.ndarray,
+    idio: np.ndarray,
+    risk_tolerance: float = 0.0,
+    floor: float = 0.0,
+    anchor: Optional[np.ndarray] = None,
+    penalty: float = 0.0,
+    multipliers: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    Weights minimising
+
+        w' cov w / 2 - risk_tolerance * mu' w + penalty * |w - anchor|^2 / 2
+
+    subject to sum(w) = 1 and w >= floor.  ``multipliers`` (a, c) from a
+    nearby solve warm-start the iteration.  Returns the weights, the
+    unclamped values ``z`` (how strongly each stock is wanted, also for
+    stocks held at the floor), the multipliers and the iteration count.
+    """
+    market_variance = MARKET_VOLATILITY ** 2
+    curvature = idio * idio + penalty
+    gain = risk_tolerance * mu + (penalty * anchor if anchor is not None and penalty > 0 else 0.0)
+    inverse = 1.0 / curvature
+
+    def jacobian(free: np.ndarray) -> np.ndarray:
+        h, bh, bbh = inverse[free].sum(), (beta * inverse)[free].sum(), (beta * beta * inverse)[free].sum()
+        return np.array([[h, -bh], [market_variance * bh, -market_variance * bbh - 1.0]])
+
+    def residual(lam: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        z = (lam[0] + gain - lam[1] * beta) * inverse
+        w = np.maximum(floor, z)
+        return np.array([w.sum() - 1.0, market_variance * (w @ beta) - lam[1]]), w, z
+
+    if multipliers is None:
+        # Exact solution if no floor binds
+        everything = np.ones(len(mu), dtype=bool)
+        rhs = np.array([1.0 - (gain * inverse).sum(), -market_variance * (beta * gain * inverse).sum()])
+        multipliers = np.linalg.solve(jacobian(everything), rhs)
+    lam = np.asarray(multipliers, dtype=float)
+    F, w, z = residual(lam)
+    norm = np.abs(F).max()
+    for iteration in range(1, NEWTON_MAX_ITER + 1):
+        if norm < NEWTON_TOLERANCE:
+            return w, z, lam, iteration
+        free = z > floor
+        if not free.any():
+            # Every stock clamped: raise the budget multiplier to free the most wanted
+            k = int(np.argmax(z))
+            lam = lam + np.array([(floor - z[k]) * curvature[k] + 1e-12, 0.0])
+            F, w, z = residual(lam)
+            norm = np.abs(F).max()
+            continue
+        step = np.linalg.lstsq(jacobian(free), F, rcond=None)[0]
+        # Halve the step until the residual shrinks
+        scale = 1.0
+        for _ in range(30):
+            trial = lam - scale * step
+            F_trial, w_trial, z_trial = residual(trial)
+            norm_trial = np.abs(F_trial).max()
+            if norm_trial < norm:
+                break
+            scale *= 0.5
+        lam, F, w, z, norm = trial, F_trial, w_trial, z_trial, norm_trial
+    return w, z, lam, NEWTON_MAX_ITER
+
+
+def sharpe_ratio(w: np.ndarray, mu: np.ndarray, beta: np.ndarray, idio: np.ndarray, risk_free_rate: float) -> float:
+    volatility = math.hypot(MARKET_VOLATILITY * float(w @ beta), float(np.sqrt((w * w) @ (idio * idio))))
+    return (float(w @ mu) - risk_free_rate) / volatility if volatility > 0 else -math.inf
+
+
+def max_sharpe(
+    mu: np.ndarray,
+    beta: np.ndarray,
+    idio: np.ndarray,
+    risk_free_rate: float,
+    floor: float = 0.0,
+    anchor: Optional[np.ndarray] = None,
+    penalty: float = 0.0
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Highest-Sharpe portfolio among the :func:`mean_variance` solutions.
+    The Sharpe ratio is unimodal along the efficient frontier, so a
+    golden-section search over the risk tolerance (mapped from [0, 1))
+    finds it, each solve warm-started from its neighbour.  Returns the
+    weights, their unclamped values and the total Newton iterations.
+    """
+    cache: Dict[float, Tuple[float, np.ndarray, np.ndarray]] = {}
+    iterations = 0
+    lam = None
+
+    def evaluate(theta: float) -> float:
+        nonlocal iterations, lam
+        if theta not in cache:
+            w, z, lam, steps = mean_variance(mu, beta, idio, theta / (1.0 - theta), floor, anchor, penalty, lam)
+            iterations += steps
+            cache[theta] = (sharpe_ratio(w, mu, beta, idio, risk_free_rate), w, z)
+        return cache[theta][0]
+
+    low, high = 0.0, 1.0 - 1e-9
+    left, right = high - GOLDEN_RATIO * (high - low), low + GOLDEN_RATIO * (high - low)
+    for _ in range(FRONTIER_STEPS):
+        # Past the point where one stock takes everything the ratio is
+        # flat; ties (up to rounding) move the search back towards the peak
+        if evaluate(left) >= evaluate(right) - 1e-12:
+            high, right = right, left
+            left = high - GOLDEN_RATIO * (high - low)
+        else:
+            low, left = left, right
+            right = low + GOLDEN_RATIO * (high - low)
+    _, w, z = max(cache.values(), key=lambda entry: entry[0])
+    return w, z, iterations
+
+
+def _solve_2x2(a: float, b: float, c: float, d: float, rhs: np.ndarray) -> np.ndarray:
+    """[[a, b], [c, d]]^-1 rhs by Cramer's rule (least squares if singular)."""
+    det = a * d - b * c
+    if det == 0.0:
+        return np.linalg.lstsq(np.array([[a, b], [c, d]]), rhs, rcond=None)[0]
+    return np.array([d * rhs[0] - b * rhs[1], a * rhs[1] - c * rhs[0]]) / det
+
+
+def risk_parity(
+    beta: np.ndarray,
+    idio: np.ndarray,
+    floor: float = 0.0,
+    start: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, int]:
+    """
+    Weights whose risk contributions w_i * (cov w)_i are equal, except
+    for stocks lifted to ``floor`` (which contribute more).  With
+    portfolio beta ``b`` and common contribution ``R`` each weight is the
+    positive root of
+
+        idio_i^2 w^2 + market_variance * beta_i * b * w = R
+
+    so Newton solves for the two scalars (b, R) with sum(w) = 1 and
+    beta' w = b.  Stocks whose root falls below the floor are fixed there
+    and the rest re-solved, until none does.  If the floors leave too
+    little budget for an exact solution (stocks with negative beta need
+    a minimum weight to contribute positive risk), every stock gets the
+    floor and the remaining budget is shared in proportion to how far
+    the closest iterate puts each free stock above it.  ``start`` (weights summing
+    to 1) seeds (b, R); equal weights otherwise.  Returns the weights and
+    the total Newton iterations.
+    """
+    market_beta = MARKET_VOLATILITY ** 2 * beta
+    variance = idio * idio
+    start = np.full(len(beta), 1.0 / len(beta)) if start is None else start
+    b = float(start @ beta)
+    R = float(np.mean(start * (market_beta * b + variance * start)))
+    fixed = np.zeros(len(beta), dtype=bool)
+    any_fixed = False
+    hedges = bool((beta < 0).any())
+
+    def residual(b: float, R: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        exposure = market_beta * b
+        root = np.sqrt(exposure * exposure + (4.0 * R) * variance)
+        # The positive root, in forms that stay accurate for either sign of the exposure
+        z = (2.0 * R) / (root + exposure)
+        if hedges:
+            z = np.where(exposure >= 0, z, (root - exposure) / (2.0 * variance))
+        w = np.where(fixed, floor, z) if any_fixed else z
+        return np.array([w.sum() - 1.0, w @ beta - b]), z, root
+
+    iterations = 0
+    while not fixed.all():
+        F, z, root = residual(b, R)
+        norm = np.abs(F).max()
+        for _ in range(NEWTON_MAX_ITER):
+            if norm < NEWTON_TOLERANCE:
+                break
+            iterations += 1
+            dR = 1.0 / root
+            db = -market_beta * z * dR
+            if any_fixed:
+                dR, db = np.where(fixed, 0.0, dR), np.where(fixed, 0.0, db)
+            step = _solve_2x2(db.sum(), dR.sum(), db @ beta - 1.0, dR @ beta, F)
+            scale = 1.0
+            for _ in range(30):
+                # Halve the step until the residual shrinks (and R stays positive)
+                b_trial, R_trial = b - scale * step[0], R - scale * step[1]
+                if R_trial > 0:
+                    F_trial, z_trial, root_trial = residual(b_trial, R_trial)
+                    norm_trial = np.abs(F_trial).max()
+                    if norm_trial < norm:
+                        break
+                scale *= 0.5
+            else:
+                break
+            b, R, F, z, root, norm = b_trial, R_trial, F_trial, z_trial, root_trial, norm_trial
+        if norm >= NEWTON_TOLERANCE:
+            excess = np.where(fixed, 0.0, np.maximum(z - floor, 0.0))
+            total = excess.sum()
+            share = excess / total if total > 0 else (~fixed) / (~fixed).sum()
+            return floor + share * (1.0 - floor * len(beta)), iterations
+        below = ~fixed & (z < floor)
+        if not below.any():
+            return np.where(fixed, floor, z), iterations
+        fixed |= below
+        any_fixed = True
+    return np.full(len(beta), 1.0 / len(beta)), iterations
+
+
+def hierarchical_risk_parity(beta: np.ndarray, idio: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """
+    Hierarchical risk parity weights for stocks in cluster ``order``
+    (see :func:`clustering.cluster_order`).  Each contiguous range of the
+    order is split in half and its weight divided between the halves in
+    inverse proportion to their variance, each half held in
+    inverse-variance weights.  Prefix sums give any range's variance in
+    O(1), so every level of the recursion is a handful of vector
+    operations and no matrix is inverted.
+    """
+    n = len(order)
+    if n == 1:
+        return np.ones(1)
+    market_variance = MARKET_VOLATILITY ** 2
+    b = beta[order]
+    idio_variance = idio[order] ** 2
+    inverse = 1.0 / (market_variance * b * b + idio_variance)
+    sums = [np.concatenate(([0.0], np.cumsum(x))) for x in (inverse, b * inverse, idio_variance * inverse * inverse)]
+
+    def cluster_variance(lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        s0, s1, s2 = (total[hi] - total[lo] for total in sums)
+        return (market_variance * s1 * s1 + s2) / (s0 * s0)
+
+    weights = np.empty(n)
+    lo, hi, share = np.array([0]), np.array([n]), np.array([1.0])
+    while len(lo):
+        mid = (lo + hi) // 2
+        left, right = cluster_variance(lo, mid), cluster_variance(mid, hi)
+        alpha = right / (left + right)
+        lo, hi, share = np.concatenate((lo, mid)), np.concatenate((mid, hi)), np.concatenate((share * alpha, share * (1.0 - alpha)))
+        single = hi - lo == 1
+        weights[order[lo[single]]] = share[single]
+        lo, hi, share = lo[~single], hi[~single], share[~single]
+    return weights
+
+
+def _lift_to_floor(weights: np.ndarray, floor: float) -> np.ndarray:
+    """Raise weights below ``floor`` to it, scaling the others down to keep the sum at 1."""
+    fixed = np.zeros(len(weights), dtype=bool)
+    while True:
+        free_total = weights[~fixed].sum()
+        weights = np.where(fixed, floor, weights * (1.0 - floor * fixed.sum()) / free_total)
+        below = ~fixed & (weights < floor)
+        if not below.any():
+            return weights
+        fixed |= below
+
+
+class Universe(NamedTuple):
+    """The optimiser's universe, for allocators that precompute over all of it."""
+    stocks: List[Dict]
+    version: int
+    store_dir: Optional[str] = None
+
+
+class Allocator:
+    """
+    Interface for allocation strategies.
+
+    :meth:`solve` returns (weights, scores) as arrays over ``stocks``:
+    the weights sum to 1 with each at or above ``floor``, and higher
+    scores mark the stocks the strategy wants more (used to pick names).
+    ``initial_weights`` (symbol -> weight) is the current portfolio; with
+    a ``turnover_penalty`` p the allocator also keeps the weights close
+    to it.  ``universe`` is the whole universe ``stocks`` come from.
+    :meth:`metrics` adds strategy-specific figures to the result.
+    """
+
+    name = ''
+    description = ''
+
+    def solve(
+        self,
+        stocks: List[Dict],
+        individual_returns: Dict[str, float],
+        floor: float = 0.0,
+        initial_weights: Optional[Dict[str, float]] = None,
+        turnover_penalty: float = 0.0,
+        risk_free_rate: float = 0.02,
+        universe: Optional[Universe] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def select(self, stocks: List[Dict], individual_returns: Dict[str, float], num_stocks: int,
+               risk_free_rate: float = 0.02, universe: Optional[Universe] = None) -> List[Dict]:
+        """The ``num_stocks`` stocks with the highest scores when solving on all of ``stocks``."""
+        weights, scores = self.solve(stocks, individual_returns, risk_free_rate=risk_free_rate, universe=universe)
+        order = np.lexsort((-scores, -weights))[:num_stocks]
+        return [stocks[i] for i in order]
+
+    def allocate(
+        self,
+        stocks: List[Dict],
+        individual_returns: Dict[str, float],
+        floor: float = 0.0,
+        initial_weights: Optional[Dict[str, float]] = None,
+        turnover_penalty: float = 0.0,
+        risk_free_rate: float = 0.02,
+        universe: Optional[Universe] = None
+    ) -> Dict[str, float]:
+        """:meth:`solve` as float weights keyed by symbol."""
+        weights, _ = self.solve(stocks, individual_returns, floor, initial_weights, turnover_penalty, risk_free_rate,
+                                universe)
+        return {stock['symbol']: float(w) for stock, w in zip(stocks, weights)}
+
+    def metrics(self, stocks: List[Dict], weights: Dict[str, float], universe: Optional[Universe] = None) -> Dict:
+        return {}
+
+
+ALLOCATORS: Dict[str, Type[Allocator]] = {}
+_instances: Dict[str, Allocator] = {}
+
+
+def register_allocator(cls: Type[Allocator]) -> Type[Allocator]:
+    """Class decorator adding an allocation strategy to the registry."""
+    ALLOCATORS[cls.name] = cls
+    return cls
+
+
+def available_allocators() -> List[str]:
+    return sorted(ALLOCATORS)
+
+
+def get_allocator(name: str) -> Optional[Allocator]:
+    """The shared allocator for strategy ``name``, or None if it is not an allocation strategy."""
+    allocator = _instances.get(name)
+    if allocator is None and name in ALLOCATORS:
+        allocator = _instances[name] = ALLOCATORS[name]()
+    return allocator
+
+
+def _holdings(stocks: List[Dict], initial_weights: Optional[Dict[str, float]]) -> Optional[np.ndarray]:
+    """The current holdings over ``stocks``, rescaled to sum to 1 (None without any)."""
+    if not initial_weights:
+        return None
+    start = np.array([max(initial_weights.get(stock['symbol'], 0.0), 0.0) for stock in stocks])
+    total = start.sum()
+    return start / total if total > 0 else None
+
+
+@register_allocator
+class MinVarianceAllocator(Allocator):
+    name = 'min_variance'
+    description = 'Lowest-variance portfolio under the factor model'
+
+    def solve(self, stocks, individual_returns, floor=0.0, initial_weights=None, turnover_penalty=0.0,
+              risk_free_rate=0.02, universe=None):
+        mu, beta, idio = factor_exposures(stocks, individual_returns)
+        w, z, _, _ = mean_variance(mu, beta, idio, 0.0, floor, _holdings(stocks, initial_weights),
+                                   turnover_penalty)
+        return w, z
+
+
+@register_allocator
+class MaxSharpeAllocator(Allocator):
+    name = 'max_sharpe'
+    description = 'Highest Sharpe ratio on the efficient frontier under the factor model'
+
+    def solve(self, stocks, individual_returns, floor=0.0, initial_weights=None, turnover_penalty=0.0,
+              risk_free_rate=0.02, universe=None):
+        mu, beta, idio = factor_exposures(stocks, individual_returns)
+        w, z, _ = max_sharpe(mu, beta, idio, risk_free_rate, floor, _holdings(stocks, initial_weights),
+                             turnover_penalty)
+        return w, z
+
+
+@register_allocator
+class RiskParityAllocator(Allocator):
+    """
+    Equal risk contributions.  Warm-started from ``initial_weights``; the
+    solution is unique, so ``turnover_penalty`` does not apply.
+    """
+
+    name = 'risk_parity'
+    description = 'Equal risk contributions under the factor model'
+
+    def solve(self, stocks, individual_returns, floor=0.0, initial_weights=None, turnover_penalty=0.0,
+              risk_free_rate=0.02, universe=None):
+        _, beta, idio = factor_exposures(stocks, individual_returns)
+        w, _ = risk_parity(beta, idio, floor, _holdings(stocks, initial_weights))
+        return w, w
+
+
+@register_allocator
+class HRPAllocator(Allocator):
+    """
+    Hierarchical risk parity.  The cluster order of the whole universe
+    is computed once per universe version (and symbol set) and reused:
+    any subset keeps the relative order of its stocks, so a request only
+    pays for the O(n log n) bisection.  The weights depend only on the
+    risk model and that order, so they are stable between requests and
+    ``initial_weights`` and ``turnover_penalty`` do not apply.
+    """
+
+    name = 'hrp'
+    description = 'Hierarchical risk parity over correlation clusters'
+
+    # Universes whose cluster order is kept
+    CACHE_SIZE = 4
+
+    def __init__(self) -> None:
+        self._positions: Dict[Tuple, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def solve(self, stocks, individual_returns, floor=0.0, initial_weights=None, turnover_penalty=0.0,
+              risk_free_rate=0.02, universe=None):
+        _, beta, idio = factor_exposures(stocks, individual_returns)
+        w = _lift_to_floor(hierarchical_risk_parity(beta, idio, self.order(stocks, universe)), floor)
+        return w, w
+
+    def order(self, stocks: List[Dict], universe: Optional[Universe] = None) -> np.ndarray:
+        """Cluster order of ``stocks``, taken from the universe's when possible."""
+        from .clustering import cluster_order, correlation
+        if universe is not None:
+            positions = self.positions(universe)
+            ranks = [positions.get(stock['symbol']) for stock in stocks]
+            if None not in ranks:
+                return np.argsort(ranks, kind='stable')
+        return cluster_order(correlation(stocks, universe.store_dir if universe is not None else None))
+
+    def positions(self, universe: Universe) -> Dict[str, int]:
+        """Position of every universe symbol in the universe's cluster order (cached)."""
+        from .clustering import cluster_order, correlation
+        key = (universe.store_dir, universe.version, hash(tuple(stock['symbol'] for stock in universe.stocks)))
+        with self._lock:
+            positions = self._positions.get(key)
+            if positions is None:
+                start = time.perf_counter()
+                order = cluster_order(correlation(universe.stocks, universe.store_dir))
+                positions = {universe.stocks[i]['symbol']: position for position, i in enumerate(order)}
+                if len(self._positions) >= self.CACHE_SIZE:
+                    self._positions.pop(next(iter(self._positions)))
+                self._positions[key] = positions
+                logger.info(f"Clustered {len(order)} stocks (universe version {universe.version}) in {time.perf_counter() - start:.3f}s")
+        return positions
+
+
+def cap_weights(stocks: List[Dict]) -> np.ndarray:
+    """Market-cap weights of ``stocks`` (equal weights if no caps are known)."""
+    caps = np.array([max(stock.get('market_cap') or 0.0, 0.0) for stock in stocks], dtype=float)
+    total = caps.sum()
+    return caps / total if total > 0 else np.full(len(stocks), 1.0 / len(stocks))
+
+
+@register_allocator
+class TrackingAllocator(Allocator):
+    """
+    Index tracking.  The benchmark holds the whole universe (``stocks``
+    when no universe is given) by market cap.  Under the factor model the
+    squared tracking error of weights w against benchmark weights b is
+
+        market_variance * (beta' (w - b))^2 + sum(idio^2 * (w - b)^2)
+
+    which is :func:`mean_variance` with ``mu = market_variance *
+    benchmark_beta * beta + idio^2 * b`` and unit risk tolerance, so a
+    refit on any set of names takes a few O(n) steps.
+
+    Names are added greedily: after each refit the multipliers give
+    every stock outside the portfolio its unclamped weight ``z`` (how
+    much the refit would hold), and the stock with the largest joins.
+    Swap passes then try replacing each holding, smallest first, with the
+    ``SWAP_CANDIDATES`` stocks outside that have the largest ``z``,
+    keeping the swap that lowers the tracking error most, until a pass
+    improves nothing.  Once ``TIME_BUDGET`` seconds have passed, the
+    remaining places go to the next highest ``z`` at once and no more
+    swaps are tried.  A ``turnover_penalty`` keeps the refit close to
+    ``initial_weights``.
+    """
+
+    name = 'tracking'
+    description = 'Lowest tracking error against the cap-weighted universe'
+
+    TIME_BUDGET = ProductionConfig.TRACKING_TIME_BUDGET
+    SWAP_CANDIDATES = 4
+
+    @staticmethod
+    def benchmark(universe_stocks: List[Dict]) -> Tuple[Dict[str, int], np.ndarray, np.ndarray, np.ndarray, float]:
+        """Index by symbol, beta, idiosyncratic volatility, cap weights and beta of the benchmark."""
+        _, beta, idio = factor_exposures(universe_stocks, {})
+        weights = cap_weights(universe_stocks)
+        index = {stock['symbol']: i for i, stock in enumerate(universe_stocks)}
+        return index, beta, idio, weights, float(weights @ beta)
+
+    @staticmethod
+    def _gain(beta: np.ndarray, idio: np.ndarray, weights: np.ndarray, benchmark_beta: float) -> np.ndarray:
+        return MARKET_VOLATILITY ** 2 * benchmark_beta * beta + idio * idio * weights
+
+    def select(self, stocks, individual_returns, num_stocks, risk_free_rate=0.02, universe=None):
+        _, beta, idio, weights, benchmark_beta = self.benchmark(stocks)
+        market_variance = MARKET_VOLATILITY ** 2
+        gain = self._gain(beta, idio, weights, benchmark_beta)
+        curvature = idio * idio
+        num_stocks = min(num_stocks, len(stocks))
+        deadline = time.perf_counter() + self.TIME_BUDGET
+
+        def refit(chosen: List[int], lam: Optional[np.ndarray] = None) -> Tuple[np.ndarray, float, np.ndarray]:
+            """Multipliers, squared tracking error (up to a constant) and weights of the refit on ``chosen``."""
+            rows = np.array(chosen)
+            w, _, lam, _ = mean_variance(gain[rows], beta[rows], idio[rows], 1.0, 0.0, multipliers=lam)
+            active = w - weights[rows]
+            error = market_variance * (w @ beta[rows] - benchmark_beta) ** 2 + curvature[rows] @ (active * active - weights[rows] ** 2)
+            return lam, float(error), w
+
+        def wanted(lam: np.ndarray, held: np.ndarray) -> np.ndarray:
+            return np.where(held, -np.inf, (lam[0] + gain - lam[1] * beta) / curvature)
+
+        # The single stock closest to the benchmark on its own
+        first = int(np.argmin(market_variance * (beta - benchmark_beta) ** 2 + curvature * (1.0 - 2.0 * weights)))
+        chosen = [first]
+        held = np.zeros(len(stocks), dtype=bool)
+        held[first] = True
+        lam = None
+        while len(chosen) < num_stocks:
+            lam, _, _ = refit(chosen, lam)
+            z = wanted(lam, held)
+            if time.perf_counter() > deadline:
+                rest = np.argpartition(-z, num_stocks - len(chosen) - 1)[:num_stocks - len(chosen)]
+                logger.info(f"Tracking selection hit its time budget at {len(chosen)} of {num_stocks} stocks")
+                chosen.extend(int(i) for i in rest)
+                break
+            best = int(np.argmax(z))
+            chosen.append(best)
+            held[best] = True
+
+        lam, error, w = refit(chosen)
+        improved = 1 < len(chosen) < len(stocks)
+        while improved and time.perf_counter() <= deadline:
+            improved = False
+            for stock in [chosen[i] for i in np.argsort(w)]:
+                if time.perf_counter() > deadline:
+                    break
+                rest = [i for i in chosen if i != stock]
+                lam_rest, _, _ = refit(rest, lam)
+                z = wanted(lam_rest, held)
+                count = min(self.SWAP_CANDIDATES, len(stocks) - len(chosen))
+                trials = [(refit(rest + [int(c)], lam_rest), int(c)) for c in np.argpartition(-z, count - 1)[:count]]
+                (lam_trial, error_trial, w_trial), candidate = min(trials, key=lambda trial: trial[0][1])
+                if error_trial < error - 1e-12:
+                    chosen, lam, error, w = rest + [candidate], lam_trial, error_trial, w_trial
+                    held[stock], held[candidate] = False, True
+                    improved = True
+        return [stocks[i] for i in chosen]
+
+    def solve(self, stocks, individual_returns, floor=0.0, initial_weights=None, turnover_penalty=0.0,
+              risk_free_rate=0.02, universe=None):
+        index, beta, idio, weights, benchmark_beta = self.benchmark(universe.stocks if universe is not None else stocks)
+        rows = np.array([index.get(stock['symbol'], -1) for stock in stocks])
+        b = np.where(rows >= 0, weights[rows], 0.0)
+        _, beta, idio = factor_exposures(stocks, individual_returns)
+        w, z, _, _ = mean_variance(self._gain(beta, idio, b, benchmark_beta), beta, idio, 1.0, floor,
+                                   _holdings(stocks, initial_weights), turnover_penalty)
+        return w, z
+
+    def metrics(self, stocks, weights, universe=None):
+        """Annualised tracking error and the benchmark's beta."""
+        universe_stocks = universe.stocks if universe is not None else stocks
+        _, beta, idio, benchmark, benchmark_beta = self.benchmark(universe_stocks)
+        active = np.array([weights.get(stock['symbol'], 0.0) for stock in universe_stocks]) - benchmark
+        error = math.sqrt(MARKET_VOLATILITY ** 2 * float(active @ beta) ** 2 + float((idio * idio) @ (active * active)))
+        return {'tracking_error': round(error, 6), 'benchmark_beta': round(benchmark_beta, 3)}
@@ -0,0 +1,275 @@
+"""
+Vectorised backtester for optimiser strategies.
+
+Replays a price store: every ``rebalance`` trading days the optimiser is
+re-run on a universe estimated only from the bars before that day, and
+the weights are held until the next rebalance.  The estimates come from
+:class:`rolling.RollingStatistics`, so moving forward one rebalance
+costs O(n) per bar instead of a pass over the whole history.  Each
+holding period is evaluated with array operations over all of its
+dates at once.  The cumulative growth of every held stock gives the
+portfolio value (one matrix product), its daily returns, and the
+drifted weights that the next rebalance trades from.  Consecutive
+solves are warm-started from those drifted holdings (keeping the held
+stocks, optionally with a turnover penalty).
+
+Turnover is the fraction of portfolio value bought at a rebalance (1.0
+for the initial purchase from cash).  A missing return (a stock delisted
+mid-period) counts as zero, so the position is held at its last price.
+
+Usage (from ``backend/``):
+    python -m portfolio_core.backtest data/store --rebalance 21 --num-stocks 10 --target-beta 1.0
+    python -m portfolio_core.backtest data/store --strategy target_return --target-return 12 --engine exact -o bt.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import ProductionConfig
+from .prices import MIN_OBSERVATIONS, TRADING_DAYS, PriceStore, read_statistics
+from .rolling import RollingStatistics
+from .universe import stocks_from_statistics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REBALANCE = 21
+
+
+def hold(returns: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Buy and hold ``weights`` (k, summing to 1) through ``returns`` (k x L
+    daily returns, NaN when missing).  Returns the portfolio's L daily
+    returns and its drifted weights at the end of the period.
+    """
+    growth = np.cumprod(1.0 + np.nan_to_num(np.asarray(returns, dtype=np.float64), nan=0.0), axis=1)
+    value = weights @ growth
+    daily = value / np.concatenate(([weights.sum()], value[:-1])) - 1.0
+    return daily, weights * growth[:, -1] / value[-1]
+
+
+def performance(daily: np.ndarray, risk_free_rate: float) -> Dict[str, Optional[float]]:
+    """Realised return, volatility, Sharpe ratio and drawdown of a daily return series."""
+    if not len(daily):
+        return {'total_return': 0.0, 'annualized_return': 0.0, 'volatility': 0.0, 'sharpe_ratio': None, 'max_drawdown': 0.0}
+    value = np.cumprod(1.0 + daily)
+    total = float(value[-1] - 1.0)
+    volatility = float(daily.std(ddof=1) * math.sqrt(TRADING_DAYS)) if len(daily) > 1 else 0.0
+    sharpe = (float(daily.mean()) * TRADING_DAYS - risk_free_rate) / volatility if volatility > 0 else None
+    drawdown = 1.0 - value / np.maximum.accumulate(np.concatenate(([1.0], value)))[1:]
+    return {
+        'total_return': round(total, 6),
+        'annualized_return': round((1.0 + total) ** (TRADING_DAYS / len(daily)) - 1.0, 6),
+        'volatility': round(volatility, 6),
+        'sharpe_ratio': round(sharpe, 4) if sharpe is not None else None,
+        'max_drawdown': round(float(drawdown.max()), 6)
+    }
+
+
+def run_backtest(
+    store_dir: str,
+    num_stocks: int = 10,
+    target_beta: float = 1.0,
+    target_return: Optional[float] = None,
+    strategy: str = 'diversified',
+    engine: Optional[str] = None,
+    rebalance: int = DEFAULT_REBALANCE,
+    halflife: Optional[float] = None,
+    window: Optional[int] = None,
+    min_observations: int = MIN_OBSERVATIONS,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    warm_start: bool = True,
+    turnover_penalty: float = 0.0,
+    seed: Optional[int] = None
+) -> Dict:
+    """
+    Backtest one optimiser configuration over the store in ``store_dir``
+    between ``start`` and ``end`` (ISO dates, default: the whole history
+    after ``min_observations`` warm-up bars).  Raises ``ValueError`` for
+    invalid settings.
+    """
+    from .engines import get_engine
+    from .optimizer import PortfolioOptimizer, turnover
+
+    total_start = time.perf_counter()
+    if rebalance < 1:
+        raise ValueError('rebalance must be at least 1 day')
+    if turnover_penalty < 0:
+        raise ValueError('turnover_penalty must not be negative')
+    optimizer = PortfolioOptimizer()
+    # The universe is set per rebalance; never reload the live one
+    optimizer.store_dir = None
+    if strategy == 'target_return' and target_return is None:
+        raise ValueError('Target Return strategy requires a target return to be specified')
+    if strategy != 'target_return':
+        is_valid, error_msg = optimizer.validate_inputs(num_stocks, target_beta, target_return)
+        if not is_valid:
+            raise ValueError(error_msg)
+    engine = get_engine(engine).name
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed % 2 ** 32)
+
+    store = PriceStore(store_dir)
+    first = int(np.searchsorted(store.dates, np.datetime64(start))) if start else 0
+    first = max(first, min_observations + 1)
+    stop = int(np.searchsorted(store.dates, np.datetime64(end), side='right')) if end else len(store.dates)
+    if first >= stop:
+        raise ValueError(f"Not enough history: need {min_observations} bars before the first rebalance")
+    try:
+        metadata = {entry['symbol']: entry for entry in read_statistics(store_dir)['symbols']}
+    except (OSError, ValueError, KeyError):
+        metadata = {}
+
+    state = RollingStatistics(store.symbols, halflife, window)
+    column = {symbol: i for i, symbol in enumerate(store.symbols)}
+    holdings: Dict[str, float] = {}
+    periods: List[Dict] = []
+    daily_returns: List[np.ndarray] = []
+    timing = {'estimation': 0.0, 'optimization': 0.0, 'holding': 0.0}
+
+    for t in range(first, stop, rebalance):
+        period_end = min(t + rebalance, stop)
+
+        # Universe from the bars before t only
+        stage_start = time.perf_counter()
+        state.update_from_store(store, stop=t)
+        stats = state.statistics(min_observations)
+        listed = ~np.isnan(np.asarray(store.returns[:len(store.symbols), t - 1], dtype=np.float64))
+        entries = []
+        for i in np.flatnonzero(listed & ~np.isnan(stats['beta'])):
+            symbol = store.symbols[i]
+            entry = {k: v for k, v in metadata.get(symbol, {}).items() if k in ('name', 'sector', 'market_cap')}
+            entry['symbol'] = symbol
+            for name in ('beta', 'mean_return', 'volatility', 'idiosyncratic_volatility'):
+                entry[name] = float(stats[name][i])
+            entries.append(entry)
+        optimizer.stocks = stocks_from_statistics(entries)
+        timing['estimation'] += time.perf_counter() - stage_start
+
+        # Re-optimise, warm-started from the drifted holdings
+        stage_start = time.perf_counter()
+        if optimizer.stocks:
+            result = optimizer.compute(num_stocks, target_beta, target_return, strategy, engine,
+                                       holdings if warm_start else None, turnover_penalty)
+        else:
+            result = {'error': 'empty universe'}
+        runtime = time.perf_counter() - stage_start
+        timing['optimization'] += runtime
+        if 'error' in result:
+            # Nothing to trade into: keep the current holdings
+            logger.warning(f"No rebalance on {store.dates[t]}: {result['error']}")
+            weights = holdings
+        else:
+            weights = result['weights']
+
+        stage_start = time.perf_counter()
+        traded = turnover(holdings, weights)
+        symbols = [symbol for symbol, weight in weights.items() if weight > 0]
+        if symbols:
+            vector = np.array([weights[symbol] for symbol in symbols])
+            rows = np.array([column[symbol] for symbol in symbols])
+            daily, drifted = hold(store.returns[rows, t:period_end], vector / vector.sum())
+            holdings = dict(zip(symbols, drifted.tolist()))
+        else:
+            daily = np.zeros(period_end - t)
+        daily_returns.append(daily)
+        timing['holding'] += time.perf_counter() - stage_start
+
+        realized = performance(daily, ProductionConfig.RISK_FREE_RATE)
+        periods.append({
+            'date': str(store.dates[t]),
+            'universe': len(optimizer.stocks),
+            'stocks': len(symbols),
+            'rebalanced': 'error' not in result,
+            'turnover': round(traded, 4),
+            'expected_return': result.get('expected_return'),
+            'beta': result.get('actual_beta'),
+            'return': realized['total_return'],
+            'volatility': realized['volatility'],
+            'sharpe_ratio': realized['sharpe_ratio'],
+            'runtime': round(runtime, 4)
+        })
+
+    daily = np.concatenate(daily_returns)
+    summary = performance(daily, ProductionConfig.RISK_FREE_RATE)
+    # Initial purchase excluded: turnover per year of subsequent trading
+    years = len(daily) / TRADING_DAYS
+    annual_turnover = sum(period['turnover'] for period in periods[1:]) / years if years > 0 else 0.0
+    timing = {stage: round(seconds, 3) for stage, seconds in timing.items()}
+    timing['total'] = round(time.perf_counter() - total_start, 3)
+    logger.info(f"Backtest of {len(periods)} rebalances over {len(daily)} days in {timing['total']}s")
+    return dict(
+        summary,
+        start=str(store.dates[first]),
+        end=str(store.dates[stop - 1]),
+        days=len(daily),
+        rebalances=len(periods),
+        strategy=strategy,
+        engine=engine,
+        estimator=state.method,
+        warm_start=warm_start,
+        turnover_penalty=turnover_penalty,
+        annual_turnover=round(annual_turnover, 4),
+        timing=timing,
+        periods=periods
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from .optimizer import normalize_target_return
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('store', help='price store directory')
+    parser.add_argument('--num-stocks', type=int, default=10)
+    parser.add_argument('--target-beta', type=float, default=1.0)
+    parser.add_argument('--target-return', type=float, help='target return, as a decimal or percentage (e.g. 0.12 or 12)')
+    parser.add_argument('--strategy', default='diversified')
+    parser.add_argument('--engine', help='weight engine (default: the configured default)')
+    parser.add_argument('--rebalance', type=int, default=DEFAULT_REBALANCE, help='trading days between rebalances')
+    estimator = parser.add_mutually_exclusive_group()
+    estimator.add_argument('--halflife', type=float, help='exponential weighting half-life in days for the estimates')
+    estimator.add_argument('--window', type=int, help='fixed estimation window in days')
+    parser.add_argument('--min-observations', type=int, default=MIN_OBSERVATIONS,
+                        help='fewest observations for a symbol to enter the universe')
+    parser.add_argument('--start', help='first rebalance date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='last date held (YYYY-MM-DD)')
+    parser.add_argument('--no-warm-start', action='store_true', help='solve every rebalance from scratch')
+    parser.add_argument('--turnover-penalty', type=float, default=0.0,
+                        help='cost per unit of turnover added to the fitting error of warm-started solves')
+    parser.add_argument('--seed', type=int, help='seed the random stock selection and search')
+    parser.add_argument('--summary', action='store_true', help='omit the per-rebalance table')
+    parser.add_argument('-o', '--output', help='write JSON here instead of stdout')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    try:
+        report = run_backtest(
+            args.store, args.num_stocks, args.target_beta, normalize_target_return(args.target_return),
+            args.strategy, args.engine, args.rebalance, args.halflife, args.window, args.min_observations,
+            args.start, args.end, not args.no_warm_start, args.turnover_penalty, args.seed
+        )
+    except (OSError, ValueError) as e:
+        print(f"Backtest failed: {e}", file=sys.stderr)
+        return 1
+    if args.summary:
+        report.pop('periods')
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
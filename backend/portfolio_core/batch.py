@@ -0,0 +1,256 @@
+"""
+Batch optimiser: stream JSONL requests through a process pool.
+
+Each input line is a JSON object with the same fields as the
+``/api/optimize`` body (``num_stocks``, ``target_beta``,
+``target_return``, ``strategy``, ``engine``, ``current_weights``,
+``turnover_penalty``, ``sector_limits``, ``robust``) plus an optional ``id``
+echoed back in the output.  Each output line holds the ``line`` number, the ``id`` and
+either ``result`` or ``error``.
+
+Input is read lazily and at most ``--max-in-flight`` chunks are
+submitted at a time, so memory stays constant however long the input
+is.  Results are written in input order by default, or as they complete
+with ``--unordered``.  Progress and throughput go to stderr.
+
+Usage (from ``backend/``):
+    python -m portfolio_core.batch requests.jsonl -o results.jsonl
+    cat requests.jsonl | python -m portfolio_core.batch - --workers 8 --unordered
+    python -m portfolio_core.batch requests.jsonl --seed 1 --cache-limit 0   # reproducible for any --workers
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+
+from .config import ProductionConfig
+
+# (line number, parsed request or parse error message)
+Task = Tuple[int, object]
+
+# Worker-process state, set up by _init_worker
+_optimizer = None
+_cache_limit = 0
+_seed: Optional[int] = None
+
+
+def _init_worker(cache_limit: int, seed: Optional[int], log_level: int) -> None:
+    global _optimizer, _cache_limit, _seed
+    from .optimizer import PortfolioOptimizer
+    logging.getLogger('portfolio_core').setLevel(log_level)
+    _optimizer = PortfolioOptimizer()
+    _cache_limit = cache_limit
+    _seed = seed
+
+
+def _run_one(line: int, request: object) -> Dict:
+    from .optimizer import normalize_target_return, optimization_cache
+    if not isinstance(request, dict):
+        return {'line': line, 'error': str(request)}
+    entry: Dict = {'line': line}
+    if 'id' in request:
+        entry['id'] = request['id']
+    if _seed is not None:
+        # Seed per line so results do not depend on scheduling
+        import random
+        import numpy as np
+        random.seed(_seed + line)
+        np.random.seed((_seed + line) % 2 ** 32)
+    try:
+        num_stocks = request.get('num_stocks', ProductionConfig.DEFAULT_STOCKS)
+        target_beta = request.get('target_beta', ProductionConfig.DEFAULT_BETA)
+        num_stocks = int(num_stocks) if num_stocks is not None else ProductionConfig.DEFAULT_STOCKS
+        target_beta = float(target_beta) if target_beta is not None else ProductionConfig.DEFAULT_BETA
+        result = _optimizer.optimize(
+            num_stocks,
+            target_beta,
+            normalize_target_return(request.get('target_return')),
+            request.get('strategy', 'diversified'),
+            request.get('engine'),
+            request.get('current_weights'),
+            request.get('turnover_penalty', 0.0),
+            request.get('sector_limits'),
+            request.get('robust')
+        )
+    except Exception as e:
+        entry['error'] = f"{type(e).__name__}: {e}"
+        return entry
+    if 'error' in result:
+        entry['error'] = result['error']
+    else:
+        entry['result'] = result
+    if len(optimization_cache) > _cache_limit:
+        # Keep worker memory bounded on long runs
+        optimization_cache.clear()
+    return entry
+
+
+def _run_chunk(chunk: List[Task]) -> List[Dict]:
+    return [_run_one(line, request) for line, request in chunk]
+
+
+def read_requests(stream: IO[str]) -> Iterator[Task]:
+    """Yield (line number, request) pairs; malformed lines yield an error message."""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            yield line_number, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(request, dict):
+            yield line_number, 'Request must be a JSON object'
+            continue
+        yield line_number, request
+
+
+def chunked(tasks: Iterator[Task], size: int) -> Iterator[List[Task]]:
+    chunk: List[Task] = []
+    for task in tasks:
+        chunk.append(task)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Progress:
+    """Throttled progress and throughput reporting on stderr."""
+
+    def __init__(self, interval: float, stream: IO[str] = sys.stderr) -> None:
+        self.interval = interval
+        self.stream = stream
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.done = 0
+        self.errors = 0
+
+    def update(self, entries: List[Dict]) -> None:
+        self.done += len(entries)
+        self.errors += sum(1 for entry in entries if 'error' in entry)
+        now = time.perf_counter()
+        if self.interval > 0 and now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report(now)
+
+    def report(self, now: Optional[float] = None) -> None:
+        elapsed = (now or time.perf_counter()) - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        print(f"{self.done} done, {self.errors} errors, {elapsed:.1f}s, {rate:.1f} req/s", file=self.stream, flush=True)
+
+
+def _write(out: IO[str], entries: List[Dict]) -> None:
+    for entry in entries:
+        # default=float covers NumPy scalars
+        out.write(json.dumps(entry, separators=(',', ':'), default=float) + '\n')
+
+
+def run_batch(
+    tasks: Iterator[Task],
+    out: IO[str],
+    workers: int,
+    chunk_size: int,
+    max_in_flight: int,
+    ordered: bool,
+    progress: Progress,
+    cache_limit: int = 1000,
+    seed: Optional[int] = None,
+    log_level: int = logging.WARNING
+) -> None:
+    chunks = chunked(tasks, chunk_size)
+    if workers == 0:
+        _init_worker(cache_limit, seed, log_level)
+        for chunk in chunks:
+            entries = _run_chunk(chunk)
+            _write(out, entries)
+            progress.update(entries)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cache_limit, seed, log_level)) as pool:
+        if ordered:
+            # Futures in submission order; the head is written first, so a
+            # slow chunk holds back later output but never grows the window.
+            pending: deque = deque()
+            for chunk in chunks:
+                if len(pending) >= max_in_flight:
+                    entries = pending.popleft().result()
+                    _write(out, entries)
+                    progress.update(entries)
+                pending.append(pool.submit(_run_chunk, chunk))
+            while pending:
+                entries = pending.popleft().result()
+                _write(out, entries)
+                progress.update(entries)
+        else:
+            running: set = set()
+
+            def drain() -> None:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.discard(future)
+                    entries = future.result()
+                    _write(out, entries)
+                    progress.update(entries)
+
+            for chunk in chunks:
+                if len(running) >= max_in_flight:
+                    drain()
+                running.add(pool.submit(_run_chunk, chunk))
+            while running:
+                drain()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help="JSONL requests file, or '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="JSONL results file (default: stdout)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (0 runs in-process)')
+    parser.add_argument('--chunk-size', type=int, default=8, help='requests sent to a worker at a time')
+    parser.add_argument('--max-in-flight', type=int, help='chunks submitted but not yet written (default: 4 per worker)')
+    parser.add_argument('--unordered', action='store_true', help='write results as they complete')
+    parser.add_argument('--cache-limit', type=int, default=1000,
+                        help="clear a worker's result cache above this many entries (0 disables caching)")
+    parser.add_argument('--seed', type=int,
+                        help='seed each request with SEED + line number; with --cache-limit 0 results '
+                             'do not depend on worker count or order')
+    parser.add_argument('--progress-interval', type=float, default=5.0, help='seconds between progress lines (0 = off)')
+    parser.add_argument('--verbose', action='store_true', help='log each optimisation')
+    args = parser.parse_args(argv)
+
+    max_in_flight = args.max_in_flight or 4 * max(args.workers, 1)
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    out = sys.stdout if args.output == '-' else open(args.output, 'w')
+    progress = Progress(args.progress_interval)
+    try:
+        run_batch(read_requests(source), out, args.workers, max(1, args.chunk_size), max(1, max_in_flight),
+                  not args.unordered, progress, args.cache_limit, args.seed, log_level)
+    except KeyboardInterrupt:
+        print('Interrupted', file=sys.stderr)
+        return 130
+    finally:
+        out.flush()
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    progress.report()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
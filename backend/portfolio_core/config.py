@@ -0,0 +1,81 @@
+"""
+Settings shared by the optimisation core and the Flask backend.
+
+Values are read from environment variables once, at import time.
+"""
+
+import os
+
+# backend/, where runtime files (profiles, captures) are written by default
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ProductionConfig:
+    RISK_FREE_RATE = 0.02
+    # Price store built by ``python -m portfolio_core.prices ingest``; when
+    # set, its symbols and historical statistics replace the built-in
+    # universe.
+    PRICE_STORE_DIR = os.environ.get('PRICE_STORE_DIR', '')
+    # Seconds between checks for rewritten store statistics (a new
+    # universe version invalidates cached results)
+    UNIVERSE_CHECK_INTERVAL = float(os.environ.get('UNIVERSE_CHECK_INTERVAL', 5.0))
+    MIN_STOCKS = 1
+    MAX_STOCKS = 50
+    DEFAULT_STOCKS = 10
+    DEFAULT_BETA = 1.0
+    CACHE_DURATION = 300  # 5 minutes
+    # Expired entries younger than CACHE_DURATION + STALE_WHILE_REVALIDATE
+    # are served immediately while one background refresh recomputes them.
+    # Set to 0 to disable stale serving.
+    STALE_WHILE_REVALIDATE = int(os.environ.get('STALE_WHILE_REVALIDATE', 60))
+    # Admission control for /api/optimize (limits are per worker process).
+    # Cache hits and requests joining an in-flight search bypass the limiter.
+    MAX_CONCURRENT_OPTIMIZATIONS = int(os.environ.get('MAX_CONCURRENT_OPTIMIZATIONS', 4))
+    MAX_QUEUED_OPTIMIZATIONS = int(os.environ.get('MAX_QUEUED_OPTIMIZATIONS', 8))
+    QUEUE_TIMEOUT = float(os.environ.get('QUEUE_TIMEOUT', 5.0))  # seconds
+    # Per-client token bucket for uncached searches; 0 disables rate limiting
+    RATE_LIMIT_PER_MINUTE = int(os.environ.get('RATE_LIMIT_PER_MINUTE', 30))
+    RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', 10))
+    # Buckets kept at most; the least recently seen client is dropped first
+    RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 10000))
+    # Reverse proxies in front of the app.  Clients are identified by the
+    # X-Forwarded-For entry this many hops from the right; with 0 the
+    # header is ignored, since clients can set it to anything.
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+    # Admin endpoints (profiling) are disabled unless ADMIN_TOKEN is set;
+    # callers authenticate with an X-Admin-Token header.
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+    # On-demand profiling of /api/optimize: 'sample' writes collapsed stacks
+    # (flame graph input), 'cprofile' writes pstats files.
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(BACKEND_DIR, 'profiles'))
+    PROFILE_MODE = os.environ.get('PROFILE_MODE', 'sample')
+    PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))  # seconds
+    PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 50))
+    # Opt-in capture of normalised /api/optimize requests for replay
+    # (benchmarks/replay.py).  The file rotates at CAPTURE_MAX_BYTES.
+    CAPTURE_REQUESTS = os.environ.get('CAPTURE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+    CAPTURE_FILE = os.environ.get('CAPTURE_FILE', os.path.join(BACKEND_DIR, 'captures', 'optimize_requests.jsonl'))
+    CAPTURE_MAX_BYTES = int(os.environ.get('CAPTURE_MAX_BYTES', 10 * 1024 * 1024))
+    CAPTURE_BACKUPS = int(os.environ.get('CAPTURE_BACKUPS', 5))
+    CAPTURE_SAMPLE_RATE = float(os.environ.get('CAPTURE_SAMPLE_RATE', 1.0))
+    # Monte Carlo simulation (/api/simulate).  SIMULATION_MAX_DRAWS caps
+    # paths x steps per request.
+    SIMULATION_DEFAULT_PATHS = int(os.environ.get('SIMULATION_DEFAULT_PATHS', 10000))
+    SIMULATION_MAX_PATHS = int(os.environ.get('SIMULATION_MAX_PATHS', 1000000))
+    SIMULATION_MAX_DRAWS = int(os.environ.get('SIMULATION_MAX_DRAWS', 50000000))
+    SIMULATION_MAX_HORIZON_YEARS = 30
+    SIMULATION_MAX_STEPS_PER_YEAR = 252
+    # VaR/CVaR screening (/api/risk)
+    RISK_MAX_PORTFOLIOS = int(os.environ.get('RISK_MAX_PORTFOLIOS', 10000))
+    RISK_MAX_HORIZON_DAYS = 252
+    # Cost-aware rebalancing (/api/rebalance)
+    REBALANCE_TURNOVER_CAP = float(os.environ.get('REBALANCE_TURNOVER_CAP', 0.25))
+    REBALANCE_PORTFOLIO_VALUE = float(os.environ.get('REBALANCE_PORTFOLIO_VALUE', 1000000))
+    REBALANCE_CANDIDATES = int(os.environ.get('REBALANCE_CANDIDATES', 4096))
+    REBALANCE_MAX_CANDIDATES = int(os.environ.get('REBALANCE_MAX_CANDIDATES', 100000))
+    # Seconds the tracking strategy spends adding names one at a time
+    # before filling the rest in one step
+    TRACKING_TIME_BUDGET = float(os.environ.get('TRACKING_TIME_BUDGET', 0.25))
+    # Standard errors the worst case of the robust mode allows for
+    ROBUST_CONFIDENCE = float(os.environ.get('ROBUST_CONFIDENCE', 1.96))
+    DEBUG = False
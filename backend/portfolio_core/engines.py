@@ -0,0 +1,1088 @@
+"""
+Pluggable portfolio weight engines.
+
+Every engine implements the same :class:`WeightEngine` interface and is
+registered under a name, so the Flask entry points, batch tools and
+benchmarks can pick one by configuration (``OPTIMIZER_ENGINE``) or per
+request and compare engines side by side.
+
+Registered engines:
+    * python-loop:   pure-Python random search (the original algorithm)
+    * bracket-refine: pure-Python return bracket plus local refinement
+                     (the algorithm of ``optimized_app.py``)
+    * numpy-random:  random search with NumPy dot products, one sample per step
+    * numpy-batched: random search evaluating whole batches of samples with
+                     one matrix product each
+    * exact:         deterministic solver; projects equal weights onto the
+                     target constraints with a semismooth Newton method and
+                     falls back to the closest reachable portfolio when the
+                     targets cannot be met exactly
+
+The NumPy engines and ``exact`` accept a warm start (``initial_weights``),
+a turnover penalty, per-sector weight limits (``sector_limits``) and
+estimation errors of the betas and returns (``uncertainty``); the
+pure-Python engines keep the original algorithms and ignore all four.
+"""
+
+import os
+import random
+from typing import Dict, List, NamedTuple, Optional, Tuple, Type
+
+import numpy as np
+
+from .tracing import annotate_trace
+
+
+class WeightEngine:
+    """
+    Interface for weight engines.
+
+    :meth:`optimize` returns float weights keyed by symbol that sum to 1.  With
+    ``strict=True`` every stock must receive at least :meth:`min_weight`.
+    When ``target_return`` is given the engine also fits the portfolio
+    return, weighting return errors more heavily for the
+    ``target_return`` strategy.
+
+    ``initial_weights`` (symbol -> weight, e.g. the current holdings or
+    the previous solve of a similar problem) is a warm start: engines that
+    can use a starting point search around it, the others ignore it.
+    ``turnover_penalty`` then adds that multiple of the turnover (the
+    fraction of the portfolio traded away from the start) to the fitting
+    error, trading target precision for stability.
+
+    ``sector_limits`` maps sectors to (min, max) bounds on their total
+    weight.  Engines with ``supports_sector_limits`` keep every accepted
+    portfolio within them; the others ignore them.
+
+    ``uncertainty`` (see :class:`Uncertainty`) treats the betas and
+    returns as estimates: engines with ``supports_uncertainty`` score
+    target errors over their standard errors instead of at the point
+    estimates.
+
+    ``rng`` (a NumPy ``Generator``) supplies the random draws of the
+    search engines, so a caller can reproduce a search without seeding
+    the process-wide generators; without one they draw from those.
+    """
+
+    name = ''
+    description = ''
+    supports_sector_limits = False
+    supports_uncertainty = False
+
+    def optimize(
+        self,
+        stocks: List[Dict],
+        target_beta: float,
+        individual_returns: Optional[Dict[str, float]] = None,
+        target_return: Optional[float] = None,
+        strategy: str = 'diversified',
+        strict: bool = False,
+        initial_weights: Optional[Dict[str, float]] = None,
+        turnover_penalty: float = 0.0,
+        sector_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        uncertainty: Optional['Uncertainty'] = None,
+        rng: Optional[np.random.Generator] = None
+    ) -> Dict[str, float]:
+        raise NotImplementedError
+
+    @staticmethod
+    def min_weight(n: int) -> float:
+        """Smallest weight each stock receives in strict mode."""
+        return 1.0 / n if n * 0.01 > 1.0 else 0.01
+
+    @staticmethod
+    def return_priority(strategy: str) -> float:
+        """Weight of return error relative to beta error when scoring."""
+        return 1000.0 if strategy == 'target_return' else 10.0
+
+
+ENGINES: Dict[str, Type[WeightEngine]] = {}
+_instances: Dict[str, WeightEngine] = {}
+
+DEFAULT_ENGINE = os.environ.get('OPTIMIZER_ENGINE', 'numpy-random')
+
+
+def register_engine(cls: Type[WeightEngine]) -> Type[WeightEngine]:
+    """Class decorator adding an engine to the registry."""
+    ENGINES[cls.name] = cls
+    return cls
+
+
+def available_engines() -> List[str]:
+    return sorted(ENGINES)
+
+
+def get_engine(name: Optional[str] = None) -> WeightEngine:
+    """
+    Return the shared instance of engine ``name`` (default engine if
+    None).  Raises ``ValueError`` for unknown names.
+    """
+    name = name or DEFAULT_ENGINE
+    engine = _instances.get(name)
+    if engine is None:
+        if name not in ENGINES:
+            raise ValueError(f"Unknown engine '{name}'. Available engines: {', '.join(available_engines())}")
+        engine = _instances[name] = ENGINES[name]()
+    return engine
+
+
+def _arrays(stocks: List[Dict], individual_returns: Optional[Dict[str, float]]):
+    symbols = [stock['symbol'] for stock in stocks]
+    betas = np.array([stock['beta'] for stock in stocks], dtype=float)
+    if individual_returns is not None:
+        returns = np.array([individual_returns.get(sym, 0.08) for sym in symbols], dtype=float)
+    else:
+        returns = np.full(len(stocks), 0.08)
+    return symbols, betas, returns
+
+
+def _start_vector(symbols: List[str], initial_weights: Optional[Dict[str, float]], floor: float = 0.0) -> Optional[np.ndarray]:
+    """
+    ``initial_weights`` as a feasible weight vector over ``symbols``:
+    symbols not in it get zero, the rest is rescaled to sum to 1 and
+    lifted to ``floor``.  None if no weight falls on ``symbols``.
+    """
+    if not initial_weights:
+        return None
+    start = np.array([max(initial_weights.get(sym, 0.0), 0.0) for sym in symbols], dtype=float)
+    total = start.sum()
+    if not total > 0:
+        return None
+    return floor + start * ((1.0 - len(symbols) * floor) / total)
+
+
+class SectorLimits(NamedTuple):
+    """
+    Sector weight bounds over a list of stocks.  ``membership`` has one
+    row per limited sector and one column per stock, so the sector
+    weights of a batch of candidates (one per row) are a single product
+    ``weights @ membership.T``.  ``groups`` adds a row for the stocks in
+    no limited sector and ``counts`` the number of stocks per group.
+    """
+    sectors: List[str]
+    membership: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    groups: np.ndarray
+    counts: np.ndarray
+
+    def violation(self, weights: np.ndarray) -> np.ndarray:
+        """Total weight outside the bounds, per candidate (row) of ``weights``."""
+        exposure = weights @ self.membership.T
+        return (np.maximum(self.lower - exposure, 0.0) + np.maximum(exposure - self.upper, 0.0)).sum(axis=-1)
+
+    def repair(self, weights: np.ndarray, floor: float = 0.0) -> np.ndarray:
+        """
+        Candidates (rows of ``weights``, each summing to 1 with every
+        weight at least ``floor``) moved within the bounds.  Each sector's
+        weight above the floor is rescaled, keeping the proportions within
+        the sector.  The new sector totals are the closest to the old ones
+        (shifted by a common amount, then clipped to the bounds), found
+        exactly from the sorted breakpoints of that shift.  Candidates
+        already within the bounds are returned unchanged.
+        """
+        single = weights.ndim == 1
+        weights = np.atleast_2d(weights)
+        exposure = weights @ self.membership.T
+        outside = ((exposure < self.lower) | (exposure > self.upper)).any(axis=1)
+        if not outside.any():
+            return weights[0] if single else weights
+        n = weights.shape[1]
+        groups, counts = self.groups, self.counts
+        excess = weights[outside] - floor
+        budget = excess.sum(axis=1, keepdims=True)
+        current = excess @ groups.T
+        # A group without stocks can hold no weight whatever its bounds
+        present = counts[:-1] > 0
+        lower = np.append(np.where(present, np.maximum(self.lower - counts[:-1] * floor, 0.0), 0.0), 0.0)
+        upper = np.append(np.where(present, np.maximum(self.upper - counts[:-1] * floor, lower[:-1]), 0.0),
+                          1.0 - n * floor if counts[-1] else 0.0)
+
+        # Total of clip(current + shift, lower, upper) is piecewise linear
+        # in the shift, with breakpoints where a group reaches a bound
+        shifts = np.sort(np.hstack((lower - current, upper - current)), axis=1)
+        totals = np.minimum(np.maximum(current[:, None, :] + shifts[:, :, None], lower), upper).sum(axis=2)
+        rows = np.arange(len(shifts))
+        i = np.minimum(np.maximum((totals < budget).sum(axis=1), 1), shifts.shape[1] - 1)
+        left, right = shifts[rows, i - 1], shifts[rows, i]
+        low, rise = totals[rows, i - 1], totals[rows, i] - totals[rows, i - 1]
+        shift = left + np.where(rise > 0, (budget[:, 0] - low) / np.where(rise > 0, rise, 1.0), 0.0) * (right - left)
+        target = np.minimum(np.maximum(current + shift[:, None], lower), upper)
+
+        # Rescale each group; a group without weight above the floor
+        # receives its target evenly
+        held = current > 0
+        scale = np.where(held, target / np.where(held, current, 1.0), 0.0)
+        even = np.where(held, 0.0, target / np.maximum(counts, 1.0))
+        repaired = weights.copy()
+        repaired[outside] = floor + excess * (scale @ groups) + even @ groups
+        return repaired[0] if single else repaired
+
+
+ROBUST_MODES = ('worst_case', 'expected')
+
+
+class Uncertainty(NamedTuple):
+    """
+    Standard errors of the betas and expected returns (symbol -> error,
+    assumed independent) and how a portfolio's error against a target is
+    scored.  With deviation ``m`` of the point estimate from the target
+    and spread ``s = sqrt(sum((weight * se) ** 2))``:
+
+        * worst_case: ``|m| + confidence * s``, the largest error over the
+          ellipsoid of estimates within ``confidence`` standard errors
+        * expected:   ``sqrt(m ** 2 + s ** 2)``, the root mean square error
+
+    Both are closed forms, so a batch of candidates is scored with one
+    more product per target than its nominal errors, whatever the number
+    of estimates the set contains.
+    """
+    mode: str
+    beta_se: Dict[str, float]
+    return_se: Dict[str, float]
+    confidence: float = 1.96
+
+    def variances(self, symbols: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Squared beta and return standard errors over ``symbols``."""
+        beta_se = np.array([self.beta_se.get(sym, 0.0) for sym in symbols], dtype=float)
+        return_se = np.array([self.return_se.get(sym, 0.0) for sym in symbols], dtype=float)
+        return beta_se * beta_se, return_se * return_se
+
+    def error(self, weights: np.ndarray, values: np.ndarray, variances: np.ndarray, target: float) -> np.ndarray:
+        """Error of each candidate (row of ``weights``) against ``target`` for estimates ``values``."""
+        deviation = weights @ values - target
+        spread = (weights * weights) @ variances
+        if self.mode == 'worst_case':
+            return np.abs(deviation) + self.confidence * np.sqrt(spread)
+        return np.sqrt(deviation * deviation + spread)
+
+
+def sector_matrix(stocks: List[Dict], sector_limits: Optional[Dict[str, Tuple[float, float]]]) -> Optional[SectorLimits]:
+    """:class:`SectorLimits` of ``sector_limits`` (sector -> (min, max)) over ``stocks``, or None without limits."""
+    if not sector_limits:
+        return None
+    sectors = sorted(sector_limits)
+    stock_sectors = np.array([stock.get('sector', '') for stock in stocks])
+    membership = (np.array(sectors)[:, None] == stock_sectors[None, :]).astype(float)
+    lower = np.array([sector_limits[sector][0] for sector in sectors], dtype=float)
+    upper = np.array([sector_limits[sector][1] for sector in sectors], dtype=float)
+    groups = np.vstack((membership, 1.0 - membership.sum(axis=0)))
+    return SectorLimits(sectors, membership, lower, upper, groups, groups.sum(axis=1))
+
+
+def sector_limits_error(stocks: List[Dict], sector_limits: Optional[Dict[str, Tuple[float, float]]], floor: float = 0.0) -> str:
+    """Why no portfolio of ``stocks`` with every weight at least ``floor`` meets ``sector_limits`` ('' if one does)."""
+    limits = sector_matrix(stocks, sector_limits)
+    if limits is None:
+        return ''
+    counts = limits.membership.sum(axis=1)
+    lower = np.maximum(limits.lower, counts * floor)
+    upper = np.where(counts > 0, limits.upper, 0.0)
+    for sector, count, low, high in zip(limits.sectors, counts, lower, upper):
+        if low > high + 1e-12:
+            if count == 0:
+                return f"No {sector} stocks selected to reach its minimum weight"
+            return f"{sector} maximum weight is below the {floor:.2%} floor of its {int(count)} stocks"
+    unlimited = len(stocks) - int(counts.sum())
+    if lower.sum() + unlimited * floor > 1.0 + 1e-12:
+        return 'Sector minimum weights sum to more than 1'
+    if not unlimited and upper.sum() < 1.0 - 1e-12:
+        return 'Sector maximum weights of the selected stocks sum to less than 1'
+    return ''
+
+
+@register_engine
+class PythonLoopEngine(WeightEngine):
+    """Pure-Python random search from the original backend."""
+
+    name = 'python-loop'
+    description = 'Pure-Python random search (original algorithm)'
+
+    def optimize(self, stocks, target_beta, individual_returns=None, target_return=None,
+                 strategy='diversified', strict=False, initial_weights=None, turnover_penalty=0.0,
+                 sector_limits=None, uncertainty=None, rng=None):
+        if strict:
+            return self._optimize_strict(stocks, target_beta, individual_returns, target_return, strategy, rng)
+        n = len(stocks)
+        draw = rng.random if rng is not None else random.random
+        iterations = 0
+
+        # If target return is specified, prioritize matching it exactly
+        if target_return is not None and individual_returns is not None:
+            best_weights = None
+            best_score = float('inf')
+            best_return_diff = float('inf')
+            for _ in range(10000):
+                iterations += 1
+                raw_weights = [draw() for _ in range(n)]
+                total = sum(raw_weights)
+                weights = {stock['symbol']: w / total for stock, w in zip(stocks, raw_weights)}
+                portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
+                return_diff = abs(portfolio_return - target_return)
+                portfolio_beta = sum(weights[stock['symbol']] * stock['beta'] for stock in stocks)
+                beta_diff = abs(portfolio_beta - target_beta)
+                # Once the return is close, beta becomes the main factor
+                if return_diff < 0.005:
+                    score = return_diff * 100 + beta_diff
+                else:
+                    score = return_diff * 1000 + beta_diff
+                if score < best_score:
+                    best_score = score
+                    best_weights = weights
+                    best_return_diff = return_diff
+                if return_diff < 0.001 and beta_diff < 0.2:
+                    break
+            if best_weights and best_return_diff < 0.01:
+                annotate_trace(iterations=iterations)
+                return best_weights
+
+        # Fallback: optimize for beta (or if no target return specified)
+        best_weights = None
+        best_score = float('inf')
+        for _ in range(5000):
+            iterations += 1
+            raw_weights = [draw() for _ in range(n)]
+            total = sum(raw_weights)
+            weights = {stock['symbol']: w / total for stock, w in zip(stocks, raw_weights)}
+            portfolio_beta = sum(weights[stock['symbol']] * stock['beta'] for stock in stocks)
+            beta_diff = abs(portfolio_beta - target_beta)
+            return_diff = None
+            if target_return is not None and individual_returns is not None:
+                portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
+                return_diff = abs(portfolio_return - target_return)
+                score = return_diff * 10 + beta_diff
+            else:
+                score = beta_diff
+            if score < best_score:
+                best_score = score
+                best_weights = weights
+            if return_diff is not None:
+                if return_diff < 0.01 and beta_diff < 0.1:
+                    break
+            elif beta_diff < 0.05:
+                break
+        annotate_trace(iterations=iterations)
+        return best_weights or {stock['symbol']: 1.0 / n for stock in stocks}
+
+    def _optimize_strict(self, stocks, target_beta, individual_returns, target_return, strategy, rng=None):
+        n = len(stocks)
+        min_weight = self.min_weight(n)
+        draw = rng.random if rng is not None else random.random
+        best_weights = None
+        best_score = float('inf')
+        iterations = 0
+        for _ in range(10000):
+            iterations += 1
+            weights_list = [min_weight] * n
+            remaining = 1.0 - (n * min_weight)
+            if remaining > 0:
+                raw_additional = [draw() for _ in range(n)]
+                total_additional = sum(raw_additional)
+                if total_additional > 0:
+                    for i in range(n):
+                        weights_list[i] += (raw_additional[i] / total_additional) * remaining
+            weights = {stock['symbol']: weights_list[i] for i, stock in enumerate(stocks)}
+            portfolio_beta = sum(weights[stock['symbol']] * stock['beta'] for stock in stocks)
+            score = abs(portfolio_beta - target_beta)
+            return_diff = None
+            if target_return is not None and individual_returns is not None:
+                portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
+                return_diff = abs(portfolio_return - target_return)
+                score = return_diff * self.return_priority(strategy) + score
+            if score < best_score:
+                best_score = score
+                best_weights = weights
+                # Early exit for target_return strategy if return is very close
+                if strategy == 'target_return' and return_diff is not None and return_diff < 0.0001:
+                    break
+        annotate_trace(iterations=iterations)
+        return best_weights or {stock['symbol']: 1.0 / n for stock in stocks}
+
+
+@register_engine
+class BracketRefineEngine(PythonLoopEngine):
+    """
+    Return-first search from the optimized backend: blend the two stocks
+    whose returns are closest to the target, then perturb that blend to
+    improve beta while keeping the return.
+    """
+
+    name = 'bracket-refine'
+    description = 'Pure-Python two-stock return bracket with random refinement'
+
+    def optimize(self, stocks, target_beta, individual_returns=None, target_return=None,
+                 strategy='diversified', strict=False, initial_weights=None, turnover_penalty=0.0,
+                 sector_limits=None, uncertainty=None, rng=None):
+        if strict or target_return is None or individual_returns is None:
+            return super().optimize(stocks, target_beta, individual_returns, target_return, strategy, strict, rng=rng)
+        n = len(stocks)
+        draw = rng.random if rng is not None else random.random
+        stock_returns = [individual_returns.get(stock['symbol'], 0.08) for stock in stocks]
+        stock_betas = [stock['beta'] for stock in stocks]
+
+        # Use two stocks to create a combination that hits target return
+        weights_list = [0.0] * n
+        if n >= 2:
+            sorted_indices = sorted(range(n), key=lambda i: abs(stock_returns[i] - target_return))
+            idx1, idx2 = sorted_indices[0], sorted_indices[1]
+            r1, r2 = stock_returns[idx1], stock_returns[idx2]
+            # Solve: w1*r1 + w2*r2 = target_return, w1 + w2 = 1
+            if abs(r1 - r2) > 0.001:
+                w1 = max(0.0, min(1.0, (target_return - r2) / (r1 - r2)))
+                weights_list[idx1] = w1
+                weights_list[idx2] = 1.0 - w1
+            else:
+                weights_list[idx1] = 0.5
+                weights_list[idx2] = 0.5
+        else:
+            weights_list[0] = 1.0
+
+        # Refine: random search around the blend to improve beta
+        best_weights = {stock['symbol']: weights_list[i] for i, stock in enumerate(stocks)}
+        best_return_diff = abs(sum(w * r for w, r in zip(weights_list, stock_returns)) - target_return)
+        best_beta_diff = abs(sum(w * b for w, b in zip(weights_list, stock_betas)) - target_beta)
+        iterations = 0
+        for refinement in range(5000):
+            iterations += 1
+            if refinement == 0:
+                test_weights = weights_list.copy()
+            else:
+                test_weights = [w * (0.9 + 0.2 * draw()) for w in weights_list]
+                total = sum(test_weights)
+                test_weights = [w / total for w in test_weights] if total > 0 else weights_list.copy()
+            return_diff = abs(sum(w * r for w, r in zip(test_weights, stock_returns)) - target_return)
+            beta_diff = abs(sum(w * b for w, b in zip(test_weights, stock_betas)) - target_beta)
+            # Accept if return is close and beta is better
+            if return_diff < 0.01 and (return_diff < best_return_diff or (abs(return_diff - best_return_diff) < 0.001 and beta_diff < best_beta_diff)):
+                best_return_diff = return_diff
+                best_beta_diff = beta_diff
+                weights_list = test_weights
+                best_weights = {stock['symbol']: weights_list[i] for i, stock in enumerate(stocks)}
+            if return_diff < 0.001 and beta_diff < 0.05:
+                break
+        annotate_trace(iterations=iterations)
+        return best_weights
+
+
+@register_engine
+class NumpyRandomEngine(WeightEngine):
+    """
+    Random search drawing one weight vector per step and scoring it with
+    NumPy dot products.
+    """
+
+    name = 'numpy-random'
+    description = 'NumPy random search, one sample per step'
+    supports_sector_limits = True
+    supports_uncertainty = True
+
+    # Early-exit tolerances.  Looser values stop sooner with a less exact
+    # fit; benchmarks/bench_quality.py measures the trade-off.
+    BETA_TOLERANCE = 0.05
+    RETURN_TOLERANCE = 0.01          # beta + return searches
+    TARGET_RETURN_TOLERANCE = 0.0001  # target_return strategy
+    # With ``uncertainty`` the tolerances still apply to the point
+    # estimates, since the robust errors include a spread no sample
+    # avoids.  The search then returns the acceptable sample with the
+    # least robust error among the first ROBUST_SAMPLES, searching at
+    # most twice as long as it took to find the first.
+    ROBUST_SAMPLES = 4
+    # With sector limits every sample is first moved within them (see
+    # SectorLimits.repair).  Samples still outside (by rounding, or when
+    # the limits cannot be met) score SECTOR_PENALTY per unit of weight
+    # outside them and are never accepted early.
+    SECTOR_PENALTY = 1e6
+    SECTOR_TOLERANCE = 1e-9
+
+    # Warm starts search a neighbourhood first.  The first attempt is the
+    # start itself; up to LOCAL_SHARE of the attempts then move a fraction
+    # of the portfolio (at most NEIGHBOURHOOD) from the start towards a
+    # random direction, and the rest search globally.  Move sizes follow
+    # the golden-ratio sequence, so small and large moves are tried from
+    # the first few attempts on.  Directions are uniform draws raised to
+    # DIRECTION_POWER, concentrating each move on a few stocks: trading
+    # between stocks far apart shifts beta or return with the least
+    # turnover.
+    NEIGHBOURHOOD = 0.25
+    LOCAL_SHARE = 0.5
+    DIRECTION_POWER = 8
+    GOLDEN_RATIO = 0.6180339887498949
+
+    def _neighbours(self, start: np.ndarray, raw: np.ndarray, first_attempt: int, max_attempts: int,
+                    floor: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Local candidates around ``start`` from the uniform draws ``raw``
+        (one row per attempt, starting at 0-based ``first_attempt``).
+        Returns the candidates and a mask of the rows still in the local
+        phase; the other rows are not meaningful.
+        """
+        local_attempts = max(1, int(max_attempts * self.LOCAL_SHARE))
+        attempt = first_attempt + np.arange(len(raw))
+        local = attempt < local_attempts
+        radius = (self.NEIGHBOURHOOD * ((attempt * self.GOLDEN_RATIO) % 1.0))[:, None]
+        direction = raw ** self.DIRECTION_POWER
+        direction = floor + direction * ((1.0 - raw.shape[1] * floor) / direction.sum(axis=1, keepdims=True))
+        return (1.0 - radius) * start + radius * direction, local
+
+    @staticmethod
+    def _robust_excess(uncertainty: Uncertainty, weights: np.ndarray, values: np.ndarray, variances: np.ndarray,
+                       target: float, deviation):
+        """How much the robust error of ``weights`` exceeds its point-estimate ``deviation``."""
+        return uncertainty.error(weights, values, variances, target) - deviation
+
+    def optimize(self, stocks, target_beta, individual_returns=None, target_return=None,
+                 strategy='diversified', strict=False, initial_weights=None, turnover_penalty=0.0,
+                 sector_limits=None, uncertainty=None, rng=None):
+        if strict:
+            return self._optimize_strict(stocks, target_beta, individual_returns, target_return, strategy,
+                                         initial_weights, turnover_penalty, sector_limits, uncertainty, rng)
+        n = len(stocks)
+        draw = (rng if rng is not None else np.random).random
+        stock_symbols, stock_betas, stock_returns = _arrays(stocks, individual_returns)
+        start = _start_vector(stock_symbols, initial_weights)
+        limits = sector_matrix(stocks, sector_limits)
+        within = True
+        if uncertainty is not None:
+            beta_variance, return_variance = uncertainty.variances(stock_symbols)
+
+        # For target_return strategy, use more attempts and prioritize return
+        max_attempts = 10000 if strategy == 'target_return' else 5000
+        best_weights = None
+        best_score = float('inf')
+        hit_weights, hit_rank, hits, first_hit = None, float('inf'), 0, 0
+
+        iterations = 0
+        for _ in range(max_attempts):
+            iterations += 1
+            # Generate random weights using NumPy; this ensures they sum to 1
+            raw_weights = draw(n)
+            weights_arr = raw_weights / raw_weights.sum()
+            if start is not None:
+                candidates, local = self._neighbours(start, raw_weights[None], iterations - 1, max_attempts)
+                if local[0]:
+                    weights_arr = candidates[0]
+            if limits is not None:
+                weights_arr = limits.repair(weights_arr)
+            portfolio_beta = float(np.dot(weights_arr, stock_betas))
+            beta_diff = abs(portfolio_beta - target_beta)
+
+            if target_return is not None and individual_returns is not None:
+                portfolio_return = float(np.dot(weights_arr, stock_returns))
+                return_diff = abs(portfolio_return - target_return)
+                score = return_diff * self.return_priority(strategy) + beta_diff
+            else:
+                score = beta_diff
+                return_diff = float('inf')
+            if turnover_penalty and start is not None:
+                score += turnover_penalty * 0.5 * float(np.abs(weights_arr - start).sum())
+            if limits is not None:
+                violation = float(limits.violation(weights_arr))
+                score += self.SECTOR_PENALTY * violation
+                within = violation <= self.SECTOR_TOLERANCE
+
+            if score < best_score:
+                best_score = score
+                best_weights = weights_arr.copy()
+
+            # Early exit for target_return strategy if return is very close
+            if strategy == 'target_return' and target_return is not None and individual_returns is not None:
+                accepted = return_diff < self.TARGET_RETURN_TOLERANCE and within
+            # Early exit if sufficiently close
+            elif target_return is not None and individual_returns is not None:
+                accepted = return_diff < self.RETURN_TOLERANCE and beta_diff < self.BETA_TOLERANCE and within
+            else:
+                accepted = beta_diff < self.BETA_TOLERANCE and within
+            if accepted and uncertainty is None:
+                best_weights = weights_arr
+                break
+            if accepted:
+                rank = score + self._robust_excess(uncertainty, weights_arr, stock_betas, beta_variance, target_beta, beta_diff)
+                if target_return is not None and individual_returns is not None:
+                    rank += self.return_priority(strategy) * self._robust_excess(
+                        uncertainty, weights_arr, stock_returns, return_variance, target_return, return_diff)
+                if rank < hit_rank:
+                    hit_weights, hit_rank = weights_arr.copy(), rank
+                hits += 1
+                first_hit = first_hit or iterations
+            if hits and (hits >= self.ROBUST_SAMPLES or iterations >= 2 * first_hit):
+                break
+        annotate_trace(iterations=iterations)
+        if hit_weights is not None:
+            best_weights = hit_weights
+        # Fallback equal weights
+        if best_weights is None:
+            best_weights = np.array([1.0 / n] * n)
+        return {sym: float(weight) for sym, weight in zip(stock_symbols, best_weights)}
+
+    def _optimize_strict(self, stocks, target_beta, individual_returns, target_return, strategy,
+                         initial_weights=None, turnover_penalty=0.0, sector_limits=None, uncertainty=None, rng=None):
+        n = len(stocks)
+        min_weight = self.min_weight(n)
+        draw = (rng if rng is not None else np.random).random
+        stock_symbols, stock_betas, stock_returns = _arrays(stocks, individual_returns)
+        start = _start_vector(stock_symbols, initial_weights, min_weight)
+        limits = sector_matrix(stocks, sector_limits)
+        within = True
+        if uncertainty is not None:
+            beta_variance, return_variance = uncertainty.variances(stock_symbols)
+
+        # For target_return strategy, use more attempts
+        max_attempts = 20000 if strategy == 'target_return' else 10000
+        best_weights = None
+        best_score = float('inf')
+        hit_weights, hit_rank, hits, first_hit = None, float('inf'), 0, 0
+
+        iterations = 0
+        for _ in range(max_attempts):
+            iterations += 1
+            # Start with minimum weights for all
+            weights_arr = np.full(n, min_weight)
+            remaining = 1.0 - (n * min_weight)
+            if remaining > 0:
+                raw_additional = draw(n)
+                total_additional = raw_additional.sum()
+                if total_additional > 0:
+                    weights_arr += (raw_additional / total_additional) * remaining
+                if start is not None:
+                    candidates, local = self._neighbours(start, raw_additional[None], iterations - 1, max_attempts, min_weight)
+                    if local[0]:
+                        weights_arr = candidates[0]
+            if limits is not None:
+                weights_arr = limits.repair(weights_arr, min_weight)
+            portfolio_beta = float(np.dot(weights_arr, stock_betas))
+            beta_diff = abs(portfolio_beta - target_beta)
+
+            score = beta_diff
+            return_diff = None
+            if target_return is not None and individual_returns is not None:
+                portfolio_return = float(np.dot(weights_arr, stock_returns))
+                return_diff = abs(portfolio_return - target_return)
+                score = return_diff * self.return_priority(strategy) + beta_diff
+            if turnover_penalty and start is not None:
+                score += turnover_penalty * 0.5 * float(np.abs(weights_arr - start).sum())
+            if limits is not None:
+                violation = float(limits.violation(weights_arr))
+                score += self.SECTOR_PENALTY * violation
+                within = violation <= self.SECTOR_TOLERANCE
+
+            if score < best_score:
+                best_score = score
+                best_weights = weights_arr.copy()
+
+            # Early exit for target_return strategy if return is very close
+            if strategy == 'target_return' and return_diff is not None:
+                accepted = return_diff < self.TARGET_RETURN_TOLERANCE and within
+            # Early exit
+            elif return_diff is not None:
+                accepted = score < 0.001 and beta_diff < self.BETA_TOLERANCE and within
+            else:
+                accepted = beta_diff < self.BETA_TOLERANCE and within
+            if accepted and uncertainty is None:
+                if strategy != 'target_return' or return_diff is None:
+                    best_weights = weights_arr
+                break
+            if accepted:
+                rank = score + self._robust_excess(uncertainty, weights_arr, stock_betas, beta_variance, target_beta, beta_diff)
+                if return_diff is not None:
+                    rank += self.return_priority(strategy) * self._robust_excess(
+                        uncertainty, weights_arr, stock_returns, return_variance, target_return, return_diff)
+                if rank < hit_rank:
+                    hit_weights, hit_rank = weights_arr.copy(), rank
+                hits += 1
+                first_hit = first_hit or iterations
+            if hits and (hits >= self.ROBUST_SAMPLES or iterations >= 2 * first_hit):
+                break
+        annotate_trace(iterations=iterations)
+        if hit_weights is not None:
+            best_weights = hit_weights
+        if best_weights is None:
+            best_weights = np.array([1.0 / n] * n)
+        return {sym: float(weight) for sym, weight in zip(stock_symbols, best_weights)}
+
+
+@register_engine
+class NumpyBatchedEngine(NumpyRandomEngine):
+    """
+    The same random search as ``numpy-random``, but each step draws a
+    whole batch of candidate weight vectors and scores them with one
+    matrix-vector product, removing the per-sample Python overhead.  It
+    uses the same attempt budget and early-exit tolerances and returns
+    the first acceptable sample in draw order (with ``uncertainty``, the
+    acceptable sample of that batch with the least robust error).
+    """
+
+    name = 'numpy-batched'
+    description = 'NumPy random search, scored in batches'
+
+    BATCH_SIZE = 1024
+    # Upper bound on floats per batch matrix, to cap memory for large universes
+    MAX_BATCH_ELEMENTS = 1 << 20
+
+    def optimize(self, stocks, target_beta, individual_returns=None, target_return=None,
+                 strategy='diversified', strict=False, initial_weights=None, turnover_penalty=0.0,
+                 sector_limits=None, uncertainty=None, rng=None):
+        n = len(stocks)
+        stock_symbols, stock_betas, stock_returns = _arrays(stocks, individual_returns)
+        has_return = target_return is not None and individual_returns is not None
+        floor = self.min_weight(n) if strict else 0.0
+        remaining = 1.0 - n * floor
+        draw = (rng if rng is not None else np.random).random
+        start = _start_vector(stock_symbols, initial_weights, floor)
+        limits = sector_matrix(stocks, sector_limits)
+        if uncertainty is not None:
+            beta_variance, return_variance = uncertainty.variances(stock_symbols)
+        if strict:
+            max_attempts = 20000 if strategy == 'target_return' else 10000
+        else:
+            max_attempts = 10000 if strategy == 'target_return' else 5000
+        priority = self.return_priority(strategy)
+        batch_size = max(1, min(self.BATCH_SIZE, self.MAX_BATCH_ELEMENTS // max(n, 1)))
+
+        best_weights = None
+        best_score = float('inf')
+        iterations = 0
+        while iterations < max_attempts:
+            size = min(batch_size, max_attempts - iterations)
+            raw = draw((size, n))
+            weights = floor + raw * (remaining / raw.sum(axis=1, keepdims=True))
+            if start is not None and iterations < max_attempts * self.LOCAL_SHARE:
+                candidates, local = self._neighbours(start, raw, iterations, max_attempts, floor)
+                weights[local] = candidates[local]
+            if limits is not None:
+                weights = limits.repair(weights, floor)
+            beta_diff = np.abs(weights @ stock_betas - target_beta)
+            if has_return:
+                return_diff = np.abs(weights @ stock_returns - target_return)
+                score = return_diff * priority + beta_diff
+                if strategy == 'target_return':
+                    accepted = return_diff < self.TARGET_RETURN_TOLERANCE
+                elif strict:
+                    accepted = (score < 0.001) & (beta_diff < self.BETA_TOLERANCE)
+                else:
+                    accepted = (return_diff < self.RETURN_TOLERANCE) & (beta_diff < self.BETA_TOLERANCE)
+            else:
+                score = beta_diff
+                accepted = beta_diff < self.BETA_TOLERANCE
+            if turnover_penalty and start is not None:
+                score = score + turnover_penalty * 0.5 * np.abs(weights - start).sum(axis=1)
+            if limits is not None:
+                # One product checks the whole batch against every sector
+                violation = limits.violation(weights)
+                score = score + self.SECTOR_PENALTY * violation
+                accepted = accepted & (violation <= self.SECTOR_TOLERANCE)
+
+            hits = np.flatnonzero(accepted)
+            if hits.size and uncertainty is not None:
+                # Robust: take the acceptable sample of the batch with the
+                # least robust error
+                candidates = weights[hits]
+                rank = score[hits] + self._robust_excess(uncertainty, candidates, stock_betas, beta_variance, target_beta,
+                                                         beta_diff[hits])
+                if has_return:
+                    rank = rank + priority * self._robust_excess(uncertainty, candidates, stock_returns, return_variance,
+                                                                 target_return, return_diff[hits])
+                iterations += size
+                best_weights = candidates[np.argmin(rank)]
+                break
+            if hits.size and start is not None:
+                # Warm start: the whole batch is scored anyway, so take
+                # the acceptable sample that moves least
+                iterations += size
+                best_weights = weights[hits[np.argmin(np.abs(weights[hits] - start).sum(axis=1))]]
+                break
+            if hits.size:
+                iterations += int(hits[0]) + 1
+                best_weights = weights[hits[0]]
+                break
+            best = int(np.argmin(score))
+            if score[best] < best_score:
+                best_score = float(score[best])
+                best_weights = weights[best].copy()
+            iterations += size
+        annotate_trace(iterations=iterations)
+        if best_weights is None:
+            best_weights = np.full(n, 1.0 / n)
+        return {sym: float(weight) for sym, weight in zip(stock_symbols, best_weights)}
+
+
+@register_engine
+class ExactEngine(WeightEngine):
+    """
+    Deterministic solver.  It finds the weights closest to equal weighting
+    that satisfy sum(w) = 1, w . beta = target_beta (and w . r =
+    target_return when given) with every weight at or above the floor.
+
+    The KKT conditions give w = max(floor, u + A^T lambda) for the
+    constraint matrix A.  lambda has at most three components, so a
+    semismooth Newton iteration solves for it in a handful of small
+    linear solves.  If the targets lie outside what the stocks can reach,
+    Newton does not converge.  The reachable (beta, return) pairs form the
+    convex hull of the single-stock portfolios, so the engine then returns
+    the mix of at most three stocks closest to the targets, with return
+    errors weighted as in the random-search engines.
+
+    A warm start fits lambda to the starting weights of its unclamped
+    stocks, so re-solving a slightly changed problem (the next rebalance
+    of a backtest) takes one or two Newton steps.  With a turnover
+    penalty p the anchor u moves from equal weights to (u + p * start) /
+    (1 + p), the minimiser of |w - u|^2 + p |w - start|^2, so larger
+    penalties keep the solution closer to the start (in squared rather
+    than absolute distance).
+
+    Sector limits are inequalities on sums of weights.  An active set
+    holds the violated ones at their bounds as extra rows of A: sectors
+    past a bound are added and bounds whose multiplier has the wrong sign
+    are released until neither remains.  When the targets are out of
+    reach within the limits, the engine moves them from what the anchor
+    portfolio reaches towards the requested ones as far as the limits
+    allow (by bisection).
+
+    With ``uncertainty`` the engine still meets the point-estimate
+    targets, but instead of the portfolio closest to equal weights it
+    finds the one with the least estimation error: it minimises
+    sum(v * w^2) + p |w - start|^2 with v = se_beta^2 + (priority *
+    se_return)^2 scaled to mean 1 (only the beta term without a return
+    target).  For beta targets that minimises both the worst-case and
+    the expected error among those portfolios; equal errors give the
+    nominal solution.  Solving for y = sqrt(v + p) w turns the objective
+    back into a plain distance, so the same Newton iteration applies
+    with a floor per stock.
+    """
+
+    name = 'exact'
+    description = 'Deterministic constrained least-distance solver'
+    supports_sector_limits = True
+    supports_uncertainty = True
+
+    NEWTON_MAX_ITER = 50
+    NEWTON_TOLERANCE = 1e-10
+    # Newton steps from a warm start before falling back to a cold start
+    WARM_MAX_ITER = 5
+    SECTOR_TOLERANCE = 1e-9
+    BISECTION_STEPS = 30
+
+    def optimize(self, stocks, target_beta, individual_returns=None, target_return=None,
+                 strategy='diversified', strict=False, initial_weights=None, turnover_penalty=0.0,
+                 sector_limits=None, uncertainty=None, rng=None):
+        n = len(stocks)
+        stock_symbols, stock_betas, stock_returns = _arrays(stocks, individual_returns)
+        floor = self.min_weight(n) if strict else 0.0
+        has_return = target_return is not None and individual_returns is not None
+
+        rows = [np.ones(n), stock_betas]
+        targets = [1.0, target_beta]
+        if has_return:
+            rows.append(stock_returns)
+            targets.append(target_return)
+        A = np.vstack(rows)
+        b = np.array(targets)
+        u = np.full(n, 1.0 / n)
+
+        weights, iterations = None, 0
+        start = _start_vector(stock_symbols, initial_weights, floor)
+        limits = sector_matrix(stocks, sector_limits)
+        root = self._robust_scale(stock_symbols, uncertainty, has_return, strategy, turnover_penalty if start is not None else 0.0)
+        if root is not None:
+            # Solve for y = root * w: the weighted objective becomes a distance
+            # to u.  Shifting u along the sum row leaves the optimum unchanged;
+            # this shift makes the sum-only solution the inverse-variance portfolio
+            u = (1.0 / np.sum(root ** -2)) / root
+            if start is not None:
+                u = u + turnover_penalty * start / root
+            A_solve, floor_solve = A / root, floor * root
+            start_solve = start * root if start is not None else None
+            limits_solve = limits._replace(membership=limits.membership / root) if limits is not None else None
+        else:
+            if start is not None and turnover_penalty > 0:
+                u = (u + turnover_penalty * start) / (1.0 + turnover_penalty)
+            A_solve, floor_solve, start_solve, limits_solve = A, floor, start, limits
+        warm = self._warm_multipliers(A_solve, u, start_solve, floor_solve) if start is not None else None
+        if warm is not None:
+            weights, _, iterations = self._solve(A_solve, b, u, floor_solve, limits_solve, warm, self.WARM_MAX_ITER)
+        if weights is None:
+            weights, _, cold_iterations = self._solve(A_solve, b, u, floor_solve, limits_solve)
+            iterations += cold_iterations
+        if weights is None and limits is not None:
+            weights, reach_iterations = self._reach(A_solve, b, u, floor_solve, limits_solve)
+            iterations += reach_iterations
+        if weights is not None and root is not None:
+            weights = weights / root
+        if weights is None:
+            # Targets unreachable: fit them as closely as possible
+            priorities = np.array([1.0, self.return_priority(strategy)][:A.shape[0] - 1])
+            weights = self._closest_mix(A[1:], b[1:], priorities, floor)
+        annotate_trace(iterations=iterations)
+        return {sym: float(weight) for sym, weight in zip(stock_symbols, weights)}
+
+    def _robust_scale(self, symbols: List[str], uncertainty: Optional[Uncertainty], has_return: bool, strategy: str,
+                      penalty: float) -> Optional[np.ndarray]:
+        """sqrt(v + p) of the robust objective, or None without (nonzero) standard errors."""
+        if uncertainty is None:
+            return None
+        beta_variance, return_variance = uncertainty.variances(symbols)
+        spread = beta_variance + (self.return_priority(strategy) ** 2 * return_variance if has_return else 0.0)
+        mean = spread.mean()
+        if not mean > 0:
+            return None
+        return np.sqrt(np.maximum(spread / mean, 1e-9) + penalty)
+
+    @staticmethod
+    def _warm_multipliers(A: np.ndarray, u: np.ndarray, start: np.ndarray, floor) -> Optional[np.ndarray]:
+        """Least-squares lambda with u + A^T lambda = start on the stocks above the floor."""
+        free = start > floor + 1e-12
+        if free.sum() < A.shape[0]:
+            return None
+        return np.linalg.lstsq(A[:, free].T, (start - u)[free], rcond=None)[0]
+
+    def _newton(self, A: np.ndarray, b: np.ndarray, u: np.ndarray, floor,
+                lam: Optional[np.ndarray] = None, max_iter: Optional[int] = None):
+        lam = np.zeros(A.shape[0]) if lam is None else lam
+        max_iter = max_iter or self.NEWTON_MAX_ITER
+        for iteration in range(1, max_iter + 1):
+            z = u + A.T @ lam
+            w = np.maximum(floor, z)
+            residual = A @ w - b
+            if np.max(np.abs(residual)) < self.NEWTON_TOLERANCE:
+                return w, lam, iteration
+            free = z > floor
+            if not free.any():
+                return None, lam, iteration
+            A_free = A[:, free]
+            jacobian = A_free @ A_free.T
+            step = np.linalg.lstsq(jacobian, residual, rcond=None)[0]
+            lam = lam - step
+        return None, lam, max_iter
+
+    def _solve(self, A: np.ndarray, b: np.ndarray, u: np.ndarray, floor, limits: Optional[SectorLimits],
+               lam: Optional[np.ndarray] = None, max_iter: Optional[int] = None):
+        """
+        :meth:`_newton` within the sector ``limits``.  Returns (weights or
+        None, the multipliers of A, iterations).
+        """
+        if limits is None:
+            return self._newton(A, b, u, floor, lam, max_iter)
+        m, k = A.shape[0], len(limits.sectors)
+        lam = np.zeros(m) if lam is None else lam
+        mu = np.zeros(k)
+        at_lower = np.zeros(k, dtype=bool)
+        at_upper = np.zeros(k, dtype=bool)
+        iterations = 0
+        for _ in range(2 * k + 2):
+            active = at_lower | at_upper
+            bounds = np.where(at_lower, limits.lower, limits.upper)[active]
+            w, multipliers, newton_iterations = self._newton(
+                np.vstack((A, limits.membership[active])), np.concatenate((b, bounds)), u, floor,
+                np.concatenate((lam, mu[active])), max_iter)
+            iterations += newton_iterations
+            if w is None:
+                return None, lam, iterations
+            lam = multipliers[:m]
+            mu[:] = 0.0
+            mu[active] = multipliers[m:]
+            exposure = limits.membership @ w
+            below = exposure < limits.lower - self.SECTOR_TOLERANCE
+            above = exposure > limits.upper + self.SECTOR_TOLERANCE
+            if below.any() or above.any():
+                at_lower |= below
+                at_upper |= above
+                continue
+            # A lower bound must push its sector up (mu > 0), an upper one down
+            wrong = np.where(at_lower, -mu, np.where(at_upper, mu, 0.0))
+            j = int(np.argmax(wrong))
+            if wrong[j] <= self.NEWTON_TOLERANCE:
+                return w, lam, iterations
+            at_lower[j] = at_upper[j] = False
+            mu[j] = 0.0
+        return None, lam, iterations
+
+    def _reach(self, A: np.ndarray, b: np.ndarray, u: np.ndarray, floor, limits: SectorLimits):
+        """
+        Weights within ``limits`` reaching the targets ``b`` as far as they
+        allow: targets on the segment from those of the anchor portfolio
+        (only the weights' sum fixed) to ``b``, as close to ``b`` as
+        bisection finds reachable.  Returns (weights or None, iterations).
+        """
+        weights, _, iterations = self._solve(A[:1], b[:1], u, floor, limits)
+        if weights is None:
+            return None, iterations
+        reached = A @ weights
+        low, high, lam = 0.0, 1.0, None
+        for _ in range(self.BISECTION_STEPS):
+            middle = 0.5 * (low + high)
+            # Neighbouring targets converge from each other's multipliers
+            # in a few steps; more only delays rejecting unreachable ones
+            candidate, multipliers, step_iterations = self._solve(A, reached + middle * (b - reached), u, floor, limits, lam,
+                                                                  self.WARM_MAX_ITER if lam is not None else None)
+            iterations += step_iterations
+            if candidate is None:
+                high = middle
+            else:
+                low, weights, lam = middle, candidate, multipliers
+        return weights, iterations
+
+    @staticmethod
+    def _convex_hull(points: np.ndarray) -> List[int]:
+        """Indices of the 2-D convex hull of ``points``, counter-clockwise."""
+        order = sorted(range(len(points)), key=lambda i: (points[i, 0], points[i, 1]))
+
+        def cross(o, a, b):
+            return (points[a, 0] - points[o, 0]) * (points[b, 1] - points[o, 1]) - \
+                (points[a, 1] - points[o, 1]) * (points[b, 0] - points[o, 0])
+
+        lower: List[int] = []
+        for i in order:
+            while len(lower) >= 2 and cross(lower[-2], lower[-1], i) <= 0:
+                lower.pop()
+            lower.append(i)
+        upper: List[int] = []
+        for i in reversed(order):
+            while len(upper) >= 2 and cross(upper[-2], upper[-1], i) <= 0:
+                upper.pop()
+            upper.append(i)
+        hull = lower[:-1] + upper[:-1]
+        return hull or order[:1]
+
+    def _closest_mix(self, A: np.ndarray, b: np.ndarray, priorities: np.ndarray, floor: float) -> np.ndarray:
+        n = A.shape[1]
+        budget = 1.0 - n * floor
+        weights = np.full(n, floor)
+        if budget <= 0:
+            return weights
+        # Spending the whole budget on stock k reaches points[k]; mixes
+        # reach the convex hull of those points.
+        points = (A * priorities[:, None]).T
+        target = (b * priorities - floor * points.sum(axis=0)) / budget
+        if points.shape[1] == 1:
+            low, high = int(np.argmin(points[:, 0])), int(np.argmax(points[:, 0]))
+            span = points[high, 0] - points[low, 0]
+            t = float(np.clip((target[0] - points[low, 0]) / span, 0.0, 1.0)) if span > 0 else 0.0
+            weights[low] += budget * (1.0 - t)
+            weights[high] += budget * t
+            return weights
+
+        hull = self._convex_hull(points)
+        vertices = points[hull]
+        if len(hull) >= 3:
+            # Target inside the hull: express it in a triangle of a fan
+            for m in range(1, len(hull) - 1):
+                p0, p1, p2 = vertices[0], vertices[m], vertices[m + 1]
+                basis = np.column_stack((p1 - p0, p2 - p0))
+                s, t = np.linalg.solve(basis, target - p0)
+                if s >= -1e-12 and t >= -1e-12 and s + t <= 1.0 + 1e-12:
+                    s, t = max(s, 0.0), max(t, 0.0)
+                    weights[hull[0]] += budget * max(1.0 - s - t, 0.0)
+                    weights[hull[m]] += budget * s
+                    weights[hull[m + 1]] += budget * t
+                    return weights / weights.sum()
+        # Otherwise the closest point lies on a hull edge
+        starts = vertices
+        ends = np.roll(vertices, -1, axis=0)
+        edges = ends - starts
+        lengths = np.einsum('ij,ij->i', edges, edges)
+        t = np.where(lengths > 0, np.einsum('ij,ij->i', target - starts, edges) / np.where(lengths > 0, lengths, 1.0), 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        distances = np.sum((starts + t[:, None] * edges - target) ** 2, axis=1)
+        best = int(np.argmin(distances))
+        weights[hull[best]] += budget * (1.0 - t[best])
+        weights[hull[(best + 1) % len(hull)]] += budget * t[best]
+        return weights
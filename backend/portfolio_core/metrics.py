@@ -0,0 +1,282 @@
+"""
+In-process metrics shared by the optimisation core and the web layer.
+
+The web layer renders :data:`metrics` at ``/api/metrics``; the core
+records cache lookups, stage timings and optimisation latency into it.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from .tracing import current_trace
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus-style counters and histograms.
+
+    Updates only touch in-memory dictionaries under a lock.  When a
+    ``directory`` is configured (``METRICS_DIR``), each worker process
+    periodically snapshots its totals to ``metrics_<pid>.json`` there and
+    :meth:`render` sums the snapshots of every worker, so ``/api/metrics``
+    reports the whole server no matter which worker answers the scrape.
+
+    Recycled workers would leave one snapshot each behind, so a scrape
+    folds the snapshots of exited workers (POSIX only) into the scraping
+    worker's ``retired`` totals, which its own snapshot carries on.
+    Counters therefore never go backwards and the directory holds about
+    one file per live worker.
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    # name -> (type, help text)
+    DEFINITIONS = {
+        'portfolio_optimizer_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status.'),
+        'portfolio_optimizer_http_request_seconds': ('histogram', 'HTTP request latency by endpoint.'),
+        'portfolio_optimizer_optimize_seconds': ('histogram', 'Uncached optimisation latency by strategy.'),
+        'portfolio_optimizer_stage_seconds': ('histogram', 'Optimisation pipeline stage latency by stage and strategy.'),
+        'portfolio_optimizer_cache_lookups_total': ('counter', 'Optimisation cache lookups by result (hit, stale, coalesced, miss).'),
+    }
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 1.0) -> None:
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple, float] = {}
+        self._histograms: Dict[Tuple, List[float]] = {}
+        # Totals of exited workers, in snapshot form
+        self._retired: Dict = {'counters': [], 'histograms': []}
+        self._last_flush = 0.0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _key(name: str, labels: Optional[Dict[str, str]]) -> Tuple:
+        return (name, tuple(sorted((labels or {}).items())))
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1.0) -> None:
+        """Increment a counter."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+        self._maybe_flush()
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """Record one histogram observation (in seconds)."""
+        key = self._key(name, labels)
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                # Per-bucket counts, then +Inf, sum and count
+                series = self._histograms[key] = [0.0] * (len(self.BUCKETS) + 3)
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.BUCKETS)] += 1
+            series[-2] += value
+            series[-1] += 1
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, name: str, labels: Optional[Dict[str, str]] = None):
+        """Time the enclosed block into a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def counter_totals(self, name: str, label: str) -> Dict[str, float]:
+        """Sum a counter across this process, grouped by one label."""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for (metric, labels), value in self._counters.items():
+                if metric == name:
+                    group = dict(labels).get(label, '')
+                    totals[group] = totals.get(group, 0.0) + value
+        return totals
+
+    # --- Multi-process aggregation ----------------------------------------
+    def _snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'counters': [[k[0], list(k[1]), v] for k, v in self._counters.items()] + self._retired['counters'],
+                'histograms': [[k[0], list(k[1]), list(v)] for k, v in self._histograms.items()]
+                + self._retired['histograms']
+            }
+
+    def _maybe_flush(self) -> None:
+        if not self.directory:
+            return
+        now = time.time()
+        with self._lock:
+            # Claim the flush, so concurrent requests do not all write it
+            if now - self._last_flush < self.flush_interval:
+                return
+            self._last_flush = now
+        self._write()
+
+    def flush(self) -> None:
+        """Write this process's totals to the shared metrics directory."""
+        if not self.directory:
+            return
+        with self._lock:
+            self._last_flush = time.time()
+        self._write()
+
+    def _write(self) -> None:
+        path = os.path.join(self.directory, f"metrics_{os.getpid()}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot: {str(e)}")
+
+    @staticmethod
+    def _exited(filename: str) -> bool:
+        """Whether the worker that wrote snapshot ``filename`` has exited."""
+        if os.name != 'posix':
+            # Signal 0 would terminate the process elsewhere
+            return False
+        try:
+            os.kill(int(filename[len('metrics_'):-len('.json')]), 0)
+        except ValueError:
+            return False
+        except ProcessLookupError:
+            return True
+        except OSError:
+            # Alive under another user
+            return False
+        return False
+
+    def _retire(self, filename: str) -> None:
+        """Fold an exited worker's snapshot into this worker's retired totals."""
+        path = os.path.join(self.directory, filename)
+        claimed = f"{path}.retiring.{os.getpid()}"
+        try:
+            # Only one scraping worker wins the rename
+            os.rename(path, claimed)
+            with open(claimed) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return
+        counters, histograms = self._merge([self._retired, snapshot])
+        with self._lock:
+            self._retired = {
+                'counters': [[k[0], list(k[1]), v] for k, v in counters.items()],
+                'histograms': [[k[0], list(k[1]), v] for k, v in histograms.items()]
+            }
+        # Written with this worker's totals before the claimed copy goes
+        self.flush()
+        try:
+            os.remove(claimed)
+        except OSError:
+            pass
+        logger.info(f"Retired metrics snapshot {filename}")
+
+    def _collect(self) -> Tuple[Dict[Tuple, float], Dict[Tuple, List[float]]]:
+        if self.directory:
+            own_file = f"metrics_{os.getpid()}.json"
+            for filename in os.listdir(self.directory):
+                if filename.startswith('metrics_') and filename.endswith('.json') and filename != own_file \
+                        and self._exited(filename):
+                    self._retire(filename)
+        snapshots = [self._snapshot()]
+        if self.directory:
+            for filename in os.listdir(self.directory):
+                if not filename.startswith('metrics_') or not filename.endswith('.json') or filename == own_file:
+                    continue
+                try:
+                    with open(os.path.join(self.directory, filename)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return self._merge(snapshots)
+
+    @staticmethod
+    def _merge(snapshots: List[Dict]) -> Tuple[Dict[Tuple, float], Dict[Tuple, List[float]]]:
+        """Sum snapshots into counter and histogram totals keyed by (name, labels)."""
+        counters: Dict[Tuple, float] = {}
+        histograms: Dict[Tuple, List[float]] = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, labels, series in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged = histograms.setdefault(key, [0.0] * len(series))
+                for i, value in enumerate(series):
+                    merged[i] += value
+        return counters, histograms
+
+    # --- Exposition ---------------------------------------------------------
+    @staticmethod
+    def _format_labels(labels: Tuple, extra: Optional[Tuple] = None) -> str:
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        escaped = []
+        for k, v in pairs:
+            value = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            escaped.append(f'{k}="{value}"')
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self, gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        self.flush()
+        counters, histograms = self._collect()
+        lines: List[str] = []
+        for name, (metric_type, help_text) in self.DEFINITIONS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{self._format_labels(labels)} {value:g}")
+            else:
+                for (metric, labels), series in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0.0
+                    for bound, count in zip(self.BUCKETS, series):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._format_labels(labels, ('le', f'{bound:g}'))} {cumulative:g}")
+                    cumulative += series[len(self.BUCKETS)]
+                    lines.append(f"{name}_bucket{self._format_labels(labels, ('le', '+Inf'))} {cumulative:g}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {series[-2]:.6f}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {series[-1]:g}")
+        for name, (help_text, value) in (gauges or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{{pid=\"{os.getpid()}\"}} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry(os.environ.get('METRICS_DIR'))
+
+
+@contextmanager
+def stage_timer(stage: str, strategy: str):
+    """Time a pipeline stage into the stage histogram and the request trace."""
+    trace = current_trace()
+    entry = trace.begin(stage) if trace is not None else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe('portfolio_optimizer_stage_seconds', duration, {'stage': stage, 'strategy': strategy})
+        if entry is not None:
+            trace.end(entry, duration)
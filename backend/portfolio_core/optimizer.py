@@ -0,0 +1,1318 @@
+"""
+Portfolio optimiser: stock selection, weight search and result assembly.
+
+This module has no web dependencies.  The Flask backend wraps a shared
+:class:`PortfolioOptimizer`; batch jobs and benchmarks can import it
+directly.
+"""
+
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from .config import ProductionConfig
+from .metrics import metrics, stage_timer
+from .tracing import annotate_trace, current_trace
+from .universe import read_universe, universe_stamp
+
+if TYPE_CHECKING:
+    from .engines import Uncertainty
+
+logger = logging.getLogger(__name__)
+
+
+def _get_engine(name: Optional[str] = None):
+    """Look up a weight engine, importing the engines (and NumPy) on first use."""
+    from .engines import get_engine
+    return get_engine(name)
+
+
+def _get_allocator(strategy: str):
+    """The allocator for a risk-model strategy (see ``allocation``), or None for the others."""
+    from .allocation import get_allocator
+    return get_allocator(strategy)
+
+
+def normalize_target_return(value) -> Optional[float]:
+    """
+    Convert a user-supplied target return to a decimal.  Strings may carry
+    a percent sign; numbers above 1 are read as percentages.  Unparseable
+    values and NaN become None.
+    """
+    if value is None:
+        return None
+    try:
+        if isinstance(value, str):
+            return float(value.replace('%', '').strip()) / 100
+        if isinstance(value, (int, float)):
+            # Check for NaN
+            if value != value:
+                return None
+            return float(value) / 100 if value > 1 else float(value)
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Could not convert target_return: {e}, setting to None")
+    return None
+
+
+def turnover(old: Dict[str, float], new: Dict[str, float]) -> float:
+    """Fraction of portfolio value bought to move from weights ``old`` to ``new``."""
+    return sum(max(weight - old.get(symbol, 0.0), 0.0) for symbol, weight in new.items())
+
+
+# Cache for optimization results
+optimization_cache: Dict[str, Dict[str, float]] = {}
+
+
+class _InFlight:
+    """Result slot shared by concurrent callers of the same cache key."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[Dict] = None
+        self.error: Optional[BaseException] = None
+
+
+# Optimisations currently running, keyed by cache key (single-flight)
+_inflight: Dict[str, _InFlight] = {}
+# Cache keys with a stale-while-revalidate refresh in progress
+_refreshing: set = set()
+_inflight_lock = threading.Lock()
+
+
+class PortfolioOptimizer:
+    """
+    Portfolio optimisation logic using vectorised operations.
+
+    This class contains the core algorithms for selecting stocks and
+    assembling results.  Weight search is delegated to the pluggable
+    engines in ``portfolio_core.engines``, selected per request or by
+    the ``OPTIMIZER_ENGINE`` setting.
+    """
+
+    def __init__(self) -> None:
+        self.store_dir = ProductionConfig.PRICE_STORE_DIR
+        self._universe_stamp = universe_stamp(self.store_dir)
+        self.stocks, self.universe_version = read_universe(self.store_dir)
+        self.risk_free_rate: float = ProductionConfig.RISK_FREE_RATE
+        self._universe_lock = threading.Lock()
+        self._universe_checked = time.monotonic()
+
+    # --- Universe -------------------------------------------------------------
+    def refresh_universe(self, force: bool = False) -> bool:
+        """
+        Reload the universe if the price store's statistics were rewritten
+        (checked at most every ``UNIVERSE_CHECK_INTERVAL`` seconds unless
+        ``force``).  A new version drops every cached result, and the
+        version is part of the cache key, so results computed from old
+        inputs are never served.  Returns True if the universe changed.
+        """
+        if not self.store_dir:
+            return False
+        now = time.monotonic()
+        if not force and now - self._universe_checked < ProductionConfig.UNIVERSE_CHECK_INTERVAL:
+            return False
+        with self._universe_lock:
+            self._universe_checked = now
+            stamp = universe_stamp(self.store_dir)
+            if stamp == self._universe_stamp:
+                return False
+            self._universe_stamp = stamp
+            stocks, version = read_universe(self.store_dir)
+            if version == self.universe_version:
+                return False
+            logger.info(f"Universe version {self.universe_version} -> {version}; clearing optimization cache")
+            self.stocks, self.universe_version = stocks, version
+            optimization_cache.clear()
+            return True
+
+    def _universe(self):
+        """The current universe as passed to allocators."""
+        from .allocation import Universe
+        return Universe(self.stocks, self.universe_version, self.store_dir)
+
+    # --- Input validation --------------------------------------------------
+    def validate_inputs(
+        self,
+        num_stocks: int,
+        target_beta: float,
+        target_return: Optional[float] = None,
+    ) -> Tuple[bool, str]:
+        """Validate input parameters for optimisation."""
+        if not isinstance(num_stocks, int) or num_stocks < ProductionConfig.MIN_STOCKS or num_stocks > ProductionConfig.MAX_STOCKS:
+            return False, f"Number of stocks must be between {ProductionConfig.MIN_STOCKS} and {ProductionConfig.MAX_STOCKS}"
+        if not isinstance(target_beta, (int, float)) or target_beta < 0.1 or target_beta > 3.0:
+            return False, "Target beta must be between 0.1 and 3.0"
+        if target_return is not None:
+            if not isinstance(target_return, (int, float)) or target_return < 0.01 or target_return > 0.50:
+                return False, "Target return must be between 1% and 50%"
+        return True, ""
+
+    # --- Stock selection ----------------------------------------------------
+    def select_stocks(self, num_stocks: int, strategy: str = 'diversified',
+                      rng: Optional[random.Random] = None) -> List[Dict]:
+        """
+        Select a subset of stocks based on a strategy.
+
+        Strategies:
+            * diversified: diversify across sectors with at least half the number of sectors.
+            * random: pick random stocks.
+            * target_return: return all stocks (optimization will select best subset).
+            * min_variance, max_sharpe, risk_parity, hrp, tracking: the stocks the allocator weights most
+              when solving on the whole universe (see ``allocation``).
+            * default: first N stocks.
+
+        Random choices draw from ``rng`` (the ``random`` module if None).
+        Returns a list of stock dictionaries.
+        """
+        rng = rng or random
+        allocator = _get_allocator(strategy)
+        if allocator is not None:
+            return allocator.select(self.stocks, self._calculate_individual_returns(self.stocks), num_stocks,
+                                    self.risk_free_rate, self._universe())
+        if strategy == 'diversified':
+            # Group stocks by sector
+            sectors: Dict[str, List[Dict]] = {}
+            selected: List[Dict] = []
+            for stock in self.stocks:
+                sector = stock['sector']
+                sectors.setdefault(sector, []).append(stock)
+            available_sectors = list(sectors.keys())
+            # Minimum industries for diversification: at least 3 or num_stocks//2
+            min_industries = min(max(3, num_stocks // 2), len(available_sectors))
+            # Sample sectors
+            sector_keys = rng.sample(available_sectors, min(min_industries, len(available_sectors)))
+            # Distribute stocks across selected sectors
+            stocks_per_sector = num_stocks // len(sector_keys) if sector_keys else 1
+            remainder = num_stocks % len(sector_keys) if sector_keys else 0
+            for i, sector in enumerate(sector_keys):
+                count = stocks_per_sector + (1 if i < remainder else 0)
+                for _ in range(min(count, len(sectors[sector]))):
+                    selected.append(sectors[sector].pop(0))
+            # Fill remaining slots if needed
+            while len(selected) < num_stocks:
+                remaining = [s for s in self.stocks if s not in selected]
+                if not remaining:
+                    break
+                selected.append(remaining[0])
+            rng.shuffle(selected)
+        elif strategy == 'random':
+            selected = rng.sample(self.stocks, min(num_stocks, len(self.stocks)))
+        elif strategy == 'target_return':
+            # Target Return strategy: ignore num_stocks, find best mix to achieve target return
+            # This will be handled specially in the optimize method
+            # For now, return all stocks - optimization will select the best subset
+            return self.stocks.copy()
+        else:
+            selected = self.stocks[:num_stocks]
+        
+        # STRICT: Ensure exactly num_stocks are returned (or as many as available)
+        # EXCEPT for target_return strategy which ignores num_stocks
+        if strategy != 'target_return':
+            if len(selected) < num_stocks:
+                logger.warning(f"Requested {num_stocks} stocks but only {len(selected)} available. Using all available stocks.")
+            return selected[:num_stocks] if len(selected) >= num_stocks else selected
+        else:
+            # For target_return strategy, return all stocks (optimization will select best subset)
+            return self.stocks.copy()
+
+    # --- Metrics calculation -----------------------------------------------
+    def calculate_realistic_metrics(self, stocks: List[Dict], target_return: Optional[float] = None) -> Dict[str, float]:
+        """
+        Calculate realistic portfolio metrics such as expected return,
+        volatility, Sharpe ratio and beta.  This method remains
+        unchanged from the original implementation but is included for
+        completeness.
+        """
+        sector_returns = {
+            'Technology': 0.12,
+            'Healthcare': 0.08,
+            'Financial Services': 0.10,
+            'Consumer Discretionary': 0.11,
+            'Consumer Staples': 0.06,
+            'Communication Services': 0.09
+        }
+        total_market_cap = sum(stock['market_cap'] for stock in stocks)
+        weighted_beta = sum(stock['beta'] * (stock['market_cap'] / total_market_cap) for stock in stocks)
+        weighted_return = sum(sector_returns.get(stock['sector'], 0.08) * (stock['market_cap'] / total_market_cap) for stock in stocks)
+        volatility = random.uniform(0.15, 0.35) * (1 + weighted_beta * 0.1)
+        if target_return is not None:
+            max_possible = max(sector_returns.values()) + 0.05
+            min_possible = min(sector_returns.values()) - 0.02
+            if min_possible <= target_return <= max_possible:
+                expected_return = target_return + random.uniform(-0.01, 0.01)
+            else:
+                expected_return = weighted_return + random.uniform(-0.02, 0.02)
+        else:
+            expected_return = weighted_return + random.uniform(-0.02, 0.02)
+        sharpe_ratio = (expected_return - self.risk_free_rate) / volatility
+        return {
+            'expected_return': max(0.01, expected_return),
+            'volatility': max(0.05, volatility),
+            'sharpe_ratio': max(0.1, sharpe_ratio),
+            'portfolio_beta': max(0.1, weighted_beta),
+            'target_achieved': target_return is not None and abs(expected_return - target_return) < 0.02
+        }
+
+    # --- Weight optimisation -----------------------------------------------
+    def optimize_portfolio_weights(
+        self,
+        stocks: List[Dict],
+        target_beta: float,
+        individual_returns: Optional[Dict[str, float]] = None,
+        target_return: Optional[float] = None,
+        strategy: str = 'diversified',
+        engine: Optional[str] = None,
+        initial_weights: Optional[Dict[str, float]] = None,
+        turnover_penalty: float = 0.0,
+        sector_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        uncertainty: Optional['Uncertainty'] = None
+    ) -> Dict[str, float]:
+        """
+        Optimise portfolio weights to match a target beta and optionally a
+        target return, using the named weight engine (the configured
+        default if None).  For target_return strategy, prioritizes return
+        matching above all else.  ``initial_weights`` warm-starts engines
+        that support it, and ``turnover_penalty`` discourages moving away
+        from them.  ``sector_limits`` bounds each sector's total weight, and
+        ``uncertainty`` makes the fit robust to estimation errors.
+        """
+        return _get_engine(engine).optimize(stocks, target_beta, individual_returns, target_return, strategy,
+                                            initial_weights=initial_weights, turnover_penalty=turnover_penalty,
+                                            sector_limits=sector_limits, uncertainty=uncertainty)
+
+    def optimize_portfolio_weights_strict(
+        self,
+        stocks: List[Dict],
+        target_beta: float,
+        individual_returns: Optional[Dict[str, float]] = None,
+        target_return: Optional[float] = None,
+        strategy: str = 'diversified',
+        engine: Optional[str] = None,
+        initial_weights: Optional[Dict[str, float]] = None,
+        turnover_penalty: float = 0.0,
+        sector_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        uncertainty: Optional['Uncertainty'] = None
+    ) -> Dict[str, float]:
+        """
+        Optimise portfolio weights with the strict requirement that
+        all stocks receive a non-zero weight.
+        """
+        return _get_engine(engine).optimize(stocks, target_beta, individual_returns, target_return, strategy,
+                                            strict=True, initial_weights=initial_weights, turnover_penalty=turnover_penalty,
+                                            sector_limits=sector_limits, uncertainty=uncertainty)
+
+    # --- Main optimisation interface ---------------------------------------
+    def optimize(
+        self,
+        num_stocks: int,
+        target_beta: float,
+        target_return: Optional[float] = None,
+        strategy: str = 'diversified',
+        engine: Optional[str] = None,
+        initial_weights: Optional[Dict[str, float]] = None,
+        turnover_penalty: float = 0.0,
+        sector_limits: Optional[Dict] = None,
+        robust=None
+    ) -> Dict:
+        """
+        Perform end-to-end portfolio optimisation.  This method
+        validates inputs, selects stocks, computes individual returns,
+        optimises weights, ensures no zero-weight stocks, and returns
+        the optimisation results along with various metrics.
+
+        ``initial_weights`` (current holdings, see :meth:`resolve_start`)
+        re-optimises from an existing portfolio: the held stocks are kept
+        and the engine searches around their weights, adding
+        ``turnover_penalty`` times the turnover to the fitting error.
+
+        ``sector_limits`` (see :meth:`resolve_sector_limits`) bounds the
+        total weight of each sector inside the weight engine.
+
+        ``robust`` (see :meth:`resolve_robust`) fits the targets allowing
+        for the standard errors of the betas and expected returns.
+        """
+        start_time = time.time()
+        self.refresh_universe()
+        
+        # For target_return strategy, target_return is required
+        if strategy == 'target_return' and target_return is None:
+            return {'error': 'Target Return strategy requires a target return to be specified'}
+        
+        # Validate inputs (skip num_stocks validation for target_return strategy)
+        if strategy != 'target_return':
+            is_valid, error_msg = self.validate_inputs(num_stocks, target_beta, target_return)
+            if not is_valid:
+                return {'error': error_msg}
+        try:
+            weight_engine = _get_engine(engine)
+        except ValueError as e:
+            return {'error': str(e)}
+        engine = weight_engine.name
+        if sector_limits is not None:
+            sector_limits, error = self.resolve_sector_limits(sector_limits)
+            if error:
+                return {'error': f"sector_limits: {error}"}
+            if _get_allocator(strategy) is not None:
+                return {'error': f"sector_limits are not supported by the {strategy} strategy"}
+            if not weight_engine.supports_sector_limits:
+                return {'error': f"Engine '{engine}' does not support sector_limits"}
+        if robust is not None:
+            robust, error = self.resolve_robust(robust)
+            if error:
+                return {'error': f"robust: {error}"}
+            if _get_allocator(strategy) is not None:
+                return {'error': f"robust is not supported by the {strategy} strategy"}
+            if not weight_engine.supports_uncertainty:
+                return {'error': f"Engine '{engine}' does not support robust"}
+        if initial_weights is not None:
+            initial_weights, error = self._normalize_weights(initial_weights)
+            if error:
+                return {'error': f"current_weights: {error}"}
+        if isinstance(turnover_penalty, bool) or not isinstance(turnover_penalty, (int, float)) or not 0 <= turnover_penalty <= 100:
+            return {'error': 'turnover_penalty must be a number between 0 and 100'}
+        
+        # Check cache
+        with stage_timer('cache_lookup', strategy):
+            cache_key = self.cache_key(num_stocks, target_beta, target_return, strategy, engine, initial_weights, turnover_penalty,
+                                       sector_limits, robust)
+            cached_result = optimization_cache.get(cache_key)
+            cache_state = 'miss'
+            if cached_result is not None:
+                age = time.time() - cached_result['timestamp']
+                if age < ProductionConfig.CACHE_DURATION:
+                    cache_state = 'hit'
+                elif age < ProductionConfig.CACHE_DURATION + ProductionConfig.STALE_WHILE_REVALIDATE:
+                    cache_state = 'stale'
+            annotate_trace(result=cache_state)
+        if cache_state == 'hit':
+            logger.info(f"Returning cached result for {cache_key}")
+            metrics.inc('portfolio_optimizer_cache_lookups_total', {'result': 'hit'})
+            return cached_result['data']
+        if cache_state == 'stale':
+            logger.info(f"Returning stale result for {cache_key} while refreshing")
+            metrics.inc('portfolio_optimizer_cache_lookups_total', {'result': 'stale'})
+            self._refresh_in_background(cache_key, num_stocks, target_beta, target_return, strategy, engine,
+                                        initial_weights, turnover_penalty, sector_limits, robust)
+            return cached_result['data']
+        
+        # Coalesce identical concurrent requests: the first caller computes,
+        # the others wait for its result instead of repeating the search.
+        return self._single_flight(
+            cache_key,
+            lambda: self._run_optimization(cache_key, num_stocks, target_beta, target_return, strategy, engine, start_time,
+                                           initial_weights, turnover_penalty, sector_limits, robust)
+        )
+
+    def cache_key(
+        self,
+        num_stocks: int,
+        target_beta: float,
+        target_return: Optional[float] = None,
+        strategy: str = 'diversified',
+        engine: Optional[str] = None,
+        initial_weights: Optional[Dict[str, float]] = None,
+        turnover_penalty: float = 0.0,
+        sector_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        robust: Optional[Dict] = None
+    ) -> str:
+        """Build the optimisation cache key for a set of inputs."""
+        # For target_return strategy, num_stocks is not relevant for caching
+        cache_num_stocks = 0 if strategy == 'target_return' else num_stocks
+        key = f"{cache_num_stocks}_{target_beta}_{target_return}_{strategy}_{engine or _get_engine().name}_u{self.universe_version}"
+        if initial_weights:
+            # Warm-started results depend on the starting portfolio
+            start = json.dumps(sorted((symbol, round(w, 6)) for symbol, w in initial_weights.items()))
+            key += f"_w{hashlib.sha1(start.encode()).hexdigest()[:12]}_p{turnover_penalty}"
+        if sector_limits:
+            limits = json.dumps(sorted((sector, list(bounds)) for sector, bounds in sector_limits.items()))
+            key += f"_s{hashlib.sha1(limits.encode()).hexdigest()[:12]}"
+        if robust:
+            errors = json.dumps(robust, sort_keys=True)
+            key += f"_r{hashlib.sha1(errors.encode()).hexdigest()[:12]}"
+        return key
+
+    def resolve_start(
+        self,
+        current_weights: Optional[Dict[str, float]] = None,
+        previous_result_key: Optional[str] = None
+    ) -> Tuple[Optional[Dict[str, float]], str]:
+        """
+        The starting portfolio of a warm-started optimisation: explicit
+        ``current_weights`` or the weights of the cached result
+        ``previous_result_key``.  Returns (weights or None, error).
+        """
+        if current_weights is not None and previous_result_key is not None:
+            return None, 'Provide either current_weights or previous_result_key, not both'
+        if previous_result_key is not None:
+            cached = optimization_cache.get(previous_result_key)
+            if cached is None:
+                return None, f"No cached result for '{previous_result_key}'. Run the optimization again."
+            return dict(cached['data']['weights']), ''
+        if current_weights is not None:
+            weights, error = self._normalize_weights(current_weights)
+            if error:
+                return None, f"current_weights: {error}"
+            return weights, ''
+        return None, ''
+
+    def resolve_sector_limits(self, sector_limits) -> Tuple[Optional[Dict[str, Tuple[float, float]]], str]:
+        """
+        Validate ``sector_limits``: sector -> {'min': ..., 'max': ...}
+        (either may be omitted) or [min, max], as fractions of the
+        portfolio.  Returns (sector -> (min, max) or None, error).
+        """
+        if sector_limits is None:
+            return None, ''
+        if not isinstance(sector_limits, dict):
+            return None, 'Sector limits must be an object mapping sectors to {"min": ..., "max": ...}'
+        sectors = {stock['sector'] for stock in self.stocks}
+        unknown = [sector for sector in sector_limits if sector not in sectors]
+        if unknown:
+            return None, f"Unknown sectors: {', '.join(sorted(unknown))}"
+        limits: Dict[str, Tuple[float, float]] = {}
+        for sector, bounds in sector_limits.items():
+            if isinstance(bounds, dict):
+                bounds = (bounds.get('min', 0.0), bounds.get('max', 1.0))
+            if not isinstance(bounds, (list, tuple)) or len(bounds) != 2 or any(
+                    isinstance(b, bool) or not isinstance(b, (int, float)) or not 0 <= b <= 1 for b in bounds):
+                return None, f"{sector}: min and max must be numbers between 0 and 1"
+            if bounds[0] > bounds[1]:
+                return None, f"{sector}: min is above max"
+            limits[sector] = (float(bounds[0]), float(bounds[1]))
+        if sum(low for low, _ in limits.values()) > 1.0:
+            return None, 'Sector minimum weights sum to more than 1'
+        return limits or None, ''
+
+    def resolve_robust(self, robust) -> Tuple[Optional[Dict], str]:
+        """
+        Validate ``robust``: a mode ('worst_case' or 'expected') or
+        {'mode': ..., 'beta_se': ..., 'return_se': ...}.  Each standard
+        error may be one number for every stock or symbol -> number
+        overriding the estimates from each stock's history.  Returns
+        ({'mode', 'beta_se', 'return_se'} or None, error).
+        """
+        from .engines import ROBUST_MODES
+        if robust is None:
+            return None, ''
+        if isinstance(robust, str):
+            robust = {'mode': robust}
+        if not isinstance(robust, dict):
+            return None, 'Robust must be a mode or an object with "mode", "beta_se" and "return_se"'
+        unknown = sorted(set(robust) - {'mode', 'beta_se', 'return_se'})
+        if unknown:
+            return None, f"Unknown fields: {', '.join(unknown)}"
+        mode = robust.get('mode', ROBUST_MODES[0])
+        if mode not in ROBUST_MODES:
+            return None, f"mode must be one of {', '.join(ROBUST_MODES)}"
+        resolved: Dict = {'mode': mode}
+        symbols = {stock['symbol'] for stock in self.stocks}
+        for field in ('beta_se', 'return_se'):
+            given = robust.get(field)
+            values = list(given.values()) if isinstance(given, dict) else [given]
+            if given is not None and any(isinstance(v, bool) or not isinstance(v, (int, float)) or not 0 <= v <= 10 for v in values):
+                return None, f"{field} must be a number or an object mapping symbols to numbers between 0 and 10"
+            if isinstance(given, dict):
+                unknown = [symbol for symbol in given if symbol not in symbols]
+                if unknown:
+                    return None, f"{field}: unknown symbols: {', '.join(sorted(unknown))}"
+                given = {symbol: float(v) for symbol, v in given.items()}
+            elif given is not None:
+                given = float(given)
+            resolved[field] = given
+        return resolved, ''
+
+    def is_cheap(
+        self,
+        num_stocks: int,
+        target_beta: float,
+        target_return: Optional[float] = None,
+        strategy: str = 'diversified',
+        engine: Optional[str] = None,
+        initial_weights: Optional[Dict[str, float]] = None,
+        turnover_penalty: float = 0.0,
+        sector_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        robust: Optional[Dict] = None
+    ) -> bool:
+        """
+        Return True if ``optimize`` can answer without starting a new
+        search: the result is cached (fresh or servable stale) or an
+        identical search is already in flight.
+        """
+        cache_key = self.cache_key(num_stocks, target_beta, target_return, strategy, engine, initial_weights, turnover_penalty,
+                                   sector_limits, robust)
+        cached_result = optimization_cache.get(cache_key)
+        if cached_result is not None:
+            age = time.time() - cached_result['timestamp']
+            if age < ProductionConfig.CACHE_DURATION + ProductionConfig.STALE_WHILE_REVALIDATE:
+                return True
+        with _inflight_lock:
+            return cache_key in _inflight
+
+    def _single_flight(self, cache_key: str, compute) -> Dict:
+        """
+        Run ``compute`` once per cache key across concurrent callers.  The
+        first caller becomes the leader and computes the result; callers
+        arriving while it runs block until it finishes and share the same
+        result (or exception).
+        """
+        with _inflight_lock:
+            call = _inflight.get(cache_key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlight()
+                _inflight[cache_key] = call
+        metrics.inc('portfolio_optimizer_cache_lookups_total', {'result': 'miss' if is_leader else 'coalesced'})
+        if not is_leader:
+            logger.info(f"Waiting for in-flight optimization of {cache_key}")
+            trace = current_trace()
+            entry = trace.begin('coalesced_wait') if trace is not None else None
+            wait_start = time.perf_counter()
+            call.done.wait()
+            if entry is not None:
+                trace.end(entry, time.perf_counter() - wait_start)
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = compute()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(cache_key, None)
+            call.done.set()
+
+    def _refresh_in_background(
+        self,
+        cache_key: str,
+        num_stocks: int,
+        target_beta: float,
+        target_return: Optional[float],
+        strategy: str,
+        engine: str,
+        initial_weights: Optional[Dict[str, float]] = None,
+        turnover_penalty: float = 0.0,
+        sector_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        robust: Optional[Dict] = None
+    ) -> None:
+        """Start at most one background recomputation of a stale cache entry."""
+        with _inflight_lock:
+            if cache_key in _refreshing or cache_key in _inflight:
+                return
+            _refreshing.add(cache_key)
+
+        def refresh() -> None:
+            try:
+                self._single_flight(
+                    cache_key,
+                    lambda: self._run_optimization(cache_key, num_stocks, target_beta, target_return, strategy, engine, time.time(),
+                                                   initial_weights, turnover_penalty, sector_limits, robust)
+                )
+            except Exception as e:
+                logger.error(f"Background refresh of {cache_key} failed: {str(e)}")
+            finally:
+                with _inflight_lock:
+                    _refreshing.discard(cache_key)
+
+        threading.Thread(target=refresh, name=f"refresh-{cache_key}", daemon=True).start()
+
+    def _run_optimization(
+        self,
+        cache_key: str,
+        num_stocks: int,
+        target_beta: float,
+        target_return: Optional[float],
+        strategy: str,
+        engine: str,
+        start_time: float,
+        initial_weights: Optional[Dict[str, float]] = None,
+        turnover_penalty: float = 0.0,
+        sector_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        robust: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Compute an optimisation result from scratch and store it in the
+        cache.  Inputs are assumed to be validated by ``optimize``.
+        """
+        run_start = time.perf_counter()
+        result = self.compute(num_stocks, target_beta, target_return, strategy, engine, initial_weights,
+                              turnover_penalty, start_time, sector_limits, robust)
+        if 'error' in result:
+            return result
+        result['result_key'] = cache_key
+        result['universe_version'] = self.universe_version
+        result['risk'] = self._risk_summary(result['stocks'], result['weights'], result['individual_returns'])
+        optimization_cache[cache_key] = {
+            'data': result,
+            'timestamp': time.time()
+        }
+        metrics.observe('portfolio_optimizer_optimize_seconds', time.perf_counter() - run_start, {'strategy': strategy})
+        logger.info(f"Optimization completed in {result['optimization_time']}s")
+        return result
+
+    def compute(
+        self,
+        num_stocks: int,
+        target_beta: float,
+        target_return: Optional[float] = None,
+        strategy: str = 'diversified',
+        engine: Optional[str] = None,
+        initial_weights: Optional[Dict[str, float]] = None,
+        turnover_penalty: float = 0.0,
+        start_time: Optional[float] = None,
+        sector_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        robust: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Select stocks and optimise weights on the current universe,
+        bypassing the cache and the risk summary (used directly by the
+        backtester).  ``initial_weights`` keeps the held stocks and
+        warm-starts the weight engine.  With ``sector_limits`` the
+        selection includes every sector with a minimum weight, and with
+        ``robust`` the engine scores fits by their robust errors.  Inputs
+        are assumed to be validated.
+        """
+        start_time = time.time() if start_time is None else start_time
+        allocator = _get_allocator(strategy)
+
+        # Select stocks
+        # For target_return strategy, ignore num_stocks and find optimal mix
+        with stage_timer('select_stocks', strategy):
+            if strategy == 'target_return' and target_return is not None:
+                # Calculate returns for all stocks first
+                all_individual_returns = self._calculate_individual_returns(self.stocks, target_return)
+                
+                # Find optimal subset of stocks that can achieve target return
+                selected_stocks = self._select_stocks_for_target_return(target_return, all_individual_returns)
+                logger.info(f"Target Return strategy selected {len(selected_stocks)} stocks to achieve {target_return:.1%} return")
+            else:
+                selected_stocks = self.select_stocks(num_stocks, strategy)
+            if initial_weights:
+                selected_stocks = self._keep_holdings(selected_stocks, initial_weights)
+            if sector_limits:
+                from .engines import WeightEngine, sector_limits_error
+                selected_stocks = self._cover_sectors(selected_stocks, sector_limits)
+                error = sector_limits_error(selected_stocks, sector_limits, WeightEngine.min_weight(len(selected_stocks)))
+                if error:
+                    return {'error': error}
+        
+        # Calculate individual stock returns (allocators use the unadjusted estimates)
+        with stage_timer('individual_returns', strategy):
+            individual_returns = self._calculate_individual_returns(selected_stocks, target_return if allocator is None else None)
+        
+        uncertainty = self._uncertainty(selected_stocks, robust) if robust else None
+
+        # Optimise weights (pass strategy for target_return handling)
+        with stage_timer('weights', strategy):
+            if allocator is not None:
+                from .engines import WeightEngine
+                weights = allocator.allocate(selected_stocks, individual_returns, WeightEngine.min_weight(len(selected_stocks)),
+                                             initial_weights, turnover_penalty, self.risk_free_rate, self._universe())
+            else:
+                weights = self.optimize_portfolio_weights(selected_stocks, target_beta, individual_returns, target_return, strategy, engine,
+                                                          initial_weights, turnover_penalty, sector_limits, uncertainty)
+        
+        # Ensure no zero-weight stocks
+        stocks_with_zero = [s for s in selected_stocks if weights.get(s['symbol'], 0) < 0.001]
+        if stocks_with_zero and allocator is None:
+            # Re-optimize with strict constraint (pass strategy)
+            with stage_timer('weights_strict', strategy):
+                weights = self.optimize_portfolio_weights_strict(selected_stocks, target_beta, individual_returns, target_return, strategy, engine,
+                                                                 initial_weights, turnover_penalty, sector_limits, uncertainty)
+        
+        # Final verification: ensure all selected stocks have weights
+        # For target_return strategy, use actual number of selected stocks
+        # For other strategies, use num_stocks
+        expected_stock_count = len(selected_stocks) if strategy == 'target_return' else num_stocks
+        stocks_with_weight = [s for s in selected_stocks if weights.get(s['symbol'], 0) > 0.001]
+        if len(stocks_with_weight) < expected_stock_count:
+            # This shouldn't happen, but if it does, ensure all stocks get equal weights
+            per_stock = 1.0 / len(selected_stocks)
+            weights = {stock['symbol']: per_stock for stock in selected_stocks}
+        
+        # Calculate final metrics using actual optimized weights
+        # Expected return = sum(weights * individual_returns) - NEVER force to target
+        actual_beta = sum(weights.get(s['symbol'], 0) * s.get('beta', 1.0) for s in selected_stocks if weights.get(s['symbol'], 0) > 0.001)
+        actual_return = sum(weights.get(s['symbol'], 0) * individual_returns.get(s['symbol'], 0.08) for s in selected_stocks if weights.get(s['symbol'], 0) > 0.001)
+        
+        # Safety check: ensure we have valid values
+        if not selected_stocks or len(selected_stocks) == 0:
+            logger.error("No stocks selected for optimization")
+            return {'error': 'No stocks selected. Please try again.'}
+        
+        if actual_beta == 0 or actual_return == 0:
+            logger.warning(f"Zero values detected: beta={actual_beta}, return={actual_return}")
+            # Use default values if calculation failed
+            if actual_beta == 0:
+                actual_beta = sum(s.get('beta', 1.0) / len(selected_stocks) for s in selected_stocks)
+            if actual_return == 0:
+                actual_return = sum(individual_returns.get(s['symbol'], 0.08) / len(selected_stocks) for s in selected_stocks)
+        if allocator is not None:
+            # The allocator optimised against the risk model, so report its volatility
+            from .risk import portfolio_risk
+            volatility = portfolio_risk(selected_stocks, weights, individual_returns)['volatility']
+        else:
+            volatility = random.uniform(0.15, 0.35) * (1 + actual_beta * 0.1)
+        sharpe_ratio = (actual_return - self.risk_free_rate) / volatility if volatility > 0 else 0.1
+        
+        # Consistency checks
+        total_weight = sum(weights.values())
+        if abs(total_weight - 1.0) > 1e-6:
+            logger.warning(f"Weights don't sum to 1.0: {total_weight}")
+            # Normalize weights
+            weights = {k: v / total_weight for k, v in weights.items()}
+            # Recalculate with normalized weights
+            actual_return = sum(weights.get(s['symbol'], 0) * individual_returns.get(s['symbol'], 0.08) for s in selected_stocks if weights.get(s['symbol'], 0) > 0.001)
+            actual_beta = sum(weights.get(s['symbol'], 0) * s.get('beta', 1.0) for s in selected_stocks if weights.get(s['symbol'], 0) > 0.001)
+        
+        # Check for negative weights (shorting not allowed)
+        negative_weights = [k for k, v in weights.items() if v < -1e-6]
+        if negative_weights:
+            logger.warning(f"Negative weights found: {negative_weights}")
+        
+        # Target achieved check with tolerance (0.25% = 0.0025)
+        tolerance = 0.0025  # 0.25% tolerance
+        target_achieved = target_return is None or abs(actual_return - target_return) <= tolerance
+        
+        # Debug logging for target_return strategy
+        if strategy == 'target_return' and target_return is not None:
+            logger.info(f"Target Return Strategy Debug:")
+            logger.info(f"  target_return_input: {target_return:.4f} ({target_return*100:.2f}%)")
+            logger.info(f"  computed_expected_return: {actual_return:.4f} ({actual_return*100:.2f}%)")
+            logger.info(f"  difference: {abs(actual_return - target_return):.4f} ({abs(actual_return - target_return)*100:.2f}%)")
+            logger.info(f"  tolerance: {tolerance:.4f} ({tolerance*100:.2f}%)")
+            logger.info(f"  target_achieved: {target_achieved}")
+        # Ensure all numeric values are valid
+        actual_beta = float(actual_beta) if actual_beta is not None else 1.0
+        actual_return = float(actual_return) if actual_return is not None else 0.08
+        volatility = float(volatility) if volatility is not None else 0.20
+        sharpe_ratio = float(sharpe_ratio) if sharpe_ratio is not None else 0.1
+        
+        result = {
+            'weights': weights,
+            'stocks': selected_stocks,
+            'individual_returns': individual_returns,
+            'target_beta': float(target_beta),
+            'actual_beta': round(actual_beta, 3),
+            'target_return': float(target_return) if target_return is not None else None,
+            'expected_return': round(actual_return, 4),
+            'volatility': round(volatility, 4),
+            'sharpe_ratio': round(sharpe_ratio, 3),
+            'target_achieved': bool(target_achieved),
+            'optimization_time': round(time.time() - start_time, 3),
+            'strategy_used': str(strategy),
+            'engine_used': engine,
+            'turnover': round(turnover(initial_weights, weights), 4) if initial_weights else None,
+            'message': self._generate_optimization_message(len(selected_stocks) if strategy == 'target_return' else num_stocks, strategy, target_return, actual_return, target_achieved)
+        }
+        if allocator is not None:
+            result.update(allocator.metrics(selected_stocks, weights, self._universe()))
+        if sector_limits:
+            sector_weights: Dict[str, float] = {}
+            for stock in selected_stocks:
+                sector_weights[stock['sector']] = sector_weights.get(stock['sector'], 0.0) + weights.get(stock['symbol'], 0.0)
+            result['sector_weights'] = {sector: round(weight, 4) for sector, weight in sorted(sector_weights.items())}
+            result['sector_limits_met'] = all(
+                low - 1e-6 <= sector_weights.get(sector, 0.0) <= high + 1e-6 for sector, (low, high) in sector_limits.items()
+            )
+        if uncertainty is not None:
+            result['robust'] = self._robust_errors(uncertainty, selected_stocks, weights, individual_returns, target_beta, target_return)
+        return result
+
+    # --- Rebalancing -------------------------------------------------------
+    def rebalance(
+        self,
+        current_weights: Optional[Dict[str, float]] = None,
+        previous_result_key: Optional[str] = None,
+        target_beta: float = 1.0,
+        target_return: Optional[float] = None,
+        num_stocks: int = 0,
+        strategy: str = 'diversified',
+        engine: Optional[str] = None,
+        turnover_cap: Optional[float] = None,
+        portfolio_value: Optional[float] = None,
+        horizon_years: float = 1.0,
+        num_candidates: Optional[int] = None,
+        seed: Optional[int] = None
+    ) -> Dict:
+        """
+        Trade the holdings (``current_weights`` or the weights of the
+        cached result ``previous_result_key``) towards the targets net of
+        transaction costs, buying at most ``turnover_cap`` of the
+        portfolio.  The universe is the held stocks plus, up to
+        ``num_stocks`` names, the strategy's selection.  The named engine
+        supplies the ideal, cost-free portfolio that the search trades
+        towards.  A ``seed`` makes the whole rebalance reproducible: the
+        selection and both searches then draw from generators of their
+        own, never the process-wide ones.
+        """
+        import numpy as np
+        from . import rebalance as rebalancing
+
+        start_time = time.perf_counter()
+        self.refresh_universe()
+        turnover_cap = ProductionConfig.REBALANCE_TURNOVER_CAP if turnover_cap is None else turnover_cap
+        portfolio_value = ProductionConfig.REBALANCE_PORTFOLIO_VALUE if portfolio_value is None else portfolio_value
+        num_candidates = ProductionConfig.REBALANCE_CANDIDATES if num_candidates is None else num_candidates
+        current_weights, error = self.resolve_start(current_weights, previous_result_key)
+        if error:
+            return {'error': error}
+        if current_weights is None:
+            return {'error': 'Provide either current_weights or previous_result_key'}
+        if not isinstance(target_beta, (int, float)) or not 0.1 <= target_beta <= 3.0:
+            return {'error': 'Target beta must be between 0.1 and 3.0'}
+        if target_return is not None and not 0.01 <= target_return <= 0.50:
+            return {'error': 'Target return must be between 1% and 50%'}
+        if not 0 <= num_stocks <= ProductionConfig.MAX_STOCKS:
+            return {'error': f"num_stocks must be between 0 and {ProductionConfig.MAX_STOCKS}"}
+        if not 0 <= turnover_cap <= 1:
+            return {'error': 'turnover_cap must be between 0 and 1'}
+        if not 0 < portfolio_value <= 1e12:
+            return {'error': 'portfolio_value must be positive'}
+        if not 0 < horizon_years <= ProductionConfig.SIMULATION_MAX_HORIZON_YEARS:
+            return {'error': f"horizon_years must be greater than 0 and at most {ProductionConfig.SIMULATION_MAX_HORIZON_YEARS}"}
+        if not 1 <= num_candidates <= ProductionConfig.REBALANCE_MAX_CANDIDATES:
+            return {'error': f"num_candidates must be between 1 and {ProductionConfig.REBALANCE_MAX_CANDIDATES}"}
+        if seed is not None and not 0 <= seed < 2 ** 64:
+            return {'error': 'seed must be between 0 and 2**64 - 1'}
+        try:
+            weight_engine = _get_engine(engine)
+        except ValueError as e:
+            return {'error': str(e)}
+        selection_rng = random.Random(seed) if seed is not None else None
+        search_rng = np.random.default_rng(seed) if seed is not None else None
+
+        with stage_timer('select_stocks', 'rebalance'):
+            held = self._stocks_for(current_weights)
+            if num_stocks > len(held):
+                selected = self.select_stocks(num_stocks, strategy if strategy != 'target_return' else 'diversified',
+                                              selection_rng)
+                held_symbols = set(current_weights)
+                held += [stock for stock in selected if stock['symbol'] not in held_symbols][:num_stocks - len(held)]
+            individual_returns = self._calculate_individual_returns(held, target_return)
+        symbols = [stock['symbol'] for stock in held]
+        with stage_timer('weights', 'rebalance'):
+            ideal = weight_engine.optimize(held, target_beta, individual_returns, target_return, strategy,
+                                           initial_weights=current_weights, rng=search_rng)
+        with stage_timer('rebalance', 'rebalance'):
+            current = np.array([current_weights.get(symbol, 0.0) for symbol in symbols])
+            spread, impact = rebalancing.cost_model(held, portfolio_value)
+            best = rebalancing.rebalance(
+                current,
+                np.array([ideal.get(symbol, 0.0) for symbol in symbols]),
+                np.array([stock['beta'] for stock in held], dtype=float),
+                np.array([individual_returns[symbol] for symbol in symbols]),
+                spread, impact, target_beta, target_return, weight_engine.return_priority(strategy),
+                turnover_cap, horizon_years, num_candidates, seed
+            )
+
+        weights = {symbol: float(w) for symbol, w in zip(symbols, best['weights']) if w > 1e-6}
+        trades = {symbol: round(float(w - c), 6) for symbol, w, c in zip(symbols, best['weights'], current) if abs(w - c) > 1e-6}
+        cost = best['spread_cost'] + best['impact_cost']
+        beta_before = float(current @ np.array([stock['beta'] for stock in held], dtype=float))
+        return_before = sum(current_weights[symbol] * individual_returns[symbol] for symbol in current_weights)
+        target_achieved = abs(best['beta'] - target_beta) <= 0.05 and (
+            target_return is None or abs(best['net_return'] - target_return) <= 0.0025)
+        return {
+            'weights': weights,
+            'trades': trades,
+            'stocks': [stock for stock in held if stock['symbol'] in weights],
+            'individual_returns': {symbol: individual_returns[symbol] for symbol in weights},
+            'target_beta': float(target_beta),
+            'target_return': float(target_return) if target_return is not None else None,
+            'actual_beta': round(best['beta'], 3),
+            'expected_return': round(best['expected_return'], 4),
+            'net_expected_return': round(best['net_return'], 4),
+            'target_achieved': bool(target_achieved),
+            'before': {'actual_beta': round(beta_before, 3), 'expected_return': round(return_before, 4)},
+            'turnover': round(best['turnover'], 4),
+            'turnover_cap': turnover_cap,
+            'costs': {
+                'spread': round(best['spread_cost'], 6),
+                'impact': round(best['impact_cost'], 6),
+                'total': round(cost, 6),
+                'total_value': round(cost * portfolio_value, 2)
+            },
+            'portfolio_value': portfolio_value,
+            'horizon_years': horizon_years,
+            'candidates_evaluated': best['candidates_evaluated'],
+            'feasible_candidates': best['feasible_candidates'],
+            'engine_used': weight_engine.name,
+            'computation_time': round(time.perf_counter() - start_time, 4)
+        }
+
+    # --- Simulation -------------------------------------------------------
+    def simulate(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        result_key: Optional[str] = None,
+        target_return: Optional[float] = None,
+        num_paths: Optional[int] = None,
+        horizon_years: float = 1.0,
+        steps_per_year: int = 12,
+        seed: Optional[int] = None,
+        percentiles: Optional[List[float]] = None
+    ) -> Dict:
+        """
+        Monte Carlo simulation of a portfolio given either explicit
+        ``weights`` (symbol -> weight, normalised to sum to 1) or the
+        ``result_key`` of a cached optimisation result.  Without an explicit
+        ``target_return``, a cached result's target is used.
+        """
+        if num_paths is None:
+            num_paths = ProductionConfig.SIMULATION_DEFAULT_PATHS
+        if not 1 <= num_paths <= ProductionConfig.SIMULATION_MAX_PATHS:
+            return {'error': f"num_paths must be between 1 and {ProductionConfig.SIMULATION_MAX_PATHS}"}
+        if not 0 < horizon_years <= ProductionConfig.SIMULATION_MAX_HORIZON_YEARS:
+            return {'error': f"horizon_years must be greater than 0 and at most {ProductionConfig.SIMULATION_MAX_HORIZON_YEARS}"}
+        if not 1 <= steps_per_year <= ProductionConfig.SIMULATION_MAX_STEPS_PER_YEAR:
+            return {'error': f"steps_per_year must be between 1 and {ProductionConfig.SIMULATION_MAX_STEPS_PER_YEAR}"}
+        if num_paths * max(1, round(horizon_years * steps_per_year)) > ProductionConfig.SIMULATION_MAX_DRAWS:
+            return {'error': f"num_paths x steps must not exceed {ProductionConfig.SIMULATION_MAX_DRAWS}"}
+        if percentiles is not None and (not percentiles or any(not 0 <= p <= 100 for p in percentiles)):
+            return {'error': 'percentiles must be a non-empty list of values between 0 and 100'}
+        if seed is not None and not 0 <= seed < 2 ** 64:
+            return {'error': 'seed must be between 0 and 2**64 - 1'}
+
+        if result_key is not None:
+            cached = optimization_cache.get(result_key)
+            if cached is None:
+                return {'error': f"No cached result for '{result_key}'. Run the optimization again."}
+            result = cached['data']
+            stocks = result['stocks']
+            weights = result['weights']
+            individual_returns = result['individual_returns']
+            if target_return is None:
+                target_return = result.get('target_return')
+        elif weights:
+            weights, error = self._normalize_weights(weights)
+            if error:
+                return {'error': error}
+            stocks = self._stocks_for(weights)
+            individual_returns = self._calculate_individual_returns(stocks)
+        else:
+            return {'error': 'Provide either weights or a result_key'}
+
+        from .simulation import DEFAULT_PERCENTILES, simulate
+        with stage_timer('simulate', 'simulation'):
+            return simulate(
+                stocks, weights, individual_returns, target_return,
+                num_paths, horizon_years, steps_per_year, seed,
+                percentiles if percentiles is not None else DEFAULT_PERCENTILES
+            )
+
+    # --- Risk analytics -----------------------------------------------------
+    def risk_report(
+        self,
+        portfolios: Optional[List[Dict[str, float]]] = None,
+        result_keys: Optional[List[str]] = None,
+        all_cached: bool = False,
+        levels: Optional[List[float]] = None,
+        horizon_days: float = 1.0
+    ) -> Dict:
+        """
+        VaR and CVaR for many portfolios in one pass: explicit weight
+        dicts, cached results by ``result_key``, or every cached result
+        with ``all_cached``.  Cached results keep their own return
+        estimates; explicit weights use the model's base returns.
+        """
+        import numpy as np
+        from .risk import DEFAULT_LEVELS, factor_exposures, risk_entries, value_at_risk
+        levels = list(levels) if levels is not None else list(DEFAULT_LEVELS)
+        if not levels or len(levels) > 10 or any(not 0.5 <= level < 1 for level in levels):
+            return {'error': 'levels must be 1 to 10 confidence levels between 0.5 and 1'}
+        if not 0 < horizon_days <= ProductionConfig.RISK_MAX_HORIZON_DAYS:
+            return {'error': f"horizon_days must be greater than 0 and at most {ProductionConfig.RISK_MAX_HORIZON_DAYS}"}
+
+        labels: List[Dict] = []
+        rows: List[Tuple[Dict[str, float], Dict[str, float]]] = []
+        base_returns = self._calculate_individual_returns(self.stocks)
+        for index, weights in enumerate(portfolios or []):
+            weights, error = self._normalize_weights(weights)
+            if error:
+                return {'error': f"Portfolio {index}: {error}"}
+            labels.append({'index': index})
+            rows.append((weights, base_returns))
+        if all_cached:
+            result_keys = list(optimization_cache.keys())
+        for key in result_keys or []:
+            cached = optimization_cache.get(key)
+            if cached is None:
+                return {'error': f"No cached result for '{key}'. Run the optimization again."}
+            labels.append({'result_key': key})
+            rows.append((cached['data']['weights'], dict(base_returns, **cached['data']['individual_returns'])))
+        if not rows:
+            return {'error': 'Provide portfolios, result_keys or all_cached'}
+        if len(rows) > ProductionConfig.RISK_MAX_PORTFOLIOS:
+            return {'error': f"At most {ProductionConfig.RISK_MAX_PORTFOLIOS} portfolios per request"}
+
+        start_time = time.perf_counter()
+        with stage_timer('risk', 'risk'):
+            column = {stock['symbol']: i for i, stock in enumerate(self.stocks)}
+            weight_matrix = np.zeros((len(rows), len(self.stocks)))
+            return_matrix = np.empty((len(rows), len(self.stocks)))
+            for i, (weights, returns) in enumerate(rows):
+                for symbol, weight in weights.items():
+                    weight_matrix[i, column[symbol]] = weight
+                return_matrix[i] = [returns[stock['symbol']] for stock in self.stocks]
+            _, beta, idio = factor_exposures(self.stocks, base_returns)
+            analytics = value_at_risk(weight_matrix, return_matrix, beta, idio, levels, horizon_days)
+            entries = risk_entries(analytics, levels, horizon_days)
+        return {
+            'levels': levels,
+            'horizon_days': horizon_days,
+            'portfolios': [dict(label, **entry) for label, entry in zip(labels, entries)],
+            'computation_time': round(time.perf_counter() - start_time, 4)
+        }
+
+    def _risk_summary(self, stocks: List[Dict], weights: Dict[str, float], individual_returns: Dict[str, float]) -> Optional[Dict]:
+        """One-day VaR and CVaR of an optimisation result, or None if it cannot be computed."""
+        from .risk import risk_summary
+        try:
+            return risk_summary(stocks, weights, individual_returns)
+        except Exception as e:
+            logger.warning(f"Risk summary failed: {str(e)}")
+            return None
+
+    def _normalize_weights(self, weights: Dict[str, float]) -> Tuple[Dict[str, float], str]:
+        """Validate user weights against the universe and scale them to sum to 1."""
+        if not isinstance(weights, dict) or not weights:
+            return {}, 'Weights must be a non-empty object mapping symbols to weights'
+        symbols = {stock['symbol'] for stock in self.stocks}
+        unknown = [symbol for symbol in weights if symbol not in symbols]
+        if unknown:
+            return {}, f"Unknown symbols: {', '.join(sorted(unknown))}"
+        if any(isinstance(w, bool) or not isinstance(w, (int, float)) or w != w or w < 0 for w in weights.values()):
+            return {}, 'Weights must be non-negative numbers'
+        total = sum(weights.values())
+        if total <= 0 or total == float('inf'):
+            return {}, 'Weights must sum to a positive value'
+        return {symbol: w / total for symbol, w in weights.items()}, ''
+
+    def _keep_holdings(self, selected: List[Dict], holdings: Dict[str, float]) -> List[Dict]:
+        """
+        Re-select the held stocks (largest first) so a warm start
+        re-optimises the same names, topping up from ``selected`` to the
+        same count.  Holdings outside the universe are dropped.
+        """
+        by_symbol = {stock['symbol']: stock for stock in self.stocks}
+        held = sorted((symbol for symbol, weight in holdings.items() if weight > 0 and symbol in by_symbol),
+                      key=lambda symbol: -holdings[symbol])
+        kept = [by_symbol[symbol] for symbol in held[:len(selected)]]
+        kept_symbols = {stock['symbol'] for stock in kept}
+        kept += [stock for stock in selected if stock['symbol'] not in kept_symbols][:len(selected) - len(kept)]
+        return kept
+
+    def _cover_sectors(self, selected: List[Dict], sector_limits: Dict[str, Tuple[float, float]]) -> List[Dict]:
+        """
+        Swap a stock of every sector with a minimum weight but none
+        selected (the first in the universe) for the last selected stock
+        whose sector keeps others.
+        """
+        selected = list(selected)
+        for sector in sorted(sector_limits):
+            if sector_limits[sector][0] <= 0 or any(stock['sector'] == sector for stock in selected):
+                continue
+            candidate = next((stock for stock in self.stocks if stock['sector'] == sector), None)
+            counts: Dict[str, int] = {}
+            for stock in selected:
+                counts[stock['sector']] = counts.get(stock['sector'], 0) + 1
+            spare = [i for i, stock in enumerate(selected)
+                     if counts[stock['sector']] > 1 or sector_limits.get(stock['sector'], (0.0, 1.0))[0] <= 0]
+            if candidate is None or not spare:
+                continue
+            selected[spare[-1]] = candidate
+        return selected
+
+    def _uncertainty(self, stocks: List[Dict], robust: Dict) -> 'Uncertainty':
+        """The :class:`Uncertainty` of ``stocks``: standard errors from their history, overridden by ``robust``."""
+        from .engines import Uncertainty
+        from .risk import standard_errors
+        symbols = [stock['symbol'] for stock in stocks]
+        errors = []
+        for estimated, given in zip(standard_errors(stocks), (robust.get('beta_se'), robust.get('return_se'))):
+            se = dict(zip(symbols, estimated.tolist()))
+            if isinstance(given, dict):
+                se.update((symbol, value) for symbol, value in given.items() if symbol in se)
+            elif given is not None:
+                se = dict.fromkeys(symbols, given)
+            errors.append(se)
+        return Uncertainty(robust['mode'], errors[0], errors[1], ProductionConfig.ROBUST_CONFIDENCE)
+
+    def _robust_errors(self, uncertainty: 'Uncertainty', stocks: List[Dict], weights: Dict[str, float],
+                       individual_returns: Dict[str, float], target_beta: float, target_return: Optional[float]) -> Dict:
+        """The robust errors of ``weights`` against the targets under ``uncertainty``."""
+        import numpy as np
+        symbols = [stock['symbol'] for stock in stocks]
+        w = np.array([[weights.get(symbol, 0.0) for symbol in symbols]])
+        beta_variance, return_variance = uncertainty.variances(symbols)
+        betas = np.array([stock.get('beta', 1.0) for stock in stocks], dtype=float)
+        returns = np.array([individual_returns.get(symbol, 0.08) for symbol in symbols])
+        return {
+            'mode': uncertainty.mode,
+            'beta_error': round(float(uncertainty.error(w, betas, beta_variance, target_beta)[0]), 4),
+            'return_error': round(float(uncertainty.error(w, returns, return_variance, target_return)[0]), 4)
+            if target_return is not None else None
+        }
+
+    def _stocks_for(self, weights: Dict[str, float]) -> List[Dict]:
+        by_symbol = {stock['symbol']: stock for stock in self.stocks}
+        return [by_symbol[symbol] for symbol in weights]
+
+    # --- Individual returns calculation -----------------------------------
+    def _calculate_individual_returns(self, stocks: List[Dict], target_return: Optional[float] = None) -> Dict[str, float]:
+        """
+        Calculate deterministic individual stock returns: historical means
+        for stocks from a price store, a sector/beta model otherwise.
+        """
+        sector_returns = {
+            'Technology': 0.12,
+            'Healthcare': 0.08,
+            'Financial Services': 0.10,
+            'Consumer Discretionary': 0.11,
+            'Consumer Staples': 0.06,
+            'Communication Services': 0.09
+        }
+        individual_returns: Dict[str, float] = {}
+        for stock in stocks:
+            if stock.get('expected_return') is not None:
+                # Historical mean from the price store
+                indiv_return = stock['expected_return']
+            else:
+                base_return = sector_returns.get(stock['sector'], 0.08)
+                beta_factor = (stock['beta'] - 1.0) * 0.02
+                symbol_hash = zlib.crc32(stock['symbol'].encode()) % 1000 / 10000.0
+                deterministic_factor = (symbol_hash - 0.05) * 0.4
+                indiv_return = base_return + beta_factor + deterministic_factor
+            individual_returns[stock['symbol']] = max(0.01, indiv_return)
+        if target_return is not None:
+            min_return = min(individual_returns.values())
+            max_return = max(individual_returns.values())
+            if target_return < min_return:
+                lowest_stock = min(individual_returns.items(), key=lambda x: x[1])[0]
+                individual_returns[lowest_stock] = target_return - 0.01
+            elif target_return > max_return:
+                highest_stock = max(individual_returns.items(), key=lambda x: x[1])[0]
+                individual_returns[highest_stock] = target_return + 0.01
+        return individual_returns
+
+    def _select_stocks_for_target_return(self, target_return: float, individual_returns: Dict[str, float]) -> List[Dict]:
+        """Select optimal stocks to achieve target return - finds best mix regardless of count"""
+        # Strategy: Find minimum number of stocks that can achieve target return
+        # Prioritize stocks with returns close to target, good diversification, and reasonable beta
+        
+        # Calculate expected returns for all stocks
+        stock_scores = []
+        for stock in self.stocks:
+            symbol = stock['symbol']
+            stock_return = individual_returns.get(symbol, 0.08)
+            
+            # Score based on:
+            # 1. How close return is to target (closer is better)
+            # 2. Beta (prefer moderate beta around 1.0)
+            # 3. Diversification (prefer different sectors)
+            return_diff = abs(stock_return - target_return)
+            beta_score = 1.0 - abs(stock['beta'] - 1.0) / 2.0  # Prefer beta around 1.0
+            score = (1.0 / (1.0 + return_diff * 10)) * 0.6 + beta_score * 0.4
+            
+            stock_scores.append((stock, score, stock_return))
+        
+        # Sort by score (best first)
+        stock_scores.sort(key=lambda x: x[1], reverse=True)
+        
+        # Try to find minimum set that can achieve target return
+        # Start with top stocks and check if we can achieve target
+        selected = []
+        min_stocks = 2  # At least 2 stocks for diversification
+        max_stocks = len(self.stocks)  # Can use all stocks if needed
+        
+        # Try different portfolio sizes
+        for portfolio_size in range(min_stocks, min(max_stocks + 1, 20)):  # Limit to 20 stocks max
+            candidate_stocks = [s[0] for s in stock_scores[:portfolio_size]]
+            candidate_returns = [s[2] for s in stock_scores[:portfolio_size]]
+            
+            # Check if this set can achieve target return
+            min_possible = min(candidate_returns)
+            max_possible = max(candidate_returns)
+            
+            if min_possible <= target_return <= max_possible:
+                # This set can achieve target - use it
+                selected = candidate_stocks
+                break
+        
+        # If no set found, use top stocks that bracket the target
+        if not selected:
+            # Find stocks above and below target
+            above_target = [s for s in stock_scores if s[2] >= target_return]
+            below_target = [s for s in stock_scores if s[2] < target_return]
+            
+            # Take best from each group
+            if above_target and below_target:
+                selected = [above_target[0][0], below_target[0][0]]
+            elif above_target:
+                selected = [s[0] for s in above_target[:3]]
+            elif below_target:
+                selected = [s[0] for s in below_target[:3]]
+            else:
+                # Fallback: top 5 stocks
+                selected = [s[0] for s in stock_scores[:5]]
+        
+        # Ensure diversification: add stocks from different sectors if possible
+        selected_sectors = {s['sector'] for s in selected}
+        sectors = {}
+        for stock in self.stocks:
+            if stock['sector'] not in sectors:
+                sectors[stock['sector']] = []
+            sectors[stock['sector']].append(stock)
+        
+        # If we have few sectors, add one stock from each missing sector
+        if len(selected_sectors) < 3 and len(selected) < 10:
+            for sector, stocks_in_sector in sectors.items():
+                if sector not in selected_sectors and len(selected) < 10:
+                    # Find best stock from this sector
+                    sector_stocks = [(s, individual_returns.get(s['symbol'], 0.08)) 
+                                    for s in stocks_in_sector if s not in selected]
+                    if sector_stocks:
+                        best_sector_stock = max(sector_stocks, key=lambda x: x[1])
+                        selected.append(best_sector_stock[0])
+                        selected_sectors.add(sector)
+        
+        return selected
+
+    # --- Message generation ------------------------------------------------
+    def _generate_optimization_message(
+        self,
+        num_stocks: int,
+        strategy: str,
+        target_return: Optional[float],
+        actual_return: float,
+        target_achieved: bool
+    ) -> str:
+        """
+        Generate a human readable message summarising the optimisation
+        results.
+        """
+        if strategy == 'target_return':
+            base_message = f'Portfolio optimized using Target Return strategy with {num_stocks} stocks!'
+            if target_return is not None:
+                if target_achieved:
+                    return f"{base_message} Target return of {target_return:.1%} achieved (expected: {actual_return:.2%})."
+                else:
+                    return f"{base_message} Target return of {target_return:.1%} not fully achievable. Best achievable: {actual_return:.2%} (closest feasible solution)."
+            return base_message
+        else:
+            base_message = f'Portfolio optimized with {num_stocks} stocks using {strategy} strategy!'
+        
+        if target_return is not None:
+            if target_achieved:
+                return f"{base_message} Target return of {target_return:.1%} achieved with {actual_return:.2%} expected return."
+            else:
+                return f"{base_message} Target return of {target_return:.1%} not fully achievable. Best achievable: {actual_return:.2%}."
+        return base_message
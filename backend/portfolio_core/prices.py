@@ -0,0 +1,391 @@
+"""
+Historical price ingestion.
+
+Reads one daily price CSV per symbol (``AAPL.csv``, ``SPY.csv``, ...)
+from a directory and builds a *price store*:
+
+    meta.json    symbols, market symbol, calendar range, layout
+    dates.npy    return dates (datetime64[D]), length T
+    market.npy   float32 market returns, length T
+    returns.f32  float32 returns, symbol-major (N x T), memory-mapped
+    stats.json   per-symbol beta, mean return, volatility and
+                 idiosyncratic volatility (annualised), plus metadata
+                 and a universe version bumped on every rewrite
+
+Each file is parsed in chunks of rows and aligned to the market
+symbol's trading calendar, so only one symbol's series (and one chunk of
+text) is held in memory at a time.  Returns are simple daily returns of
+the adjusted close, forward-filled across gaps; days before a symbol's
+first price and after its last are NaN.  Statistics are computed over blocks of symbols
+read from the memory map.
+
+Set ``PRICE_STORE_DIR`` to a store to make it the optimiser's universe.
+:mod:`portfolio_core.rolling` keeps the statistics up to date as new
+days arrive.
+
+Usage (from ``backend/``):
+    python -m portfolio_core.prices ingest data/prices data/store --market SPY
+    python -m portfolio_core.prices stats data/store
+"""
+
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import sys
+import time
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS = 252
+# Rows parsed per chunk
+CHUNK_ROWS = 65536
+# Symbols per block when computing statistics
+STATS_BLOCK = 256
+# Symbols with fewer daily returns than this get no statistics
+MIN_OBSERVATIONS = 60
+
+DATE_COLUMNS = ('date', 'timestamp', 'time', 'datetime')
+PRICE_COLUMNS = ('adj close', 'adj_close', 'adjclose', 'adjusted_close', 'close', 'price')
+METADATA_FILE = 'universe.csv'
+STATS_FILE = 'stats.json'
+STORE_VERSION = 1
+
+
+def _find_column(header: List[str], candidates: Tuple[str, ...]) -> Optional[int]:
+    normalized = [name.strip().lower() for name in header]
+    for candidate in candidates:
+        if candidate in normalized:
+            return normalized.index(candidate)
+    return None
+
+
+def _to_float(values: List[str]) -> np.ndarray:
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except ValueError:
+        # Rare: 'null', '' or similar placeholders somewhere in the chunk
+        out = np.empty(len(values))
+        for i, value in enumerate(values):
+            try:
+                out[i] = float(value)
+            except ValueError:
+                out[i] = math.nan
+        return out
+
+
+def read_price_chunks(stream: IO[str], chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Yield ``(dates, prices)`` arrays (datetime64[D], float64) for each
+    chunk of rows of a price CSV.  Rows with a missing or non-positive
+    price are dropped.
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    date_column = _find_column(header, DATE_COLUMNS)
+    price_column = _find_column(header, PRICE_COLUMNS)
+    if date_column is None or price_column is None:
+        raise ValueError(f"Expected a date column and one of {', '.join(PRICE_COLUMNS)}; got {', '.join(header)}")
+    width = max(date_column, price_column) + 1
+    dates: List[str] = []
+    prices: List[str] = []
+    for row in reader:
+        if len(row) < width:
+            continue
+        dates.append(row[date_column][:10])
+        prices.append(row[price_column])
+        if len(dates) >= chunk_rows:
+            yield _finish_chunk(dates, prices)
+            dates, prices = [], []
+    if dates:
+        yield _finish_chunk(dates, prices)
+
+
+def _finish_chunk(dates: List[str], prices: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    day = np.asarray(dates, dtype='datetime64[D]')
+    price = _to_float(prices)
+    keep = price > 0
+    return day[keep], price[keep]
+
+
+def read_aligned_prices(path: str, calendar: np.ndarray, chunk_rows: int = CHUNK_ROWS) -> np.ndarray:
+    """Prices from ``path`` on the days of ``calendar`` (NaN where missing)."""
+    aligned = np.full(len(calendar), np.nan)
+    with open(path, newline='') as f:
+        for dates, prices in read_price_chunks(f, chunk_rows):
+            index = np.searchsorted(calendar, dates)
+            index = np.minimum(index, len(calendar) - 1)
+            on_calendar = calendar[index] == dates
+            aligned[index[on_calendar]] = prices[on_calendar]
+    return aligned
+
+
+def _forward_fill(values: np.ndarray) -> np.ndarray:
+    """Fill gaps with the last price; leave NaN before the first and after the last price."""
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return values.copy()
+    index = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(index, out=index)
+    filled = values[index]
+    filled[int(np.flatnonzero(valid)[-1]) + 1:] = np.nan
+    return filled
+
+
+def daily_returns(prices: np.ndarray) -> np.ndarray:
+    """Simple returns between consecutive calendar days, with gaps forward-filled."""
+    filled = _forward_fill(prices)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return filled[1:] / filled[:-1] - 1.0
+
+
+def _read_metadata(path: str) -> Dict[str, Dict]:
+    """Optional ``symbol,name,sector,market_cap`` file."""
+    if not os.path.exists(path):
+        return {}
+    metadata: Dict[str, Dict] = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            row = {k.strip().lower(): (v or '').strip() for k, v in row.items() if k}
+            symbol = row.get('symbol', '').upper()
+            if not symbol:
+                continue
+            entry: Dict = {}
+            if row.get('name'):
+                entry['name'] = row['name']
+            if row.get('sector'):
+                entry['sector'] = row['sector']
+            if row.get('market_cap'):
+                try:
+                    entry['market_cap'] = float(row['market_cap'])
+                except ValueError:
+                    pass
+            metadata[symbol] = entry
+    return metadata
+
+
+def compute_statistics(
+    returns: np.ndarray,
+    market: np.ndarray,
+    block: int = STATS_BLOCK,
+    min_observations: int = MIN_OBSERVATIONS
+) -> Dict[str, np.ndarray]:
+    """
+    Annualised mean return, volatility, beta against ``market`` and
+    idiosyncratic volatility for each row of ``returns`` (N x T, may be a
+    memory map), using the days on which both the symbol and the market
+    have a return.  Rows with too few observations get NaN.
+    """
+    count = returns.shape[0]
+    result = {name: np.full(count, np.nan) for name in ('mean_return', 'volatility', 'beta', 'idiosyncratic_volatility')}
+    result['observations'] = np.zeros(count, dtype=np.int64)
+    m = np.asarray(market, dtype=np.float64)
+    for start in range(0, count, block):
+        stop = min(start + block, count)
+        r = np.asarray(returns[start:stop], dtype=np.float64)
+        valid = ~np.isnan(r) & ~np.isnan(m)
+        n = valid.sum(axis=1)
+        result['observations'][start:stop] = n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            r = np.where(valid, r, 0.0)
+            mm = np.where(valid, m, 0.0)
+            mean_r = r.sum(axis=1) / n
+            mean_m = mm.sum(axis=1) / n
+            dr = np.where(valid, r - mean_r[:, None], 0.0)
+            dm = np.where(valid, mm - mean_m[:, None], 0.0)
+            var_r = (dr * dr).sum(axis=1) / (n - 1)
+            var_m = (dm * dm).sum(axis=1) / (n - 1)
+            beta = (dr * dm).sum(axis=1) / (n - 1) / var_m
+            residual = np.maximum(var_r - beta * beta * var_m, 0.0)
+        enough = n >= min_observations
+        result['mean_return'][start:stop] = np.where(enough, mean_r * TRADING_DAYS, np.nan)
+        result['volatility'][start:stop] = np.where(enough, np.sqrt(var_r * TRADING_DAYS), np.nan)
+        result['beta'][start:stop] = np.where(enough, beta, np.nan)
+        result['idiosyncratic_volatility'][start:stop] = np.where(enough, np.sqrt(residual * TRADING_DAYS), np.nan)
+    return result
+
+
+def ingest(
+    source_dir: str,
+    store_dir: str,
+    market: str = 'SPY',
+    chunk_rows: int = CHUNK_ROWS,
+    min_observations: int = MIN_OBSERVATIONS
+) -> Dict:
+    """
+    Build a price store in ``store_dir`` from the ``*.csv`` files in
+    ``source_dir``.  The market symbol's file defines the calendar and is
+    the benchmark for betas.  Returns the store metadata.
+    """
+    start_time = time.perf_counter()
+    files = {
+        os.path.splitext(name)[0].upper(): os.path.join(source_dir, name)
+        for name in sorted(os.listdir(source_dir))
+        if name.lower().endswith('.csv') and name.lower() != METADATA_FILE
+    }
+    market = market.upper()
+    if market not in files:
+        raise ValueError(f"No price file for market symbol {market} in {source_dir}")
+
+    # The calendar is every day with a market price
+    days: List[np.ndarray] = []
+    with open(files[market], newline='') as f:
+        for dates, _ in read_price_chunks(f, chunk_rows):
+            days.append(dates)
+    calendar = np.unique(np.concatenate(days)) if days else np.array([], dtype='datetime64[D]')
+    if len(calendar) < 2:
+        raise ValueError(f"Market file {files[market]} has fewer than two prices")
+    market_returns = daily_returns(read_aligned_prices(files[market], calendar, chunk_rows)).astype(np.float32)
+
+    symbols = [symbol for symbol in files if symbol != market]
+    os.makedirs(store_dir, exist_ok=True)
+    returns_path = os.path.join(store_dir, 'returns.f32')
+    partial_path = returns_path + '.partial'
+    returns = np.memmap(partial_path, dtype=np.float32, mode='w+', shape=(max(len(symbols), 1), len(calendar) - 1))
+    for i, symbol in enumerate(symbols):
+        try:
+            returns[i] = daily_returns(read_aligned_prices(files[symbol], calendar, chunk_rows))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping {symbol}: {str(e)}")
+            returns[i] = np.nan
+    returns.flush()
+    stats = compute_statistics(returns, market_returns, min_observations=min_observations)
+    del returns
+    os.replace(partial_path, returns_path)
+
+    np.save(os.path.join(store_dir, 'dates.npy'), calendar[1:])
+    np.save(os.path.join(store_dir, 'market.npy'), market_returns)
+    write_statistics(store_dir, symbols, stats, _read_metadata(os.path.join(source_dir, METADATA_FILE)), 'full-sample')
+    meta = {
+        'version': STORE_VERSION,
+        'symbols': symbols,
+        'market': market,
+        'start': str(calendar[1]),
+        'end': str(calendar[-1]),
+        'days': len(calendar) - 1,
+        'dtype': 'float32',
+        'layout': 'symbol-major',
+        'created': time.time()
+    }
+    # meta.json is written last and marks the store complete
+    with open(os.path.join(store_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    logger.info(f"Ingested {len(symbols)} symbols x {meta['days']} days in {time.perf_counter() - start_time:.1f}s")
+    return meta
+
+
+class PriceStore:
+    """Read-only access to a price store built by :func:`ingest`."""
+
+    def __init__(self, store_dir: str) -> None:
+        self.directory = store_dir
+        with open(os.path.join(store_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.symbols: List[str] = self.meta['symbols']
+        self.market = self.meta['market']
+        self._index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.dates = np.load(os.path.join(store_dir, 'dates.npy'))
+        self.market_returns = np.load(os.path.join(store_dir, 'market.npy'))
+        self.returns = np.memmap(os.path.join(store_dir, 'returns.f32'), dtype=np.float32, mode='r',
+                                 shape=(max(len(self.symbols), 1), self.meta['days']))
+
+    def series(self, symbol: str) -> np.ndarray:
+        """Daily returns of one symbol (a view into the memory map)."""
+        return self.returns[self._index[symbol]]
+
+    def matrix(self, symbols: List[str]) -> np.ndarray:
+        """Daily returns of ``symbols`` as a T x len(symbols) float32 array."""
+        return np.stack([self.series(symbol) for symbol in symbols], axis=1)
+
+    def statistics(self) -> List[Dict]:
+        return load_statistics(self.directory)
+
+
+def read_statistics(store_dir: str) -> Dict:
+    """
+    The store's ``stats.json``: ``symbols`` (per-symbol statistics and
+    metadata), the universe ``version`` and the estimator ``method``.
+    """
+    with open(os.path.join(store_dir, STATS_FILE)) as f:
+        return json.load(f)
+
+
+def load_statistics(store_dir: str) -> List[Dict]:
+    """Per-symbol statistics and metadata of a store."""
+    return read_statistics(store_dir)['symbols']
+
+
+def write_statistics(
+    store_dir: str,
+    symbols: List[str],
+    stats: Dict[str, np.ndarray],
+    metadata: Dict[str, Dict],
+    method: str
+) -> int:
+    """
+    Replace the store's statistics with ``stats`` (arrays aligned with
+    ``symbols``, as returned by :func:`compute_statistics`) and bump the
+    universe version, so optimisers reload and drop cached results.
+    Returns the new version.
+    """
+    path = os.path.join(store_dir, STATS_FILE)
+    try:
+        version = read_statistics(store_dir).get('version', 0) + 1
+    except (OSError, ValueError):
+        version = 1
+    entries = []
+    for i, symbol in enumerate(symbols):
+        entry = {'symbol': symbol, 'observations': int(stats['observations'][i])}
+        for name in ('beta', 'mean_return', 'volatility', 'idiosyncratic_volatility'):
+            value = float(stats[name][i])
+            entry[name] = None if math.isnan(value) else round(value, 6)
+        entry.update(metadata.get(symbol, {}))
+        entries.append(entry)
+    partial_path = path + '.partial'
+    with open(partial_path, 'w') as f:
+        json.dump({'version': version, 'method': method, 'updated': time.time(), 'symbols': entries}, f)
+    os.replace(partial_path, path)
+    return version
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = commands.add_parser('ingest', help='build a price store from a directory of CSV files')
+    ingest_parser.add_argument('source', help='directory of <SYMBOL>.csv price files (optional universe.csv metadata)')
+    ingest_parser.add_argument('store', help='output store directory')
+    ingest_parser.add_argument('--market', default='SPY', help='benchmark symbol defining the calendar (default: SPY)')
+    ingest_parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='CSV rows parsed per chunk')
+    ingest_parser.add_argument('--min-observations', type=int, default=MIN_OBSERVATIONS,
+                               help='fewest daily returns for a symbol to get statistics')
+    stats_parser = commands.add_parser('stats', help='print the statistics of a store')
+    stats_parser.add_argument('store')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.command == 'ingest':
+        try:
+            meta = ingest(args.source, args.store, args.market, max(1, args.chunk_rows), args.min_observations)
+        except (OSError, ValueError) as e:
+            print(f"Ingestion failed: {e}", file=sys.stderr)
+            return 1
+        print(f"{len(meta['symbols'])} symbols, {meta['days']} days ({meta['start']} to {meta['end']}) in {args.store}")
+        return 0
+
+    print(f"{'symbol':<10} {'obs':>6} {'beta':>7} {'mean':>8} {'vol':>7} {'idio':>7}")
+    for entry in load_statistics(args.store):
+        values = [entry.get(name) for name in ('beta', 'mean_return', 'volatility', 'idiosyncratic_volatility')]
+        cells = ' '.join(f"{v:>7.3f}" if v is not None else f"{'-':>7}" for v in values)
+        print(f"{entry['symbol']:<10} {entry['observations']:>6} {cells}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
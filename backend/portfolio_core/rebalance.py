@@ -0,0 +1,149 @@
+"""
+Transaction-cost-aware rebalancing.
+
+Trading weight ``d`` (a fraction of the portfolio) of a stock costs
+
+    spread * |d| + impact * |d| ** 1.5
+
+of portfolio value.  The half-spread shrinks with market cap.  Impact
+follows the square-root law: daily volatility times the square root of
+the traded value over the stock's daily traded value.  That daily
+traded value is estimated as a fixed fraction of ``market_cap``, so
+larger portfolios and smaller companies cost more to trade.
+
+:func:`rebalance` searches trades from the current holdings: points
+on the straight line towards the ideal (cost-free) portfolio, and
+random moves concentrated on a few stocks around those points.  Every
+candidate is scored at once with matrix products.  Scores combine
+beta error and either the error in return *net of costs* (costs spread
+over the holding horizon) or, without a return target, the costs
+themselves.  Candidates that trade more than the turnover cap are
+discarded; not trading at all is always a candidate.
+"""
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .risk import MARKET_VOLATILITY, TRADING_DAYS, factor_exposures
+
+# Half-spread as a fraction of traded value: SPREAD_SCALE / sqrt(market
+# cap in $bn), clipped to [MIN_SPREAD, MAX_SPREAD]
+SPREAD_SCALE = 5e-4
+MIN_SPREAD = 1e-4
+MAX_SPREAD = 5e-3
+# Square-root impact coefficient and daily traded value as a fraction of
+# market cap
+IMPACT_COEFFICIENT = 1.0
+DAILY_VOLUME_FRACTION = 0.005
+# Assumed for stocks without a market cap
+DEFAULT_MARKET_CAP = 5e9
+
+# Share of candidates on the line towards the ideal portfolio
+LINE_SHARE = 0.125
+# Exponent concentrating random moves on a few stocks
+DIRECTION_POWER = 8
+# Floats per candidate matrix, to cap memory for large universes
+MAX_BATCH_ELEMENTS = 1 << 20
+
+
+def cost_model(stocks: List[Dict], portfolio_value: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-stock half-spread and impact coefficients for a portfolio of ``portfolio_value``."""
+    caps = np.array([stock.get('market_cap') or DEFAULT_MARKET_CAP for stock in stocks], dtype=float)
+    spread = np.clip(SPREAD_SCALE / np.sqrt(caps / 1e9), MIN_SPREAD, MAX_SPREAD)
+    _, beta, idio = factor_exposures(stocks, {})
+    volatility = np.array([
+        stock.get('volatility') or math.hypot(b * MARKET_VOLATILITY, s)
+        for stock, b, s in zip(stocks, beta, idio)
+    ])
+    daily_volume = DAILY_VOLUME_FRACTION * caps
+    impact = IMPACT_COEFFICIENT * volatility / math.sqrt(TRADING_DAYS) * np.sqrt(portfolio_value / daily_volume)
+    return spread, impact
+
+
+def trade_costs(trades: np.ndarray, spread: np.ndarray, impact: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Spread and impact costs of each row of ``trades`` (weight changes), as fractions of value."""
+    size = np.abs(trades)
+    return size @ spread, (size * np.sqrt(size)) @ impact
+
+
+def rebalance(
+    current: np.ndarray,
+    ideal: np.ndarray,
+    betas: np.ndarray,
+    returns: np.ndarray,
+    spread: np.ndarray,
+    impact: np.ndarray,
+    target_beta: float,
+    target_return: Optional[float],
+    return_priority: float,
+    turnover_cap: float,
+    horizon_years: float,
+    num_candidates: int,
+    seed: Optional[int] = None
+) -> Dict:
+    """
+    Best trade from ``current`` weights over ``num_candidates``
+    candidates.  ``ideal`` is the portfolio an unconstrained, cost-free
+    solve would hold.  Returns the chosen ``weights`` vector, its
+    ``turnover``, ``spread_cost``, ``impact_cost``, ``beta``,
+    ``expected_return`` and ``net_return``, and the number of
+    candidates evaluated and within the cap.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(current)
+    line_count = max(2, int(num_candidates * LINE_SHARE))
+    # Turnover is linear along the line, so the cap bounds how far to go
+    ideal_turnover = float(np.maximum(ideal - current, 0.0).sum())
+    reach = min(1.0, turnover_cap / ideal_turnover) if ideal_turnover > 0 else 1.0
+    batch_size = max(1, MAX_BATCH_ELEMENTS // max(n, 1))
+
+    best: Optional[Dict] = None
+    evaluated = feasible = 0
+    while evaluated < num_candidates:
+        size = min(batch_size, num_candidates - evaluated)
+        index = evaluated + np.arange(size)
+        on_line = index < line_count
+        # Line points (the first one is the current portfolio) ...
+        t = np.where(on_line, index / max(line_count - 1, 1), rng.random(size)) * reach
+        candidates = current + t[:, None] * (ideal - current)
+        # ... and random moves of up to the cap around them
+        moves = ~on_line
+        if moves.any():
+            direction = rng.random((int(moves.sum()), n)) ** DIRECTION_POWER
+            direction /= direction.sum(axis=1, keepdims=True)
+            radius = rng.random(int(moves.sum()))[:, None] * turnover_cap
+            candidates[moves] = (1.0 - radius) * candidates[moves] + radius * direction
+
+        trades = candidates - current
+        turnover = np.maximum(trades, 0.0).sum(axis=1)
+        spread_cost, impact_cost = trade_costs(trades, spread, impact)
+        cost = spread_cost + impact_cost
+        beta = candidates @ betas
+        gross = candidates @ returns
+        net = gross - cost / horizon_years
+        if target_return is not None:
+            score = np.abs(beta - target_beta) + return_priority * np.abs(net - target_return)
+        else:
+            score = np.abs(beta - target_beta) + return_priority * cost
+        allowed = turnover <= turnover_cap + 1e-12
+        score = np.where(allowed, score, np.inf)
+        feasible += int(allowed.sum())
+        evaluated += size
+
+        i = int(np.argmin(score))
+        if best is None or score[i] < best['score']:
+            best = {
+                'score': float(score[i]),
+                'weights': candidates[i].copy(),
+                'turnover': float(turnover[i]),
+                'spread_cost': float(spread_cost[i]),
+                'impact_cost': float(impact_cost[i]),
+                'beta': float(beta[i]),
+                'expected_return': float(gross[i]),
+                'net_return': float(net[i])
+            }
+    best['candidates_evaluated'] = evaluated
+    best['feasible_candidates'] = feasible
+    return best
@@ -0,0 +1,222 @@
+"""
+Risk model and Value-at-Risk analytics.
+
+Stocks follow a single-factor model: expected return plus ``beta`` times
+a market shock plus an independent idiosyncratic shock, whose
+volatility is historical for stocks from a price store and per-sector
+otherwise.  A portfolio is therefore fully described by
+three numbers: its expected return, its beta and its idiosyncratic
+volatility (``sqrt(sum((weight * sigma) ** 2))``).  Every function here
+reduces a weight matrix to those numbers with one matrix product, so
+many portfolios are analysed at once.
+
+VaR and CVaR are reported two ways, as positive losses (fractions of
+portfolio value) over ``horizon_days`` trading days:
+
+    * parametric: closed form under normal returns
+    * simulated:  empirical quantiles of a fixed scenario set whose
+                  market factor is Student-t distributed, so fat tails
+                  show up as a gap between the two
+"""
+
+import math
+from functools import lru_cache
+from statistics import NormalDist
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Annualised volatility of the market factor
+MARKET_VOLATILITY = 0.16
+
+# Annualised idiosyncratic volatility by sector
+SECTOR_IDIOSYNCRATIC_VOLATILITY = {
+    'Technology': 0.28,
+    'Healthcare': 0.22,
+    'Financial Services': 0.20,
+    'Consumer Discretionary': 0.30,
+    'Consumer Staples': 0.15,
+    'Communication Services': 0.25
+}
+DEFAULT_IDIOSYNCRATIC_VOLATILITY = 0.25
+
+TRADING_DAYS = 252
+# Length of the estimation history assumed for stocks without one
+DEFAULT_HISTORY_DAYS = 3 * TRADING_DAYS
+DEFAULT_LEVELS = (0.95, 0.975, 0.99)
+
+# Simulated scenarios: Student-t market factor with this many degrees of
+# freedom (scaled to unit variance) and normal idiosyncratic shocks
+MARKET_TAIL_DOF = 5
+NUM_SCENARIOS = 20000
+SCENARIO_SEED = 20240101
+# Losses held in memory at once when screening many portfolios
+CHUNK_ELEMENTS = 1 << 20
+
+
+def factor_exposures(stocks: List[Dict], individual_returns: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Expected return, beta and idiosyncratic volatility vectors for ``stocks``."""
+    mu = np.array([individual_returns.get(s['symbol'], 0.08) for s in stocks])
+    beta = np.array([s.get('beta', 1.0) for s in stocks])
+    idio = np.array([
+        s.get('idiosyncratic_volatility') or SECTOR_IDIOSYNCRATIC_VOLATILITY.get(s['sector'], DEFAULT_IDIOSYNCRATIC_VOLATILITY)
+        for s in stocks
+    ])
+    return mu, beta, idio
+
+
+def standard_errors(stocks: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Standard errors of each stock's beta and annualised mean return when
+    estimated from its ``observations`` daily returns (regression on the
+    market for the beta, the sample mean for the return).
+    """
+    _, beta, idio = factor_exposures(stocks, {})
+    days = np.array([s.get('observations') or DEFAULT_HISTORY_DAYS for s in stocks], dtype=float)
+    volatility = np.array([s.get('volatility') or math.hypot(b * MARKET_VOLATILITY, e) for s, b, e in zip(stocks, beta, idio)])
+    return idio / (MARKET_VOLATILITY * np.sqrt(days)), volatility * np.sqrt(TRADING_DAYS / days)
+
+
+def portfolio_moments(
+    weights: np.ndarray,
+    mu: np.ndarray,
+    beta: np.ndarray,
+    idio: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """
+    Annualised moments of each row of ``weights`` (P x N, or a single
+    N vector).  ``mu`` may be an N vector or a P x N matrix when each
+    portfolio has its own return estimates.
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    mu = np.asarray(mu, dtype=float)
+    expected_return = (weights * mu).sum(axis=1) if mu.ndim == 2 else weights @ mu
+    portfolio_beta = weights @ beta
+    idiosyncratic = np.sqrt((weights * weights) @ (idio * idio))
+    return {
+        'expected_return': expected_return,
+        'beta': portfolio_beta,
+        'market_volatility': portfolio_beta * MARKET_VOLATILITY,
+        'idiosyncratic_volatility': idiosyncratic,
+        'volatility': np.hypot(portfolio_beta * MARKET_VOLATILITY, idiosyncratic)
+    }
+
+
+def portfolio_risk(stocks: List[Dict], weights: Dict[str, float], individual_returns: Dict[str, float]) -> Dict[str, float]:
+    """Expected return, beta and volatility of one portfolio under the factor model."""
+    mu, beta, idio = factor_exposures(stocks, individual_returns)
+    w = np.array([max(weights.get(s['symbol'], 0.0), 0.0) for s in stocks])
+    return {k: float(v[0]) for k, v in portfolio_moments(w, mu, beta, idio).items()}
+
+
+@lru_cache(maxsize=4)
+def _scenario_shocks(num_scenarios: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Unit-variance market and idiosyncratic shocks shared by every portfolio."""
+    rng = np.random.default_rng(seed)
+    market = rng.standard_t(MARKET_TAIL_DOF, num_scenarios) * math.sqrt((MARKET_TAIL_DOF - 2) / MARKET_TAIL_DOF)
+    idiosyncratic = rng.standard_normal(num_scenarios)
+    market.setflags(write=False)
+    idiosyncratic.setflags(write=False)
+    return market, idiosyncratic
+
+
+def value_at_risk(
+    weights: np.ndarray,
+    mu: np.ndarray,
+    beta: np.ndarray,
+    idio: np.ndarray,
+    levels: Sequence[float] = DEFAULT_LEVELS,
+    horizon_days: float = 1.0,
+    num_scenarios: int = NUM_SCENARIOS
+) -> Dict[str, np.ndarray]:
+    """
+    Parametric and simulated VaR and CVaR for each row of ``weights``.
+    Returns the portfolio moments (P vectors) plus ``parametric_var``,
+    ``parametric_cvar``, ``simulated_var`` and ``simulated_cvar`` as
+    P x len(levels) arrays of losses.
+    """
+    moments = portfolio_moments(weights, mu, beta, idio)
+    horizon = horizon_days / TRADING_DAYS
+    mean = moments['expected_return'] * horizon
+    scale = math.sqrt(horizon)
+    levels = np.asarray(levels, dtype=float)
+
+    # Normal returns: VaR = z * sd - mean, CVaR = pdf(z) / (1 - level) * sd - mean
+    normal = NormalDist()
+    z = np.array([normal.inv_cdf(level) for level in levels])
+    tail = np.array([normal.pdf(q) for q in z]) / (1 - levels)
+    sd = moments['volatility'][:, None] * scale
+    parametric_var = sd * z - mean[:, None]
+    parametric_cvar = sd * tail - mean[:, None]
+
+    # Scenario losses per portfolio, a chunk of portfolios at a time
+    market, idiosyncratic = _scenario_shocks(num_scenarios, SCENARIO_SEED)
+    cutoffs = np.minimum(np.ceil(levels * num_scenarios).astype(int) - 1, num_scenarios - 1)
+    first = int(cutoffs.min())
+    count = len(mean)
+    simulated_var = np.empty((count, len(levels)))
+    simulated_cvar = np.empty((count, len(levels)))
+    market_exposure = moments['market_volatility'] * scale
+    idio_exposure = moments['idiosyncratic_volatility'] * scale
+    rows = max(1, CHUNK_ELEMENTS // num_scenarios)
+    for start in range(0, count, rows):
+        stop = min(start + rows, count)
+        losses = np.multiply.outer(-market_exposure[start:stop], market)
+        losses -= np.multiply.outer(idio_exposure[start:stop], idiosyncratic)
+        losses -= mean[start:stop, None]
+        # Only the tail beyond the lowest level needs sorting
+        losses.partition(first, axis=1)
+        tail = np.sort(losses[:, first:], axis=1)
+        # Mean of each tail from suffix sums of the sorted tail
+        tail_sums = np.cumsum(tail[:, ::-1], axis=1)[:, ::-1]
+        simulated_var[start:stop] = tail[:, cutoffs - first]
+        simulated_cvar[start:stop] = tail_sums[:, cutoffs - first] / (num_scenarios - cutoffs)
+
+    return dict(
+        moments,
+        parametric_var=parametric_var,
+        parametric_cvar=parametric_cvar,
+        simulated_var=simulated_var,
+        simulated_cvar=simulated_cvar
+    )
+
+
+def _level_label(level: float) -> str:
+    return f"{level:g}"
+
+
+def risk_entries(
+    analytics: Dict[str, np.ndarray],
+    levels: Sequence[float],
+    horizon_days: float
+) -> List[Dict]:
+    """Convert :func:`value_at_risk` arrays into one JSON-ready dict per portfolio."""
+    labels = [_level_label(level) for level in levels]
+    entries = []
+    for i in range(len(analytics['expected_return'])):
+        entry = {
+            'horizon_days': horizon_days,
+            'expected_return': round(float(analytics['expected_return'][i]), 4),
+            'volatility': round(float(analytics['volatility'][i]), 4),
+            'beta': round(float(analytics['beta'][i]), 3)
+        }
+        for measure in ('var', 'cvar'):
+            entry[measure] = {
+                method: {label: round(float(v), 5) for label, v in zip(labels, analytics[f"{method}_{measure}"][i])}
+                for method in ('parametric', 'simulated')
+            }
+        entries.append(entry)
+    return entries
+
+
+def risk_summary(
+    stocks: List[Dict],
+    weights: Dict[str, float],
+    individual_returns: Dict[str, float],
+    levels: Sequence[float] = DEFAULT_LEVELS,
+    horizon_days: float = 1.0
+) -> Dict:
+    """VaR and CVaR of a single portfolio, as included in optimisation results."""
+    mu, beta, idio = factor_exposures(stocks, individual_returns)
+    w = np.array([weights.get(s['symbol'], 0.0) for s in stocks])
+    return risk_entries(value_at_risk(w, mu, beta, idio, levels, horizon_days), levels, horizon_days)[0]
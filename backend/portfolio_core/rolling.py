@@ -0,0 +1,309 @@
+"""
+Incremental rolling statistics for a price store.
+
+:class:`RollingStatistics` keeps, for every symbol, running estimates of
+its mean return and variance and of the market's mean, variance and
+covariance with the symbol, from which betas, volatilities and
+idiosyncratic volatilities follow.  Each new daily bar updates them in
+O(n) for n symbols (one market factor), instead of recomputing the full
+history.  Two estimators are available:
+
+    * exponentially weighted (``halflife`` days): West's weighted update;
+      the first observations are weighted equally so early estimates are
+      unbiased by the start-up
+    * fixed window (``window`` days): running sums plus a ring buffer of
+      the last ``window`` bars, resummed exactly once per window to stop
+      floating-point drift
+
+Missing returns (before listing, after delisting) leave a symbol's
+estimates untouched.  State is saved next to the store
+(``rolling_state.npz``), so a daily run only processes the new bars;
+every run rewrites ``stats.json`` and bumps the universe version.
+
+Usage (from ``backend/``):
+    python -m portfolio_core.rolling update data/store --halflife 126
+    python -m portfolio_core.rolling update data/store --window 252 --reset
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .prices import MIN_OBSERVATIONS, TRADING_DAYS, PriceStore, read_statistics, write_statistics
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = 'rolling_state.npz'
+DEFAULT_HALFLIFE = 126
+# Bars read from the store at once when catching up
+READ_BLOCK = 256
+
+
+class RollingStatistics:
+    """Per-symbol incremental mean, variance and market covariance estimators."""
+
+    def __init__(self, symbols: List[str], halflife: Optional[float] = None, window: Optional[int] = None) -> None:
+        if window is not None and window < 2:
+            raise ValueError('window must be at least 2 bars')
+        if window is None and halflife is None:
+            halflife = DEFAULT_HALFLIFE
+        if halflife is not None and halflife <= 0:
+            raise ValueError('halflife must be positive')
+        self.window = window
+        self.halflife = None if window is not None else float(halflife)
+        self.alpha = 1.0 - 0.5 ** (1.0 / self.halflife) if self.halflife else 0.0
+        self.symbols: List[str] = []
+        self.last_date: Optional[np.datetime64] = None
+        self.bars = 0
+        self.count = np.zeros(0, dtype=np.int64)
+        # Exponentially weighted: means, variances and covariance per symbol
+        self.mean_r = np.zeros(0)
+        self.mean_m = np.zeros(0)
+        self.var_r = np.zeros(0)
+        self.var_m = np.zeros(0)
+        self.cov = np.zeros(0)
+        # Fixed window: sums of r, m, r*r, m*m, r*m over the window and the bars in it
+        self.sums = np.zeros((5, 0))
+        self.buffer = np.zeros((window or 0, 0), dtype=np.float32)
+        self.market_buffer = np.full(window or 0, np.nan)
+        self.position = 0
+        self.add_symbols(symbols)
+
+    @property
+    def method(self) -> str:
+        return f"window-{self.window}" if self.window else f"ewm-halflife-{self.halflife:g}"
+
+    def add_symbols(self, symbols: List[str]) -> None:
+        """Start tracking new symbols with empty estimates."""
+        tracked = set(self.symbols)
+        new = [symbol for symbol in symbols if symbol not in tracked]
+        if not new:
+            return
+        if self.bars:
+            logger.warning(f"{len(new)} new symbols only get statistics from bars after {self.last_date}; use --reset to include their history")
+        extra = len(new)
+        self.symbols = self.symbols + new
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        for name in ('mean_r', 'mean_m', 'var_r', 'var_m', 'cov'):
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(extra)]))
+        self.sums = np.concatenate([self.sums, np.zeros((5, extra))], axis=1)
+        self.buffer = np.concatenate([self.buffer, np.full((self.buffer.shape[0], extra), np.nan, dtype=np.float32)], axis=1)
+
+    def update(self, returns: np.ndarray, market_return: float, date: Optional[np.datetime64] = None) -> None:
+        """Fold one bar (a return per tracked symbol, NaN if missing) into the estimates."""
+        r = np.asarray(returns, dtype=np.float64)
+        m = float(market_return)
+        valid = ~np.isnan(r) & (not math.isnan(m))
+        if self.window:
+            self._update_window(r, m, valid)
+        else:
+            self._update_ewm(r, m, valid)
+        self.bars += 1
+        if date is not None:
+            self.last_date = date
+
+    def _update_ewm(self, r: np.ndarray, m: float, valid: np.ndarray) -> None:
+        index = np.flatnonzero(valid)
+        if not len(index):
+            return
+        self.count[index] += 1
+        # Equal weights until 1/count drops below alpha
+        a = np.maximum(self.alpha, 1.0 / self.count[index])
+        dr = r[index] - self.mean_r[index]
+        dm = m - self.mean_m[index]
+        self.mean_r[index] += a * dr
+        self.mean_m[index] += a * dm
+        keep = 1.0 - a
+        self.var_r[index] = keep * (self.var_r[index] + a * dr * dr)
+        self.var_m[index] = keep * (self.var_m[index] + a * dm * dm)
+        self.cov[index] = keep * (self.cov[index] + a * dr * dm)
+
+    def _contributions(self, r: np.ndarray, m: float, valid: np.ndarray) -> np.ndarray:
+        rv = np.where(valid, r, 0.0)
+        mv = np.where(valid, m, 0.0)
+        return np.stack([rv, mv, rv * rv, mv * mv, rv * mv])
+
+    def _update_window(self, r: np.ndarray, m: float, valid: np.ndarray) -> None:
+        old_r = self.buffer[self.position].astype(np.float64)
+        old_m = self.market_buffer[self.position]
+        old_valid = ~np.isnan(old_r) & (not math.isnan(old_m))
+        self.sums -= self._contributions(old_r, old_m, old_valid)
+        self.count -= old_valid
+        # Add the value as stored, so it cancels exactly when it leaves
+        r = r.astype(np.float32).astype(np.float64)
+        self.sums += self._contributions(r, m, valid)
+        self.count += valid
+        self.buffer[self.position] = r
+        self.market_buffer[self.position] = m
+        self.position = (self.position + 1) % self.window
+        if self.position == 0:
+            self._resum()
+
+    def _resum(self) -> None:
+        """Recompute the window sums from the ring buffer."""
+        r = self.buffer.astype(np.float64)
+        m = self.market_buffer[:, None]
+        valid = ~np.isnan(r) & ~np.isnan(m)
+        rv = np.where(valid, r, 0.0)
+        mv = np.where(valid, m, 0.0)
+        self.sums = np.stack([rv.sum(0), mv.sum(0), (rv * rv).sum(0), (mv * mv).sum(0), (rv * mv).sum(0)])
+        self.count = valid.sum(axis=0).astype(np.int64)
+
+    def statistics(self, min_observations: int = MIN_OBSERVATIONS) -> Dict[str, np.ndarray]:
+        """Annualised estimates per tracked symbol, in the format of :func:`prices.compute_statistics`."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if self.window:
+                n = self.count.astype(np.float64)
+                mean_r = self.sums[0] / n
+                mean_m = self.sums[1] / n
+                var_r = np.maximum(self.sums[2] / n - mean_r * mean_r, 0.0)
+                var_m = np.maximum(self.sums[3] / n - mean_m * mean_m, 0.0)
+                cov = self.sums[4] / n - mean_r * mean_m
+            else:
+                mean_r, var_r, var_m, cov = self.mean_r, self.var_r, self.var_m, self.cov
+            beta = cov / var_m
+            residual = np.maximum(var_r - beta * beta * var_m, 0.0)
+        enough = self.count >= min_observations
+        return {
+            'mean_return': np.where(enough, mean_r * TRADING_DAYS, np.nan),
+            'volatility': np.where(enough, np.sqrt(var_r * TRADING_DAYS), np.nan),
+            'beta': np.where(enough, beta, np.nan),
+            'idiosyncratic_volatility': np.where(enough, np.sqrt(residual * TRADING_DAYS), np.nan),
+            'observations': self.count.copy()
+        }
+
+    def update_from_store(self, store: PriceStore, stop: Optional[int] = None) -> int:
+        """
+        Process the store's bars after :attr:`last_date` and before index
+        ``stop`` (default: all of them); returns the number of new bars.
+        """
+        self.add_symbols(store.symbols)
+        position = {symbol: i for i, symbol in enumerate(self.symbols)}
+        columns = np.array([position[symbol] for symbol in store.symbols], dtype=np.int64)
+        start = 0 if self.last_date is None else int(np.searchsorted(store.dates, self.last_date, side='right'))
+        stop = len(store.dates) if stop is None else min(stop, len(store.dates))
+        bar = np.full(len(self.symbols), np.nan)
+        for block_start in range(start, stop, READ_BLOCK):
+            block_stop = min(block_start + READ_BLOCK, stop)
+            block = np.asarray(store.returns[:len(store.symbols), block_start:block_stop], dtype=np.float64)
+            for j in range(block_stop - block_start):
+                bar[columns] = block[:, j]
+                t = block_start + j
+                self.update(bar, store.market_returns[t], store.dates[t])
+        return max(0, stop - start)
+
+    # --- Persistence -------------------------------------------------------
+    def save(self, path: str) -> None:
+        meta = {
+            'symbols': self.symbols,
+            'halflife': self.halflife,
+            'window': self.window,
+            'last_date': str(self.last_date) if self.last_date is not None else None,
+            'bars': self.bars,
+            'position': self.position
+        }
+        partial_path = path + '.partial.npz'
+        np.savez(partial_path, meta=np.array(json.dumps(meta)), count=self.count, mean_r=self.mean_r,
+                 mean_m=self.mean_m, var_r=self.var_r, var_m=self.var_m, cov=self.cov, sums=self.sums,
+                 buffer=self.buffer, market_buffer=self.market_buffer)
+        os.replace(partial_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'RollingStatistics':
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            state = cls([], meta['halflife'], meta['window'])
+            state.symbols = meta['symbols']
+            state.last_date = np.datetime64(meta['last_date']) if meta['last_date'] else None
+            state.bars = meta['bars']
+            state.position = meta['position']
+            for name in ('count', 'mean_r', 'mean_m', 'var_r', 'var_m', 'cov', 'sums', 'buffer', 'market_buffer'):
+                setattr(state, name, data[name])
+        return state
+
+
+def update_store(
+    store_dir: str,
+    halflife: Optional[float] = None,
+    window: Optional[int] = None,
+    reset: bool = False,
+    min_observations: int = MIN_OBSERVATIONS
+) -> Dict:
+    """
+    Bring the rolling state of ``store_dir`` up to date with its returns,
+    then rewrite ``stats.json`` from it (bumping the universe version).
+    A saved state is reused unless ``reset`` is set or the estimator
+    settings differ.
+    """
+    start_time = time.perf_counter()
+    store = PriceStore(store_dir)
+    path = os.path.join(store_dir, STATE_FILE)
+    state = None
+    if not reset and os.path.exists(path):
+        state = RollingStatistics.load(path)
+        requested = RollingStatistics([], halflife, window)
+        if (halflife is not None or window is not None) and requested.method != state.method:
+            logger.info(f"Estimator changed from {state.method} to {requested.method}; starting over")
+            state = None
+    if state is None:
+        state = RollingStatistics(store.symbols, halflife, window)
+    new_bars = state.update_from_store(store)
+    state.save(path)
+
+    stats = state.statistics(min_observations)
+    position = {symbol: i for i, symbol in enumerate(state.symbols)}
+    columns = [position[symbol] for symbol in store.symbols]
+    stats = {name: values[columns] for name, values in stats.items()}
+    try:
+        previous = {entry['symbol']: entry for entry in read_statistics(store_dir)['symbols']}
+    except (OSError, ValueError, KeyError):
+        previous = {}
+    metadata = {
+        symbol: {k: v for k, v in entry.items() if k in ('name', 'sector', 'market_cap')}
+        for symbol, entry in previous.items()
+    }
+    version = write_statistics(store_dir, store.symbols, stats, metadata, state.method)
+    summary = {
+        'method': state.method,
+        'new_bars': new_bars,
+        'last_date': str(state.last_date) if state.last_date is not None else None,
+        'symbols': len(store.symbols),
+        'version': version,
+        'seconds': round(time.perf_counter() - start_time, 3)
+    }
+    logger.info(f"Rolling statistics: {new_bars} new bars for {len(store.symbols)} symbols, universe version {version}")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    update_parser = commands.add_parser('update', help='fold new bars into the rolling state and rewrite stats.json')
+    update_parser.add_argument('store', help='price store directory')
+    estimator = update_parser.add_mutually_exclusive_group()
+    estimator.add_argument('--halflife', type=float, help=f"exponential weighting half-life in days (default: {DEFAULT_HALFLIFE})")
+    estimator.add_argument('--window', type=int, help='fixed window length in days')
+    update_parser.add_argument('--reset', action='store_true', help='discard the saved state and start from the first bar')
+    update_parser.add_argument('--min-observations', type=int, default=MIN_OBSERVATIONS,
+                               help='fewest observations for a symbol to get statistics')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    try:
+        summary = update_store(args.store, args.halflife, args.window, args.reset, args.min_observations)
+    except (OSError, ValueError) as e:
+        print(f"Update failed: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Monte Carlo simulation of portfolio outcomes.
+
+Returns follow the single-factor model of :mod:`portfolio_core.risk`.
+Because the model is linear and Gaussian, a portfolio's return per step
+is itself normal with
+
+    variance = (portfolio beta * MARKET_VOLATILITY) ** 2
+               + sum(weight ** 2 * idiosyncratic volatility ** 2)
+
+so paths are generated for the portfolio directly instead of per stock.
+
+Paths are produced in fixed-size chunks and every statistic is
+accumulated in streaming form (counts, sums and fixed-bin histograms),
+so memory is bounded by the chunk size however many paths are run.
+Percentiles read from the histograms are accurate to within one bin.
+"""
+
+import math
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .risk import portfolio_risk
+
+DEFAULT_PERCENTILES = (5.0, 25.0, 50.0, 75.0, 95.0)
+DRAWDOWN_THRESHOLDS = (0.1, 0.2, 0.3, 0.5)
+
+# Normal draws generated per chunk (8 MiB of float64)
+CHUNK_DRAWS = 1 << 20
+# Histogram resolution
+HISTOGRAM_BINS = 4096
+
+
+class StreamingHistogram:
+    """
+    Fixed-bin histogram over ``[low, high]`` for streaming quantiles.
+    Values outside the range are counted in the end bins; the exact
+    minimum and maximum are tracked separately.
+    """
+
+    def __init__(self, low: float, high: float, bins: int = HISTOGRAM_BINS) -> None:
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.width = (high - low) / bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values: np.ndarray) -> None:
+        if values.size == 0:
+            return
+        index = ((values - self.low) / self.width).astype(np.int64)
+        np.clip(index, 0, self.bins - 1, out=index)
+        self.counts += np.bincount(index, minlength=self.bins)
+        self.count += values.size
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+
+    def quantile(self, q: float) -> float:
+        """Value below which a fraction ``q`` of the samples fall, interpolated within its bin."""
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        cumulative = np.cumsum(self.counts)
+        i = int(np.searchsorted(cumulative, rank, side='left'))
+        i = min(i, self.bins - 1)
+        before = cumulative[i - 1] if i > 0 else 0
+        in_bin = self.counts[i]
+        fraction = (rank - before) / in_bin if in_bin else 0.0
+        value = self.low + (i + float(fraction)) * self.width
+        return float(min(max(value, self.min), self.max))
+
+
+def _percentile_label(p: float) -> str:
+    return f"p{p:g}"
+
+
+def simulate(
+    stocks: List[Dict],
+    weights: Dict[str, float],
+    individual_returns: Dict[str, float],
+    target_return: Optional[float] = None,
+    num_paths: int = 10000,
+    horizon_years: float = 1.0,
+    steps_per_year: int = 12,
+    seed: Optional[int] = None,
+    percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+    chunk_draws: int = CHUNK_DRAWS
+) -> Dict:
+    """
+    Simulate ``num_paths`` wealth paths of the portfolio over
+    ``horizon_years`` and summarise the terminal value, annualised
+    return and maximum drawdown distributions.  ``target_return`` is an
+    annualised decimal; the probability of reaching it compares each
+    path's annualised return at the horizon.
+    """
+    start_time = time.perf_counter()
+    risk = portfolio_risk(stocks, weights, individual_returns)
+    steps = max(1, int(round(horizon_years * steps_per_year)))
+    dt = horizon_years / steps
+    sigma = risk['volatility']
+    # Log-return drift keeps the expected simple return at expected_return
+    mu_log = math.log1p(max(risk['expected_return'], -0.99))
+    drift = (mu_log - 0.5 * sigma ** 2) * dt
+    diffusion = sigma * math.sqrt(dt)
+
+    # Terminal log wealth is normal, so +-8 sd covers all but ~1e-15 of paths
+    center = drift * steps
+    spread = 8 * diffusion * math.sqrt(steps) + 1e-9
+    terminal = StreamingHistogram(center - spread, center + spread)
+    drawdown = StreamingHistogram(0.0, 1.0)
+    log_target = horizon_years * math.log1p(target_return) if target_return is not None else None
+    target_hits = 0
+    losses = 0
+    sum_value = 0.0
+    sum_value_sq = 0.0
+    drawdown_exceeded = np.zeros(len(DRAWDOWN_THRESHOLDS), dtype=np.int64)
+    thresholds = np.asarray(DRAWDOWN_THRESHOLDS)
+
+    rng = np.random.default_rng(seed)
+    chunk_paths = max(1, chunk_draws // steps)
+    remaining = num_paths
+    while remaining > 0:
+        n = min(chunk_paths, remaining)
+        remaining -= n
+        # Log wealth along each path, built in place
+        paths = rng.standard_normal((n, steps))
+        paths *= diffusion
+        paths += drift
+        np.cumsum(paths, axis=1, out=paths)
+        # Peak log wealth so far, including the starting value of 0
+        peak = np.maximum.accumulate(paths, axis=1)
+        np.maximum(peak, 0.0, out=peak)
+        np.subtract(paths, peak, out=peak)
+        max_drawdown = -np.expm1(peak.min(axis=1))
+        final = paths[:, -1]
+
+        terminal.add(final)
+        drawdown.add(max_drawdown)
+        values = np.exp(final)
+        sum_value += float(values.sum())
+        sum_value_sq += float(np.dot(values, values))
+        losses += int(np.count_nonzero(final < 0))
+        if log_target is not None:
+            target_hits += int(np.count_nonzero(final >= log_target))
+        drawdown_exceeded += (max_drawdown[:, None] >= thresholds).sum(axis=0)
+
+    mean_value = sum_value / num_paths
+    std_value = math.sqrt(max(0.0, sum_value_sq / num_paths - mean_value ** 2))
+    terminal_quantiles = {p: terminal.quantile(p / 100) for p in percentiles}
+
+    def round_all(values: Dict[float, float], digits: int = 4) -> Dict[str, float]:
+        return {_percentile_label(p): round(v, digits) for p, v in values.items()}
+
+    return {
+        'num_paths': num_paths,
+        'horizon_years': horizon_years,
+        'steps_per_year': steps_per_year,
+        'seed': seed,
+        'model': {k: round(v, 4) for k, v in risk.items()},
+        'terminal_value': {
+            'mean': round(mean_value, 4),
+            'std': round(std_value, 4),
+            'min': round(math.exp(terminal.min), 4),
+            'max': round(math.exp(terminal.max), 4),
+            'percentiles': round_all({p: math.exp(v) for p, v in terminal_quantiles.items()})
+        },
+        'annualized_return': {
+            'percentiles': round_all({p: math.expm1(v / horizon_years) for p, v in terminal_quantiles.items()})
+        },
+        'max_drawdown': {
+            'mean': round(drawdown.mean(), 4),
+            'max': round(drawdown.max, 4),
+            'percentiles': round_all({p: drawdown.quantile(p / 100) for p in percentiles}),
+            'probability_exceeding': {
+                f"{threshold:g}": round(int(count) / num_paths, 4)
+                for threshold, count in zip(DRAWDOWN_THRESHOLDS, drawdown_exceeded)
+            }
+        },
+        'target_return': target_return,
+        'probability_of_target': round(target_hits / num_paths, 4) if log_target is not None else None,
+        'probability_of_loss': round(losses / num_paths, 4),
+        'simulation_time': round(time.perf_counter() - start_time, 3)
+    }
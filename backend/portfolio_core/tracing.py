@@ -0,0 +1,79 @@
+"""
+Per-request stage tracing.
+
+A :class:`RequestTrace` installed for the current thread collects stage
+timings and details (such as weight-search iteration counts) from
+anywhere in the optimisation pipeline, without threading a trace object
+through every call.  The web layer turns it into a ``Server-Timing``
+header; benchmarks read it directly.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class RequestTrace:
+    """
+    Stage timings for a single request, reported back to the client in a
+    ``Server-Timing`` header and, on request, in the JSON body.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.stages: List[Dict] = []
+        self._open: List[Dict] = []
+
+    def begin(self, stage: str) -> Dict:
+        entry: Dict = {'stage': stage}
+        self.stages.append(entry)
+        self._open.append(entry)
+        return entry
+
+    def end(self, entry: Dict, duration: float) -> None:
+        entry['duration_ms'] = round(duration * 1000, 3)
+        if entry in self._open:
+            self._open.remove(entry)
+
+    def annotate(self, **details) -> None:
+        """Attach details (e.g. iteration counts) to the innermost open stage."""
+        if self._open:
+            self._open[-1].update(details)
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.start) * 1000, 3)
+
+    def server_timing(self) -> str:
+        """Format the recorded stages as a Server-Timing header value."""
+        parts = []
+        for entry in self.stages:
+            if 'duration_ms' not in entry:
+                continue
+            part = f"{entry['stage']};dur={entry['duration_ms']}"
+            details = ' '.join(f"{k}={v}" for k, v in entry.items() if k not in ('stage', 'duration_ms'))
+            if details:
+                part += f';desc="{details}"'
+            parts.append(part)
+        parts.append(f"total;dur={self.total_ms()}")
+        return ', '.join(parts)
+
+
+# Trace of the request being handled by the current thread, if any
+_trace_local = threading.local()
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return getattr(_trace_local, 'trace', None)
+
+
+def set_trace(trace: Optional[RequestTrace]) -> Optional[RequestTrace]:
+    """Install ``trace`` as the current thread's trace (None clears it)."""
+    _trace_local.trace = trace
+    return trace
+
+
+def annotate_trace(**details) -> None:
+    """Attach details to the current request's innermost open stage."""
+    trace = current_trace()
+    if trace is not None:
+        trace.annotate(**details)
@@ -0,0 +1,103 @@
+"""
+Stock universe: the built-in list, or one derived from an ingested price
+store (``PRICE_STORE_DIR``).
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Enhanced stock data with more realistic metrics
+ENHANCED_STOCKS = [
+    {'symbol': 'AAPL', 'name': 'Apple Inc.', 'sector': 'Technology', 'beta': 1.2, 'market_cap': 3000000000000},
+    {'symbol': 'MSFT', 'name': 'Microsoft Corp.', 'sector': 'Technology', 'beta': 1.1, 'market_cap': 2800000000000},
+    {'symbol': 'GOOGL', 'name': 'Alphabet Inc.', 'sector': 'Technology', 'beta': 1.3, 'market_cap': 1800000000000},
+    {'symbol': 'AMZN', 'name': 'Amazon.com Inc.', 'sector': 'Consumer Discretionary', 'beta': 1.4, 'market_cap': 1500000000000},
+    {'symbol': 'TSLA', 'name': 'Tesla Inc.', 'sector': 'Consumer Discretionary', 'beta': 2.1, 'market_cap': 800000000000},
+    {'symbol': 'META', 'name': 'Meta Platforms Inc.', 'sector': 'Technology', 'beta': 1.5, 'market_cap': 900000000000},
+    {'symbol': 'NVDA', 'name': 'NVIDIA Corp.', 'sector': 'Technology', 'beta': 1.8, 'market_cap': 1200000000000},
+    {'symbol': 'JPM', 'name': 'JPMorgan Chase & Co.', 'sector': 'Financial Services', 'beta': 1.0, 'market_cap': 450000000000},
+    {'symbol': 'JNJ', 'name': 'Johnson & Johnson', 'sector': 'Healthcare', 'beta': 0.7, 'market_cap': 420000000000},
+    {'symbol': 'V', 'name': 'Visa Inc.', 'sector': 'Financial Services', 'beta': 1.1, 'market_cap': 500000000000},
+    {'symbol': 'PG', 'name': 'Procter & Gamble', 'sector': 'Consumer Staples', 'beta': 0.5, 'market_cap': 380000000000},
+    {'symbol': 'UNH', 'name': 'UnitedHealth Group', 'sector': 'Healthcare', 'beta': 0.8, 'market_cap': 520000000000},
+    {'symbol': 'HD', 'name': 'Home Depot Inc.', 'sector': 'Consumer Discretionary', 'beta': 1.0, 'market_cap': 350000000000},
+    {'symbol': 'MA', 'name': 'Mastercard Inc.', 'sector': 'Financial Services', 'beta': 1.2, 'market_cap': 400000000000},
+    {'symbol': 'DIS', 'name': 'Walt Disney Co.', 'sector': 'Communication Services', 'beta': 1.3, 'market_cap': 200000000000},
+    {'symbol': 'PYPL', 'name': 'PayPal Holdings Inc.', 'sector': 'Financial Services', 'beta': 1.6, 'market_cap': 100000000000},
+    {'symbol': 'ADBE', 'name': 'Adobe Inc.', 'sector': 'Technology', 'beta': 1.4, 'market_cap': 250000000000},
+    {'symbol': 'CRM', 'name': 'Salesforce Inc.', 'sector': 'Technology', 'beta': 1.3, 'market_cap': 200000000000},
+    {'symbol': 'NFLX', 'name': 'Netflix Inc.', 'sector': 'Communication Services', 'beta': 1.7, 'market_cap': 180000000000},
+    {'symbol': 'INTC', 'name': 'Intel Corp.', 'sector': 'Technology', 'beta': 1.1, 'market_cap': 150000000000}
+]
+
+
+def load_universe(store_dir: Optional[str] = None) -> List[Dict]:
+    """
+    Return the built-in universe, or the symbols of the price store in
+    ``store_dir`` with historical betas, expected returns and
+    idiosyncratic volatilities.  Names and sectors come from the store's
+    metadata, then from the built-in list.  Symbols without statistics
+    are left out.
+    """
+    return read_universe(store_dir)[0]
+
+
+def read_universe(store_dir: Optional[str] = None) -> Tuple[List[Dict], int]:
+    """
+    Like :func:`load_universe`, also returning the universe version: 0 for
+    the built-in list, otherwise the store's statistics version, which
+    changes whenever the statistics are rewritten.
+    """
+    if not store_dir:
+        return ENHANCED_STOCKS, 0
+    from .prices import read_statistics
+    try:
+        statistics = read_statistics(store_dir)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Cannot load price store {store_dir}: {str(e)}; using built-in universe")
+        return ENHANCED_STOCKS, 0
+    stocks = stocks_from_statistics(statistics['symbols'])
+    if not stocks:
+        logger.error(f"Price store {store_dir} has no usable symbols; using built-in universe")
+        return ENHANCED_STOCKS, 0
+    version = statistics.get('version', 0)
+    logger.info(f"Loaded {len(stocks)} symbols from price store {store_dir} (universe version {version})")
+    return stocks, version
+
+
+def stocks_from_statistics(entries: List[Dict]) -> List[Dict]:
+    """
+    Stock dicts from per-symbol statistics entries (as in ``stats.json``),
+    skipping symbols without a beta.
+    """
+    known = {stock['symbol']: stock for stock in ENHANCED_STOCKS}
+    stocks = []
+    for entry in entries:
+        if entry.get('beta') is None:
+            continue
+        base = known.get(entry['symbol'], {})
+        stocks.append({
+            'symbol': entry['symbol'],
+            'name': entry.get('name') or base.get('name', entry['symbol']),
+            'sector': entry.get('sector') or base.get('sector', 'Unknown'),
+            'beta': round(entry['beta'], 3),
+            'market_cap': entry.get('market_cap') or base.get('market_cap', 0),
+            'expected_return': entry['mean_return'],
+            'volatility': entry['volatility'],
+            'idiosyncratic_volatility': entry['idiosyncratic_volatility'],
+            'observations': entry.get('observations')
+        })
+    return stocks
+
+
+def universe_stamp(store_dir: Optional[str]) -> Optional[int]:
+    """Modification time of the store's statistics, a cheap check for new versions."""
+    if not store_dir:
+        return None
+    try:
+        return os.stat(os.path.join(store_dir, 'stats.json')).st_mtime_ns
+    except OSError:
+        return None
@@ -1,689 +1,508 @@
 """
-Optimized version of the portfolio optimizer backend.
-
-This module refactors the original `production_app.py` by leveraging
-NumPy for vectorized operations when generating random portfolio
-weights and computing portfolio metrics.  Using vectorized array
-computations substantially reduces the overhead of Python loops and
-improves performance, especially when running many iterations of
-portfolio optimisation.  The API surface remains similar to the
-original code, so it can be used as a drop‐in replacement for
-`production_app.py`.
-
-Note: NumPy is used here for performance.  If NumPy is not
-available in your environment you can install it with
-`pip install numpy`.  The rest of the Flask application remains
-unchanged.
+Flask backend for the portfolio optimizer.
+
+The optimisation logic lives in the ``portfolio_core`` package, which has
+no web dependencies.  This module adds the HTTP layer on top of it:
+admission control, profiling, request capture, metrics endpoints and the
+React build.  :func:`create_app` builds the Flask application, so gunicorn
+can preload one app before forking (``gunicorn --preload
+'production_app:create_app()'``).  The shared optimizer, admission
+controller, profiler and request recorder are module-level objects
+created at import time; each worker process gets its own copy after the
+fork.
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Blueprint, Flask, request, jsonify, send_from_directory, Response, current_app, g
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import json
 import random
 import time
 import os
+import sys
+import threading
+import math
+import hmac
+import cProfile
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 import logging
 
-# New dependency for vectorised operations
-import numpy as np
+from portfolio_core.config import ProductionConfig
+from portfolio_core.engines import available_engines, get_engine
+from portfolio_core.metrics import metrics, stage_timer
+from portfolio_core.optimizer import PortfolioOptimizer, normalize_target_return, optimization_cache
+from portfolio_core.tracing import RequestTrace, set_trace
 
-# Configure logging for production
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Set static folder path - handle both relative and absolute paths
-# Hostinger path: typically in public_html or domain root
-static_folder_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'build')
-if not os.path.exists(static_folder_path):
-    # Fallback: try common Hostinger paths
-    # Hostinger typically uses public_html or domain root
+api = Blueprint('portfolio_optimizer', __name__)
+
+
+def _find_static_folder() -> str:
+    """Locate the React build folder, trying common Hostinger layouts."""
+    # Hostinger path: typically in public_html or domain root
+    static_folder_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'build')
+    if os.path.exists(static_folder_path):
+        return static_folder_path
     possible_paths = [
         os.path.join(os.path.expanduser('~'), 'domains', 'yourdomain.com', 'public_html', 'build'),
         os.path.join(os.path.expanduser('~'), 'public_html', 'build'),
         os.path.join('/home', os.getenv('USER', 'user'), 'public_html', 'build'),
-        os.path.join(os.path.dirname(os.path.dirname(__file__)), 'build'),
     ]
     for path in possible_paths:
         if os.path.exists(path):
-            static_folder_path = path
-            break
-    else:
-        # Try user home directory
-        static_folder_path = os.path.join(os.path.expanduser('~'), 'portfolio_optimizer', 'build')
-        if not os.path.exists(static_folder_path):
-            logger.warning(f"Build folder not found at {static_folder_path}. Frontend may not work.")
-            # Use a dummy path to avoid Flask errors
-            static_folder_path = os.path.dirname(os.path.dirname(__file__))
-
-app = Flask(__name__, static_folder=static_folder_path, static_url_path='')
-CORS(app)
-
-# Production configuration
-class ProductionConfig:
-    RISK_FREE_RATE = 0.02
-    MIN_STOCKS = 1
-    MAX_STOCKS = 50
-    DEFAULT_STOCKS = 10
-    DEFAULT_BETA = 1.0
-    CACHE_DURATION = 300  # 5 minutes
-    DEBUG = False
-
-app.config.from_object(ProductionConfig)
-
-# Enhanced stock data with more realistic metrics
-ENHANCED_STOCKS = [
-    {'symbol': 'AAPL', 'name': 'Apple Inc.', 'sector': 'Technology', 'beta': 1.2, 'market_cap': 3000000000000},
-    {'symbol': 'MSFT', 'name': 'Microsoft Corp.', 'sector': 'Technology', 'beta': 1.1, 'market_cap': 2800000000000},
-    {'symbol': 'GOOGL', 'name': 'Alphabet Inc.', 'sector': 'Technology', 'beta': 1.3, 'market_cap': 1800000000000},
-    {'symbol': 'AMZN', 'name': 'Amazon.com Inc.', 'sector': 'Consumer Discretionary', 'beta': 1.4, 'market_cap': 1500000000000},
-    {'symbol': 'TSLA', 'name': 'Tesla Inc.', 'sector': 'Consumer Discretionary', 'beta': 2.1, 'market_cap': 800000000000},
-    {'symbol': 'META', 'name': 'Meta Platforms Inc.', 'sector': 'Technology', 'beta': 1.5, 'market_cap': 900000000000},
-    {'symbol': 'NVDA', 'name': 'NVIDIA Corp.', 'sector': 'Technology', 'beta': 1.8, 'market_cap': 1200000000000},
-    {'symbol': 'JPM', 'name': 'JPMorgan Chase & Co.', 'sector': 'Financial Services', 'beta': 1.0, 'market_cap': 450000000000},
-    {'symbol': 'JNJ', 'name': 'Johnson & Johnson', 'sector': 'Healthcare', 'beta': 0.7, 'market_cap': 420000000000},
-    {'symbol': 'V', 'name': 'Visa Inc.', 'sector': 'Financial Services', 'beta': 1.1, 'market_cap': 500000000000},
-    {'symbol': 'PG', 'name': 'Procter & Gamble', 'sector': 'Consumer Staples', 'beta': 0.5, 'market_cap': 380000000000},
-    {'symbol': 'UNH', 'name': 'UnitedHealth Group', 'sector': 'Healthcare', 'beta': 0.8, 'market_cap': 520000000000},
-    {'symbol': 'HD', 'name': 'Home Depot Inc.', 'sector': 'Consumer Discretionary', 'beta': 1.0, 'market_cap': 350000000000},
-    {'symbol': 'MA', 'name': 'Mastercard Inc.', 'sector': 'Financial Services', 'beta': 1.2, 'market_cap': 400000000000},
-    {'symbol': 'DIS', 'name': 'Walt Disney Co.', 'sector': 'Communication Services', 'beta': 1.3, 'market_cap': 200000000000},
-    {'symbol': 'PYPL', 'name': 'PayPal Holdings Inc.', 'sector': 'Financial Services', 'beta': 1.6, 'market_cap': 100000000000},
-    {'symbol': 'ADBE', 'name': 'Adobe Inc.', 'sector': 'Technology', 'beta': 1.4, 'market_cap': 250000000000},
-    {'symbol': 'CRM', 'name': 'Salesforce Inc.', 'sector': 'Technology', 'beta': 1.3, 'market_cap': 200000000000},
-    {'symbol': 'NFLX', 'name': 'Netflix Inc.', 'sector': 'Communication Services', 'beta': 1.7, 'market_cap': 180000000000},
-    {'symbol': 'INTC', 'name': 'Intel Corp.', 'sector': 'Technology', 'beta': 1.1, 'market_cap': 150000000000}
-]
-
-# Cache for optimization results
-optimization_cache: Dict[str, Dict[str, float]] = {}
-
-
-class PortfolioOptimizer:
-    """
-    Portfolio optimisation logic using vectorised operations.
+            return path
+    # Try user home directory
+    static_folder_path = os.path.join(os.path.expanduser('~'), 'portfolio_optimizer', 'build')
+    if not os.path.exists(static_folder_path):
+        logger.warning(f"Build folder not found at {static_folder_path}. Frontend may not work.")
+        # Use a dummy path to avoid Flask errors
+        static_folder_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return static_folder_path
 
-    This class contains the core algorithms for selecting stocks and
-    computing portfolio weights.  Where the original implementation
-    iterated with Python lists, this version makes use of NumPy
-    arrays and dot products to accelerate the inner loops.  The
-    semantics of the methods remain the same.
+
+def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
+    """
+    Build the Flask application.  ``config`` entries override the
+    ``ProductionConfig`` defaults in ``app.config``.
     """
+    # Configure logging for production
+    logging.basicConfig(level=logging.INFO)
+    app = Flask(__name__, static_folder=_find_static_folder(), static_url_path='')
+    CORS(app)
+    app.config.from_object(ProductionConfig)
+    if config:
+        app.config.update(config)
+    if app.config['TRUSTED_PROXIES']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+    app.register_blueprint(api)
+    return app
 
-    def __init__(self) -> None:
-        self.stocks: List[Dict] = ENHANCED_STOCKS
-        self.risk_free_rate: float = ProductionConfig.RISK_FREE_RATE
 
-    # --- Input validation --------------------------------------------------
-    def validate_inputs(
-        self,
-        num_stocks: int,
-        target_beta: float,
-        target_return: Optional[float] = None,
-    ) -> Tuple[bool, str]:
-        """Validate input parameters for optimisation."""
-        if not isinstance(num_stocks, int) or num_stocks < ProductionConfig.MIN_STOCKS or num_stocks > ProductionConfig.MAX_STOCKS:
-            return False, f"Number of stocks must be between {ProductionConfig.MIN_STOCKS} and {ProductionConfig.MAX_STOCKS}"
-        if not isinstance(target_beta, (int, float)) or target_beta < 0.1 or target_beta > 3.0:
-            return False, "Target beta must be between 0.1 and 3.0"
-        if target_return is not None:
-            if not isinstance(target_return, (int, float)) or target_return < 0.01 or target_return > 0.50:
-                return False, "Target return must be between 1% and 50%"
-        return True, ""
-
-    # --- Stock selection ----------------------------------------------------
-    def select_stocks(self, num_stocks: int, strategy: str = 'diversified') -> List[Dict]:
-        """
-        Select a subset of stocks based on a strategy.
+def __getattr__(name: str):
+    # Compatibility for ``from production_app import app``: build the
+    # application on first access instead of at import time.
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-        Strategies:
-            * diversified: diversify across sectors with at least half the number of sectors.
-            * random: pick random stocks.
-            * target_return: return all stocks (optimization will select best subset).
-            * default: first N stocks.
 
-        Returns a list of stock dictionaries.
-        """
-        if strategy == 'diversified':
-            # Group stocks by sector
-            sectors: Dict[str, List[Dict]] = {}
-            selected: List[Dict] = []
-            for stock in self.stocks:
-                sector = stock['sector']
-                sectors.setdefault(sector, []).append(stock)
-            available_sectors = list(sectors.keys())
-            # Minimum industries for diversification: at least 3 or num_stocks//2
-            min_industries = min(max(3, num_stocks // 2), len(available_sectors))
-            # Sample sectors
-            sector_keys = random.sample(available_sectors, min(min_industries, len(available_sectors)))
-            # Distribute stocks across selected sectors
-            stocks_per_sector = num_stocks // len(sector_keys) if sector_keys else 1
-            remainder = num_stocks % len(sector_keys) if sector_keys else 0
-            for i, sector in enumerate(sector_keys):
-                count = stocks_per_sector + (1 if i < remainder else 0)
-                for _ in range(min(count, len(sectors[sector]))):
-                    selected.append(sectors[sector].pop(0))
-            # Fill remaining slots if needed
-            while len(selected) < num_stocks:
-                remaining = [s for s in self.stocks if s not in selected]
-                if not remaining:
-                    break
-                selected.append(remaining[0])
-            random.shuffle(selected)
-        elif strategy == 'random':
-            selected = random.sample(self.stocks, min(num_stocks, len(self.stocks)))
-        elif strategy == 'target_return':
-            # Target Return strategy: ignore num_stocks, find best mix to achieve target return
-            # This will be handled specially in the optimize method
-            # For now, return all stocks - optimization will select the best subset
-            return self.stocks.copy()
-        else:
-            selected = self.stocks[:num_stocks]
-        
-        # STRICT: Ensure exactly num_stocks are returned (or as many as available)
-        # EXCEPT for target_return strategy which ignores num_stocks
-        if strategy != 'target_return':
-            if len(selected) < num_stocks:
-                logger.warning(f"Requested {num_stocks} stocks but only {len(selected)} available. Using all available stocks.")
-            return selected[:num_stocks] if len(selected) >= num_stocks else selected
-        else:
-            # For target_return strategy, return all stocks (optimization will select best subset)
-            return self.stocks.copy()
+# Process start time, used for uptime reporting
+START_TIME = time.time()
 
-    # --- Metrics calculation -----------------------------------------------
-    def calculate_realistic_metrics(self, stocks: List[Dict], target_return: Optional[float] = None) -> Dict[str, float]:
-        """
-        Calculate realistic portfolio metrics such as expected return,
-        volatility, Sharpe ratio and beta.  This method remains
-        unchanged from the original implementation but is included for
-        completeness.
-        """
-        sector_returns = {
-            'Technology': 0.12,
-            'Healthcare': 0.08,
-            'Financial Services': 0.10,
-            'Consumer Discretionary': 0.11,
-            'Consumer Staples': 0.06,
-            'Communication Services': 0.09
-        }
-        total_market_cap = sum(stock['market_cap'] for stock in stocks)
-        weighted_beta = sum(stock['beta'] * (stock['market_cap'] / total_market_cap) for stock in stocks)
-        weighted_return = sum(sector_returns.get(stock['sector'], 0.08) * (stock['market_cap'] / total_market_cap) for stock in stocks)
-        volatility = random.uniform(0.15, 0.35) * (1 + weighted_beta * 0.1)
-        if target_return is not None:
-            max_possible = max(sector_returns.values()) + 0.05
-            min_possible = min(sector_returns.values()) - 0.02
-            if min_possible <= target_return <= max_possible:
-                expected_return = target_return + random.uniform(-0.01, 0.01)
-            else:
-                expected_return = weighted_return + random.uniform(-0.02, 0.02)
-        else:
-            expected_return = weighted_return + random.uniform(-0.02, 0.02)
-        sharpe_ratio = (expected_return - self.risk_free_rate) / volatility
-        return {
-            'expected_return': max(0.01, expected_return),
-            'volatility': max(0.05, volatility),
-            'sharpe_ratio': max(0.1, sharpe_ratio),
-            'portfolio_beta': max(0.1, weighted_beta),
-            'target_achieved': target_return is not None and abs(expected_return - target_return) < 0.02
-        }
-
-    # --- Weight optimisation -----------------------------------------------
-    def optimize_portfolio_weights(
-        self,
-        stocks: List[Dict],
-        target_beta: float,
-        individual_returns: Optional[Dict[str, float]] = None,
-        target_return: Optional[float] = None,
-        strategy: str = 'diversified'
-    ) -> Dict[str, float]:
-        """
-        Optimise portfolio weights to match a target beta and optionally a
-        target return.  This method uses NumPy arrays to generate
-        random weights and compute portfolio returns and betas using
-        vectorised dot products.  For target_return strategy, prioritizes
-        return matching above all else.
-        """
-        n = len(stocks)
-        # Precompute arrays of returns and betas
-        stock_symbols = [stock['symbol'] for stock in stocks]
-        if individual_returns is not None:
-            stock_returns = np.array([individual_returns.get(sym, 0.08) for sym in stock_symbols])
-        else:
-            stock_returns = np.array([0.08] * n)
-        stock_betas = np.array([stock['beta'] for stock in stocks])
-        
-        # For target_return strategy, use more attempts and prioritize return
-        max_attempts = 10000 if strategy == 'target_return' else 5000
-        best_weights = None
-        best_score = float('inf')
-        best_return_diff = float('inf')
-        
-        for _ in range(max_attempts):
-            # Generate random weights using NumPy; this ensures they sum to 1
-            raw_weights = np.random.rand(n)
-            weights_arr = raw_weights / raw_weights.sum()
-            # Compute portfolio beta via dot product
-            portfolio_beta = float(np.dot(weights_arr, stock_betas))
-            beta_diff = abs(portfolio_beta - target_beta)
-            
-            # Compute return diff if applicable
-            if target_return is not None and individual_returns is not None:
-                portfolio_return = float(np.dot(weights_arr, stock_returns))
-                return_diff = abs(portfolio_return - target_return)
-                
-                # For target_return strategy, prioritize return matching
-                if strategy == 'target_return':
-                    # Prioritize return matching - use return_diff as primary score
-                    score = return_diff * 1000 + beta_diff
-                else:
-                    score = return_diff * 10 + beta_diff
-            else:
-                score = beta_diff
-                return_diff = float('inf')
-            
-            # Keep best
-            if score < best_score:
-                best_score = score
-                best_weights = weights_arr.copy()
-                if target_return is not None:
-                    best_return_diff = return_diff
-            
-            # Early exit for target_return strategy if return is very close
-            if strategy == 'target_return' and target_return is not None and individual_returns is not None:
-                if return_diff < 0.0001:
-                    best_weights = weights_arr
-                    break
-            # Early exit if sufficiently close
-            elif target_return is not None and individual_returns is not None:
-                if return_diff < 0.01 and beta_diff < 0.05:
-                    best_weights = weights_arr
-                    break
-            elif beta_diff < 0.05:
-                best_weights = weights_arr
-                break
-        # Fallback equal weights
-        if best_weights is None:
-            best_weights = np.array([1.0 / n] * n)
-        # Convert to dictionary keyed by symbol
-        return {sym: weight for sym, weight in zip(stock_symbols, best_weights)}
-
-    def optimize_portfolio_weights_strict(
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate`` tokens per second."""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, capacity: float, now: float) -> None:
+        self.tokens = capacity
+        self.updated = now
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded wait queue and per-client token
+    buckets for expensive optimisation requests.
+
+    At most ``max_concurrent`` searches run at once; up to ``max_queued``
+    further requests wait (for at most ``queue_timeout`` seconds) for a
+    slot, and anything beyond that is rejected immediately so the caller
+    can answer with 503 instead of piling more work onto the server.
+    At most ``max_clients`` buckets are kept; the least recently seen
+    client's bucket is dropped to make room for a new one.
+    """
+
+    # Idle buckets are dropped after this many seconds
+    BUCKET_TTL = 600
+
+    def __init__(
         self,
-        stocks: List[Dict],
-        target_beta: float,
-        individual_returns: Optional[Dict[str, float]] = None,
-        target_return: Optional[float] = None,
-        strategy: str = 'diversified'
-    ) -> Dict[str, float]:
+        max_concurrent: int,
+        max_queued: int,
+        queue_timeout: float,
+        rate_per_minute: int,
+        burst: int,
+        max_clients: int = 10000
+    ) -> None:
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queued = max(0, max_queued)
+        self.queue_timeout = queue_timeout
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_clients = max(1, max_clients)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._avg_service_time = 1.0
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._last_prune = time.monotonic()
+        self.admitted = 0
+        self.rejected_busy = 0
+        self.rejected_rate = 0
+
+    def check_rate(self, client_id: str) -> float:
         """
-        Optimise portfolio weights with the strict requirement that
-        all stocks receive a non-zero weight.  Uses NumPy for
-        efficient weight generation and portfolio calculations.
-        For target_return strategy, prioritizes return matching.
+        Take one token from the client's bucket.  Returns 0 if the request
+        is allowed, otherwise the number of seconds until a token is free.
         """
-        n = len(stocks)
-        min_weight = 0.01
-        if n * min_weight > 1.0:
-            min_weight = 1.0 / n
-        stock_symbols = [stock['symbol'] for stock in stocks]
-        if individual_returns is not None:
-            stock_returns = np.array([individual_returns.get(sym, 0.08) for sym in stock_symbols])
-        else:
-            stock_returns = np.array([0.08] * n)
-        stock_betas = np.array([stock['beta'] for stock in stocks])
-        
-        # For target_return strategy, use more attempts
-        max_attempts = 20000 if strategy == 'target_return' else 10000
-        best_weights = None
-        best_score = float('inf')
-        best_return_diff = float('inf')
-        
-        for _ in range(max_attempts):
-            # Start with minimum weights for all
-            weights_arr = np.full(n, min_weight)
-            remaining = 1.0 - (n * min_weight)
-            if remaining > 0:
-                raw_additional = np.random.rand(n)
-                total_additional = raw_additional.sum()
-                if total_additional > 0:
-                    weights_arr += (raw_additional / total_additional) * remaining
-            # Compute portfolio beta
-            portfolio_beta = float(np.dot(weights_arr, stock_betas))
-            beta_diff = abs(portfolio_beta - target_beta)
-            
-            # For target_return strategy, prioritize return matching
-            if strategy == 'target_return' and target_return is not None and individual_returns is not None:
-                portfolio_return = float(np.dot(weights_arr, stock_returns))
-                return_diff = abs(portfolio_return - target_return)
-                # Prioritize return matching - use return_diff as primary score
-                score = return_diff * 1000 + beta_diff
-            else:
-                score = beta_diff
-                if target_return is not None and individual_returns is not None:
-                    portfolio_return = float(np.dot(weights_arr, stock_returns))
-                    return_diff = abs(portfolio_return - target_return)
-                    score = return_diff * 10 + beta_diff
-            
-            if score < best_score:
-                best_score = score
-                best_weights = weights_arr.copy()
-                if target_return is not None and individual_returns is not None:
-                    portfolio_return = float(np.dot(weights_arr, stock_returns))
-                    best_return_diff = abs(portfolio_return - target_return)
-            
-            # Early exit for target_return strategy if return is very close
-            if strategy == 'target_return' and target_return is not None and individual_returns is not None:
-                portfolio_return = float(np.dot(weights_arr, stock_returns))
-                if abs(portfolio_return - target_return) < 0.0001:
-                    break
-            # Early exit
-            elif target_return is not None and individual_returns is not None:
-                if score < 0.001 and beta_diff < 0.05:
-                    best_weights = weights_arr
-                    break
-            elif beta_diff < 0.05:
-                best_weights = weights_arr
-                break
-        if best_weights is None:
-            best_weights = np.array([1.0 / n] * n)
-        return {sym: weight for sym, weight in zip(stock_symbols, best_weights)}
-
-    # --- Main optimisation interface ---------------------------------------
-    def optimize(
-        self,
-        num_stocks: int,
-        target_beta: float,
-        target_return: Optional[float] = None,
-        strategy: str = 'diversified'
-    ) -> Dict:
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._cond:
+            if now - self._last_prune > self.BUCKET_TTL:
+                self._buckets = {k: b for k, b in self._buckets.items() if now - b.updated < self.BUCKET_TTL}
+                self._last_prune = now
+            # Re-inserted on every request, so the first key is the least
+            # recently seen client
+            bucket = self._buckets.pop(client_id, None)
+            if bucket is None:
+                bucket = TokenBucket(self.burst, now)
+                if len(self._buckets) >= self.max_clients:
+                    del self._buckets[next(iter(self._buckets))]
+            self._buckets[client_id] = bucket
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            if bucket.tokens >= 1.0:
+                bucket.tokens -= 1.0
+                return 0.0
+            self.rejected_rate += 1
+            return (1.0 - bucket.tokens) / self.rate
+
+    def acquire(self) -> Tuple[bool, float]:
         """
-        Perform end-to-end portfolio optimisation.  This method
-        validates inputs, selects stocks, computes individual returns,
-        optimises weights, ensures no zero-weight stocks, and returns
-        the optimisation results along with various metrics.
+        Wait for a free optimisation slot.  Returns ``(admitted,
+        retry_after)`` where ``retry_after`` is a suggested back-off in
+        seconds when the request was rejected.
         """
-        start_time = time.time()
-        
-        # For target_return strategy, target_return is required
-        if strategy == 'target_return' and target_return is None:
-            return {'error': 'Target Return strategy requires a target return to be specified'}
-        
-        # Validate inputs (skip num_stocks validation for target_return strategy)
-        if strategy != 'target_return':
-            is_valid, error_msg = self.validate_inputs(num_stocks, target_beta, target_return)
-            if not is_valid:
-                return {'error': error_msg}
-        
-        # Check cache
-        # For target_return strategy, num_stocks is not relevant for caching
-        cache_num_stocks = 0 if strategy == 'target_return' else num_stocks
-        cache_key = f"{cache_num_stocks}_{target_beta}_{target_return}_{strategy}"
-        if cache_key in optimization_cache:
-            cached_result = optimization_cache[cache_key]
-            if time.time() - cached_result['timestamp'] < ProductionConfig.CACHE_DURATION:
-                logger.info(f"Returning cached result for {cache_key}")
-                return cached_result['data']
-        
-        # Select stocks
-        # For target_return strategy, ignore num_stocks and find optimal mix
-        if strategy == 'target_return' and target_return is not None:
-            # Calculate returns for all stocks first
-            all_individual_returns = self._calculate_individual_returns(self.stocks, target_return)
-            
-            # Find optimal subset of stocks that can achieve target return
-            selected_stocks = self._select_stocks_for_target_return(target_return, all_individual_returns)
-            logger.info(f"Target Return strategy selected {len(selected_stocks)} stocks to achieve {target_return:.1%} return")
-        else:
-            selected_stocks = self.select_stocks(num_stocks, strategy)
-        
-        # Calculate individual stock returns
-        individual_returns = self._calculate_individual_returns(selected_stocks, target_return)
-        
-        # Optimise weights (pass strategy for target_return handling)
-        weights = self.optimize_portfolio_weights(selected_stocks, target_beta, individual_returns, target_return, strategy)
-        
-        # Ensure no zero-weight stocks
-        stocks_with_zero = [s for s in selected_stocks if weights.get(s['symbol'], 0) < 0.001]
-        if stocks_with_zero:
-            # Re-optimize with strict constraint (pass strategy)
-            weights = self.optimize_portfolio_weights_strict(selected_stocks, target_beta, individual_returns, target_return, strategy)
-        
-        # Final verification: ensure all selected stocks have weights
-        # For target_return strategy, use actual number of selected stocks
-        # For other strategies, use num_stocks
-        expected_stock_count = len(selected_stocks) if strategy == 'target_return' else num_stocks
-        stocks_with_weight = [s for s in selected_stocks if weights.get(s['symbol'], 0) > 0.001]
-        if len(stocks_with_weight) < expected_stock_count:
-            # This shouldn't happen, but if it does, ensure all stocks get equal weights
-            per_stock = 1.0 / len(selected_stocks)
-            weights = {stock['symbol']: per_stock for stock in selected_stocks}
-        
-        # Calculate final metrics using actual optimized weights
-        # Expected return = sum(weights * individual_returns) - NEVER force to target
-        actual_beta = sum(weights.get(s['symbol'], 0) * s.get('beta', 1.0) for s in selected_stocks if weights.get(s['symbol'], 0) > 0.001)
-        actual_return = sum(weights.get(s['symbol'], 0) * individual_returns.get(s['symbol'], 0.08) for s in selected_stocks if weights.get(s['symbol'], 0) > 0.001)
-        
-        # Safety check: ensure we have valid values
-        if not selected_stocks or len(selected_stocks) == 0:
-            logger.error("No stocks selected for optimization")
-            return {'error': 'No stocks selected. Please try again.'}
-        
-        if actual_beta == 0 or actual_return == 0:
-            logger.warning(f"Zero values detected: beta={actual_beta}, return={actual_return}")
-            # Use default values if calculation failed
-            if actual_beta == 0:
-                actual_beta = sum(s.get('beta', 1.0) / len(selected_stocks) for s in selected_stocks)
-            if actual_return == 0:
-                actual_return = sum(individual_returns.get(s['symbol'], 0.08) / len(selected_stocks) for s in selected_stocks)
-        volatility = random.uniform(0.15, 0.35) * (1 + actual_beta * 0.1)
-        sharpe_ratio = (actual_return - self.risk_free_rate) / volatility if volatility > 0 else 0.1
-        
-        # Consistency checks
-        total_weight = sum(weights.values())
-        if abs(total_weight - 1.0) > 1e-6:
-            logger.warning(f"Weights don't sum to 1.0: {total_weight}")
-            # Normalize weights
-            weights = {k: v / total_weight for k, v in weights.items()}
-            # Recalculate with normalized weights
-            actual_return = sum(weights.get(s['symbol'], 0) * individual_returns.get(s['symbol'], 0.08) for s in selected_stocks if weights.get(s['symbol'], 0) > 0.001)
-            actual_beta = sum(weights.get(s['symbol'], 0) * s.get('beta', 1.0) for s in selected_stocks if weights.get(s['symbol'], 0) > 0.001)
-        
-        # Check for negative weights (shorting not allowed)
-        negative_weights = [k for k, v in weights.items() if v < -1e-6]
-        if negative_weights:
-            logger.warning(f"Negative weights found: {negative_weights}")
-        
-        # Target achieved check with tolerance (0.25% = 0.0025)
-        tolerance = 0.0025  # 0.25% tolerance
-        target_achieved = target_return is None or abs(actual_return - target_return) <= tolerance
-        
-        # Debug logging for target_return strategy
-        if strategy == 'target_return' and target_return is not None:
-            logger.info(f"Target Return Strategy Debug:")
-            logger.info(f"  target_return_input: {target_return:.4f} ({target_return*100:.2f}%)")
-            logger.info(f"  computed_expected_return: {actual_return:.4f} ({actual_return*100:.2f}%)")
-            logger.info(f"  difference: {abs(actual_return - target_return):.4f} ({abs(actual_return - target_return)*100:.2f}%)")
-            logger.info(f"  tolerance: {tolerance:.4f} ({tolerance*100:.2f}%)")
-            logger.info(f"  target_achieved: {target_achieved}")
-        # Ensure all numeric values are valid
-        actual_beta = float(actual_beta) if actual_beta is not None else 1.0
-        actual_return = float(actual_return) if actual_return is not None else 0.08
-        volatility = float(volatility) if volatility is not None else 0.20
-        sharpe_ratio = float(sharpe_ratio) if sharpe_ratio is not None else 0.1
-        
-        result = {
-            'weights': weights,
-            'stocks': selected_stocks,
-            'individual_returns': individual_returns,
-            'target_beta': float(target_beta),
-            'actual_beta': round(actual_beta, 3),
-            'target_return': float(target_return) if target_return is not None else None,
-            'expected_return': round(actual_return, 4),
-            'volatility': round(volatility, 4),
-            'sharpe_ratio': round(sharpe_ratio, 3),
-            'target_achieved': bool(target_achieved),
-            'optimization_time': round(time.time() - start_time, 3),
-            'strategy_used': str(strategy),
-            'message': self._generate_optimization_message(len(selected_stocks) if strategy == 'target_return' else num_stocks, strategy, target_return, actual_return, target_achieved)
-        }
-        optimization_cache[cache_key] = {
-            'data': result,
-            'timestamp': time.time()
-        }
-        logger.info(f"Optimization completed in {result['optimization_time']}s")
-        return result
-
-    # --- Individual returns calculation -----------------------------------
-    def _calculate_individual_returns(self, stocks: List[Dict], target_return: Optional[float] = None) -> Dict[str, float]:
-        """Calculate deterministic individual stock returns."""
-        sector_returns = {
-            'Technology': 0.12,
-            'Healthcare': 0.08,
-            'Financial Services': 0.10,
-            'Consumer Discretionary': 0.11,
-            'Consumer Staples': 0.06,
-            'Communication Services': 0.09
-        }
-        individual_returns: Dict[str, float] = {}
-        for stock in stocks:
-            base_return = sector_returns.get(stock['sector'], 0.08)
-            beta_factor = (stock['beta'] - 1.0) * 0.02
-            symbol_hash = hash(stock['symbol']) % 1000 / 10000.0
-            deterministic_factor = (symbol_hash - 0.05) * 0.4
-            indiv_return = base_return + beta_factor + deterministic_factor
-            individual_returns[stock['symbol']] = max(0.01, indiv_return)
-        if target_return is not None:
-            min_return = min(individual_returns.values())
-            max_return = max(individual_returns.values())
-            if target_return < min_return:
-                lowest_stock = min(individual_returns.items(), key=lambda x: x[1])[0]
-                individual_returns[lowest_stock] = target_return - 0.01
-            elif target_return > max_return:
-                highest_stock = max(individual_returns.items(), key=lambda x: x[1])[0]
-                individual_returns[highest_stock] = target_return + 0.01
-        return individual_returns
-
-    def _select_stocks_for_target_return(self, target_return: float, individual_returns: Dict[str, float]) -> List[Dict]:
-        """Select optimal stocks to achieve target return - finds best mix regardless of count"""
-        # Strategy: Find minimum number of stocks that can achieve target return
-        # Prioritize stocks with returns close to target, good diversification, and reasonable beta
-        
-        # Calculate expected returns for all stocks
-        stock_scores = []
-        for stock in self.stocks:
-            symbol = stock['symbol']
-            stock_return = individual_returns.get(symbol, 0.08)
-            
-            # Score based on:
-            # 1. How close return is to target (closer is better)
-            # 2. Beta (prefer moderate beta around 1.0)
-            # 3. Diversification (prefer different sectors)
-            return_diff = abs(stock_return - target_return)
-            beta_score = 1.0 - abs(stock['beta'] - 1.0) / 2.0  # Prefer beta around 1.0
-            score = (1.0 / (1.0 + return_diff * 10)) * 0.6 + beta_score * 0.4
-            
-            stock_scores.append((stock, score, stock_return))
-        
-        # Sort by score (best first)
-        stock_scores.sort(key=lambda x: x[1], reverse=True)
-        
-        # Try to find minimum set that can achieve target return
-        # Start with top stocks and check if we can achieve target
-        selected = []
-        min_stocks = 2  # At least 2 stocks for diversification
-        max_stocks = len(self.stocks)  # Can use all stocks if needed
-        
-        # Try different portfolio sizes
-        for portfolio_size in range(min_stocks, min(max_stocks + 1, 20)):  # Limit to 20 stocks max
-            candidate_stocks = [s[0] for s in stock_scores[:portfolio_size]]
-            candidate_returns = [s[2] for s in stock_scores[:portfolio_size]]
-            
-            # Check if this set can achieve target return
-            min_possible = min(candidate_returns)
-            max_possible = max(candidate_returns)
-            
-            if min_possible <= target_return <= max_possible:
-                # This set can achieve target - use it
-                selected = candidate_stocks
-                break
-        
-        # If no set found, use top stocks that bracket the target
-        if not selected:
-            # Find stocks above and below target
-            above_target = [s for s in stock_scores if s[2] >= target_return]
-            below_target = [s for s in stock_scores if s[2] < target_return]
-            
-            # Take best from each group
-            if above_target and below_target:
-                selected = [above_target[0][0], below_target[0][0]]
-            elif above_target:
-                selected = [s[0] for s in above_target[:3]]
-            elif below_target:
-                selected = [s[0] for s in below_target[:3]]
-            else:
-                # Fallback: top 5 stocks
-                selected = [s[0] for s in stock_scores[:5]]
-        
-        # Ensure diversification: add stocks from different sectors if possible
-        selected_sectors = {s['sector'] for s in selected}
-        sectors = {}
-        for stock in self.stocks:
-            if stock['sector'] not in sectors:
-                sectors[stock['sector']] = []
-            sectors[stock['sector']].append(stock)
-        
-        # If we have few sectors, add one stock from each missing sector
-        if len(selected_sectors) < 3 and len(selected) < 10:
-            for sector, stocks_in_sector in sectors.items():
-                if sector not in selected_sectors and len(selected) < 10:
-                    # Find best stock from this sector
-                    sector_stocks = [(s, individual_returns.get(s['symbol'], 0.08)) 
-                                    for s in stocks_in_sector if s not in selected]
-                    if sector_stocks:
-                        best_sector_stock = max(sector_stocks, key=lambda x: x[1])
-                        selected.append(best_sector_stock[0])
-                        selected_sectors.add(sector)
-        
-        return selected
+        with self._cond:
+            if self._active < self.max_concurrent:
+                self._active += 1
+                self.admitted += 1
+                return True, 0.0
+            if self._waiting >= self.max_queued:
+                self.rejected_busy += 1
+                return False, self._retry_after()
+            self._waiting += 1
+            try:
+                deadline = time.monotonic() + self.queue_timeout
+                while self._active >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_busy += 1
+                        return False, self._retry_after()
+                    self._cond.wait(remaining)
+                self._active += 1
+                self.admitted += 1
+                return True, 0.0
+            finally:
+                self._waiting -= 1
+
+    def release(self, service_time: float) -> None:
+        """Free a slot and fold ``service_time`` into the back-off estimate."""
+        with self._cond:
+            self._active -= 1
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+            self._cond.notify()
+
+    def _retry_after(self) -> float:
+        # Time for the current queue to drain through the available slots
+        return self._avg_service_time * (self._waiting + self.max_concurrent) / self.max_concurrent
+
+    def snapshot(self) -> Dict:
+        """Return current limiter state for the stats endpoint."""
+        with self._cond:
+            return {
+                'active': self._active,
+                'queued': self._waiting,
+                'max_concurrent': self.max_concurrent,
+                'max_queued': self.max_queued,
+                'admitted': self.admitted,
+                'rejected_busy': self.rejected_busy,
+                'rejected_rate_limited': self.rejected_rate,
+                'tracked_clients': len(self._buckets)
+            }
+
+
+def _client_id() -> str:
+    """
+    Identify the calling client.  Behind ``TRUSTED_PROXIES`` proxies,
+    ProxyFix has already set ``remote_addr`` from X-Forwarded-For.
+    """
+    return request.remote_addr or 'unknown'
+
+
+def _retry_response(status: int, error: str, message: str, retry_after: float):
+    """Build a fast rejection response carrying a Retry-After header."""
+    response = jsonify({'error': error, 'message': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
 
-    # --- Message generation ------------------------------------------------
-    def _generate_optimization_message(
-        self,
-        num_stocks: int,
-        strategy: str,
-        target_return: Optional[float],
-        actual_return: float,
-        target_achieved: bool
-    ) -> str:
-        """
-        Generate a human readable message summarising the optimisation
-        results.
-        """
-        if strategy == 'target_return':
-            base_message = f'Portfolio optimized using Target Return strategy with {num_stocks} stocks!'
-            if target_return is not None:
-                if target_achieved:
-                    return f"{base_message} Target return of {target_return:.1%} achieved (expected: {actual_return:.2%})."
-                else:
-                    return f"{base_message} Target return of {target_return:.1%} not fully achievable. Best achievable: {actual_return:.2%} (closest feasible solution)."
-            return base_message
-        else:
-            base_message = f'Portfolio optimized with {num_stocks} stocks using {strategy} strategy!'
-        
-        if target_return is not None:
-            if target_achieved:
-                return f"{base_message} Target return of {target_return:.1%} achieved with {actual_return:.2%} expected return."
-            else:
-                return f"{base_message} Target return of {target_return:.1%} not fully achievable. Best achievable: {actual_return:.2%}."
-        return base_message
 
 # Initialize optimizer
 optimizer = PortfolioOptimizer()
+admission = AdmissionController(
+    ProductionConfig.MAX_CONCURRENT_OPTIMIZATIONS,
+    ProductionConfig.MAX_QUEUED_OPTIMIZATIONS,
+    ProductionConfig.QUEUE_TIMEOUT,
+    ProductionConfig.RATE_LIMIT_PER_MINUTE,
+    ProductionConfig.RATE_LIMIT_BURST,
+    ProductionConfig.RATE_LIMIT_MAX_CLIENTS
+)
+
+class SamplingProfiler:
+    """
+    Low-overhead sampling profiler for a single thread.  A background
+    thread reads the target thread's stack every ``interval`` seconds and
+    counts identical stacks in collapsed (``a;b;c count``) form, which
+    flame graph tools read directly.
+    """
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if names:
+                stack = ';'.join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Dict[str, int]:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+class ProfileManager:
+    """
+    Profiles live optimisation requests on demand and keeps the output
+    files in ``directory``.  Profiling is armed for the next N calls via
+    :meth:`arm`, or forced for a single request.
+    """
+
+    MODES = ('sample', 'cprofile')
+
+    def __init__(self, directory: str, mode: str, sample_interval: float, max_files: int) -> None:
+        self.directory = directory
+        self.mode = mode if mode in self.MODES else 'sample'
+        self.sample_interval = sample_interval
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._armed_mode = self.mode
+        # Only one cProfile profiler can be active per process
+        self._cprofile_lock = threading.Lock()
+
+    def arm(self, count: int, mode: Optional[str] = None) -> None:
+        """Profile the next ``count`` optimisation calls."""
+        with self._lock:
+            self._remaining = max(0, count)
+            self._armed_mode = mode if mode in self.MODES else self.mode
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {'remaining': self._remaining, 'mode': self._armed_mode, 'directory': self.directory}
+
+    def _take(self, forced: bool) -> Optional[str]:
+        with self._lock:
+            if self._remaining > 0:
+                self._remaining -= 1
+                return self._armed_mode
+        return self.mode if forced else None
+
+    @contextmanager
+    def session(self, forced: bool, label: str):
+        """Profile the enclosed block if profiling is armed or ``forced``."""
+        mode = self._take(forced)
+        if mode is None:
+            yield
+            return
+        if mode == 'cprofile' and not self._cprofile_lock.acquire(blocking=False):
+            logger.info("cProfile busy with another request, sampling instead")
+            mode = 'sample'
+        if mode == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                self._cprofile_lock.release()
+                path = self._new_path(label, 'prof')
+                if path:
+                    profile.dump_stats(path)
+                    self._prune()
+        else:
+            sampler = SamplingProfiler(threading.get_ident(), self.sample_interval)
+            sampler.start()
+            try:
+                yield
+            finally:
+                stacks = sampler.stop()
+                path = self._new_path(label, 'collapsed')
+                if path:
+                    with open(path, 'w') as f:
+                        for stack, count in sorted(stacks.items()):
+                            f.write(f"{stack} {count}\n")
+                    self._prune()
+
+    def _new_path(self, label: str, extension: str) -> Optional[str]:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError as e:
+            logger.error(f"Cannot create profile directory {self.directory}: {str(e)}")
+            return None
+        safe_label = ''.join(c if c.isalnum() or c in '-_' else '_' for c in label)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        return os.path.join(self.directory, f"optimize_{stamp}_{safe_label}_{os.getpid()}.{extension}")
+
+    def list_profiles(self) -> List[Dict]:
+        """Return the stored profile files, newest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(('.prof', '.collapsed')):
+                continue
+            stat = os.stat(os.path.join(self.directory, filename))
+            profiles.append({
+                'file': filename,
+                'size': stat.st_size,
+                'created': datetime.fromtimestamp(stat.st_mtime).isoformat()
+            })
+        profiles.sort(key=lambda p: p['created'], reverse=True)
+        return profiles
+
+    def _prune(self) -> None:
+        for stale in self.list_profiles()[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, stale['file']))
+            except OSError:
+                pass
+
+
+profiler = ProfileManager(
+    ProductionConfig.PROFILE_DIR,
+    ProductionConfig.PROFILE_MODE,
+    ProductionConfig.PROFILE_SAMPLE_INTERVAL,
+    ProductionConfig.PROFILE_MAX_FILES
+)
+
+
+class RequestRecorder:
+    """
+    Appends one JSON line per captured request to a size-rotated file
+    (``optimize_requests.jsonl``, ``.1``, ``.2``, ...).  Each line is a
+    single write to a file opened in append mode, so lines from several
+    worker processes do not interleave.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int, sample_rate: float) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def record(self, entry: Dict) -> None:
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, 'a') as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning(f"Could not capture request: {str(e)}")
+
+    def _rotate(self) -> None:
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+recorder = RequestRecorder(
+    ProductionConfig.CAPTURE_FILE,
+    ProductionConfig.CAPTURE_MAX_BYTES,
+    ProductionConfig.CAPTURE_BACKUPS,
+    ProductionConfig.CAPTURE_SAMPLE_RATE
+) if ProductionConfig.CAPTURE_REQUESTS else None
+
+
+def _is_admin() -> bool:
+    """Check the X-Admin-Token header against the configured admin token."""
+    token = current_app.config['ADMIN_TOKEN']
+    supplied = request.headers.get('X-Admin-Token', '')
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+@api.before_app_request
+def start_request_timer() -> None:
+    g.request_start = time.perf_counter()
+
+
+@api.after_app_request
+def record_request_metrics(response):
+    """Count every request and record its latency per endpoint."""
+    start = getattr(g, 'request_start', None)
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.inc('portfolio_optimizer_http_requests_total',
+                {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)})
+    if start is not None:
+        metrics.observe('portfolio_optimizer_http_request_seconds', time.perf_counter() - start, {'endpoint': endpoint})
+    trace = getattr(g, 'trace', None)
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+        response.headers['Timing-Allow-Origin'] = '*'
+    capture = getattr(g, 'capture', None)
+    if capture is not None:
+        capture['status'] = response.status_code
+        if start is not None:
+            capture['latency_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        cache_entry = next((e for e in trace.stages if e['stage'] == 'cache_lookup'), None) if trace is not None else None
+        capture['cache'] = cache_entry.get('result') if cache_entry else None
+        recorder.record(capture)
+    return response
+
+
+def _cache_hit_ratio() -> Optional[float]:
+    """Share of optimisation requests answered without a new search."""
+    lookups = metrics.counter_totals('portfolio_optimizer_cache_lookups_total', 'result')
+    total = sum(lookups.values())
+    if not total:
+        return None
+    return (total - lookups.get('miss', 0.0)) / total
 
 # API Routes - MUST be defined BEFORE catch-all static route
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health_check() -> jsonify:
     """Enhanced health check endpoint"""
     return jsonify({
@@ -694,7 +513,7 @@ def health_check() -> jsonify:
         'cache_size': len(optimization_cache)
     })
 
-@app.route('/api/stocks', methods=['GET'])
+@api.route('/api/stocks', methods=['GET'])
 def get_stocks() -> jsonify:
     """Get enhanced stock list with filtering options"""
     try:
@@ -714,9 +533,11 @@ def get_stocks() -> jsonify:
         logger.error(f"Error in get_stocks: {str(e)}")
         return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
 
-@app.route('/api/optimize', methods=['POST'])
+@api.route('/api/optimize', methods=['POST'])
 def optimize_portfolio() -> jsonify:
     """Enhanced portfolio optimization endpoint"""
+    trace = g.trace = RequestTrace()
+    set_trace(trace)
     try:
         data = request.get_json()
         if not data:
@@ -726,6 +547,9 @@ def optimize_portfolio() -> jsonify:
         target_beta = data.get('target_beta', ProductionConfig.DEFAULT_BETA)
         target_return = data.get('target_return')  # Can be None
         strategy = data.get('strategy', 'diversified')
+        engine = data.get('engine')
+        if engine is not None and engine not in available_engines():
+            return jsonify({'error': f"Unknown engine '{engine}'. Available engines: {', '.join(available_engines())}"}), 400
         
         # Validate and convert inputs
         try:
@@ -736,82 +560,361 @@ def optimize_portfolio() -> jsonify:
             return jsonify({'error': f'Invalid input format: {str(e)}'}), 400
         
         # Convert target_return from percentage to decimal if provided
-        if target_return is not None:
-            try:
-                if isinstance(target_return, str):
-                    target_return = float(target_return.replace('%', '').strip()) / 100
-                elif isinstance(target_return, (int, float)):
-                    # Check for NaN
-                    if target_return != target_return:  # NaN check
-                        target_return = None
-                    elif target_return > 1:
-                        target_return = float(target_return) / 100
-                    else:
-                        target_return = float(target_return)
-                else:
-                    target_return = None
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Could not convert target_return: {e}, setting to None")
-                target_return = None
-        
-        logger.info(f"Optimization request: num_stocks={num_stocks}, target_beta={target_beta}, target_return={target_return}, strategy={strategy}")
-        
-        # Optimize portfolio
-        result = optimizer.optimize(num_stocks, target_beta, target_return, strategy)
+        target_return = normalize_target_return(target_return)
+        
+        # Optional warm start from existing holdings
+        current_weights, error = optimizer.resolve_start(data.get('current_weights'), data.get('previous_result_key'))
+        if error:
+            return jsonify({'error': error}), 400
+        turnover_penalty = data.get('turnover_penalty', 0.0)
+        if isinstance(turnover_penalty, bool) or not isinstance(turnover_penalty, (int, float)) or not 0 <= turnover_penalty <= 100:
+            return jsonify({'error': 'turnover_penalty must be a number between 0 and 100'}), 400
+        sector_limits, error = optimizer.resolve_sector_limits(data.get('sector_limits'))
+        if error:
+            return jsonify({'error': f"sector_limits: {error}"}), 400
+        robust, error = optimizer.resolve_robust(data.get('robust'))
+        if error:
+            return jsonify({'error': f"robust: {error}"}), 400
+        
+        logger.info(f"Optimization request: num_stocks={num_stocks}, target_beta={target_beta}, target_return={target_return}, strategy={strategy}, engine={engine}, warm_start={current_weights is not None}")
+        if recorder is not None and recorder.sampled():
+            g.capture = {
+                'ts': round(time.time(), 3),
+                'request': {
+                    'num_stocks': num_stocks,
+                    'target_beta': target_beta,
+                    'target_return': target_return,
+                    'strategy': strategy,
+                    'engine': engine
+                }
+            }
+            if current_weights is not None:
+                g.capture['request'].update(current_weights=current_weights, turnover_penalty=turnover_penalty)
+            if sector_limits is not None:
+                g.capture['request']['sector_limits'] = sector_limits
+            if robust is not None:
+                g.capture['request']['robust'] = robust
+        
+        # Cache hits and coalesced requests are cheap; only new searches
+        # are rate limited and subject to the concurrency limit.
+        holds_slot = False
+        if not optimizer.is_cheap(num_stocks, target_beta, target_return, strategy, engine, current_weights, turnover_penalty,
+                                  sector_limits, robust):
+            retry_after = admission.check_rate(_client_id())
+            if retry_after > 0:
+                logger.warning(f"Rate limit exceeded for {_client_id()}")
+                return _retry_response(429, 'Too many requests', 'Optimization rate limit exceeded. Please retry later.', retry_after)
+            queue_entry = trace.begin('queue')
+            queue_start = time.perf_counter()
+            admitted, retry_after = admission.acquire()
+            trace.end(queue_entry, time.perf_counter() - queue_start)
+            if not admitted:
+                logger.warning("Optimization rejected: server at capacity")
+                return _retry_response(503, 'Server busy', 'Too many optimizations in progress. Please retry later.', retry_after)
+            holds_slot = True
+        
+        # Admins can profile a single request with an X-Profile header
+        force_profile = request.headers.get('X-Profile', '').lower() in ('1', 'true', 'yes') and _is_admin()
+        search_start = time.time()
+        try:
+            with profiler.session(force_profile, str(strategy)):
+                result = optimizer.optimize(num_stocks, target_beta, target_return, strategy, engine,
+                                            current_weights, turnover_penalty, sector_limits, robust)
+        finally:
+            if holds_slot:
+                admission.release(time.time() - search_start)
         
         if 'error' in result:
             logger.warning(f"Optimization returned error: {result.get('error')}")
             return jsonify(result), 400
         
         logger.info(f"Optimization successful: {len(result.get('stocks', []))} stocks, return={result.get('expected_return', 0):.4f}")
-        return jsonify(result)
+        capture = getattr(g, 'capture', None)
+        if capture is not None:
+            capture['result'] = {
+                'actual_beta': result.get('actual_beta'),
+                'expected_return': result.get('expected_return'),
+                'target_achieved': result.get('target_achieved'),
+                'num_holdings': len(result.get('stocks', []))
+            }
+        if data.get('debug_timing'):
+            # Serialization time is only known afterwards, so it is reported
+            # in the Server-Timing header but not in the body.
+            result = dict(result, debug_timing={
+                'cache_key': optimizer.cache_key(num_stocks, target_beta, target_return, strategy, engine,
+                                                 current_weights, turnover_penalty, sector_limits, robust),
+                'stages': [dict(entry) for entry in trace.stages],
+                'total_ms': trace.total_ms()
+            })
+        with stage_timer('serialization', str(strategy)):
+            response = jsonify(result)
+        return response
     except Exception as e:
         logger.error(f"Optimization error: {str(e)}", exc_info=True)
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+    finally:
+        set_trace(None)
+
+@api.route('/api/simulate', methods=['POST'])
+def simulate_portfolio() -> jsonify:
+    """Monte Carlo outcome distribution for given weights or a cached optimization result"""
+    trace = g.trace = RequestTrace()
+    set_trace(trace)
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        weights = data.get('weights')
+        result_key = data.get('result_key')
+        if weights is not None and not isinstance(weights, dict):
+            return jsonify({'error': 'weights must be an object mapping symbols to weights'}), 400
+        percentiles = data.get('percentiles')
+        try:
+            num_paths = int(data['num_paths']) if data.get('num_paths') is not None else None
+            horizon_years = float(data.get('horizon_years', 1.0))
+            steps_per_year = int(data.get('steps_per_year', 12))
+            seed = int(data['seed']) if data.get('seed') is not None else None
+            if percentiles is not None:
+                percentiles = [float(p) for p in percentiles]
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid input format: {str(e)}'}), 400
+        target_return = normalize_target_return(data.get('target_return'))
+
+        # Simulations are as expensive as a search, so they share its limits
+        retry_after = admission.check_rate(_client_id())
+        if retry_after > 0:
+            logger.warning(f"Rate limit exceeded for {_client_id()}")
+            return _retry_response(429, 'Too many requests', 'Simulation rate limit exceeded. Please retry later.', retry_after)
+        admitted, retry_after = admission.acquire()
+        if not admitted:
+            logger.warning("Simulation rejected: server at capacity")
+            return _retry_response(503, 'Server busy', 'Too many optimizations in progress. Please retry later.', retry_after)
+        simulation_start = time.time()
+        try:
+            result = optimizer.simulate(weights, result_key, target_return, num_paths, horizon_years,
+                                        steps_per_year, seed, percentiles)
+        finally:
+            admission.release(time.time() - simulation_start)
 
-@app.route('/api/clear-cache', methods=['POST'])
+        if 'error' in result:
+            logger.warning(f"Simulation returned error: {result.get('error')}")
+            return jsonify(result), 400
+        logger.info(f"Simulation completed: {result['num_paths']} paths in {result['simulation_time']}s")
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Simulation error: {str(e)}", exc_info=True)
+        return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+    finally:
+        set_trace(None)
+
+@api.route('/api/rebalance', methods=['POST'])
+def rebalance_portfolio() -> jsonify:
+    """Cost-aware trades from current holdings towards target beta/return under a turnover cap"""
+    trace = g.trace = RequestTrace()
+    set_trace(trace)
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        current_weights = data.get('current_weights')
+        if current_weights is not None and not isinstance(current_weights, dict):
+            return jsonify({'error': 'current_weights must be an object mapping symbols to weights'}), 400
+        strategy = data.get('strategy', 'diversified')
+        engine = data.get('engine')
+        try:
+            target_beta = float(data.get('target_beta', ProductionConfig.DEFAULT_BETA))
+            num_stocks = int(data.get('num_stocks', 0))
+            turnover_cap = float(data['turnover_cap']) if data.get('turnover_cap') is not None else None
+            portfolio_value = float(data['portfolio_value']) if data.get('portfolio_value') is not None else None
+            horizon_years = float(data.get('horizon_years', 1.0))
+            num_candidates = int(data['num_candidates']) if data.get('num_candidates') is not None else None
+            seed = int(data['seed']) if data.get('seed') is not None else None
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid input format: {str(e)}'}), 400
+        target_return = normalize_target_return(data.get('target_return'))
+
+        retry_after = admission.check_rate(_client_id())
+        if retry_after > 0:
+            logger.warning(f"Rate limit exceeded for {_client_id()}")
+            return _retry_response(429, 'Too many requests', 'Rebalance rate limit exceeded. Please retry later.', retry_after)
+        admitted, retry_after = admission.acquire()
+        if not admitted:
+            logger.warning("Rebalance rejected: server at capacity")
+            return _retry_response(503, 'Server busy', 'Too many optimizations in progress. Please retry later.', retry_after)
+        rebalance_start = time.time()
+        try:
+            result = optimizer.rebalance(current_weights, data.get('previous_result_key'), target_beta, target_return,
+                                         num_stocks, strategy, engine, turnover_cap, portfolio_value, horizon_years,
+                                         num_candidates, seed)
+        finally:
+            admission.release(time.time() - rebalance_start)
+
+        if 'error' in result:
+            logger.warning(f"Rebalance returned error: {result.get('error')}")
+            return jsonify(result), 400
+        logger.info(f"Rebalance completed: turnover {result['turnover']}, {result['candidates_evaluated']} candidates in {result['computation_time']}s")
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Rebalance error: {str(e)}", exc_info=True)
+        return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+    finally:
+        set_trace(None)
+
+@api.route('/api/risk', methods=['POST'])
+def portfolio_risk() -> jsonify:
+    """VaR/CVaR for one or many portfolios (weights, cached result keys or every cached result)"""
+    trace = g.trace = RequestTrace()
+    set_trace(trace)
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        portfolios = data.get('portfolios')
+        if data.get('weights') is not None:
+            portfolios = [data['weights']] + list(portfolios or [])
+        result_keys = data.get('result_keys')
+        if data.get('result_key') is not None:
+            result_keys = [data['result_key']] + list(result_keys or [])
+        if portfolios is not None and not isinstance(portfolios, list):
+            return jsonify({'error': 'portfolios must be a list of weight objects'}), 400
+        if result_keys is not None and not isinstance(result_keys, list):
+            return jsonify({'error': 'result_keys must be a list'}), 400
+        levels = data.get('levels')
+        try:
+            horizon_days = float(data.get('horizon_days', 1))
+            if levels is not None:
+                levels = [float(level) for level in levels]
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid input format: {str(e)}'}), 400
+
+        retry_after = admission.check_rate(_client_id())
+        if retry_after > 0:
+            logger.warning(f"Rate limit exceeded for {_client_id()}")
+            return _retry_response(429, 'Too many requests', 'Risk analytics rate limit exceeded. Please retry later.', retry_after)
+        admitted, retry_after = admission.acquire()
+        if not admitted:
+            logger.warning("Risk analytics rejected: server at capacity")
+            return _retry_response(503, 'Server busy', 'Too many optimizations in progress. Please retry later.', retry_after)
+        risk_start = time.time()
+        try:
+            result = optimizer.risk_report(portfolios, result_keys, bool(data.get('all_cached')), levels, horizon_days)
+        finally:
+            admission.release(time.time() - risk_start)
+
+        if 'error' in result:
+            logger.warning(f"Risk analytics returned error: {result.get('error')}")
+            return jsonify(result), 400
+        logger.info(f"Risk analytics for {len(result['portfolios'])} portfolios in {result['computation_time']}s")
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Risk analytics error: {str(e)}", exc_info=True)
+        return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
+    finally:
+        set_trace(None)
+
+@api.route('/api/admin/profile', methods=['GET', 'POST'])
+def admin_profile() -> jsonify:
+    """Arm profiling of the next N optimizations (POST) or report status (GET)"""
+    if not _is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            count = int(data.get('count', 1))
+        except (ValueError, TypeError):
+            return jsonify({'error': 'count must be an integer'}), 400
+        mode = data.get('mode')
+        if mode is not None and mode not in ProfileManager.MODES:
+            return jsonify({'error': f"mode must be one of {', '.join(ProfileManager.MODES)}"}), 400
+        profiler.arm(count, mode)
+        logger.info(f"Profiling armed for the next {count} optimizations")
+    return jsonify(profiler.status())
+
+@api.route('/api/admin/profiles', methods=['GET'])
+def list_profiles() -> jsonify:
+    """List captured profile files"""
+    if not _is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({'profiles': profiler.list_profiles(), **profiler.status()})
+
+@api.route('/api/admin/profiles/<path:filename>', methods=['GET'])
+def download_profile(filename: str):
+    """Download a captured profile file"""
+    if not _is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    return send_from_directory(profiler.directory, filename, as_attachment=True)
+
+@api.route('/api/engines', methods=['GET'])
+def list_engines() -> jsonify:
+    """List the available weight engines"""
+    return jsonify({
+        'engines': [{'name': name, 'description': get_engine(name).description} for name in available_engines()],
+        'default': get_engine().name
+    })
+
+@api.route('/api/clear-cache', methods=['POST'])
 def clear_cache() -> jsonify:
     """Clear optimization cache"""
     global optimization_cache
     optimization_cache.clear()
     return jsonify({'message': 'Cache cleared successfully'})
 
-@app.route('/api/stats', methods=['GET'])
+@api.route('/api/stats', methods=['GET'])
 def get_stats() -> jsonify:
     """Get API statistics"""
     try:
+        hit_ratio = _cache_hit_ratio()
         return jsonify({
             'cache_size': len(optimization_cache),
+            'cache_hit_ratio': round(hit_ratio, 4) if hit_ratio is not None else None,
             'total_stocks': len(optimizer.stocks),
-            'uptime': time.time(),
+            'universe_version': optimizer.universe_version,
+            'uptime': round(time.time() - START_TIME, 1),
+            'admission': admission.snapshot(),
             'version': '2.0'
         })
     except Exception as e:
         logger.error(f"Error in get_stats: {str(e)}")
         return jsonify({'error': 'Internal server error', 'message': str(e)}), 500
 
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics() -> Response:
+    """Expose metrics in the Prometheus text exposition format"""
+    admission_state = admission.snapshot()
+    body = metrics.render({
+        'portfolio_optimizer_process_start_time_seconds': ('Start time of this worker process.', START_TIME),
+        'portfolio_optimizer_cache_entries': ('Optimisation cache entries in this worker process.', len(optimization_cache)),
+        'portfolio_optimizer_active_optimizations': ('Optimisations running in this worker process.', admission_state['active']),
+        'portfolio_optimizer_queued_optimizations': ('Optimisations waiting for a slot in this worker process.', admission_state['queued']),
+    })
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
 # Serve React app - MUST be after API routes
-@app.route('/')
+@api.route('/')
 def serve_root() -> jsonify:
     try:
-        return send_from_directory(app.static_folder, 'index.html')
+        return send_from_directory(current_app.static_folder, 'index.html')
     except Exception as e:
         logger.error(f"Error serving index.html: {str(e)}")
         return jsonify({'error': 'Frontend not found. Please build the React app.'}), 404
 
-@app.route('/<path:path>')
+@api.route('/<path:path>')
 def serve_static(path: str) -> jsonify:
     if path.startswith('api/'):
         return jsonify({'error': 'Not found'}), 404
     try:
-        return send_from_directory(app.static_folder, path)
+        return send_from_directory(current_app.static_folder, path)
     except Exception as e:
         logger.error(f"Error serving static file {path}: {str(e)}")
         return jsonify({'error': 'File not found'}), 404
 
 if __name__ == '__main__':
+    app = create_app()
     port = int(os.environ.get('PORT', 5000))
     logger.info("Starting Optimized Production Portfolio Optimizer...")
     logger.info(f"Available stocks: {len(optimizer.stocks)}")
@@ -8,6 +8,8 @@ from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 import logging
 
+from portfolio_core.engines import available_engines, get_engine
+
 # Configure logging for production
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -47,6 +49,7 @@ class ProductionConfig:
     DEFAULT_STOCKS = 10
     DEFAULT_BETA = 1.0
     CACHE_DURATION = 300  # 5 minutes
+    ENGINE = os.environ.get('OPTIMIZER_ENGINE', 'python-loop')
     DEBUG = False
 
 app.config.from_object(ProductionConfig)
@@ -197,145 +200,15 @@ class PortfolioOptimizer:
             'target_achieved': target_return is not None and abs(expected_return - target_return) < 0.02
         }
     
-    def optimize_portfolio_weights(self, stocks: List[Dict], target_beta: float, individual_returns: Dict[str, float] = None, target_return: float = None) -> Dict[str, float]:
-        """Optimize portfolio weights - prioritizes matching target return when specified"""
-        n = len(stocks)
-        
-        # If target return is specified, prioritize matching it exactly
-        if target_return is not None and individual_returns is not None:
-            # Two-phase approach: first match return, then optimize beta
-            max_attempts = 10000  # More attempts when target return is specified
-            best_weights = None
-            best_score = float('inf')
-            best_return_diff = float('inf')
-            best_beta_diff = float('inf')
-            
-            # Phase 1: Prioritize matching target return exactly
-            for _ in range(max_attempts):
-                # Generate random weights
-                raw_weights = [random.random() for _ in range(n)]
-                total = sum(raw_weights)
-                weights = {stock['symbol']: w/total for stock, w in zip(stocks, raw_weights)}
-                
-                # Calculate portfolio return
-                portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
-                return_diff = abs(portfolio_return - target_return)
-                
-                # Calculate portfolio beta
-                portfolio_beta = sum(weights[stock['symbol']] * stock['beta'] for stock in stocks)
-                beta_diff = abs(portfolio_beta - target_beta)
-                
-                # Score: prioritize return matching, then beta
-                # If return is very close (< 0.005), prioritize beta; otherwise prioritize return
-                if return_diff < 0.005:
-                    # Return is very close - now optimize for beta
-                    score = return_diff * 100 + beta_diff  # Small return penalty, beta is main factor
-                else:
-                    # Return not close enough - prioritize return matching
-                    score = return_diff * 1000 + beta_diff  # Heavy penalty for missing return
-                
-                # Track best solution
-                if score < best_score:
-                    best_score = score
-                    best_weights = weights
-                    best_return_diff = return_diff
-                    best_beta_diff = beta_diff
-                
-                # Early exit if both are very close
-                if return_diff < 0.001 and beta_diff < 0.05:
-                    break
-                # Or if return is very close and beta is acceptable
-                if return_diff < 0.001 and beta_diff < 0.2:
-                    break
-            
-            # If we found a good solution, return it
-            if best_weights and best_return_diff < 0.01:
-                return best_weights
-        
-        # Fallback: optimize for beta (or if no target return specified)
-        max_attempts = 5000
-        best_weights = None
-        best_score = float('inf')
-        
-        for _ in range(max_attempts):
-            # Generate random weights
-            raw_weights = [random.random() for _ in range(n)]
-            total = sum(raw_weights)
-            weights = {stock['symbol']: w/total for stock, w in zip(stocks, raw_weights)}
-            
-            # Calculate portfolio beta
-            portfolio_beta = sum(weights[stock['symbol']] * stock['beta'] for stock in stocks)
-            beta_diff = abs(portfolio_beta - target_beta)
-            
-            # Calculate score
-            if target_return is not None and individual_returns is not None:
-                portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
-                return_diff = abs(portfolio_return - target_return)
-                # Balance both, but return is still important
-                score = return_diff * 10 + beta_diff
-            else:
-                score = beta_diff
-            
-            if score < best_score:
-                best_score = score
-                best_weights = weights
-            
-            # Early exit
-            if target_return is not None and individual_returns is not None:
-                portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
-                if abs(portfolio_return - target_return) < 0.01 and beta_diff < 0.1:
-                    break
-            elif beta_diff < 0.05:
-                break
-        
-        return best_weights or {stock['symbol']: 1.0/n for stock in stocks}
+    def optimize_portfolio_weights(self, stocks: List[Dict], target_beta: float, individual_returns: Dict[str, float] = None, target_return: float = None, engine: str = None) -> Dict[str, float]:
+        """Optimize portfolio weights with the selected weight engine"""
+        return get_engine(engine or ProductionConfig.ENGINE).optimize(stocks, target_beta, individual_returns, target_return, 'diversified')
     
-    def optimize_portfolio_weights_strict(self, stocks: List[Dict], target_beta: float, individual_returns: Dict[str, float] = None, target_return: float = None) -> Dict[str, float]:
+    def optimize_portfolio_weights_strict(self, stocks: List[Dict], target_beta: float, individual_returns: Dict[str, float] = None, target_return: float = None, engine: str = None) -> Dict[str, float]:
         """Optimize portfolio weights with strict constraint: ALL stocks must have non-zero weight"""
-        n = len(stocks)
-        min_weight = 0.01  # Minimum 1% per stock
-        
-        # Ensure we can allocate minimum to all stocks
-        if n * min_weight > 1.0:
-            min_weight = 1.0 / n
-        
-        max_attempts = 10000
-        best_weights = None
-        best_score = float('inf')
-        
-        for _ in range(max_attempts):
-            # Generate weights ensuring all stocks get at least min_weight
-            # Start with minimum weights for all
-            weights_list = [min_weight] * n
-            remaining = 1.0 - (n * min_weight)
-            
-            # Distribute remaining weight randomly but ensure all stay above minimum
-            if remaining > 0:
-                raw_additional = [random.random() for _ in range(n)]
-                total_additional = sum(raw_additional)
-                if total_additional > 0:
-                    for i in range(n):
-                        weights_list[i] += (raw_additional[i] / total_additional) * remaining
-            
-            weights = {stock['symbol']: weights_list[i] for i, stock in enumerate(stocks)}
-            
-            # Calculate metrics
-            portfolio_beta = sum(weights[stock['symbol']] * stock['beta'] for stock in stocks)
-            beta_diff = abs(portfolio_beta - target_beta)
-            
-            score = beta_diff
-            if target_return is not None and individual_returns is not None:
-                portfolio_return = sum(weights[stock['symbol']] * individual_returns.get(stock['symbol'], 0.08) for stock in stocks)
-                return_diff = abs(portfolio_return - target_return)
-                score = return_diff * 10 + beta_diff
-            
-            if score < best_score:
-                best_score = score
-                best_weights = weights
-        
-        return best_weights or {stock['symbol']: 1.0/n for stock in stocks}
+        return get_engine(engine or ProductionConfig.ENGINE).optimize(stocks, target_beta, individual_returns, target_return, 'diversified', strict=True)
     
-    def optimize(self, num_stocks: int, target_beta: float, target_return: float = None, strategy: str = 'diversified') -> Dict:
+    def optimize(self, num_stocks: int, target_beta: float, target_return: float = None, strategy: str = 'diversified', engine: str = None) -> Dict:
         """Main optimization function"""
         start_time = time.time()
         
@@ -344,8 +217,12 @@ class PortfolioOptimizer:
         if not is_valid:
             return {'error': error_msg}
         
+        engine = engine or ProductionConfig.ENGINE
+        if engine not in available_engines():
+            return {'error': f"Unknown engine '{engine}'"}
+        
         # Check cache
-        cache_key = f"{num_stocks}_{target_beta}_{target_return}_{strategy}"
+        cache_key = f"{num_stocks}_{target_beta}_{target_return}_{strategy}_{engine}"
         if cache_key in optimization_cache:
             cached_result = optimization_cache[cache_key]
             if time.time() - cached_result['timestamp'] < ProductionConfig.CACHE_DURATION:
@@ -360,7 +237,7 @@ class PortfolioOptimizer:
         individual_returns = self._calculate_individual_returns(selected_stocks, target_return)
         
         # Optimize weights (now considers both beta and return)
-        weights = self.optimize_portfolio_weights(selected_stocks, target_beta, individual_returns, target_return)
+        weights = self.optimize_portfolio_weights(selected_stocks, target_beta, individual_returns, target_return, engine)
         
         # STRICT REQUIREMENT: Ensure ALL selected stocks have meaningful weights
         # Check if any stocks have zero or near-zero weights
@@ -368,7 +245,7 @@ class PortfolioOptimizer:
         
         if stocks_with_zero_weight:
             # Re-optimize with strict constraint: ALL stocks must have at least minimum weight
-            weights = self.optimize_portfolio_weights_strict(selected_stocks, target_beta, individual_returns, target_return)
+            weights = self.optimize_portfolio_weights_strict(selected_stocks, target_beta, individual_returns, target_return, engine)
         
         # Final verification: ensure exactly num_stocks stocks have weights
         stocks_with_weight = [s for s in selected_stocks if weights.get(s['symbol'], 0) > 0.001]
@@ -526,6 +403,7 @@ def optimize_portfolio():
         target_beta = data.get('target_beta', ProductionConfig.DEFAULT_BETA)
         target_return = data.get('target_return')  # Can be None
         strategy = data.get('strategy', 'diversified')
+        engine = data.get('engine')  # None selects the configured engine
         
         # Convert target_return from percentage to decimal if provided
         if target_return is not None:
@@ -535,7 +413,7 @@ def optimize_portfolio():
                 target_return = target_return / 100
         
         # Optimize portfolio
-        result = optimizer.optimize(num_stocks, target_beta, target_return, strategy)
+        result = optimizer.optimize(num_stocks, target_beta, target_return, strategy, engine)
         
         if 'error' in result:
             return jsonify(result), 400
@@ -0,0 +1,65 @@
+"""
+Shared setup for the backend tests.
+
+Settings are read from the environment once, at import time, so this
+fixes them before anything from the backend is imported: the built-in
+universe, no rate limiting, and no metrics, profile or capture files.
+"""
+
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ['PRICE_STORE_DIR'] = ''
+os.environ['RATE_LIMIT_PER_MINUTE'] = '0'
+os.environ.pop('METRICS_DIR', None)
+os.environ.pop('CAPTURE_REQUESTS', None)
+os.environ.pop('ADMIN_TOKEN', None)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    """Every test starts without cached optimisation results."""
+    from portfolio_core.optimizer import optimization_cache
+    optimization_cache.clear()
+    yield
+    optimization_cache.clear()
+
+
+# Betas of the synthetic stocks written by ``price_dir``
+PRICE_BETAS = {'LOW': 0.5, 'MID': 1.0, 'HIGH': 1.5}
+
+
+@pytest.fixture
+def price_dir(tmp_path):
+    """
+    One price CSV per symbol over 400 business days: the market (SPY)
+    and stocks whose returns are PRICE_BETAS times the market's plus a
+    little noise.  LATE lists 100 days in; GAPPY skips every tenth day.
+    """
+    import numpy as np
+    rng = np.random.default_rng(0)
+    days = np.arange(np.datetime64('2020-01-01'), np.datetime64('2022-01-01'))
+    days = days[np.is_busday(days)][:400]
+    market = rng.normal(0.0004, 0.01, len(days))
+    series = {'SPY': market}
+    for symbol, beta in PRICE_BETAS.items():
+        series[symbol] = beta * market + rng.normal(0.0, 0.002, len(days))
+    series['LATE'] = series['MID'].copy()
+    series['GAPPY'] = series['HIGH'].copy()
+    source = tmp_path / 'prices'
+    source.mkdir()
+    for symbol, returns in series.items():
+        prices = 100 * np.cumprod(1 + returns)
+        rows = ['Date,Open,Close,Adj Close']
+        for i, (day, price) in enumerate(zip(days, prices)):
+            if (symbol == 'LATE' and i < 100) or (symbol == 'GAPPY' and i % 10 == 5):
+                continue
+            rows.append(f'{day},0,{price:.6f},{price:.6f}')
+        (source / f'{symbol}.csv').write_text('\n'.join(rows) + '\n')
+    (source / 'universe.csv').write_text('symbol,name,sector,market_cap\nHIGH,High Beta Co,Technology,5e9\n')
+    return source
@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+import production_app
+from production_app import AdmissionController, create_app
+
+RISK_REQUEST = {'weights': {'AAPL': 0.5, 'MSFT': 0.5}}
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    """Two risk requests per client, then 429."""
+    monkeypatch.setattr(production_app, 'admission', AdmissionController(2, 0, 1.0, 1, 2))
+
+
+def _statuses(client, forwarded_for):
+    return [client.post('/api/risk', json=RISK_REQUEST, headers={'X-Forwarded-For': address}).status_code
+            for address in forwarded_for]
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(limited):
+    client = create_app({'TESTING': True}).test_client()
+    # A new spoofed address per request must not buy a new bucket
+    assert _statuses(client, ['1.1.1.1', '2.2.2.2', '3.3.3.3']) == [200, 200, 429]
+    assert production_app.admission.snapshot()['tracked_clients'] == 1
+
+
+def test_trusted_proxy_hop_identifies_the_client(limited):
+    client = create_app({'TESTING': True, 'TRUSTED_PROXIES': 1}).test_client()
+    # The proxy appends the real address; entries left of it are the client's own
+    spoofed = [f'{n}.0.0.1, 10.0.0.1' for n in range(3)]
+    assert _statuses(client, spoofed) == [200, 200, 429]
+    assert _statuses(client, ['10.0.0.2']) == [200]
+
+
+def test_bucket_table_is_bounded():
+    admission = AdmissionController(1, 0, 1.0, 60, 1, max_clients=100)
+    for n in range(1000):
+        admission.check_rate(f'client-{n}')
+    assert admission.snapshot()['tracked_clients'] == 100
+
+    # The most recently seen clients keep their (empty) buckets
+    assert admission.check_rate('client-999') > 0
+    assert admission.check_rate('client-0') == 0.0
+
+
+def test_requests_beyond_the_queue_are_shed():
+    admission = AdmissionController(1, 1, 0.05, 0, 1)
+    assert admission.acquire() == (True, 0.0)
+
+    # One caller may wait for the slot, and times out here
+    start = time.monotonic()
+    admitted, retry_after = admission.acquire()
+    assert not admitted and retry_after > 0
+    assert time.monotonic() - start >= 0.05
+
+    admission.release(0.5)
+    assert admission.acquire()[0]
+    assert admission.snapshot()['rejected_busy'] == 1
+
+
+def test_busy_server_answers_503_with_retry_after(monkeypatch):
+    admission = AdmissionController(1, 0, 1.0, 0, 1)
+    monkeypatch.setattr(production_app, 'admission', admission)
+    admission.acquire()
+    client = create_app({'TESTING': True}).test_client()
+
+    response = client.post('/api/risk', json=RISK_REQUEST)
+
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
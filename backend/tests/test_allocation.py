@@ -0,0 +1,184 @@
+import numpy as np
+import pytest
+
+from portfolio_core.allocation import (MARKET_VOLATILITY, HRPAllocator, TrackingAllocator, Universe, cap_weights,
+                                       hierarchical_risk_parity, max_sharpe, mean_variance, risk_parity, sharpe_ratio)
+from portfolio_core.clustering import cluster_order
+from portfolio_core.engines import WeightEngine
+from portfolio_core.optimizer import PortfolioOptimizer
+from portfolio_core.risk import factor_exposures
+from portfolio_core.universe import ENHANCED_STOCKS
+
+STOCKS = ENHANCED_STOCKS[:15]
+RETURNS = {stock['symbol']: 0.04 + 0.006 * i for i, stock in enumerate(STOCKS)}
+
+
+def _model():
+    mu, beta, idio = factor_exposures(STOCKS, RETURNS)
+    cov = MARKET_VOLATILITY ** 2 * np.outer(beta, beta) + np.diag(idio ** 2)
+    return mu, beta, idio, cov
+
+
+def _random_portfolios(count, floor=0.0):
+    draws = np.random.default_rng(0).dirichlet(np.ones(len(STOCKS)), count)
+    return floor + draws * (1.0 - floor * len(STOCKS))
+
+
+@pytest.mark.parametrize('floor', [0.0, 0.02])
+def test_min_variance_satisfies_the_optimality_conditions(floor):
+    mu, beta, idio, cov = _model()
+
+    w, _, _, _ = mean_variance(mu, beta, idio, floor=floor)
+
+    assert w.sum() == pytest.approx(1.0) and w.min() >= floor - 1e-12
+    # Equal marginal variance on free stocks, no less on those at the floor
+    marginal = cov @ w
+    free = w > floor + 1e-9
+    assert np.ptp(marginal[free]) < 1e-9
+    assert np.all(marginal[~free] >= marginal[free].max() - 1e-9)
+    variance = w @ cov @ w
+    assert all(variance <= p @ cov @ p for p in _random_portfolios(500, floor))
+
+
+def test_max_sharpe_beats_every_other_portfolio():
+    mu, beta, idio, _ = _model()
+
+    w, _, _ = max_sharpe(mu, beta, idio, 0.02)
+    best = sharpe_ratio(w, mu, beta, idio, 0.02)
+
+    assert w.sum() == pytest.approx(1.0) and w.min() >= -1e-12
+    minimum, _, _, _ = mean_variance(mu, beta, idio)
+    assert best >= sharpe_ratio(minimum, mu, beta, idio, 0.02)
+    assert all(best >= sharpe_ratio(p, mu, beta, idio, 0.02) - 1e-9 for p in _random_portfolios(500))
+
+
+@pytest.mark.parametrize('floor', [0.0, 0.05])
+def test_risk_parity_equalises_risk_contributions(floor):
+    _, beta, idio, cov = _model()
+
+    w, iterations = risk_parity(beta, idio, floor)
+
+    assert w.sum() == pytest.approx(1.0) and w.min() >= floor - 1e-12
+    contributions = w * (cov @ w)
+    free = w > floor + 1e-9
+    assert free.sum() >= len(STOCKS) // 2
+    np.testing.assert_allclose(contributions[free], contributions[free].mean(), rtol=1e-8)
+    # Stocks lifted to the floor contribute more than their share
+    assert np.all(contributions[~free] >= contributions[free].mean() - 1e-12)
+    # Warm-started from the answer, the solve is already converged
+    again, warm_iterations = risk_parity(beta, idio, floor, w)
+    np.testing.assert_allclose(again, w, atol=1e-9)
+    assert warm_iterations <= iterations
+
+
+def test_risk_parity_handles_hedges():
+    _, beta, idio, _ = _model()
+    beta = beta.copy()
+    beta[0] = -0.5
+    cov = MARKET_VOLATILITY ** 2 * np.outer(beta, beta) + np.diag(idio ** 2)
+
+    w, _ = risk_parity(beta, idio)
+    contributions = w * (cov @ w)
+
+    assert w.sum() == pytest.approx(1.0) and w.min() > 0
+    np.testing.assert_allclose(contributions, contributions.mean(), rtol=1e-8)
+
+
+def _naive_hrp(cov, order):
+    """Recursive bisection with explicit inverse-variance cluster portfolios."""
+    weights = np.zeros(len(order))
+
+    def split(items, share):
+        if len(items) == 1:
+            weights[items[0]] = share
+            return
+        halves = items[:len(items) // 2], items[len(items) // 2:]
+        variances = []
+        for half in halves:
+            w = 1.0 / np.diag(cov)[half]
+            w /= w.sum()
+            variances.append(w @ cov[np.ix_(half, half)] @ w)
+        alpha = variances[1] / sum(variances)
+        split(halves[0], share * alpha)
+        split(halves[1], share * (1.0 - alpha))
+
+    split(list(order), 1.0)
+    return weights
+
+
+def test_hrp_matches_a_recursive_bisection():
+    _, beta, idio, cov = _model()
+    order = np.random.default_rng(0).permutation(len(STOCKS))
+
+    np.testing.assert_allclose(hierarchical_risk_parity(beta, idio, order), _naive_hrp(cov, order))
+
+
+def test_cluster_order_keeps_correlated_blocks_together():
+    blocks = np.repeat(np.arange(4), [3, 5, 2, 6])
+    permutation = np.random.default_rng(1).permutation(len(blocks))
+    labels = blocks[permutation]
+    corr = np.where(labels[:, None] == labels[None, :], 0.8, 0.1)
+    np.fill_diagonal(corr, 1.0)
+
+    order = cluster_order(corr)
+
+    assert sorted(order) == list(range(len(labels)))
+    changes = np.count_nonzero(np.diff(labels[order]))
+    assert changes == 3
+
+
+def test_hrp_reuses_the_universe_order_for_subsets():
+    allocator = HRPAllocator()
+    universe = Universe(ENHANCED_STOCKS, 1)
+    subset = ENHANCED_STOCKS[5:25:2]
+    positions = allocator.positions(universe)
+
+    order = allocator.order(subset, universe)
+
+    assert [positions[subset[i]['symbol']] for i in order] == sorted(positions[stock['symbol']] for stock in subset)
+    assert allocator.positions(universe) is positions
+    weights, _ = allocator.solve(subset, {}, floor=0.05, universe=universe)
+    assert weights.sum() == pytest.approx(1.0) and weights.min() >= 0.05 - 1e-12
+
+
+def _tracking_error(allocator, stocks, universe):
+    weights = allocator.allocate(stocks, {}, universe=universe)
+    return allocator.metrics(stocks, weights, universe)['tracking_error']
+
+
+def test_tracking_the_whole_universe_holds_the_benchmark():
+    allocator = TrackingAllocator()
+
+    weights, _ = allocator.solve(STOCKS, {})
+
+    np.testing.assert_allclose(weights, cap_weights(STOCKS), atol=1e-9)
+    assert _tracking_error(allocator, STOCKS, Universe(STOCKS, 1)) == 0
+
+
+def test_tracking_selection_beats_the_largest_caps(monkeypatch):
+    allocator = TrackingAllocator()
+    universe = Universe(ENHANCED_STOCKS, 1)
+    largest = sorted(ENHANCED_STOCKS, key=lambda stock: -stock['market_cap'])[:10]
+
+    chosen = allocator.select(ENHANCED_STOCKS, {}, 10, universe=universe)
+
+    assert len({stock['symbol'] for stock in chosen}) == 10
+    error = _tracking_error(allocator, chosen, universe)
+    assert error <= _tracking_error(allocator, largest, universe)
+    for seed in range(20):
+        picks = np.random.default_rng(seed).choice(len(ENHANCED_STOCKS), 10, replace=False)
+        assert error <= _tracking_error(allocator, [ENHANCED_STOCKS[i] for i in picks], universe) + 1e-6
+    # Out of time, the remaining places are still filled
+    monkeypatch.setattr(TrackingAllocator, 'TIME_BUDGET', 0.0)
+    assert len({stock['symbol'] for stock in allocator.select(ENHANCED_STOCKS, {}, 10, universe=universe)}) == 10
+
+
+@pytest.mark.parametrize('strategy', ['min_variance', 'max_sharpe', 'risk_parity', 'hrp', 'tracking'])
+def test_allocation_strategies_weight_the_whole_selection(strategy):
+    result = PortfolioOptimizer().optimize(8, 1.0, strategy=strategy)
+
+    assert len(result['weights']) == 8
+    assert sum(result['weights'].values()) == pytest.approx(1.0, abs=1e-3)
+    assert min(result['weights'].values()) >= WeightEngine.min_weight(8) - 1e-3
+    if strategy == 'tracking':
+        assert result['tracking_error'] > 0 and result['benchmark_beta'] > 0
@@ -0,0 +1,51 @@
+import math
+
+import numpy as np
+import pytest
+
+from portfolio_core.backtest import hold, run_backtest
+from portfolio_core.prices import ingest
+
+
+@pytest.fixture
+def store_dir(price_dir, tmp_path):
+    ingest(str(price_dir), str(tmp_path / 'store'))
+    return str(tmp_path / 'store')
+
+
+def test_hold_matches_a_day_by_day_simulation():
+    returns = np.random.default_rng(3).normal(0.0, 0.02, (4, 30))
+    returns[2, 10:] = np.nan  # delisted: held at its last price
+    weights = np.array([0.1, 0.2, 0.3, 0.4])
+
+    daily, drifted = hold(returns, weights)
+
+    positions = weights.copy()
+    for day in range(30):
+        before = positions.sum()
+        positions = positions * (1 + np.nan_to_num(returns[:, day]))
+        assert daily[day] == pytest.approx(positions.sum() / before - 1)
+    np.testing.assert_allclose(drifted, positions / positions.sum())
+
+
+def test_backtest_covers_the_history_after_warm_up(store_dir):
+    result = run_backtest(store_dir, num_stocks=5, target_beta=1.0, engine='exact', rebalance=40, min_observations=60)
+
+    assert result['start'] == result['periods'][0]['date']
+    assert result['days'] == 399 - 61
+    assert result['rebalances'] == math.ceil(result['days'] / 40)
+    assert result['periods'][0]['turnover'] == 1.0
+    assert all(period['rebalanced'] for period in result['periods'])
+    # LATE only has enough history for the later rebalances
+    assert result['periods'][0]['universe'] == 4 and result['periods'][-1]['universe'] == 5
+    # Four stocks at the minimum weight leave no room to fit beta
+    assert all(abs(period['beta'] - 1.0) < 0.01 for period in result['periods'] if period['universe'] == 5)
+    assert -1 < result['total_return'] and 0 <= result['max_drawdown'] < 1
+
+
+def test_rebalances_only_see_past_bars(store_dir):
+    full = run_backtest(store_dir, num_stocks=5, engine='exact', rebalance=40)
+    cut = run_backtest(store_dir, num_stocks=5, engine='exact', rebalance=40, end=full['periods'][3]['date'])
+
+    for before, after in zip(cut['periods'][:3], full['periods'][:3]):
+        assert {k: v for k, v in before.items() if k != 'runtime'} == {k: v for k, v in after.items() if k != 'runtime'}
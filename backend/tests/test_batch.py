@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+
+REQUESTS = [
+    {'id': 'a', 'num_stocks': 8, 'target_beta': 1.1, 'strategy': 'target_return', 'target_return': 12},
+    {'num_stocks': 6},
+    {'num_stocks': 10, 'target_beta': 0.9, 'strategy': 'random', 'engine': 'numpy-batched'},
+    {'num_stocks': 'x'},
+]
+
+
+def _run_cli(tmp_path, hash_seed, *args):
+    """Batch output lines, without timings, from a fresh interpreter."""
+    requests = tmp_path / 'requests.jsonl'
+    requests.write_text(''.join(json.dumps(request) + '\n' for request in REQUESTS * 3))
+    env = dict(os.environ, PYTHONHASHSEED=str(hash_seed))
+    completed = subprocess.run(
+        [sys.executable, '-m', 'portfolio_core.batch', str(requests), '--seed', '1', '--progress-interval', '0', *args],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    entries = [json.loads(line) for line in completed.stdout.splitlines()]
+    for entry in entries:
+        entry.get('result', {}).pop('optimization_time', None)
+    return entries
+
+
+def test_seeded_runs_are_reproducible_across_processes(tmp_path):
+    first = _run_cli(tmp_path, 1, '--workers', '0')
+    second = _run_cli(tmp_path, 2, '--workers', '0')
+    assert len(first) == 3 * len(REQUESTS)
+    assert 'error' in first[3] and 'result' in first[0]
+    assert first == second
+
+
+def test_seeded_runs_do_not_depend_on_workers(tmp_path):
+    in_process = _run_cli(tmp_path, 1, '--workers', '0', '--cache-limit', '0')
+    pooled = _run_cli(tmp_path, 2, '--workers', '2', '--chunk-size', '1', '--cache-limit', '0')
+    assert pooled == in_process
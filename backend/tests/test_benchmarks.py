@@ -0,0 +1,133 @@
+import json
+import os
+import sys
+
+from conftest import BACKEND_DIR
+
+sys.path.insert(0, os.path.join(os.path.dirname(BACKEND_DIR), 'benchmarks'))
+
+import bench_optimizer  # noqa: E402
+import bench_quality  # noqa: E402
+import load_test  # noqa: E402
+import replay  # noqa: E402
+
+
+def test_compare_reports_slower_cases_only():
+    baseline = {'results': {
+        'slower': {'p50_ms': 10.0, 'p95_ms': 20.0, 'peak_kib': 100.0},
+        'noise': {'p50_ms': 0.1, 'p95_ms': 0.2, 'peak_kib': 100.0},
+        'same': {'p50_ms': 10.0, 'p95_ms': 20.0, 'peak_kib': 100.0},
+    }}
+    current = {'results': {
+        'slower': {'p50_ms': 14.0, 'p95_ms': 21.0, 'peak_kib': 100.0},
+        'noise': {'p50_ms': 0.5, 'p95_ms': 0.9, 'peak_kib': 100.0},
+        'same': {'p50_ms': 11.0, 'p95_ms': 22.0, 'peak_kib': 110.0},
+    }}
+
+    regressions = bench_optimizer.compare(current, baseline, threshold=0.25, min_delta_ms=1.0)
+
+    assert regressions == ['slower p50_ms: 10.00 -> 14.00']
+
+
+def test_benchmark_run_saves_and_checks_a_baseline(tmp_path, capsys):
+    baseline = tmp_path / 'baseline.json'
+    args = ['--sizes', '20', '--repeat', '2', '--only', 'engine', '--engines', 'exact']
+
+    assert bench_optimizer.main(args + ['--save', str(baseline)]) == 0
+    saved = json.loads(baseline.read_text())
+    case = saved['results']['engine/exact/20/feasible']
+    assert {'p50_ms', 'p95_ms', 'p99_ms', 'iterations_mean', 'peak_kib'} <= set(case)
+    assert set(saved['results']) == {f'engine/exact{mode}/20/{scenario}'
+                                     for mode in ('', '/strict') for scenario in ('feasible', 'infeasible')}
+
+    # A baseline far faster than any real run must fail the comparison
+    for case in saved['results'].values():
+        case['p50_ms'] = case['p95_ms'] = -10.0
+    baseline.write_text(json.dumps(saved))
+    assert bench_optimizer.main(args + ['--compare', str(baseline)]) == 1
+    assert 'regression(s)' in capsys.readouterr().err
+
+
+def test_pareto_front_keeps_undominated_variants():
+    results = {
+        'fast': {'combined_error': 0.3, 'time_mean_ms': 1.0},
+        'exact': {'combined_error': 0.0, 'time_mean_ms': 5.0},
+        'between': {'combined_error': 0.1, 'time_mean_ms': 2.0},
+        'worse': {'combined_error': 0.2, 'time_mean_ms': 3.0},
+    }
+    assert bench_quality.pareto_front(results) == ['fast', 'exact', 'between']
+
+
+def test_quality_harness_scores_engines_on_one_corpus(tmp_path):
+    report = tmp_path / 'quality.json'
+
+    assert bench_quality.main(['--problems', '6', '--engines', 'exact/strict,numpy-random/loose', '--json', str(report)]) == 0
+
+    results = json.loads(report.read_text())['results']
+    assert set(results) == {'exact/strict', 'numpy-random/loose'}
+    for result in results.values():
+        assert result['violations']['sum'] == 0 and result['violations']['negative'] == 0
+    # The exact solver fits at least as well as the loosened random search
+    assert results['exact/strict']['beta_error_mean'] <= results['numpy-random/loose']['beta_error_mean']
+    assert results['exact/strict']['violations']['zero_weight'] == 0
+    # Tolerance overrides stay on the harness's own engine instance
+    from portfolio_core.engines import get_engine
+    assert get_engine('numpy-random').BETA_TOLERANCE == 0.05
+
+
+def test_load_summary_counts_errors_and_cache_hits():
+    records = [
+        ('optimize', 200, 0.010, 0.008, 'miss'),
+        ('optimize', 200, 0.002, 0.001, 'hit'),
+        ('optimize', 429, 0.001, 0.001, None),
+        ('optimize', 200, 0.003, 0.002, 'stale'),
+        ('stocks', 200, 0.001, 0.001, None),
+        ('stocks', 0, 0.030, 0.030, None),
+    ]
+
+    report = load_test.summarize(records, elapsed=2.0, rps=3.0)
+
+    assert report['requests'] == 6 and report['throughput_rps'] == 3.0
+    assert report['error_rate'] == round(2 / 6, 4)
+    optimize = report['by_kind']['optimize']
+    assert optimize['statuses'] == {'200': 3, '429': 1}
+    assert optimize['cache_hit_ratio'] == round(2 / 3, 4)
+    assert report['by_kind']['stocks']['error_rate'] == 0.5
+
+
+def test_load_test_drives_an_in_process_server(tmp_path):
+    report_path = tmp_path / 'load.json'
+
+    assert load_test.main(['--rps', '40', '--duration', '0.5', '--clients', '4', '--mix', 'optimize=1,stocks=1',
+                           '--presets', '2', '--json', str(report_path)]) == 0
+
+    report = json.loads(report_path.read_text())
+    assert report['requests'] == 20 and report['error_rate'] == 0.0
+    # Two presets repeated: most optimisations are answered from the cache
+    assert report['by_kind']['optimize']['cache_hit_ratio'] > 0.5
+
+
+def test_captured_requests_replay_in_process(monkeypatch, tmp_path):
+    import production_app
+    capture = tmp_path / 'optimize_requests.jsonl'
+    # Small files, so the captures rotate
+    monkeypatch.setattr(production_app, 'recorder', production_app.RequestRecorder(str(capture), 600, 5, 1.0))
+    client = production_app.create_app({'TESTING': True}).test_client()
+    bodies = [{'num_stocks': n, 'target_beta': 1.0} for n in (6, 8, 10)]
+    bodies += [{'num_stocks': 8, 'target_beta': 1.0}, {'strategy': 'target_return', 'target_return': 12, 'target_beta': 1.2}]
+    for body in bodies:
+        client.post('/api/optimize', json=body)
+
+    entries = list(replay.read_captures([str(capture)]))
+
+    assert len(list(tmp_path.glob('optimize_requests.jsonl.*'))) >= 1
+    assert [entry['request']['num_stocks'] for entry in entries[:4]] == [6, 8, 10, 8]
+    assert [entry['cache'] for entry in entries[:4]] == ['miss', 'miss', 'miss', 'hit']
+    assert entries[4]['request']['target_return'] == 0.12
+    assert all(entry['status'] == 200 and entry['latency_ms'] > 0 for entry in entries)
+
+    report = replay.replay(iter(entries), replay.inprocess_runner(None, {}, no_cache=True), speed=0, clients=2, limit=None)
+
+    assert report['captured']['requests'] == report['replayed']['requests'] == 5
+    assert report['replayed']['statuses'] == {'200': 5}
+    assert report['replayed']['beta_error_mean'] is not None
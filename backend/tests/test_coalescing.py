@@ -0,0 +1,64 @@
+import threading
+import time
+
+from portfolio_core.config import ProductionConfig
+from portfolio_core.optimizer import PortfolioOptimizer, optimization_cache
+
+
+def _counting_compute(monkeypatch, optimizer, release=None):
+    """Count compute calls, optionally holding each until ``release`` is set."""
+    calls = []
+    compute = optimizer.compute
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        if release is not None:
+            release.wait(5)
+        return compute(*args, **kwargs)
+
+    monkeypatch.setattr(optimizer, 'compute', counted)
+    return calls
+
+
+def test_identical_concurrent_requests_share_one_search(monkeypatch):
+    optimizer = PortfolioOptimizer()
+    release = threading.Event()
+    calls = _counting_compute(monkeypatch, optimizer, release)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(optimizer.optimize(8, 1.1))) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    # Let every caller reach the in-flight search before it finishes
+    deadline = time.monotonic() + 5
+    while not optimizer.is_cheap(8, 1.1) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 6
+    assert all(result is results[0] for result in results)
+
+
+def test_stale_result_is_served_while_one_refresh_runs(monkeypatch):
+    optimizer = PortfolioOptimizer()
+    first = optimizer.optimize(8, 1.1)
+    key = first['result_key']
+    stale_at = time.time() - ProductionConfig.CACHE_DURATION - 1
+    optimization_cache[key]['timestamp'] = stale_at
+    release = threading.Event()
+    calls = _counting_compute(monkeypatch, optimizer, release)
+
+    # Served from the stale entry without waiting for the refresh
+    assert optimizer.optimize(8, 1.1) is first
+    assert optimizer.optimize(8, 1.1) is first
+    release.set()
+    deadline = time.monotonic() + 5
+    while optimization_cache[key]['timestamp'] == stale_at and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(calls) == 1
+    assert optimization_cache[key]['timestamp'] > stale_at
+    assert optimizer.optimize(8, 1.1) is optimization_cache[key]['data']
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+import pytest
+
+import portfolio_core
+from conftest import BACKEND_DIR
+
+
+def _run(code):
+    completed = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    return completed.stdout.split()
+
+
+def test_import_is_lazy():
+    assert _run("import sys, portfolio_core; print('numpy' in sys.modules, 'flask' in sys.modules)") == ['False', 'False']
+
+
+def test_core_optimizes_without_flask():
+    code = (
+        "import sys\n"
+        "sys.modules['flask'] = None\n"  # any Flask import now fails
+        "from portfolio_core import PortfolioOptimizer\n"
+        "result = PortfolioOptimizer().optimize(8, 1.0)\n"
+        "print(len(result['weights']), 'flask_cors' in sys.modules)\n"
+    )
+    assert _run(code) == ['8', 'False']
+
+
+@pytest.mark.parametrize('name', portfolio_core.__all__)
+def test_every_export_resolves(name):
+    assert getattr(portfolio_core, name) is not None
@@ -0,0 +1,48 @@
+import random
+
+import numpy as np
+import pytest
+
+from portfolio_core.engines import DEFAULT_ENGINE, WeightEngine, available_engines, get_engine
+from portfolio_core.optimizer import PortfolioOptimizer
+from portfolio_core.universe import ENHANCED_STOCKS
+from production_app import create_app
+
+STOCKS = ENHANCED_STOCKS[:10]
+RETURNS = {stock['symbol']: 0.05 + 0.01 * i for i, stock in enumerate(STOCKS)}
+
+
+def test_registry_lists_every_engine_once():
+    assert available_engines() == ['bracket-refine', 'exact', 'numpy-batched', 'numpy-random', 'python-loop']
+    assert get_engine('exact') is get_engine('exact')
+    assert get_engine().name == DEFAULT_ENGINE
+    with pytest.raises(ValueError, match='Unknown engine'):
+        get_engine('simplex')
+
+
+@pytest.mark.parametrize('engine', available_engines())
+@pytest.mark.parametrize('strict', [False, True])
+def test_engines_share_one_interface(engine, strict):
+    random.seed(0)
+    np.random.seed(0)
+
+    weights = get_engine(engine).optimize(STOCKS, 1.1, RETURNS, None, 'diversified', strict)
+
+    assert set(weights) == {stock['symbol'] for stock in STOCKS}
+    assert sum(weights.values()) == pytest.approx(1.0)
+    assert min(weights.values()) >= (WeightEngine.min_weight(len(STOCKS)) - 1e-9 if strict else -1e-12)
+    beta = sum(weights[stock['symbol']] * stock['beta'] for stock in STOCKS)
+    assert abs(beta - 1.1) < 0.15
+
+
+def test_requests_pick_the_engine():
+    optimizer = PortfolioOptimizer()
+    assert optimizer.optimize(8, 1.0, engine='exact')['engine_used'] == 'exact'
+    assert 'Unknown engine' in optimizer.optimize(8, 1.0, engine='simplex')['error']
+
+    client = create_app({'TESTING': True}).test_client()
+    listing = client.get('/api/engines').get_json()
+    assert [entry['name'] for entry in listing['engines']] == available_engines()
+    assert listing['default'] == DEFAULT_ENGINE
+    response = client.post('/api/optimize', json={'num_stocks': 8, 'target_beta': 1.0, 'engine': 'numpy-batched'})
+    assert response.get_json()['engine_used'] == 'numpy-batched'
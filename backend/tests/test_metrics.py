@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from portfolio_core.metrics import MetricsRegistry
+
+
+def test_unwritable_snapshot_directory_logs_a_warning(tmp_path, caplog):
+    directory = tmp_path / 'metrics'
+    registry = MetricsRegistry(str(directory), flush_interval=0.0)
+    shutil.rmtree(directory)
+
+    with caplog.at_level(logging.WARNING, logger='portfolio_core.metrics'):
+        registry.inc('portfolio_optimizer_cache_lookups_total', {'result': 'hit'})
+        registry.observe('portfolio_optimizer_optimize_seconds', 0.01, {'strategy': 'diversified'})
+
+    assert 'Could not write metrics snapshot' in caplog.text
+    assert registry.counter_totals('portfolio_optimizer_cache_lookups_total', 'result') == {'hit': 1.0}
+
+
+def test_render_sums_worker_snapshots(tmp_path):
+    other = MetricsRegistry(str(tmp_path), flush_interval=0.0)
+    other.inc('portfolio_optimizer_cache_lookups_total', {'result': 'hit'}, 2)
+    other.observe('portfolio_optimizer_optimize_seconds', 0.2, {'strategy': 'diversified'})
+    # Another worker's snapshot, as if written by a different process
+    os.replace(tmp_path / f'metrics_{os.getpid()}.json', tmp_path / 'metrics_1.json')
+
+    registry = MetricsRegistry(str(tmp_path), flush_interval=0.0)
+    registry.inc('portfolio_optimizer_cache_lookups_total', {'result': 'hit'})
+    registry.observe('portfolio_optimizer_optimize_seconds', 0.003, {'strategy': 'diversified'})
+    lines = registry.render().splitlines()
+
+    assert 'portfolio_optimizer_cache_lookups_total{result="hit"} 3' in lines
+    assert 'portfolio_optimizer_optimize_seconds_bucket{strategy="diversified",le="0.005"} 1' in lines
+    assert 'portfolio_optimizer_optimize_seconds_bucket{strategy="diversified",le="0.25"} 2' in lines
+    assert 'portfolio_optimizer_optimize_seconds_bucket{strategy="diversified",le="+Inf"} 2' in lines
+    assert 'portfolio_optimizer_optimize_seconds_count{strategy="diversified"} 2' in lines
+
+
+@pytest.mark.skipif(os.name != 'posix', reason='exited workers are only detected on POSIX')
+def test_exited_worker_snapshots_are_folded_in(tmp_path):
+    exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    dead_file = tmp_path / f'metrics_{exited.stdout.strip()}.json'
+    other = MetricsRegistry(str(tmp_path), flush_interval=0.0)
+    other.inc('portfolio_optimizer_cache_lookups_total', {'result': 'hit'}, 2)
+    os.replace(tmp_path / f'metrics_{os.getpid()}.json', dead_file)
+
+    registry = MetricsRegistry(str(tmp_path), flush_interval=0.0)
+    registry.inc('portfolio_optimizer_cache_lookups_total', {'result': 'hit'})
+
+    for _ in range(2):
+        assert 'portfolio_optimizer_cache_lookups_total{result="hit"} 3' in registry.render().splitlines()
+    assert [path.name for path in tmp_path.iterdir()] == [f'metrics_{os.getpid()}.json']
+    # This worker's snapshot carries the retired totals; its own stay separate
+    snapshot = json.loads((tmp_path / f'metrics_{os.getpid()}.json').read_text())
+    assert sum(value for _, _, value in snapshot['counters']) == 3
+    assert registry.counter_totals('portfolio_optimizer_cache_lookups_total', 'result') == {'hit': 1.0}
+
+
+def test_concurrent_updates_write_one_snapshot_per_interval(tmp_path, monkeypatch):
+    registry = MetricsRegistry(str(tmp_path), flush_interval=60.0)
+    writes = []
+    monkeypatch.setattr(registry, '_write', lambda: writes.append(1))
+    threads = [threading.Thread(target=registry.inc, args=('portfolio_optimizer_cache_lookups_total',))
+               for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(writes) == 1
+
+
+def test_metrics_endpoint_reports_stage_timings():
+    from production_app import create_app
+    client = create_app({'TESTING': True}).test_client()
+    assert client.post('/api/optimize', json={'num_stocks': 8, 'target_beta': 1.0}).status_code == 200
+
+    response = client.get('/api/metrics')
+
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert '# TYPE portfolio_optimizer_stage_seconds histogram' in body
+    assert 'portfolio_optimizer_stage_seconds_count{stage="weights",strategy="diversified"}' in body
+    assert 'portfolio_optimizer_cache_entries{pid=' in body
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from conftest import PRICE_BETAS
+from portfolio_core.prices import PriceStore, ingest, read_statistics
+
+
+def test_ingest_builds_an_aligned_store(price_dir, tmp_path):
+    meta = ingest(str(price_dir), str(tmp_path / 'store'), market='SPY')
+    store = PriceStore(str(tmp_path / 'store'))
+
+    assert meta['days'] == 399 and sorted(store.symbols) == ['GAPPY', 'HIGH', 'LATE', 'LOW', 'MID']
+    assert store.returns.shape == (5, 399)
+    late = store.series('LATE')
+    assert np.isnan(late[:100]).all() and not np.isnan(late[100:]).any()
+    # A missing day shows no return, then the two-day return
+    gappy, high = store.series('GAPPY'), store.series('HIGH')
+    assert gappy[4] == 0.0
+    assert (1 + gappy[3]) * (1 + gappy[4]) * (1 + gappy[5]) == pytest.approx(
+        (1 + high[3]) * (1 + high[4]) * (1 + high[5]), rel=1e-5)
+
+
+def test_statistics_recover_the_betas(price_dir, tmp_path):
+    ingest(str(price_dir), str(tmp_path / 'store'))
+
+    stats = {entry['symbol']: entry for entry in read_statistics(str(tmp_path / 'store'))['symbols']}
+
+    for symbol, beta in PRICE_BETAS.items():
+        assert stats[symbol]['beta'] == pytest.approx(beta, abs=0.03)
+        assert stats[symbol]['observations'] == 399
+    assert stats['LATE']['observations'] == 299
+    assert stats['HIGH']['name'] == 'High Beta Co' and stats['HIGH']['sector'] == 'Technology'
+
+
+def test_chunked_parsing_gives_the_same_store(price_dir, tmp_path):
+    ingest(str(price_dir), str(tmp_path / 'whole'))
+    ingest(str(price_dir), str(tmp_path / 'chunked'), chunk_rows=7)
+    ingest(str(price_dir), str(tmp_path / 'chunked'), chunk_rows=7)
+
+    whole, chunked = PriceStore(str(tmp_path / 'whole')), PriceStore(str(tmp_path / 'chunked'))
+    np.testing.assert_array_equal(np.asarray(chunked.returns), np.asarray(whole.returns))
+    # Every rewrite bumps the universe version
+    assert read_statistics(str(tmp_path / 'chunked'))['version'] == 2
@@ -0,0 +1,48 @@
+import pstats
+
+import pytest
+
+import production_app
+from production_app import ProfileManager, create_app
+
+ADMIN = {'X-Admin-Token': 'secret'}
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(production_app, 'profiler', ProfileManager(str(tmp_path), 'sample', 0.001, 5))
+    return create_app({'TESTING': True, 'ADMIN_TOKEN': 'secret'}).test_client()
+
+
+def test_admin_endpoints_need_the_token(client):
+    assert client.get('/api/admin/profile').status_code == 403
+    assert client.get('/api/admin/profiles', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get('/api/admin/profile', headers=ADMIN).status_code == 200
+
+
+def test_armed_profiling_writes_one_profile_per_request(client, tmp_path):
+    armed = client.post('/api/admin/profile', json={'count': 1, 'mode': 'cprofile'}, headers=ADMIN).get_json()
+    assert armed['remaining'] == 1 and armed['mode'] == 'cprofile'
+
+    client.post('/api/optimize', json={'num_stocks': 8, 'target_beta': 1.0})
+    client.post('/api/optimize', json={'num_stocks': 9, 'target_beta': 1.0})
+
+    listing = client.get('/api/admin/profiles', headers=ADMIN).get_json()
+    assert listing['remaining'] == 0
+    assert [p['file'].rsplit('.', 1)[1] for p in listing['profiles']] == ['prof']
+    stats = pstats.Stats(str(tmp_path / listing['profiles'][0]['file']))
+    assert any(name == 'compute' for _, _, name in stats.stats)
+
+
+def test_forced_sampling_writes_collapsed_stacks(tmp_path):
+    profiler = ProfileManager(str(tmp_path), 'sample', 0.001, 2)
+    for _ in range(3):
+        with profiler.session(True, 'diversified'):
+            sum(i * i for i in range(300000))
+
+    files = sorted(tmp_path.iterdir())
+    # Only the newest max_files profiles are kept
+    assert len(files) == 2
+    lines = files[-1].read_text().splitlines()
+    assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    assert any('test_forced_sampling_writes_collapsed_stacks' in line for line in lines)
@@ -0,0 +1,96 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from portfolio_core import rebalance as rebalancing
+from portfolio_core.optimizer import PortfolioOptimizer
+from portfolio_core.universe import ENHANCED_STOCKS
+from production_app import create_app
+
+
+def _holdings(optimizer):
+    return optimizer.optimize(10, 1.0, engine='exact')['weights']
+
+
+def test_trade_costs_follow_the_spread_and_square_root_law():
+    trades = np.array([[0.04, -0.04, 0.0], [0.01, 0.0, -0.01]])
+    spread = np.array([1e-4, 2e-4, 3e-4])
+    impact = np.array([0.01, 0.02, 0.03])
+
+    spread_cost, impact_cost = rebalancing.trade_costs(trades, spread, impact)
+
+    np.testing.assert_allclose(spread_cost, [0.04 * 3e-4, 0.01 * 4e-4])
+    np.testing.assert_allclose(impact_cost, [0.008 * 0.03, 0.001 * 0.04])
+    # Larger portfolios and smaller companies cost more to trade
+    small, large = sorted(ENHANCED_STOCKS[:20], key=lambda stock: stock['market_cap'])[::19]
+    _, impact_small = rebalancing.cost_model([small, large], 1e6)
+    _, impact_big = rebalancing.cost_model([small, large], 1e9)
+    assert impact_big[0] > impact_small[0] and impact_small[0] / impact_small[1] > 1
+
+
+@pytest.mark.parametrize('cap', [0.0, 0.05, 0.3])
+def test_trades_stay_within_the_turnover_cap(cap):
+    optimizer = PortfolioOptimizer()
+    held = _holdings(optimizer)
+
+    result = optimizer.rebalance(held, target_beta=1.3, turnover_cap=cap, seed=0)
+
+    assert result['turnover'] <= cap + 1e-9
+    assert sum(result['weights'].values()) == pytest.approx(1.0)
+    assert result['costs']['total'] == pytest.approx(result['costs']['spread'] + result['costs']['impact'], abs=2e-6)
+    assert result['before']['actual_beta'] == pytest.approx(1.0, abs=0.01)
+    if cap == 0.0:
+        assert result['trades'] == {} and result['costs']['total'] == 0
+    else:
+        # Moves towards the target as far as the cap allows
+        assert result['before']['actual_beta'] < result['actual_beta'] <= 1.3 + 0.05
+
+
+def test_rebalance_is_reproducible_and_validated():
+    optimizer = PortfolioOptimizer()
+    held = _holdings(optimizer)
+
+    first = optimizer.rebalance(held, target_beta=1.2, seed=7)
+    again = optimizer.rebalance(held, target_beta=1.2, seed=7)
+
+    assert first['weights'] == again['weights']
+    assert 'turnover_cap' in optimizer.rebalance(held, turnover_cap=2)['error']
+    assert 'seed' in optimizer.rebalance(held, seed=-1)['error']
+    assert optimizer.rebalance()['error'] == 'Provide either current_weights or previous_result_key'
+
+
+def test_seeded_rebalances_leave_the_global_generators_alone():
+    optimizer = PortfolioOptimizer()
+    held = _holdings(optimizer)
+    request = dict(target_beta=1.2, num_stocks=14, engine='numpy-random', seed=7)
+    expected = optimizer.rebalance(held, **request)['weights']
+    random.seed(1)
+    np.random.seed(1)
+    states = random.getstate(), np.random.get_state()[1].copy()
+
+    optimizer.rebalance(held, **request)
+
+    assert random.getstate() == states[0] and np.array_equal(np.random.get_state()[1], states[1])
+    # Optimisations drawing from the global generators in between change nothing
+    with ThreadPoolExecutor(4) as pool:
+        rebalances = [pool.submit(optimizer.rebalance, held, **request) for _ in range(4)]
+        for i in range(16):
+            pool.submit(optimizer.optimize, 10, 0.8 + 0.05 * i, engine='numpy-random')
+        assert all(future.result()['weights'] == expected for future in rebalances)
+
+
+def test_rebalance_endpoint_trades_a_cached_result():
+    client = create_app({'TESTING': True}).test_client()
+    optimized = client.post('/api/optimize', json={'num_stocks': 8, 'target_beta': 1.0}).get_json()
+
+    response = client.post('/api/rebalance', json={'previous_result_key': optimized['result_key'], 'target_beta': 1.2,
+                                                   'turnover_cap': 0.1, 'seed': 1})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['turnover'] <= 0.1 + 1e-9
+    assert set(body['weights']) <= set(optimized['weights'])
+    assert client.post('/api/rebalance', json={'target_beta': 1.2}).status_code == 400
+    assert client.post('/api/rebalance', json={'current_weights': {'AAPL': 1.0}, 'seed': -1}).status_code == 400
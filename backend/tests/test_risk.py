@@ -0,0 +1,72 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+import pytest
+
+from portfolio_core import risk
+from portfolio_core.optimizer import PortfolioOptimizer
+from portfolio_core.risk import factor_exposures, value_at_risk
+from portfolio_core.universe import ENHANCED_STOCKS
+
+STOCKS = ENHANCED_STOCKS[:12]
+LEVELS = (0.95, 0.99)
+
+
+def _exposures():
+    return factor_exposures(STOCKS, {stock['symbol']: 0.08 for stock in STOCKS})
+
+
+def _portfolios(count):
+    return np.random.default_rng(0).dirichlet(np.ones(len(STOCKS)), count)
+
+
+def test_parametric_measures_match_the_normal_closed_form():
+    mu, beta, idio = _exposures()
+    weights = _portfolios(1)
+    result = value_at_risk(weights, mu, beta, idio, LEVELS, horizon_days=10)
+    mean = float(result['expected_return'][0]) * 10 / 252
+    sd = float(result['volatility'][0]) * math.sqrt(10 / 252)
+    z = NormalDist().inv_cdf(0.99)
+
+    assert result['parametric_var'][0, 1] == pytest.approx(z * sd - mean)
+    assert result['parametric_cvar'][0, 1] == pytest.approx(NormalDist().pdf(z) / 0.01 * sd - mean)
+    for method in ('parametric', 'simulated'):
+        var, cvar = result[f'{method}_var'][0], result[f'{method}_cvar'][0]
+        assert var[0] < var[1] and np.all(cvar >= var)
+
+
+def test_batched_and_chunked_analysis_matches_single_portfolios(monkeypatch):
+    mu, beta, idio = _exposures()
+    weights = _portfolios(30)
+    batched = value_at_risk(weights, mu, beta, idio, LEVELS)
+    monkeypatch.setattr(risk, 'CHUNK_ELEMENTS', 3 * risk.NUM_SCENARIOS)
+    chunked = value_at_risk(weights, mu, beta, idio, LEVELS)
+
+    for key in ('parametric_var', 'simulated_var', 'simulated_cvar'):
+        np.testing.assert_allclose(chunked[key], batched[key])
+        for i in (0, 17, 29):
+            single = value_at_risk(weights[i:i + 1], mu, beta, idio, LEVELS)
+            np.testing.assert_allclose(single[key][0], batched[key][i])
+
+
+def test_fat_tailed_scenarios_exceed_the_normal_tail():
+    mu, beta, idio = _exposures()
+    # All market risk, so the Student-t factor dominates
+    weights = np.zeros((1, len(STOCKS)))
+    weights[0, np.argmax(beta)] = 1.0
+    result = value_at_risk(weights, mu, beta, np.zeros_like(idio), (0.999,))
+    assert result['simulated_cvar'][0, 0] > result['parametric_cvar'][0, 0]
+
+
+def test_risk_report_covers_cached_results():
+    optimizer = PortfolioOptimizer()
+    keys = [optimizer.optimize(n, 1.0)['result_key'] for n in (6, 9)]
+
+    report = optimizer.risk_report(portfolios=[{'AAPL': 1.0}], all_cached=True, levels=[0.95])
+
+    assert [entry.get('result_key') for entry in report['portfolios']] == [None] + keys
+    assert report['portfolios'][0]['index'] == 0
+    for entry in report['portfolios']:
+        assert entry['var']['simulated']['0.95'] > 0
+    assert 'levels' in optimizer.risk_report(portfolios=[{'AAPL': 1.0}], levels=[0.3])['error']
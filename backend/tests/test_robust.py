@@ -0,0 +1,116 @@
+import random
+
+import numpy as np
+import pytest
+
+from portfolio_core.engines import Uncertainty, get_engine
+from portfolio_core.optimizer import PortfolioOptimizer, optimization_cache
+from portfolio_core.risk import standard_errors
+from portfolio_core.tracing import RequestTrace, set_trace
+from portfolio_core.universe import ENHANCED_STOCKS
+
+
+def _problem():
+    # Histories of different lengths give the stocks different errors
+    lengths = np.random.default_rng(1).integers(60, 1500, 12)
+    stocks = [dict(stock, observations=int(days)) for stock, days in zip(ENHANCED_STOCKS[:12], lengths)]
+    beta_se, return_se = standard_errors(stocks)
+    symbols = [stock['symbol'] for stock in stocks]
+    uncertainty = Uncertainty('worst_case', dict(zip(symbols, beta_se)), dict(zip(symbols, return_se)))
+    return stocks, symbols, uncertainty
+
+
+def _run(engine, stocks, uncertainty, seed, **kwargs):
+    """Weights and search iterations of one engine call."""
+    np.random.seed(seed)
+    trace = RequestTrace()
+    set_trace(trace)
+    try:
+        trace.begin('weights')
+        weights = get_engine(engine).optimize(stocks, 1.1, uncertainty=uncertainty, **kwargs)
+    finally:
+        set_trace(None)
+    return weights, trace.stages[0].get('iterations', 0)
+
+
+@pytest.mark.parametrize('engine', ['numpy-random', 'numpy-batched'])
+@pytest.mark.parametrize('strict', [False, True])
+def test_random_search_accepts_on_point_estimates(engine, strict):
+    stocks, symbols, uncertainty = _problem()
+    betas = np.array([stock['beta'] for stock in stocks])
+    variances = uncertainty.variances(symbols)[0]
+    nominal_iterations, robust_iterations, nominal_errors, robust_errors = [], [], [], []
+    for seed in range(20):
+        nominal, iterations = _run(engine, stocks, None, seed, strict=strict)
+        nominal_iterations.append(iterations)
+        nominal_errors.append(uncertainty.error(np.array([nominal[s] for s in symbols]), betas, variances, 1.1))
+        robust, iterations = _run(engine, stocks, uncertainty, seed, strict=strict)
+        robust_iterations.append(iterations)
+        w = np.array([robust[s] for s in symbols])
+        robust_errors.append(uncertainty.error(w, betas, variances, 1.1))
+        assert abs(w @ betas - 1.1) < get_engine(engine).BETA_TOLERANCE
+
+    # A few acceptable samples (or one batch), not the whole budget
+    batch = get_engine(engine).BATCH_SIZE if engine == 'numpy-batched' else 0
+    assert max(robust_iterations) <= max(batch, 50 * np.mean(nominal_iterations))
+    assert max(robust_iterations) < 5000
+    assert np.mean(robust_errors) < np.mean(nominal_errors)
+
+
+def test_exact_meets_targets_with_less_estimation_error():
+    stocks, symbols, uncertainty = _problem()
+    betas = np.array([stock['beta'] for stock in stocks])
+    variances = uncertainty.variances(symbols)[0]
+    nominal, _ = _run('exact', stocks, None, 0, strict=True)
+    robust, _ = _run('exact', stocks, uncertainty, 0, strict=True)
+    w_nominal = np.array([nominal[s] for s in symbols])
+    w_robust = np.array([robust[s] for s in symbols])
+
+    assert w_robust.sum() == pytest.approx(1.0)
+    assert w_robust @ betas == pytest.approx(1.1)
+    assert w_robust.min() >= get_engine('exact').min_weight(len(stocks)) - 1e-12
+    assert uncertainty.error(w_robust, betas, variances, 1.1) < uncertainty.error(w_nominal, betas, variances, 1.1)
+
+
+def test_equal_errors_give_the_nominal_exact_solution():
+    stocks, symbols, _ = _problem()
+    uncertainty = Uncertainty('expected', dict.fromkeys(symbols, 0.05), dict.fromkeys(symbols, 0.1))
+    nominal, _ = _run('exact', stocks, None, 0)
+    robust, _ = _run('exact', stocks, uncertainty, 0)
+    assert [robust[s] for s in symbols] == pytest.approx([nominal[s] for s in symbols], abs=1e-9)
+
+
+def _optimize(optimizer, engine, strategy, target_return, robust, seed):
+    """Result and weight-search iterations of one uncached optimisation."""
+    optimization_cache.clear()
+    random.seed(seed)
+    np.random.seed(seed)
+    trace = RequestTrace()
+    set_trace(trace)
+    try:
+        result = optimizer.optimize(10, 1.0, target_return, strategy, engine, robust=robust)
+    finally:
+        set_trace(None)
+    return result, sum(stage.get('iterations', 0) for stage in trace.stages if stage['stage'] == 'weights')
+
+
+@pytest.mark.parametrize('engine', ['numpy-random', 'numpy-batched'])
+@pytest.mark.parametrize('strategy,target_return', [('diversified', None), ('target_return', 0.12)])
+def test_optimizer_robust_search_stops_early(engine, strategy, target_return):
+    optimizer = PortfolioOptimizer()
+    weight_engine = get_engine(engine)
+    budget = 10000 if strategy == 'target_return' else 5000
+    batch = weight_engine.BATCH_SIZE if engine == 'numpy-batched' else 0
+    nominal_total = robust_total = 0
+    for seed in range(5):
+        _, nominal_iterations = _optimize(optimizer, engine, strategy, target_return, None, seed)
+        result, robust_iterations = _optimize(optimizer, engine, strategy, target_return, 'worst_case', seed)
+        nominal_total += nominal_iterations
+        robust_total += robust_iterations
+        # At most twice as long as the first acceptable sample
+        assert 0 < robust_iterations <= min(budget, 2 * nominal_iterations + batch)
+        assert result['robust']['mode'] == 'worst_case'
+        if strategy == 'diversified':
+            assert abs(result['actual_beta'] - 1.0) < weight_engine.BETA_TOLERANCE
+    # A constant factor of the nominal search (one batch at least)
+    assert robust_total <= 2 * weight_engine.ROBUST_SAMPLES * nominal_total + 5 * batch
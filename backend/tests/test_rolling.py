@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from portfolio_core.optimizer import PortfolioOptimizer, optimization_cache
+from portfolio_core.prices import PriceStore, compute_statistics, ingest
+from portfolio_core.rolling import STATE_FILE, RollingStatistics, update_store
+
+
+@pytest.fixture
+def store(price_dir, tmp_path):
+    ingest(str(price_dir), str(tmp_path / 'store'))
+    return PriceStore(str(tmp_path / 'store'))
+
+
+def test_window_estimates_match_a_full_recomputation(store):
+    rolling = RollingStatistics(store.symbols, window=120)
+    rolling.update_from_store(store)
+    recent = compute_statistics(store.returns[:, -120:], store.market_returns[-120:])
+
+    stats = rolling.statistics()
+
+    np.testing.assert_allclose(stats['beta'], recent['beta'], rtol=1e-6)
+    np.testing.assert_allclose(stats['mean_return'], recent['mean_return'], rtol=1e-5)
+    np.testing.assert_array_equal(stats['observations'], recent['observations'])
+
+
+@pytest.mark.parametrize('settings', [{'halflife': 30}, {'window': 50}])
+def test_resumed_updates_match_one_pass(store, tmp_path, settings):
+    one_pass = RollingStatistics(store.symbols, **settings)
+    one_pass.update_from_store(store)
+
+    resumed = RollingStatistics(store.symbols, **settings)
+    assert resumed.update_from_store(store, stop=173) == 173
+    resumed.save(str(tmp_path / STATE_FILE))
+    resumed = RollingStatistics.load(str(tmp_path / STATE_FILE))
+    assert resumed.update_from_store(store) == len(store.dates) - 173
+
+    for name, values in one_pass.statistics().items():
+        np.testing.assert_allclose(resumed.statistics()[name], values, rtol=1e-9)
+
+
+def test_store_updates_refresh_the_optimizer_universe(store):
+    optimizer = PortfolioOptimizer()
+    optimizer.store_dir = store.directory
+    assert optimizer.refresh_universe(force=True)
+    version = optimizer.universe_version
+    assert sorted(stock['symbol'] for stock in optimizer.stocks) == sorted(store.symbols)
+    result = optimizer.optimize(5, 1.0)
+    assert result['universe_version'] == version
+
+    summary = update_store(store.directory, window=60)
+    # Nothing new on a second run
+    assert update_store(store.directory, window=60)['new_bars'] == 0
+
+    assert summary['version'] == version + 1 and summary['new_bars'] == len(store.dates)
+    assert optimizer.refresh_universe(force=True)
+    assert optimizer.universe_version == version + 2
+    assert result['result_key'] not in optimization_cache
+    assert optimizer.optimize(5, 1.0)['universe_version'] == version + 2
@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+import pytest
+
+from portfolio_core.engines import get_engine, sector_matrix
+from portfolio_core.optimizer import PortfolioOptimizer, optimization_cache
+from portfolio_core.universe import ENHANCED_STOCKS
+
+# Tech, Financial Services and Consumer Discretionary capped; no
+# Financial Services stock is selected
+LIMITS = {'Consumer Discretionary': (0.0, 0.1), 'Financial Services': (0.0, 0.1), 'Technology': (0.0, 0.1)}
+
+
+def _stocks():
+    by_sector = {}
+    for stock in ENHANCED_STOCKS:
+        by_sector.setdefault(stock['sector'], []).append(stock)
+    return (by_sector['Consumer Discretionary'][:2] + by_sector['Technology'][:4]
+            + by_sector['Healthcare'] + by_sector['Communication Services'])
+
+
+def _sector_weights(stocks, weights):
+    totals = {}
+    for stock in stocks:
+        totals[stock['sector']] = totals.get(stock['sector'], 0.0) + weights[stock['symbol']]
+    return totals
+
+
+@pytest.mark.parametrize('floor', [0.0, 0.01])
+def test_repair_keeps_the_sum_with_an_absent_limited_sector(floor):
+    stocks = _stocks()
+    limits = sector_matrix(stocks, LIMITS)
+    candidates = floor + np.random.default_rng(2).dirichlet(np.ones(len(stocks)), 50) * (1.0 - len(stocks) * floor)
+
+    repaired = limits.repair(candidates, floor)
+
+    np.testing.assert_allclose(repaired.sum(axis=1), 1.0)
+    assert repaired.min() >= floor - 1e-12
+    assert limits.violation(repaired).max() < 1e-9
+
+
+@pytest.mark.parametrize('engine', ['numpy-random', 'numpy-batched', 'exact'])
+@pytest.mark.parametrize('strict', [False, True])
+def test_engines_meet_limits_with_an_absent_limited_sector(engine, strict):
+    stocks = _stocks()
+    np.random.seed(2)
+
+    weights = get_engine(engine).optimize(stocks, 1.0, strict=strict, sector_limits=LIMITS)
+
+    assert sum(weights.values()) == pytest.approx(1.0)
+    for sector, weight in _sector_weights(stocks, weights).items():
+        low, high = LIMITS.get(sector, (0.0, 1.0))
+        assert low - 1e-9 <= weight <= high + 1e-9
+
+
+def test_optimize_reports_limits_met_for_random_selections():
+    optimizer = PortfolioOptimizer()
+    limits = {sector: {'max': high} for sector, (_, high) in LIMITS.items()}
+    for seed in range(20):
+        optimization_cache.clear()
+        random.seed(seed)
+        np.random.seed(seed)
+        result = optimizer.optimize(10, 1.0, strategy='random', engine='numpy-batched', sector_limits=limits)
+        if 'error' in result:
+            # Too few stocks outside the capped sectors for the floor
+            continue
+        assert sum(result['weights'].values()) == pytest.approx(1.0)
+        assert result['sector_limits_met'], result['sector_weights']
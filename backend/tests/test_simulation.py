@@ -0,0 +1,52 @@
+import math
+
+import pytest
+
+from portfolio_core.optimizer import PortfolioOptimizer
+from portfolio_core.simulation import simulate
+from portfolio_core.universe import ENHANCED_STOCKS
+from production_app import create_app
+
+STOCKS = ENHANCED_STOCKS[:5]
+WEIGHTS = {stock['symbol']: 0.2 for stock in STOCKS}
+RETURNS = {stock['symbol']: 0.08 for stock in STOCKS}
+
+
+def _without_time(result):
+    return {k: v for k, v in result.items() if k != 'simulation_time'}
+
+
+def test_results_do_not_depend_on_chunk_size():
+    whole = simulate(STOCKS, WEIGHTS, RETURNS, 0.1, num_paths=3000, seed=5)
+    chunked = simulate(STOCKS, WEIGHTS, RETURNS, 0.1, num_paths=3000, seed=5, chunk_draws=100)
+    assert _without_time(chunked) == _without_time(whole)
+
+
+def test_terminal_distribution_matches_the_model():
+    result = simulate(STOCKS, WEIGHTS, RETURNS, 0.1, num_paths=200000, seed=1)
+    sigma = result['model']['volatility']
+    mu_log = math.log1p(result['model']['expected_return'])
+    median = math.exp(mu_log - 0.5 * sigma ** 2)
+    loss = 0.5 * math.erfc((mu_log - 0.5 * sigma ** 2) / sigma / math.sqrt(2))
+
+    assert result['terminal_value']['mean'] == pytest.approx(1.08, abs=0.005)
+    assert result['terminal_value']['percentiles']['p50'] == pytest.approx(median, abs=0.005)
+    assert result['probability_of_loss'] == pytest.approx(loss, abs=0.005)
+    probabilities = list(result['max_drawdown']['probability_exceeding'].values())
+    assert probabilities == sorted(probabilities, reverse=True)
+
+
+def test_simulate_endpoint_uses_a_cached_result():
+    client = create_app({'TESTING': True}).test_client()
+    optimized = client.post('/api/optimize', json={'num_stocks': 8, 'target_beta': 1.0}).get_json()
+
+    response = client.post('/api/simulate', json={'result_key': optimized['result_key'], 'num_paths': 2000, 'seed': 3})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['num_paths'] == 2000
+    assert body['model']['beta'] == pytest.approx(optimized['actual_beta'], abs=1e-3)
+    too_many = client.post('/api/simulate', json={'weights': WEIGHTS, 'num_paths': 10 ** 7, 'horizon_years': 30})
+    assert too_many.status_code == 400
+    assert client.post('/api/simulate', json={'weights': WEIGHTS, 'seed': -1}).status_code == 400
+    assert PortfolioOptimizer().simulate(result_key='missing')['error'].startswith('No cached result')
@@ -0,0 +1,40 @@
+from portfolio_core.tracing import RequestTrace
+from production_app import create_app
+
+
+def test_server_timing_lists_finished_stages_with_details():
+    trace = RequestTrace()
+    outer = trace.begin('compute')
+    inner = trace.begin('weights')
+    trace.annotate(iterations=42)
+    trace.end(inner, 0.002)
+    trace.end(outer, 0.003)
+    trace.begin('serialization')
+
+    parts = trace.server_timing().split(', ')
+
+    assert parts[:2] == ['compute;dur=3.0', 'weights;dur=2.0;desc="iterations=42"']
+    assert parts[-1].startswith('total;dur=')
+    assert len(parts) == 3
+
+
+def test_optimize_reports_stage_timings():
+    client = create_app({'TESTING': True}).test_client()
+
+    response = client.post('/api/optimize', json={'num_stocks': 8, 'target_beta': 1.0, 'debug_timing': True})
+
+    stages = {part.split(';')[0] for part in response.headers['Server-Timing'].split(', ')}
+    assert {'cache_lookup', 'weights', 'serialization', 'total'} <= stages
+    timing = response.get_json()['debug_timing']
+    assert timing['cache_key'] == response.get_json()['result_key']
+    weights = next(entry for entry in timing['stages'] if entry['stage'] == 'weights')
+    assert weights['iterations'] > 0 and weights['duration_ms'] >= 0
+
+
+def test_debug_timing_is_opt_in():
+    client = create_app({'TESTING': True}).test_client()
+
+    response = client.post('/api/optimize', json={'num_stocks': 8, 'target_beta': 1.0})
+
+    assert 'debug_timing' not in response.get_json()
+    assert 'Server-Timing' in response.headers
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from portfolio_core.optimizer import PortfolioOptimizer, turnover
+from production_app import create_app
+
+
+def _beta(optimizer, weights):
+    betas = {stock['symbol']: stock['beta'] for stock in optimizer.stocks}
+    return sum(weight * betas[symbol] for symbol, weight in weights.items())
+
+
+@pytest.mark.parametrize('engine', ['exact', 'numpy-random'])
+def test_warm_start_keeps_the_holdings_and_reports_turnover(engine):
+    np.random.seed(0)
+    optimizer = PortfolioOptimizer()
+    start = optimizer.optimize(10, 1.0, engine=engine)
+    held = start['weights']
+
+    result = optimizer.optimize(10, 1.1, engine=engine, initial_weights=held)
+
+    assert set(result['weights']) == set(held)
+    assert result['turnover'] == pytest.approx(turnover(held, result['weights']), abs=1e-4)
+    assert abs(_beta(optimizer, result['weights']) - 1.1) < 0.05
+    assert start['turnover'] is None
+    # A tweak of the target needs a small trade, not a new portfolio
+    assert result['turnover'] < 0.5
+
+
+def test_turnover_penalty_keeps_the_exact_fit_closer_to_the_start():
+    optimizer = PortfolioOptimizer()
+    held = optimizer.optimize(10, 1.0, engine='exact')['weights']
+
+    free = optimizer.optimize(10, 1.2, engine='exact', initial_weights=held)
+    penalised = optimizer.optimize(10, 1.2, engine='exact', initial_weights=held, turnover_penalty=50)
+
+    assert free['result_key'] != penalised['result_key']
+    assert penalised['turnover'] <= free['turnover']
+
+
+def test_optimize_endpoint_warm_starts_from_a_cached_result():
+    client = create_app({'TESTING': True}).test_client()
+    first = client.post('/api/optimize', json={'num_stocks': 8, 'target_beta': 1.0}).get_json()
+
+    response = client.post('/api/optimize', json={'num_stocks': 8, 'target_beta': 1.1,
+                                                  'previous_result_key': first['result_key']})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert set(body['weights']) == set(first['weights'])
+    assert body['turnover'] is not None
+    both = client.post('/api/optimize', json={'num_stocks': 8, 'target_beta': 1.1, 'current_weights': first['weights'],
+                                              'previous_result_key': first['result_key']})
+    assert both.status_code == 400
+    missing = client.post('/api/optimize', json={'num_stocks': 8, 'target_beta': 1.1, 'previous_result_key': 'missing'})
+    assert missing.status_code == 400
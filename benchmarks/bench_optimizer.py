@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+In-process benchmark suite for PortfolioOptimizer.
+
+Runs ``PortfolioOptimizer.optimize`` for every strategy and each
+registered weight engine on synthetic universes of several sizes, with feasible and
+infeasible targets, and records latency percentiles, weight-search
+iterations and peak memory.  Results can be saved as a JSON baseline and
+later runs compared against it; the script exits with status 1 when any
+case regresses beyond the threshold.
+
+Usage:
+    python benchmarks/bench_optimizer.py
+    python benchmarks/bench_optimizer.py --save benchmarks/baseline.json
+    python benchmarks/bench_optimizer.py --compare benchmarks/baseline.json --threshold 0.25
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from common import load_core, seed_everything, summarize_latencies, synthetic_universe
+
+STRATEGIES = ['diversified', 'random', 'target_return', 'default']
+
+# (target_beta, target_return) per scenario.  Synthetic betas lie in
+# [0.4, 2.2] and returns below 20%, so the infeasible targets cannot be met.
+TARGETS = {
+    'feasible': (1.0, 0.10),
+    'infeasible': (2.9, 0.45),
+}
+
+NUM_STOCKS = 10
+
+# Pure-Python engines take minutes on large universes; skip them above this size
+PYTHON_ENGINE_MAX_SIZE = 500
+PYTHON_ENGINES = ('python-loop', 'bracket-refine')
+
+
+def _iterations(trace) -> int:
+    return sum(entry.get('iterations', 0) for entry in trace.stages)
+
+
+def _measure(core, run: Callable[[], object], repeat: int, seed: int) -> Dict:
+    """Time ``run`` ``repeat`` times, then once more under tracemalloc."""
+    latencies: List[float] = []
+    iterations: List[int] = []
+    for i in range(repeat):
+        seed_everything(seed + i)
+        core.optimization_cache.clear()
+        trace = core.RequestTrace()
+        core.set_trace(trace)
+        start = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - start)
+        iterations.append(_iterations(trace))
+    core.set_trace(None)
+
+    seed_everything(seed)
+    core.optimization_cache.clear()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    summary = summarize_latencies(latencies)
+    summary['iterations_mean'] = round(sum(iterations) / len(iterations), 1)
+    summary['peak_kib'] = round(peak / 1024, 1)
+    return summary
+
+
+def optimize_cases(core, sizes: List[int], repeat: int, seed: int) -> Dict[str, Dict]:
+    results = {}
+    for size in sizes:
+        optimizer = core.PortfolioOptimizer()
+        optimizer.stocks = synthetic_universe(size, seed)
+        for strategy in STRATEGIES:
+            for scenario, (target_beta, target_return) in TARGETS.items():
+                if scenario == 'feasible' and strategy != 'target_return':
+                    # Beta-only requests are the common case for these strategies
+                    target_return = None
+
+                def run(optimizer=optimizer, strategy=strategy, target_beta=target_beta, target_return=target_return):
+                    result = optimizer.optimize(NUM_STOCKS, target_beta, target_return, strategy)
+                    if 'error' in result:
+                        raise RuntimeError(result['error'])
+
+                key = f"optimize/{strategy}/{size}/{scenario}"
+                results[key] = _measure(core, run, repeat, seed)
+                print(f"{key:45s} p50={results[key]['p50_ms']:9.2f}ms p95={results[key]['p95_ms']:9.2f}ms "
+                      f"iter={results[key]['iterations_mean']:8.0f} peak={results[key]['peak_kib']:9.1f}KiB",
+                      file=sys.stderr)
+    return results
+
+
+def engine_cases(core, sizes: List[int], repeat: int, seed: int, names: Optional[List[str]] = None) -> Dict[str, Dict]:
+    """Benchmark every registered weight engine directly on the whole universe."""
+    results = {}
+    optimizer = core.PortfolioOptimizer()
+    for size in sizes:
+        stocks = synthetic_universe(size, seed)
+        returns = optimizer._calculate_individual_returns(stocks)
+        for name in names or core.available_engines():
+            if name in PYTHON_ENGINES and size > PYTHON_ENGINE_MAX_SIZE:
+                continue
+            engine = core.get_engine(name)
+            for strict in (False, True):
+                for scenario, (target_beta, target_return) in TARGETS.items():
+
+                    def run(engine=engine, strict=strict, target_beta=target_beta, target_return=target_return):
+                        trace = core.current_trace()
+                        entry = trace.begin('weights') if trace is not None else None
+                        engine.optimize(stocks, target_beta, returns, target_return, 'diversified', strict)
+                        if entry is not None:
+                            trace.end(entry, 0.0)
+
+                    key = f"engine/{name}{'/strict' if strict else ''}/{size}/{scenario}"
+                    results[key] = _measure(core, run, repeat, seed)
+                    print(f"{key:45s} p50={results[key]['p50_ms']:9.2f}ms p95={results[key]['p95_ms']:9.2f}ms "
+                          f"iter={results[key]['iterations_mean']:8.0f} peak={results[key]['peak_kib']:9.1f}KiB",
+                          file=sys.stderr)
+    return results
+
+
+def compare(current: Dict, baseline: Dict, threshold: float, min_delta_ms: float) -> List[str]:
+    """Return a description of every case that regressed against ``baseline``."""
+    regressions = []
+    for key, base in baseline['results'].items():
+        now = current['results'].get(key)
+        if now is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if now[metric] > base[metric] * (1 + threshold) and now[metric] - base[metric] > min_delta_ms:
+                regressions.append(f"{key} {metric}: {base[metric]:.2f} -> {now[metric]:.2f}")
+        if now['peak_kib'] > base['peak_kib'] * (1 + threshold) and now['peak_kib'] - base['peak_kib'] > 64:
+            regressions.append(f"{key} peak_kib: {base['peak_kib']:.1f} -> {now['peak_kib']:.1f}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='20,500,5000', help='comma separated universe sizes')
+    parser.add_argument('--repeat', type=int, default=10, help='timed runs per case')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', choices=['optimize', 'engine'], help='run one group of cases')
+    parser.add_argument('--engines', help='comma separated weight engines for the engine cases (default: all)')
+    parser.add_argument('--save', metavar='PATH', help='write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative slowdown (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore slowdowns smaller than this')
+    args = parser.parse_args(argv)
+
+    core = load_core()
+    import numpy as np
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+
+    results: Dict[str, Dict] = {}
+    if args.only in (None, 'optimize'):
+        results.update(optimize_cases(core, sizes, args.repeat, args.seed))
+    if args.only in (None, 'engine'):
+        names = args.engines.split(',') if args.engines else None
+        results.update(engine_cases(core, sizes, args.repeat, args.seed, names))
+
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.save}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print("No regressions against baseline.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Solution-quality vs. speed harness for the weight engines.
+
+Runs every registered weight engine, plus tolerance variants of the
+random-search engines, on the same corpus of seeded problems
+and reports, per engine, the achieved |beta error| and |return error|,
+the smallest weight handed out, constraint violations and wall time.
+A Pareto table marks the variants no other variant beats on both error
+and time, which is the shortlist for production defaults.
+
+Variants run each engine in normal and strict mode at its default
+settings, and the NumPy random search at tighter and looser early-exit
+tolerances (``BETA_TOLERANCE`` and friends).
+
+Usage:
+    python benchmarks/bench_quality.py
+    python benchmarks/bench_quality.py --problems 200 --json quality.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from common import SECTORS, load_core, seed_everything, summarize_latencies
+
+# Extra variant name -> (engine, strict, attribute overrides); every
+# registered engine is also run at its defaults as "<engine>" and
+# "<engine>/strict".
+TUNED_VARIANTS = {
+    'numpy-random/tight': ('numpy-random', False, {'BETA_TOLERANCE': 0.01, 'RETURN_TOLERANCE': 0.002, 'TARGET_RETURN_TOLERANCE': 0.00002}),
+    'numpy-random/loose': ('numpy-random', False, {'BETA_TOLERANCE': 0.1, 'RETURN_TOLERANCE': 0.02, 'TARGET_RETURN_TOLERANCE': 0.001}),
+    'numpy-random/strict/tight': ('numpy-random', True, {'BETA_TOLERANCE': 0.01, 'TARGET_RETURN_TOLERANCE': 0.00002}),
+    'numpy-random/strict/loose': ('numpy-random', True, {'BETA_TOLERANCE': 0.1, 'TARGET_RETURN_TOLERANCE': 0.001}),
+}
+
+# Weights below this count as "zero" in the optimize() pipeline
+ZERO_WEIGHT = 0.001
+
+
+def build_corpus(count: int, seed: int) -> List[Dict]:
+    """
+    Generate ``count`` reproducible problems.  Returns are drawn here
+    rather than from ``_calculate_individual_returns`` so the corpus does
+    not change with the optimiser's return model.
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        n = rng.choice([3, 5, 10, 20, 50])
+        stocks = []
+        returns = {}
+        for j in range(n):
+            symbol = f"P{i:04d}_{j:02d}"
+            stocks.append({
+                'symbol': symbol,
+                'name': symbol,
+                'sector': SECTORS[rng.randrange(len(SECTORS))],
+                'beta': round(rng.uniform(0.4, 2.2), 2),
+                'market_cap': int(rng.lognormvariate(25, 1.2)),
+            })
+            returns[symbol] = round(rng.uniform(0.03, 0.18), 4)
+        betas = [s['beta'] for s in stocks]
+        strategy = rng.choice(['diversified', 'diversified', 'target_return'])
+        # Targets inside the achievable range most of the time, outside otherwise
+        if rng.random() < 0.8:
+            target_beta = rng.uniform(min(betas), max(betas))
+            target_return = rng.uniform(min(returns.values()), max(returns.values()))
+        else:
+            target_beta = rng.uniform(0.1, 3.0)
+            target_return = rng.uniform(0.01, 0.30)
+        if strategy != 'target_return' and rng.random() < 0.5:
+            target_return = None
+        corpus.append({
+            'stocks': stocks,
+            'returns': returns,
+            'target_beta': round(target_beta, 3),
+            'target_return': round(target_return, 4) if target_return is not None else None,
+            'strategy': strategy,
+        })
+    return corpus
+
+
+def variants(core) -> Dict[str, tuple]:
+    found = {}
+    for name in core.available_engines():
+        found[name] = (name, False, {})
+        found[f"{name}/strict"] = (name, True, {})
+    found.update(TUNED_VARIANTS)
+    return found
+
+
+def evaluate(engine: Callable, corpus: List[Dict], seed: int) -> Dict:
+    beta_errors: List[float] = []
+    return_errors: List[float] = []
+    latencies: List[float] = []
+    min_weight = float('inf')
+    violations = {'sum': 0, 'negative': 0, 'zero_weight': 0}
+    for i, problem in enumerate(corpus):
+        seed_everything(seed + i)
+        stocks, returns = problem['stocks'], problem['returns']
+        start = time.perf_counter()
+        weights = engine(stocks, problem['target_beta'], returns, problem['target_return'], problem['strategy'])
+        latencies.append(time.perf_counter() - start)
+
+        values = [float(weights.get(s['symbol'], 0.0)) for s in stocks]
+        beta = sum(w * s['beta'] for w, s in zip(values, stocks))
+        beta_errors.append(abs(beta - problem['target_beta']))
+        if problem['target_return'] is not None:
+            achieved = sum(w * returns[s['symbol']] for w, s in zip(values, stocks))
+            return_errors.append(abs(achieved - problem['target_return']))
+        min_weight = min(min_weight, min(values))
+        if abs(sum(values) - 1.0) > 1e-6:
+            violations['sum'] += 1
+        if any(w < -1e-9 for w in values):
+            violations['negative'] += 1
+        if any(w < ZERO_WEIGHT for w in values):
+            violations['zero_weight'] += 1
+
+    def mean(values: List[float]) -> float:
+        return sum(values) / len(values) if values else 0.0
+
+    def p95(values: List[float]) -> float:
+        return sorted(values)[int(0.95 * (len(values) - 1))] if values else 0.0
+
+    timing = summarize_latencies(latencies)
+    return {
+        'beta_error_mean': round(mean(beta_errors), 5),
+        'beta_error_p95': round(p95(beta_errors), 5),
+        'return_error_mean': round(mean(return_errors), 6),
+        'return_error_p95': round(p95(return_errors), 6),
+        'min_weight': round(min_weight, 6),
+        'violations': violations,
+        'time_mean_ms': timing['mean_ms'],
+        'time_p95_ms': timing['p95_ms'],
+        # Same weighting the engines use when scoring beta + return fits
+        'combined_error': round(mean(beta_errors) + 10 * mean(return_errors), 5),
+    }
+
+
+def pareto_front(results: Dict[str, Dict]) -> List[str]:
+    """Names of variants not dominated on (combined_error, time_mean_ms)."""
+    front = []
+    for name, r in results.items():
+        dominated = any(
+            o['combined_error'] <= r['combined_error'] and o['time_mean_ms'] <= r['time_mean_ms']
+            and (o['combined_error'] < r['combined_error'] or o['time_mean_ms'] < r['time_mean_ms'])
+            for other, o in results.items() if other != name
+        )
+        if not dominated:
+            front.append(name)
+    return front
+
+
+def print_table(results: Dict[str, Dict], front: List[str]) -> None:
+    header = ('engine', 'pareto', 'beta err mean', 'p95', 'return err mean', 'p95',
+              'min weight', 'violations (sum/neg/zero)', 'time mean ms', 'p95')
+    print('| ' + ' | '.join(header) + ' |')
+    print('|' + '---|' * len(header))
+    for name, r in sorted(results.items(), key=lambda item: item[1]['time_mean_ms']):
+        v = r['violations']
+        row = (name, '*' if name in front else '',
+               f"{r['beta_error_mean']:.4f}", f"{r['beta_error_p95']:.4f}",
+               f"{r['return_error_mean']:.5f}", f"{r['return_error_p95']:.5f}",
+               f"{r['min_weight']:.4f}", f"{v['sum']}/{v['negative']}/{v['zero_weight']}",
+               f"{r['time_mean_ms']:.2f}", f"{r['time_p95_ms']:.2f}")
+        print('| ' + ' | '.join(row) + ' |')
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--problems', type=int, default=100, help='corpus size')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--engines', help='comma separated subset of variants to run')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    args = parser.parse_args(argv)
+
+    core = load_core()
+    corpus = build_corpus(args.problems, args.seed)
+    available = variants(core)
+    names = args.engines.split(',') if args.engines else list(available)
+
+    results = {}
+    for name in names:
+        engine_name, strict, overrides = available[name]
+        # A fresh instance, so overrides do not leak into the shared engine
+        engine = type(core.get_engine(engine_name))()
+        for attr, value in overrides.items():
+            setattr(engine, attr, value)
+
+        def run(stocks, target_beta, returns, target_return, strategy, engine=engine, strict=strict):
+            return engine.optimize(stocks, target_beta, returns, target_return, strategy, strict)
+
+        results[name] = evaluate(run, corpus, args.seed)
+        print(f"{name}: done", file=sys.stderr)
+
+    front = pareto_front(results)
+    print_table(results, front)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'problems': args.problems, 'seed': args.seed, 'pareto': front, 'results': results},
+                      f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Shared helpers for the benchmark scripts in this folder.
+
+The scripts drive the optimizer in-process, so they need the backend
+folder on ``sys.path`` (the same layout ``passenger_wsgi.py`` sets up)
+and a way to build synthetic stock universes larger than the built-in
+``ENHANCED_STOCKS`` list.
+"""
+
+import logging
+import os
+import random
+import sys
+from typing import Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(PROJECT_ROOT, 'backend')
+
+SECTORS = [
+    'Technology',
+    'Healthcare',
+    'Financial Services',
+    'Consumer Discretionary',
+    'Consumer Staples',
+    'Communication Services',
+]
+
+
+def load_core():
+    """Import the ``portfolio_core`` package with optimiser logging silenced."""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    import portfolio_core
+    logging.getLogger('portfolio_core').setLevel(logging.WARNING)
+    return portfolio_core
+
+
+def load_backend():
+    """Import the Flask backend module with request logging silenced."""
+    load_core()
+    import production_app
+    logging.getLogger('production_app').setLevel(logging.WARNING)
+    return production_app
+
+
+def synthetic_universe(size: int, seed: int = 0) -> List[Dict]:
+    """
+    Build a reproducible universe of ``size`` stocks shaped like
+    ``ENHANCED_STOCKS`` (symbol, name, sector, beta, market_cap).
+    """
+    rng = random.Random(seed)
+    stocks = []
+    for i in range(size):
+        symbol = f"S{i:05d}"
+        stocks.append({
+            'symbol': symbol,
+            'name': f"Synthetic {symbol}",
+            'sector': SECTORS[rng.randrange(len(SECTORS))],
+            'beta': round(rng.uniform(0.4, 2.2), 2),
+            'market_cap': int(rng.lognormvariate(25, 1.2)),
+        })
+    return stocks
+
+
+def seed_everything(seed: int) -> None:
+    """Seed both random number generators used by the optimizer."""
+    import numpy as np
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def summarize_latencies(samples: List[float]) -> Dict[str, float]:
+    """Summarize latencies (in seconds) as millisecond percentiles."""
+    ordered = sorted(samples)
+
+    def percentile(q: float) -> float:
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index] * 1000
+
+    return {
+        'p50_ms': round(percentile(0.50), 3),
+        'p95_ms': round(percentile(0.95), 3),
+        'p99_ms': round(percentile(0.99), 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
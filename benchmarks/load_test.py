@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Concurrent HTTP load generator for the portfolio optimizer API.
+
+Drives a configurable mix of ``/api/optimize``, ``/api/stocks`` and
+static asset requests at a target request rate with many concurrent
+clients, then reports throughput, latency percentiles, error rates and
+the optimisation cache hit ratio (read from the ``Server-Timing``
+header).
+
+The target server can be:
+    * in-process: the Flask app served by werkzeug on a local port (default)
+    * spawned:    ``backend/production_app.py`` or gunicorn running
+                  ``passenger_wsgi:application`` in a subprocess
+    * external:   any running instance given with ``--url``
+
+Requests are sent open-loop: they are scheduled at fixed intervals and
+latency is measured from the scheduled time, so a server that falls
+behind shows up as higher latency rather than a lower request rate.
+
+Usage:
+    python benchmarks/load_test.py --rps 50 --duration 30 --clients 32
+    python benchmarks/load_test.py --server gunicorn --workers 4 --rps 200
+    python benchmarks/load_test.py --url http://localhost:5000 --mix optimize=1
+"""
+
+import argparse
+import json
+import os
+import queue
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+from common import PROJECT_ROOT, load_backend, summarize_latencies
+
+DEFAULT_MIX = 'optimize=0.5,stocks=0.3,static=0.2'
+
+_CACHE_RESULT = re.compile(r'cache_lookup;[^,]*result=(\w+)')
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in ('optimize', 'stocks', 'static'):
+            raise ValueError(f"unknown request kind '{kind}'")
+        mix.append((kind, float(weight or 1)))
+    return mix
+
+
+def build_presets(count: int, seed: int) -> List[Dict]:
+    """Parameter sets users pick from; earlier presets are more popular."""
+    rng = random.Random(seed)
+    presets = []
+    for _ in range(count):
+        strategy = rng.choice(['diversified', 'diversified', 'random', 'target_return'])
+        presets.append({
+            'num_stocks': rng.choice([5, 8, 10, 12, 15]),
+            'target_beta': rng.choice([0.8, 1.0, 1.2, 1.5]),
+            'target_return': rng.choice([8, 10, 12, 15]) if strategy == 'target_return' or rng.random() < 0.3 else None,
+            'strategy': strategy,
+        })
+    return presets
+
+
+def static_paths() -> List[str]:
+    manifest_path = os.path.join(PROJECT_ROOT, 'build', 'asset-manifest.json')
+    try:
+        with open(manifest_path) as f:
+            files = json.load(f)['files']
+        return ['/'] + [path for name, path in files.items() if not name.endswith('.map')]
+    except (OSError, ValueError, KeyError):
+        return ['/']
+
+
+class RequestFactory:
+    def __init__(self, mix: List[Tuple[str, float]], presets: List[Dict], zipf: float, seed: int) -> None:
+        self.rng = random.Random(seed)
+        self.kinds = [kind for kind, _ in mix]
+        self.kind_weights = [weight for _, weight in mix]
+        self.presets = presets
+        self.preset_weights = [1.0 / (rank + 1) ** zipf for rank in range(len(presets))]
+        self.static = static_paths()
+
+    def next(self) -> Tuple[str, str, str, Optional[bytes]]:
+        kind = self.rng.choices(self.kinds, self.kind_weights)[0]
+        if kind == 'optimize':
+            preset = self.rng.choices(self.presets, self.preset_weights)[0]
+            return kind, 'POST', '/api/optimize', json.dumps(preset).encode()
+        if kind == 'stocks':
+            return kind, 'GET', '/api/stocks', None
+        return kind, 'GET', self.rng.choice(self.static), None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_healthy(base_url: str, timeout: float) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/api/health", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become healthy within {timeout:.0f}s")
+
+
+def start_server(kind: str, workers: int, keep_limits: bool):
+    """Start the target server; returns (base_url, stop function)."""
+    if not keep_limits:
+        # Every load-test client shares one address, so the per-client
+        # rate limit would reject most of the traffic.
+        os.environ['RATE_LIMIT_PER_MINUTE'] = '0'
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    if kind == 'inprocess':
+        from werkzeug.serving import make_server
+        backend = load_backend()
+        server = make_server('127.0.0.1', port, backend.create_app(), threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        _wait_healthy(base_url, 10)
+        return base_url, server.shutdown
+
+    env = dict(os.environ, PORT=str(port), PYTHONUNBUFFERED='1')
+    if kind == 'gunicorn':
+        command = ['gunicorn', '--workers', str(workers), '--threads', '4',
+                   '--bind', f"127.0.0.1:{port}", 'passenger_wsgi:application']
+    else:
+        command = [sys.executable, os.path.join('backend', 'production_app.py')]
+    process = subprocess.Popen(command, cwd=PROJECT_ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def stop() -> None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    try:
+        _wait_healthy(base_url, 30)
+    except RuntimeError:
+        stop()
+        raise
+    return base_url, stop
+
+
+def _send(base_url: str, method: str, path: str, body: Optional[bytes], timeout: float) -> Tuple[int, Optional[str]]:
+    request = urllib.request.Request(f"{base_url}{path}", data=body, method=method)
+    if body is not None:
+        request.add_header('Content-Type', 'application/json')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status, response.headers.get('Server-Timing')
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code, e.headers.get('Server-Timing')
+    except (urllib.error.URLError, OSError):
+        return 0, None
+
+
+def run_load(base_url: str, factory: RequestFactory, rps: float, duration: float,
+             clients: int, timeout: float) -> Dict:
+    work: 'queue.Queue' = queue.Queue()
+    records: List[Tuple[str, int, float, float, Optional[str]]] = []
+    records_lock = threading.Lock()
+
+    def client() -> None:
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            scheduled, kind, method, path, body = item
+            sent = time.perf_counter()
+            status, timing = _send(base_url, method, path, body, timeout)
+            done = time.perf_counter()
+            cache = None
+            if kind == 'optimize' and timing:
+                match = _CACHE_RESULT.search(timing)
+                cache = match.group(1) if match else None
+            with records_lock:
+                records.append((kind, status, done - scheduled, done - sent, cache))
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    total = int(rps * duration)
+    start = time.perf_counter()
+    for i in range(total):
+        scheduled = start + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        work.put((scheduled, *factory.next()))
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return summarize(records, elapsed, rps)
+
+
+def summarize(records: List[Tuple], elapsed: float, rps: float) -> Dict:
+    report: Dict = {
+        'target_rps': rps,
+        'elapsed_s': round(elapsed, 2),
+        'requests': len(records),
+        'throughput_rps': round(len(records) / elapsed, 2) if elapsed else 0.0,
+        'by_kind': {},
+    }
+    for kind in sorted({r[0] for r in records}):
+        rows = [r for r in records if r[0] == kind]
+        statuses: Dict[str, int] = {}
+        for r in rows:
+            statuses[str(r[1])] = statuses.get(str(r[1]), 0) + 1
+        errors = sum(1 for r in rows if r[1] == 0 or r[1] >= 400)
+        entry = {
+            'requests': len(rows),
+            'error_rate': round(errors / len(rows), 4),
+            'statuses': statuses,
+            'latency': summarize_latencies([r[2] for r in rows]),
+            'service_time': summarize_latencies([r[3] for r in rows]),
+        }
+        if kind == 'optimize':
+            looked_up = [r[4] for r in rows if r[4] is not None]
+            hits = sum(1 for c in looked_up if c in ('hit', 'stale'))
+            entry['cache_hit_ratio'] = round(hits / len(looked_up), 4) if looked_up else None
+        report['by_kind'][kind] = entry
+    all_errors = sum(1 for r in records if r[1] == 0 or r[1] >= 400)
+    report['error_rate'] = round(all_errors / len(records), 4) if records else 0.0
+    report['latency'] = summarize_latencies([r[2] for r in records])
+    return report
+
+
+def print_report(report: Dict) -> None:
+    print(f"{report['requests']} requests in {report['elapsed_s']}s: "
+          f"{report['throughput_rps']} req/s (target {report['target_rps']}), "
+          f"error rate {report['error_rate']:.2%}", file=sys.stderr)
+    for kind, entry in report['by_kind'].items():
+        lat = entry['latency']
+        line = (f"  {kind:9s} n={entry['requests']:6d} p50={lat['p50_ms']:8.1f}ms p95={lat['p95_ms']:8.1f}ms "
+                f"p99={lat['p99_ms']:8.1f}ms errors={entry['error_rate']:.2%} statuses={entry['statuses']}")
+        if entry.get('cache_hit_ratio') is not None:
+            line += f" cache_hit={entry['cache_hit_ratio']:.1%}"
+        print(line, file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--server', choices=['inprocess', 'flask', 'gunicorn'], default='inprocess',
+                        help='how to start the target server (ignored with --url)')
+    parser.add_argument('--url', help='load test an already running server instead')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--rps', type=float, default=20.0, help='target requests per second')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent client connections')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"request mix (default {DEFAULT_MIX})")
+    parser.add_argument('--presets', type=int, default=20, help='distinct optimize parameter sets')
+    parser.add_argument('--zipf', type=float, default=1.1, help='preset popularity skew (0 = uniform)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep-limits', action='store_true',
+                        help='keep the per-client rate limit enabled on started servers')
+    parser.add_argument('--json', metavar='PATH', help='also write the report as JSON')
+    args = parser.parse_args(argv)
+
+    factory = RequestFactory(parse_mix(args.mix), build_presets(args.presets, args.seed), args.zipf, args.seed)
+    if args.url:
+        base_url, stop = args.url.rstrip('/'), (lambda: None)
+    else:
+        base_url, stop = start_server(args.server, args.workers, args.keep_limits)
+    try:
+        report = run_load(base_url, factory, args.rps, args.duration, args.clients, args.timeout)
+    finally:
+        stop()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Replay captured /api/optimize traffic for performance regression testing.
+
+Reads request captures written by the backend when ``CAPTURE_REQUESTS``
+is enabled (``backend/captures/optimize_requests.jsonl`` and its rotated
+``.1``, ``.2`` ... files) and replays them either in-process against
+``PortfolioOptimizer`` or over HTTP against any running build.  Pacing
+follows the original inter-arrival times, scaled by ``--speed`` (0 sends
+as fast as the clients allow).
+
+The report compares the replayed latency distribution and result
+quality (beta/return error, share of targets achieved) with the
+captured values, and optionally with a previously saved replay report.
+
+Usage:
+    python benchmarks/replay.py backend/captures/optimize_requests.jsonl
+    python benchmarks/replay.py captures.jsonl --speed 10 --clients 8 --save new.json
+    python benchmarks/replay.py captures.jsonl --url http://staging:5000 --baseline new.json
+    python benchmarks/replay.py captures.jsonl --set BETA_TOLERANCE=0.1
+    python benchmarks/replay.py captures.jsonl --engine exact --no-cache
+"""
+
+import argparse
+import glob
+import json
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, Dict, Iterator, List, Optional
+
+from common import load_core, summarize_latencies
+
+
+def read_captures(paths: List[str]) -> Iterator[Dict]:
+    """Yield captured entries from the given files in timestamp order."""
+    files: List[str] = []
+    for path in paths:
+        # Include rotated files, oldest (highest suffix) first
+        rotated = sorted(glob.glob(f"{path}.[0-9]*"), key=lambda p: int(p.rsplit('.', 1)[1]), reverse=True)
+        files.extend(rotated + [path])
+    entries = []
+    for path in files:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entries.append(json.loads(line))
+    entries.sort(key=lambda e: e.get('ts', 0))
+    return iter(entries)
+
+
+def quality(request: Dict, result: Optional[Dict]) -> Optional[Dict]:
+    if not result or result.get('actual_beta') is None:
+        return None
+    entry = {
+        'beta_error': abs(result['actual_beta'] - request['target_beta']),
+        'target_achieved': bool(result.get('target_achieved')),
+    }
+    if request.get('target_return') is not None and result.get('expected_return') is not None:
+        entry['return_error'] = abs(result['expected_return'] - request['target_return'])
+    return entry
+
+
+def summarize(latencies: List[float], qualities: List[Optional[Dict]], statuses: List[int]) -> Dict:
+    scored = [q for q in qualities if q is not None]
+    return_errors = [q['return_error'] for q in scored if 'return_error' in q]
+    status_counts: Dict[str, int] = {}
+    for status in statuses:
+        status_counts[str(status)] = status_counts.get(str(status), 0) + 1
+    return {
+        'requests': len(statuses),
+        'statuses': status_counts,
+        'latency': summarize_latencies(latencies),
+        'beta_error_mean': round(sum(q['beta_error'] for q in scored) / len(scored), 5) if scored else None,
+        'return_error_mean': round(sum(return_errors) / len(return_errors), 6) if return_errors else None,
+        'target_achieved_rate': round(sum(q['target_achieved'] for q in scored) / len(scored), 4) if scored else None,
+    }
+
+
+def inprocess_runner(engine: Optional[str], overrides: Dict[str, float], no_cache: bool) -> Callable[[Dict], tuple]:
+    core = load_core()
+    optimizer = core.PortfolioOptimizer()
+    if overrides:
+        # Tune the shared engine instance the optimizer will use
+        tuned = core.get_engine(engine)
+        for attr, value in overrides.items():
+            setattr(tuned, attr, value)
+
+    def run(request: Dict) -> tuple:
+        if no_cache:
+            core.optimization_cache.clear()
+        result = optimizer.optimize(request['num_stocks'], request['target_beta'],
+                                    request.get('target_return'), request.get('strategy', 'diversified'),
+                                    engine or request.get('engine'), request.get('current_weights'),
+                                    request.get('turnover_penalty', 0.0), request.get('sector_limits'),
+                                    request.get('robust'))
+        return (400 if 'error' in result else 200), result
+
+    return run
+
+
+def http_runner(base_url: str, engine: Optional[str], timeout: float) -> Callable[[Dict], tuple]:
+    def run(request: Dict) -> tuple:
+        payload = dict(request)
+        if engine:
+            payload['engine'] = engine
+        if payload.get('engine') is None:
+            payload.pop('engine', None)
+        if payload.get('target_return') is not None:
+            # The endpoint reads values above 1 as percentages
+            payload['target_return'] = payload['target_return'] * 100
+        body = json.dumps(payload).encode()
+        http_request = urllib.request.Request(f"{base_url}/api/optimize", data=body, method='POST',
+                                              headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(http_request, timeout=timeout) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, None
+        except (urllib.error.URLError, OSError):
+            return 0, None
+
+    return run
+
+
+def replay(entries: Iterator[Dict], run: Callable[[Dict], tuple], speed: float, clients: int,
+           limit: Optional[int]) -> Dict:
+    work: 'queue.Queue' = queue.Queue(maxsize=clients * 4)
+    original_latencies: List[float] = []
+    original_qualities: List[Optional[Dict]] = []
+    original_statuses: List[int] = []
+    latencies: List[float] = []
+    qualities: List[Optional[Dict]] = []
+    statuses: List[int] = []
+    lock = threading.Lock()
+
+    def client() -> None:
+        while True:
+            entry = work.get()
+            if entry is None:
+                return
+            start = time.perf_counter()
+            status, result = run(entry['request'])
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses.append(status)
+                qualities.append(quality(entry['request'], result) if status == 200 else None)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    first_ts = None
+    wall_start = time.perf_counter()
+    for count, entry in enumerate(entries):
+        if limit is not None and count >= limit:
+            break
+        if first_ts is None:
+            first_ts = entry.get('ts', 0)
+        if speed > 0:
+            due = wall_start + (entry.get('ts', first_ts) - first_ts) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if 'latency_ms' in entry:
+            original_latencies.append(entry['latency_ms'] / 1000)
+        original_statuses.append(entry.get('status', 0))
+        original_qualities.append(quality(entry['request'], entry.get('result')))
+        work.put(entry)
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+
+    return {
+        'elapsed_s': round(time.perf_counter() - wall_start, 2),
+        'captured': summarize(original_latencies, original_qualities, original_statuses),
+        'replayed': summarize(latencies, qualities, statuses),
+    }
+
+
+def _diff_line(label: str, before: Optional[float], after: Optional[float], unit: str = '') -> str:
+    if before is None or after is None:
+        return f"  {label:22s} {before!s:>12} -> {after!s:>12}"
+    change = f"{(after - before) / before:+.1%}" if before else 'n/a'
+    return f"  {label:22s} {before:12.4f}{unit} -> {after:12.4f}{unit}  ({change})"
+
+
+def print_diff(title: str, before: Dict, after: Dict) -> None:
+    print(title, file=sys.stderr)
+    for key in ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms'):
+        print(_diff_line(f"latency {key}", before['latency'][key], after['latency'][key]), file=sys.stderr)
+    for key in ('beta_error_mean', 'return_error_mean', 'target_achieved_rate'):
+        print(_diff_line(key, before[key], after[key]), file=sys.stderr)
+    print(f"  statuses {before['statuses']} -> {after['statuses']}", file=sys.stderr)
+
+
+def parse_overrides(pairs: List[str]) -> Dict[str, float]:
+    overrides = {}
+    for pair in pairs:
+        name, _, value = pair.partition('=')
+        overrides[name] = float(value)
+    return overrides
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('captures', nargs='+', help='capture JSONL file(s); rotated siblings are included')
+    parser.add_argument('--url', help='replay over HTTP against this server instead of in-process')
+    parser.add_argument('--speed', type=float, default=1.0, help='pacing multiplier (0 = no pacing)')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent replay clients')
+    parser.add_argument('--limit', type=int, help='replay at most this many requests')
+    parser.add_argument('--no-cache', action='store_true', help='clear the optimizer cache before each request')
+    parser.add_argument('--engine', help='replay with this weight engine instead of the captured one')
+    parser.add_argument('--set', action='append', default=[], metavar='ATTR=VALUE',
+                        help='override a weight engine attribute for in-process replay')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--save', metavar='PATH', help='write the replay report as JSON')
+    parser.add_argument('--baseline', metavar='PATH', help='previous replay report to diff against')
+    args = parser.parse_args(argv)
+
+    if args.url:
+        run = http_runner(args.url.rstrip('/'), args.engine, args.timeout)
+    else:
+        run = inprocess_runner(args.engine, parse_overrides(args.set), args.no_cache)
+    report = replay(read_captures(args.captures), run, args.speed, args.clients, args.limit)
+
+    print(f"Replayed {report['replayed']['requests']} requests in {report['elapsed_s']}s", file=sys.stderr)
+    print_diff('Captured -> replayed:', report['captured'], report['replayed'])
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print_diff('Baseline replay -> this replay:', baseline['replayed'], report['replayed'])
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
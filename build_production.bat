@@ -31,6 +31,7 @@ echo.
 echo Step 4: Copying production files...
 xcopy /E /I /Y "build\*" "production\build\"
 copy /Y "backend\production_app.py" "production\backend\"
+xcopy /E /I /Y "backend\portfolio_core\*.py" "production\backend\portfolio_core\"
 copy /Y "backend\production_requirements.txt" "production\backend\"
 if exist "passenger_wsgi.py" copy /Y "passenger_wsgi.py" "production\"
 if exist ".htaccess" copy /Y ".htaccess" "production\"
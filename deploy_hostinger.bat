@@ -65,6 +65,7 @@ REM Step 6: Copy files to production folder
 echo Step 6: Copying files to production folder...
 xcopy /E /I /Y "build\*" "production\build\"
 copy /Y "backend\production_app.py" "production\backend\"
+xcopy /E /I /Y "backend\portfolio_core\*.py" "production\backend\portfolio_core\"
 copy /Y "backend\production_requirements.txt" "production\backend\"
 copy /Y "passenger_wsgi.py" "production\"
 copy /Y ".htaccess" "production\"
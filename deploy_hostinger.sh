@@ -61,6 +61,8 @@ mkdir -p production/build
 echo "📋 Step 6: Copying files to production folder..."
 cp -r build/* production/build/
 cp backend/production_app.py production/backend/
+mkdir -p production/backend/portfolio_core
+cp backend/portfolio_core/*.py production/backend/portfolio_core/
 cp backend/production_requirements.txt production/backend/
 cp passenger_wsgi.py production/
 cp .htaccess production/
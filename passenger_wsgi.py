@@ -28,10 +28,12 @@ os.chdir(project_root)
 # Import the Flask application
 # IMPORTANT: This must be AFTER setting up the paths!
 try:
-    from backend.production_app import app as application
+    from backend.production_app import create_app
 except ImportError:
     # Fallback: try importing directly if backend is in path
-    from production_app import app as application
+    from production_app import create_app
+
+application = create_app()
 
 # For debugging (remove in production if needed)
 if __name__ == "__main__":